@@ -0,0 +1,18 @@
+import argparse
+import asyncio
+from presentation.batch_runner import BatchRunner
+
+#Command line entry point to answer the questions of a JSONL/CSV file without the interface.
+def main():
+    parser = argparse.ArgumentParser(description="Answer the questions of a JSONL or CSV file and write the answers to a JSONL file.")
+    parser.add_argument("input", help="JSONL file with a \"question\" field per line, or CSV file with a \"question\" column. An \"id\" field is optional.")
+    parser.add_argument("output", help="JSONL file where the answers are appended. Questions already answered in it are skipped.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of questions answered at the same time.")
+    args = parser.parse_args()
+
+    runner = BatchRunner(concurrency=args.concurrency)
+    summary = asyncio.run(runner.run(args.input, args.output))
+    runner.print_summary(summary)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import json
 
 #Loads environment variables from .env file
 load_dotenv()
@@ -8,3 +9,133 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USER = os.getenv("NEO4J_USER")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+
+#Maximum number of tokens of graph context sent to the final answer generation
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+
+#Persistent embedding cache shared by all processes. An empty path disables it
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "app/cache/embeddings.db")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+#Maximum number of inputs sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+
+#Concurrent get_embedding calls arriving within the window (or until the size cap) share one request. A window of 0 disables it
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+#Persistent cache of structured LLM responses (question validation, entity extraction). An empty path disables it
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "app/cache/llm.db")
+LLM_CACHE_TTL_SEC = float(os.getenv("LLM_CACHE_TTL_SEC", str(24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+#Persistent answer cache shared by all processes, keyed by the normalized question and the graph. The messages of questions that could not be
+#answered (no data found in the graph) expire sooner. An empty path disables it
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "app/cache/answers.db")
+ANSWER_CACHE_TTL_SEC = float(os.getenv("ANSWER_CACHE_TTL_SEC", "3600"))
+ANSWER_CACHE_NEGATIVE_TTL_SEC = float(os.getenv("ANSWER_CACHE_NEGATIVE_TTL_SEC", "300"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+#Persistent cache of the intermediate results of the pipeline (similarity searches, Cypher queries and their
+#parsed context), reused by different questions that reach the same stage inputs. An empty path disables it
+STAGE_CACHE_PATH = os.getenv("STAGE_CACHE_PATH", "app/cache/stages.db")
+STAGE_CACHE_TTL_SEC = float(os.getenv("STAGE_CACHE_TTL_SEC", "3600"))
+STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+#Semantic answer cache: questions similar enough to an answered one reuse its answer. It is opt-in, questions about different
+#entity types of the same context (e.g. its problems and its goals) can be similar enough to get each other's answer
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+SEMANTIC_CACHE_TTL_SEC = float(os.getenv("SEMANTIC_CACHE_TTL_SEC", "3600"))
+#Seconds between checks of the graph checksum, which keys and invalidates the cached results that depend on the graph
+SEMANTIC_CACHE_GRAPH_CHECK_SEC = float(os.getenv("SEMANTIC_CACHE_GRAPH_CHECK_SEC", "60"))
+
+#Requests and tokens per minute allowed for each OpenAI model. Calls over the limit wait in a queue. 0 disables a limit
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "30000"))
+
+#Retries of rate limited, timed out or failed OpenAI calls. The wait follows the Retry-After header or a jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SEC = float(os.getenv("LLM_RETRY_BASE_SEC", "1"))
+LLM_RETRY_MAX_SEC = float(os.getenv("LLM_RETRY_MAX_SEC", "30"))
+
+#Deadline of the LLM calls of each task (JSON object of task name to seconds), and of the tasks that are not listed
+LLM_TIMEOUT_SEC = json.loads(os.getenv("LLM_TIMEOUT_SEC", '{"question_validation": 20, "entity_extraction": 20, "question_analysis": 30, "cypher_generation": 30, "rag_answer_generation": 60}'))
+LLM_DEFAULT_TIMEOUT_SEC = float(os.getenv("LLM_DEFAULT_TIMEOUT_SEC", "60"))
+
+#Seconds a streamed call can wait for its first event, within the deadline of its task
+LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC = float(os.getenv("LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC", "20"))
+
+#Seconds a Neo4j query can run before the database stops it
+NEO4J_QUERY_TIMEOUT_SEC = float(os.getenv("NEO4J_QUERY_TIMEOUT_SEC", "30"))
+
+#Hedged requests: a call slower than the observed percentile of its task is duplicated and the first response wins
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+#Routing table of the model of each task. Canaries are promoted or rolled back from the logged statistics
+MODEL_ROUTES_PATH = os.getenv("MODEL_ROUTES_PATH", "app/cache/model_routes.json")
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "30"))
+ROUTER_MAX_FAILURE_INCREASE = float(os.getenv("ROUTER_MAX_FAILURE_INCREASE", "0.02"))
+ROUTER_MAX_LATENCY_RATIO = float(os.getenv("ROUTER_MAX_LATENCY_RATIO", "1.2"))
+
+#Connection pool of the OpenAI client. It is shared by the LlmClient instances of each event loop, because pooled connections
+#cannot be used from another loop. HTTP/2 needs the h2 package (pip install httpx[http2]). The warm-up opens connections before the first question
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY_SEC = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_SEC", "120"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+LLM_HTTP_WARMUP_CONNECTIONS = int(os.getenv("LLM_HTTP_WARMUP_CONNECTIONS", "2"))
+
+#spaCy model of the PERSON recognizer of the PII check. It only runs on questions without pattern PII (emails, phones, IBANs...)
+PII_SPACY_MODEL = os.getenv("PII_SPACY_MODEL", "en_core_web_lg")
+
+#Worker pool of the PII checks, outside of the event loop. "thread" workers share the analyzer of the process, "process" workers
+#load one analyzer each and run the checks in parallel. A check that waits longer than the queue timeout for a worker is rejected
+PII_POOL_MODE = os.getenv("PII_POOL_MODE", "thread")
+PII_POOL_WORKERS = int(os.getenv("PII_POOL_WORKERS", "2"))
+PII_POOL_QUEUE_TIMEOUT_SEC = float(os.getenv("PII_POOL_QUEUE_TIMEOUT_SEC", "5"))
+
+#Admission control of the questions answered at the same time by the process. Questions over the limit wait in a queue until
+#their timeout, and they are rejected at once if the queue is full. A limit of 0 disables it
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SEC = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SEC", "10"))
+
+#Traces of the stages and external calls of each question, written to TRACE_DIR in the Chrome trace event format ("chrome"),
+#which opens in chrome://tracing or Perfetto, or in OpenTelemetry OTLP JSON ("otel"). An empty directory disables the export
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "chrome")
+
+#Question validation and entity extraction in a single LLM call ("combined") or in two sequential calls ("separate").
+#A percentage of the questions also run the other path to log how much both paths agree
+QUESTION_ANALYSIS_MODE = os.getenv("QUESTION_ANALYSIS_MODE", "combined")
+QUESTION_ANALYSIS_SHADOW_PERCENT = float(os.getenv("QUESTION_ANALYSIS_SHADOW_PERCENT", "0"))
+
+#Run the question embedding, validation and entity extraction at the same time ("cancel" or "discard" the unneeded work when
+#a check fails) or one after the other ("off"). In both cases nothing is sent to OpenAI or written to the caches and logs before
+#the PII check has cleared the question
+SPECULATION_POLICY = os.getenv("SPECULATION_POLICY", "off")
+
+#End-to-end deadline of each question, in seconds (0 disables it). The stages and LLM calls read the time left and degrade when it
+#runs low: the retry of the entities without label is skipped, the final answer uses a faster model and a smaller context, and at
+#the end a partial answer is built from the retrieved context without calling the LLM
+REQUEST_DEADLINE_SEC = float(os.getenv("REQUEST_DEADLINE_SEC", "0"))
+DEADLINE_SKIP_RETRY_SEC = float(os.getenv("DEADLINE_SKIP_RETRY_SEC", "20"))
+DEADLINE_FAST_MODEL_SEC = float(os.getenv("DEADLINE_FAST_MODEL_SEC", "15"))
+DEADLINE_FAST_MODEL = os.getenv("DEADLINE_FAST_MODEL", "gpt-4.1-mini")
+DEADLINE_CAP_CONTEXT_SEC = float(os.getenv("DEADLINE_CAP_CONTEXT_SEC", "10"))
+DEADLINE_CONTEXT_TOKEN_BUDGET = int(os.getenv("DEADLINE_CONTEXT_TOKEN_BUDGET", "2000"))
+DEADLINE_PARTIAL_ANSWER_SEC = float(os.getenv("DEADLINE_PARTIAL_ANSWER_SEC", "3"))
+DEADLINE_PARTIAL_ANSWER_ITEMS = int(os.getenv("DEADLINE_PARTIAL_ANSWER_ITEMS", "10"))
+
+#Fast path of the questions about the system itself ("what can you answer?"), answered with a fixed response and without LLM or
+#database calls. Questions are matched locally with the examples of each intent: exactly, by shared words, or by the similarity of
+#their embeddings if the question's embedding is in the embedding cache. INTENTS_PATH is a JSON file that adds or replaces intents
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "true").lower() == "true"
+INTENTS_PATH = os.getenv("INTENTS_PATH", "")
+INTENT_TOKEN_THRESHOLD = float(os.getenv("INTENT_TOKEN_THRESHOLD", "0.75"))
+INTENT_EMBEDDING_THRESHOLD = float(os.getenv("INTENT_EMBEDDING_THRESHOLD", "0.9"))
@@ -0,0 +1,118 @@
+import json
+from config.config import ANSWER_CACHE_PATH, ANSWER_CACHE_TTL_SEC, ANSWER_CACHE_NEGATIVE_TTL_SEC, ANSWER_CACHE_MAX_BYTES
+from data.sqlite_cache import SqliteCache
+
+class AnswerCache:
+    """
+    Persistent exact-match cache of the answers to questions, keyed by the normalized sanitized question and the fingerprint
+    of the graph the answer came from, so answers are not reused after the graph changes.
+
+    Answers are stored as JSON in a SqliteCache, shared by all the processes that use the same file (e.g. several Streamlit
+    sessions or batch workers) and kept across restarts. Negative results, the messages of questions the pipeline could not
+    answer (no data found in the graph), expire sooner than answers. The least recently used entries are evicted when
+    the size limit is reached.
+
+    Attributes:
+        store (SqliteCache): Storage of the answers.
+        ttl (float): Seconds an answer is kept.
+        negative_ttl (float): Seconds a negative result is kept.
+        hits (int): Number of cache hits in this process.
+        misses (int): Number of cache misses in this process.
+
+    Methods:
+        normalize(): Normalizes a question so equivalent questions share an entry.
+        make_key(): Builds the cache key of a question and a graph fingerprint.
+        get(): Returns the cached answer of a question or None.
+        set(): Stores the answer of a question.
+        hit_rate(): Returns the ratio of hits over lookups in this process.
+    """
+
+    def __init__(self, path:str = ANSWER_CACHE_PATH, ttl:float = ANSWER_CACHE_TTL_SEC, negative_ttl:float = ANSWER_CACHE_NEGATIVE_TTL_SEC,
+                 max_bytes:int = ANSWER_CACHE_MAX_BYTES):
+        """
+        Initializes the AnswerCache.
+
+        Args:
+            path (str): Path of the SQLite file.
+            ttl (float): Seconds an answer is kept.
+            negative_ttl (float): Seconds a negative result is kept.
+            max_bytes (int): Maximum total size of the stored answers.
+        """
+        self.store = SqliteCache(path, "answers", max_bytes)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @property
+    def hits(self) -> int:
+        """Number of cache hits in this process."""
+        return self.store.hits
+
+    @property
+    def misses(self) -> int:
+        """Number of cache misses in this process."""
+        return self.store.misses
+
+    def normalize(self, question:str) -> str:
+        """
+        Normalizes a question by lowercasing it and collapsing whitespace.
+
+        Args:
+            question (str): The sanitized question.
+
+        Returns:
+            str: Normalized question.
+        """
+        return " ".join(question.lower().split())
+
+    def make_key(self, question:str, graph:str|None) -> str:
+        """
+        Builds the cache key of a question and a graph fingerprint.
+
+        Args:
+            question (str): The sanitized question.
+            graph (str|None): Fingerprint of the graph. None if it is unknown.
+
+        Returns:
+            str: Cache key.
+        """
+        key = self.normalize(question)
+        return key if graph is None else f"{graph}:{key}"
+
+    def get(self, question:str, graph:str = None) -> dict|None:
+        """
+        Returns the cached answer of a question.
+
+        Args:
+            question (str): The sanitized question.
+            graph (str, optional): Fingerprint of the graph the answer has to come from.
+
+        Returns:
+            dict|None: The entry with the "question", "answer", "negative" flag and "duration_sec" it took to answer,
+                or None if it is not cached.
+        """
+        value = self.store.get(self.make_key(question, graph))
+        return json.loads(value) if value is not None else None
+
+    def set(self, question:str, answer:str, duration_sec:float, negative:bool = False, graph:str = None) -> None:
+        """
+        Stores the answer of a question.
+
+        Args:
+            question (str): The sanitized question.
+            answer (str): Final answer, or the message of a negative result.
+            duration_sec (float): Time it took to answer, used to report the latency saved by hits.
+            negative (bool): Whether the answer is the message of a question the pipeline could not answer.
+            graph (str, optional): Fingerprint of the graph the answer came from.
+        """
+        entry = {"question": self.normalize(question), "answer": answer, "negative": negative, "duration_sec": duration_sec}
+        self.store.set(self.make_key(question, graph), json.dumps(entry, ensure_ascii=False).encode("utf-8"), ttl=self.negative_ttl if negative else self.ttl)
+
+    def hit_rate(self) -> float:
+        """
+        Returns the ratio of hits over lookups in this process.
+
+        Returns:
+            float: Hit rate, 0 if there were no lookups.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,80 @@
+from array import array
+from config.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES
+from data.sqlite_cache import SqliteCache
+
+class EmbeddingCache:
+    """
+    Persistent cache of embedding vectors keyed by model and normalized text.
+
+    Vectors are stored as float32 blobs in a SqliteCache, shared by all the processes that use the same file,
+    and the least recently used vectors are evicted when the size limit is reached.
+
+    Attributes:
+        store (SqliteCache): Storage of the vectors.
+        hits (int): Number of cache hits in this process.
+        misses (int): Number of cache misses in this process.
+
+    Methods:
+        normalize(): Normalizes a text so equivalent inputs share an entry.
+        get(): Returns the cached vector of a text or None.
+        set(): Stores the vector of a text.
+    """
+
+    def __init__(self, path:str = EMBEDDING_CACHE_PATH, max_bytes:int = EMBEDDING_CACHE_MAX_BYTES):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            path (str): Path of the SQLite file.
+            max_bytes (int): Maximum total size of the stored vectors.
+        """
+        self.store = SqliteCache(path, "embeddings", max_bytes)
+
+    @property
+    def hits(self) -> int:
+        """Number of cache hits in this process."""
+        return self.store.hits
+
+    @property
+    def misses(self) -> int:
+        """Number of cache misses in this process."""
+        return self.store.misses
+
+    def normalize(self, text:str) -> str:
+        """
+        Normalizes a text by lowercasing it and collapsing whitespace.
+
+        Args:
+            text (str): Input text.
+
+        Returns:
+            str: Normalized text.
+        """
+        return " ".join(text.lower().split())
+
+    def get(self, model:str, text:str) -> list[float]|None:
+        """
+        Returns the cached vector of a text.
+
+        Args:
+            model (str): Embedding model.
+            text (str): Embedded text.
+
+        Returns:
+            list[float]|None: The vector, or None if it is not cached.
+        """
+        blob = self.store.get(f"{model}:{self.normalize(text)}")
+        if blob is None:
+            return None
+        return array("f", blob).tolist()
+
+    def set(self, model:str, text:str, embedding:list[float]) -> None:
+        """
+        Stores the vector of a text as float32.
+
+        Args:
+            model (str): Embedding model.
+            text (str): Embedded text.
+            embedding (list[float]): Embedding vector.
+        """
+        self.store.set(f"{model}:{self.normalize(text)}", array("f", embedding).tobytes())
@@ -0,0 +1,93 @@
+import hashlib
+from config.config import LLM_CACHE_PATH, LLM_CACHE_TTL_SEC, LLM_CACHE_MAX_BYTES
+from data.sqlite_cache import SqliteCache
+
+class LlmResponseCache:
+    """
+    Persistent exact-match cache of structured LLM responses.
+
+    Responses are stored as JSON in a SqliteCache, keyed by the model, the hashes of the system and user prompts, the temperature
+    and the response format. Entries expire after a time to live and the least recently used ones are evicted when the size limit is reached.
+
+    Attributes:
+        store (SqliteCache): Storage of the responses.
+        ttl (float): Seconds a response is kept.
+        hits (int): Number of cache hits in this process.
+        misses (int): Number of cache misses in this process.
+
+    Methods:
+        make_key(): Builds the cache key of a call.
+        get(): Returns the cached JSON response of a call or None.
+        set(): Stores the JSON response of a call.
+    """
+
+    def __init__(self, path:str = LLM_CACHE_PATH, ttl:float = LLM_CACHE_TTL_SEC, max_bytes:int = LLM_CACHE_MAX_BYTES):
+        """
+        Initializes the LlmResponseCache.
+
+        Args:
+            path (str): Path of the SQLite file.
+            ttl (float): Seconds a response is kept.
+            max_bytes (int): Maximum total size of the stored responses.
+        """
+        self.store = SqliteCache(path, "structured_responses", max_bytes)
+        self.ttl = ttl
+
+    @property
+    def hits(self) -> int:
+        """Number of cache hits in this process."""
+        return self.store.hits
+
+    @property
+    def misses(self) -> int:
+        """Number of cache misses in this process."""
+        return self.store.misses
+
+    def make_key(self, model:str, system_prompt:str, user_prompt:str, temperature:float, text_format:str) -> str:
+        """
+        Builds the cache key of a call.
+
+        Args:
+            model (str): OpenAI model name.
+            system_prompt (str): System-level prompt instructions.
+            user_prompt (str): The user's prompt text.
+            temperature (float): Sampling temperature.
+            text_format (str): Response format name.
+
+        Returns:
+            str: Cache key.
+        """
+        system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        user_hash = hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()
+        return f"{model}:{system_hash}:{user_hash}:{temperature}:{text_format}"
+
+    def get(self, model:str, system_prompt:str, user_prompt:str, temperature:float, text_format:str) -> str|None:
+        """
+        Returns the cached response of a call.
+
+        Args:
+            model (str): OpenAI model name.
+            system_prompt (str): System-level prompt instructions.
+            user_prompt (str): The user's prompt text.
+            temperature (float): Sampling temperature.
+            text_format (str): Response format name.
+
+        Returns:
+            str|None: The response JSON, or None if it is not cached.
+        """
+        value = self.store.get(self.make_key(model, system_prompt, user_prompt, temperature, text_format))
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, model:str, system_prompt:str, user_prompt:str, temperature:float, text_format:str, response_json:str) -> None:
+        """
+        Stores the response of a call.
+
+        Args:
+            model (str): OpenAI model name.
+            system_prompt (str): System-level prompt instructions.
+            user_prompt (str): The user's prompt text.
+            temperature (float): Sampling temperature.
+            text_format (str): Response format name.
+            response_json (str): The parsed response as JSON.
+        """
+        self.store.set(self.make_key(model, system_prompt, user_prompt, temperature, text_format), response_json.encode("utf-8"), ttl=self.ttl)
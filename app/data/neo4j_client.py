@@ -1,6 +1,10 @@
-from neo4j import GraphDatabase, Driver
-from neo4j.exceptions import ServiceUnavailable, AuthError, AuthConfigurationError
-from config.config import NEO4J_URI,NEO4J_PASSWORD,NEO4J_USER
+import hashlib
+import json
+from neo4j import GraphDatabase, Driver, Query, Session
+from neo4j.exceptions import ServiceUnavailable, AuthError, AuthConfigurationError, ClientError
+from config.config import NEO4J_URI,NEO4J_PASSWORD,NEO4J_USER, NEO4J_QUERY_TIMEOUT_SEC
+from logs.tracer import Tracer
+from llm.latency_budget import LatencyBudget
 
 class Neo4jClient:
     """
@@ -14,6 +18,8 @@ class Neo4jClient:
         close_driver(): Closes the connection with the database.
         execute_multiple_queries(): Executes multiple queries with their respective parameters at the same time. Uses APOC.
         execute_query(): Executes a single query and its parameters.
+        get_graph_fingerprint(): Returns a checksum of the nodes and relationships, used to detect graph changes.
+        run_query(): Runs a query in a session within NEO4J_QUERY_TIMEOUT_SEC and the question's latency budget.
     """
 
     def __init__(self):
@@ -41,6 +47,7 @@ class Neo4jClient:
         self.driver.close()
 
 
+    @Tracer.traced()
     def execute_multiple_queries(self, queries_with_params: list[dict])->list[dict]:
         """
         Execute multiple Cypher queries with parameters using APOC.
@@ -57,11 +64,11 @@ class Neo4jClient:
         RETURN value
         """
         with self.driver.session() as session:
-            result = session.run(query, {
+            return self.run_query(session, query, {
                 "queriesWithParams": queries_with_params
-            })
-            return result.data() #Format example: [{"value": {'name': 'software architecture level', 'labels': ['context'], 'similarity': 0.7}}}, {"value": {results2}}, ...]
+            }) #Format example: [{"value": {'name': 'software architecture level', 'labels': ['context'], 'similarity': 0.7}}}, {"value": {results2}}, ...]
 
+    @Tracer.traced()
     def execute_query(self, cypher_query: str, parameters: dict = None)->list[dict]:
         """
         Execute a single Cypher query with optional parameters.
@@ -74,5 +81,51 @@ class Neo4jClient:
             list[dict]: A list of result records.
         """
         with self.driver.session() as session:
-            result = session.run(cypher_query, parameters or {})
-            return result.data() #Format example: [{'x.prop1': 'text', x.prop2: 'moreText', 'labels(x)': ['entity_type'], 'y.prop1': 'text', 'xCount': 5}]
\ No newline at end of file
+            return self.run_query(session, cypher_query, parameters or {}) #Format example: [{'x.prop1': 'text', x.prop2: 'moreText', 'labels(x)': ['entity_type'], 'y.prop1': 'text', 'xCount': 5}]
+
+    @Tracer.traced()
+    def get_graph_fingerprint(self)->str:
+        """
+        Get a checksum of the graph: the labels and properties of every node and the type, ends and properties of every relationship.
+        It changes when any of them is added, removed or edited. The embeddings are left out, they change with the name they embed.
+
+        Returns:
+            str: SHA-256 hex digest of the graph.
+        """
+        checksum = hashlib.sha256()
+        with self.driver.session() as session:
+            nodes = session.run("MATCH (n) RETURN elementId(n) AS id, labels(n) AS labels, n {.*, embedding: null} AS properties ORDER BY id")
+            for record in nodes:
+                checksum.update(json.dumps(["node", record["id"], sorted(record["labels"]), record["properties"]], sort_keys=True, default=str).encode("utf-8"))
+            relationships = session.run("MATCH (a)-[r]->(b) RETURN elementId(r) AS id, type(r) AS type, elementId(a) AS start, elementId(b) AS end, "
+                                        "properties(r) AS properties ORDER BY id")
+            for record in relationships:
+                checksum.update(json.dumps(["relationship", record["id"], record["type"], record["start"], record["end"], record["properties"]],
+                                           sort_keys=True, default=str).encode("utf-8"))
+        return checksum.hexdigest()
+
+    def run_query(self, session:Session, query:str, parameters:dict) -> list[dict]:
+        """
+        Run a query in a session. The database stops it after NEO4J_QUERY_TIMEOUT_SEC, or the time left of the question's
+        latency budget if it is shorter.
+
+        Args:
+            session (Session): Open session.
+            query (str): The Cypher query.
+            parameters (dict): Parameters of the query.
+
+        Returns:
+            list[dict]: The result records.
+
+        Raises:
+            TimeoutError: If the deadline of the question has passed or the query was stopped by its timeout.
+        """
+        timeout = LatencyBudget.cap_timeout(NEO4J_QUERY_TIMEOUT_SEC)
+        if timeout <= 0:
+            raise TimeoutError("The query was not run, the deadline of the question has passed")
+        try:
+            return session.run(Query(query, timeout=timeout), parameters).data()
+        except ClientError as e:
+            if "TransactionTimedOut" in (e.code or ""):
+                raise TimeoutError(f"The query did not finish in {timeout} seconds") from e
+            raise
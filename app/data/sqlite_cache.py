@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+
+class SqliteCache:
+    """
+    Persistent key-value cache stored in a SQLite file.
+
+    The file can be shared by several processes (WAL journal mode). Entries can expire after a time to live, and
+    the least recently used entries are evicted when the total size of the values exceeds the size limit. The total size
+    is not summed on every write: each process keeps a running estimate, counted from the last time it summed the sizes,
+    and only sums them again and evicts when the estimate goes over the limit.
+
+    The methods block on SQLite, so async code calls them with asyncio.to_thread().
+
+    Attributes:
+        path (str): Path of the SQLite file.
+        table (str): Table used by this cache, so several caches can share a file.
+        max_bytes (int): Maximum total size of the stored values.
+        hits (int): Number of hits in this process.
+        misses (int): Number of misses in this process.
+        size (int): Running estimate of the total size of the stored values. Replaced values and the writes of other
+            processes are not subtracted or added until the next eviction.
+        connection (sqlite3.Connection): Connection to the SQLite file.
+        lock (threading.Lock): Serializes the use of the connection between threads.
+
+    Methods:
+        get(): Returns the value of a key or None if it is missing or expired.
+        set(): Stores the value of a key.
+        delete(): Removes a key.
+        evict(): Removes expired entries and the least recently used ones until the size limit is met.
+        clear(): Removes all the entries.
+        total_bytes(): Returns the total size of the stored values.
+    """
+
+    def __init__(self, path:str, table:str, max_bytes:int):
+        """
+        Initializes the SqliteCache, creating the file and table if needed.
+
+        Args:
+            path (str): Path of the SQLite file.
+            table (str): Table used by this cache. Only letters, numbers and underscores.
+            max_bytes (int): Maximum total size of the stored values.
+        """
+        if not table.replace("_", "").isalnum():
+            raise ValueError(f"Invalid table name: {table}")
+
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                expires_at REAL
+            )
+        """)
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table}(last_access)")
+        self.size = self.total_bytes()
+
+    def get(self, key:str) -> bytes|None:
+        """
+        Returns the value of a key and marks it as recently used.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            bytes|None: The stored value, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return None
+            self.connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key:str, value:bytes, ttl:float = None) -> None:
+        """
+        Stores the value of a key, replacing the previous one, and evicts entries if the estimated size goes over the limit.
+
+        Args:
+            key (str): Cache key.
+            value (bytes): Value to store.
+            ttl (float, optional): Seconds until the entry expires. Never expires if None.
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self.lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, expires_at)
+            )
+            self.size += len(value)
+            full = self.size > self.max_bytes
+        if full:
+            self.evict()
+
+    def delete(self, key:str) -> None:
+        """
+        Removes a key from the cache.
+
+        Args:
+            key (str): Cache key.
+        """
+        with self.lock:
+            self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def evict(self) -> int:
+        """
+        Removes expired entries, and then the least recently used entries until the total size is under the limit. The size
+        estimate is reset to the remaining total size.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self.lock:
+            removed = self.connection.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)).rowcount
+            total = self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total <= self.max_bytes:
+                self.size = total
+                return removed
+
+            #Find the most recently used entries that fit in the limit and remove the rest
+            to_remove = []
+            for key, size in self.connection.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC"):
+                if total <= self.max_bytes:
+                    break
+                to_remove.append((key,))
+                total -= size
+            self.connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", to_remove)
+            self.size = total
+            return removed + len(to_remove)
+
+    def clear(self) -> None:
+        """
+        Removes all the entries of the cache.
+        """
+        with self.lock:
+            self.connection.execute(f"DELETE FROM {self.table}")
+            self.size = 0
+
+    def total_bytes(self) -> int:
+        """
+        Returns the total size of the stored values.
+
+        Returns:
+            int: Size in bytes.
+        """
+        with self.lock:
+            return self.connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
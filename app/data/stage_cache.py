@@ -0,0 +1,83 @@
+import hashlib
+import json
+from typing import Any
+from config.config import STAGE_CACHE_PATH, STAGE_CACHE_TTL_SEC, STAGE_CACHE_MAX_BYTES
+from data.sqlite_cache import SqliteCache
+
+class StageCache:
+    """
+    Persistent cache of the intermediate results of the pipeline stages, so different questions can reuse them.
+
+    Results are stored as JSON in a SqliteCache, keyed by the stage name and the hash of the stage inputs (e.g. the entity
+    labels and embeddings of a similarity search, or the Cypher query whose context is parsed). Entries expire after a time
+    to live and the least recently used ones are evicted when the size limit is reached.
+
+    Attributes:
+        store (SqliteCache): Storage of the results.
+        ttl (float): Seconds a result is kept.
+        hits (dict): Number of cache hits of each stage in this process.
+        misses (dict): Number of cache misses of each stage in this process.
+
+    Methods:
+        make_key(): Builds the cache key of a stage input.
+        get(): Returns the cached result of a stage input or None.
+        set(): Stores the result of a stage input.
+    """
+
+    def __init__(self, path:str = STAGE_CACHE_PATH, ttl:float = STAGE_CACHE_TTL_SEC, max_bytes:int = STAGE_CACHE_MAX_BYTES):
+        """
+        Initializes the StageCache.
+
+        Args:
+            path (str): Path of the SQLite file.
+            ttl (float): Seconds a result is kept.
+            max_bytes (int): Maximum total size of the stored results.
+        """
+        self.store = SqliteCache(path, "stage_results", max_bytes)
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+
+    def make_key(self, stage:str, key:Any) -> str:
+        """
+        Builds the cache key of a stage input.
+
+        Args:
+            stage (str): Name of the stage.
+            key (Any): JSON serializable input of the stage.
+
+        Returns:
+            str: Cache key.
+        """
+        key_hash = hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return f"{stage}:{key_hash}"
+
+    def get(self, stage:str, key:Any) -> Any|None:
+        """
+        Returns the cached result of a stage input.
+
+        Args:
+            stage (str): Name of the stage.
+            key (Any): JSON serializable input of the stage.
+
+        Returns:
+            Any|None: The result, or None if it is not cached.
+        """
+        value = self.store.get(self.make_key(stage, key))
+        if value is None:
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+        self.hits[stage] = self.hits.get(stage, 0) + 1
+        return json.loads(value)["result"]
+
+    def set(self, stage:str, key:Any, result:Any) -> None:
+        """
+        Stores the result of a stage input.
+
+        Args:
+            stage (str): Name of the stage.
+            key (Any): JSON serializable input of the stage.
+            result (Any): JSON serializable result.
+        """
+        value = json.dumps({"result": result}, ensure_ascii=False).encode("utf-8")
+        self.store.set(self.make_key(stage, key), value, ttl=self.ttl)
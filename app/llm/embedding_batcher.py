@@ -0,0 +1,123 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+from llm.latency_budget import LatencyBudget
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into multi-input requests.
+
+    Texts submitted within the batching window, or until the size cap is reached, are sent together in one
+    request. Each caller waits on its own future, which is resolved with the vector of its text. The batcher can be shared by
+    callers in several event loops, the batches of each loop are kept apart because their futures belong to it.
+
+    Attributes:
+        embed_chunk (Callable): Coroutine function that embeds a list of unique texts (chunk, model, task_name, log_extra)
+            and returns a mapping from text to vector and a mapping from text to cost.
+        window_ms (float): Milliseconds to wait for more texts after the first one of a batch.
+        max_size (int): Maximum number of texts in a batch. A full batch is sent without waiting.
+        pending (dict): Texts waiting to be sent, by (event loop, model, task_name).
+        timers (dict): Scheduled sends, by (event loop, model, task_name).
+        tasks (set): Running sends.
+
+    Methods:
+        submit(): Adds a text to the next batch and waits for its vector.
+        flush(): Sends the pending texts of a batch.
+        send(): Embeds a batch and resolves the futures of its callers.
+    """
+
+    def __init__(self, embed_chunk:Callable[..., Awaitable[tuple[dict, dict]]], window_ms:float, max_size:int):
+        """
+        Initializes the EmbeddingBatcher.
+
+        Args:
+            embed_chunk (Callable): Coroutine function that embeds a list of unique texts.
+            window_ms (float): Milliseconds to wait for more texts after the first one of a batch.
+            max_size (int): Maximum number of texts in a batch.
+        """
+        self.embed_chunk = embed_chunk
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self.pending = {}
+        self.timers = {}
+        self.tasks = set()
+
+    async def submit(self, model:str, text:str, task_name:str = None)->tuple[list[float], float]:
+        """
+        Adds a text to the next batch of its model and task, and waits until it is embedded.
+
+        Args:
+            model (str): The embedding model to use.
+            text (str): The input text to embed.
+            task_name (str, optional): Logging task name.
+
+        Returns:
+            tuple[list[float], float]: The embedding vector and its share of the batch cost.
+        """
+        loop = asyncio.get_running_loop()
+        key = (loop, model, task_name)
+        future = loop.create_future()
+        self.pending.setdefault(key, []).append((text, future, time.time()))
+
+        if len(self.pending[key]) >= self.max_size:
+            self.flush(key)
+        elif key not in self.timers:
+            self.timers[key] = loop.call_later(self.window_ms / 1000, self.flush, key)
+
+        return await future
+
+    def flush(self, key:tuple[str, str]) -> None:
+        """
+        Sends the pending texts of a batch in a new task of its event loop.
+
+        Args:
+            key (tuple): Event loop, model and task name of the batch.
+        """
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self.pending.pop(key, [])
+        if not items:
+            return
+
+        task = key[0].create_task(self.send(key, items))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def send(self, key:tuple[str, str], items:list[tuple]) -> None:
+        """
+        Embeds the unique texts of a batch and resolves the future of each caller. The cost of a text is split between the callers
+        still waiting for it, so the cost of the batch is charged in full. If the send is cancelled, the futures of its callers are cancelled too, so none of them waits forever.
+
+        Args:
+            key (tuple): Event loop, model and task name of the batch.
+            items (list[tuple]): Text, future and submit time of each caller.
+        """
+        #The batch is shared by the callers of several questions, each one waits for it within its own latency budget
+        LatencyBudget.current_budget.set(None)
+        _, model, task_name = key
+        chunk = list(dict.fromkeys(text for text, _, _ in items))
+        log_extra = {
+            "batch_window_ms": self.window_ms,
+            "batch_max_size": self.max_size,
+            "batch_callers": len(items),
+            "batch_wait_sec": time.time() - min(submitted for _, _, submitted in items)
+        }
+        try:
+            embeddings, costs = await self.embed_chunk(chunk, model, task_name, log_extra)
+            #Callers that stopped waiting are not charged, the cost of each text is split between the ones still waiting for it
+            waiting = {}
+            for text, future, _ in items:
+                if not future.done():
+                    waiting.setdefault(text, []).append(future)
+            for text, futures in waiting.items():
+                for future in futures:
+                    future.set_result((embeddings[text], costs[text] / len(futures)))
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for _, future, _ in items:
+                if not future.done():
+                    future.cancel()
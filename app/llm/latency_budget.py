@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+class LatencyBudget:
+    """
+    End-to-end latency budget of a question.
+
+    The budget of the question being answered is kept in a context variable, so every stage and LLM call of the question can read
+    the remaining time, including the tasks it starts. The stages record the degradations they apply when the remaining time is
+    low (e.g. skipping a step or using a faster model), and they are logged with the question.
+
+    Attributes:
+        current_budget (ContextVar): Budget of the current context. None if the question has no deadline.
+        deadline_sec (float): Total seconds of the budget.
+        start (float): Monotonic time when the budget started.
+        degradations (list[dict]): Degradations applied, with their name, remaining time and details.
+
+    Methods:
+        remaining(): Returns the seconds left.
+        expired(): Returns whether the deadline passed.
+        degrade(): Records a degradation.
+        start_budget(): Context manager that sets the budget of the current context.
+        get_current(): Returns the budget of the current context.
+        cap_timeout(): Reduces a timeout to the remaining time of the current budget.
+    """
+
+    current_budget = ContextVar("latency_budget", default=None)
+
+    def __init__(self, deadline_sec:float):
+        """
+        Initializes the LatencyBudget, starting to count from now.
+
+        Args:
+            deadline_sec (float): Total seconds of the budget.
+        """
+        self.deadline_sec = deadline_sec
+        self.start = time.monotonic()
+        self.degradations = []
+
+    def remaining(self) -> float:
+        """
+        Returns the seconds left, negative once the deadline passed.
+        """
+        return self.deadline_sec - (time.monotonic() - self.start)
+
+    def expired(self) -> bool:
+        """
+        Returns whether the deadline passed.
+        """
+        return self.remaining() <= 0
+
+    def degrade(self, name:str, **details) -> None:
+        """
+        Records a degradation.
+
+        Args:
+            name (str): Name of the degradation (e.g. "skip_retry").
+            **details: Details of the degradation.
+        """
+        self.degradations.append({"name": name, "remaining_sec": round(self.remaining(), 3), **details})
+
+    @classmethod
+    @contextmanager
+    def start_budget(cls, deadline_sec:float = None) -> Iterator["LatencyBudget|None"]:
+        """
+        Sets the budget of the current context while the question runs.
+
+        Args:
+            deadline_sec (float, optional): Total seconds of the budget. None or 0 for no deadline.
+
+        Yields:
+            LatencyBudget|None: The budget, or None without deadline.
+        """
+        budget = cls(deadline_sec) if deadline_sec else None
+        token = cls.current_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            try:
+                cls.current_budget.reset(token)
+            except ValueError:
+                cls.current_budget.set(None) #Exited in another context, e.g. a stream closed by another task
+
+    @classmethod
+    def get_current(cls) -> "LatencyBudget|None":
+        """
+        Returns the budget of the current context.
+
+        Returns:
+            LatencyBudget|None: The budget, or None if the question has no deadline.
+        """
+        return cls.current_budget.get()
+
+    @classmethod
+    def cap_timeout(cls, timeout:float) -> float:
+        """
+        Reduces a timeout to the remaining time of the current budget.
+
+        Args:
+            timeout (float): Timeout in seconds.
+
+        Returns:
+            float: The timeout, or the remaining time if it is shorter. Never negative.
+        """
+        budget = cls.get_current()
+        return timeout if budget is None else max(min(timeout, budget.remaining()), 0.0)
@@ -0,0 +1,61 @@
+import threading
+from collections import deque
+import numpy as np
+from typing import Hashable
+from config.config import LLM_LATENCY_WINDOW, LLM_HEDGE_MIN_SAMPLES
+
+class LatencyTracker:
+    """
+    Keeps the most recent latencies of each key (e.g. a task and model) to calculate their percentiles.
+
+    Attributes:
+        window (int): Number of recent latencies kept per task.
+        min_samples (int): Minimum number of latencies needed to calculate a percentile.
+        latencies (dict): Recent latencies of each task.
+        lock (threading.Lock): Serializes the updates between threads.
+
+    Methods:
+        record(): Adds the latency of a call.
+        percentile(): Returns a latency percentile of a task.
+    """
+
+    def __init__(self, window:int = LLM_LATENCY_WINDOW, min_samples:int = LLM_HEDGE_MIN_SAMPLES):
+        """
+        Initializes the LatencyTracker.
+
+        Args:
+            window (int): Number of recent latencies kept per task.
+            min_samples (int): Minimum number of latencies needed to calculate a percentile.
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def record(self, task_name:Hashable, seconds:float) -> None:
+        """
+        Adds the latency of a call, discarding the oldest one if the window is full.
+
+        Args:
+            task_name (Hashable): Task of the call, or task and model.
+            seconds (float): Latency of the call.
+        """
+        with self.lock:
+            self.latencies.setdefault(task_name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, task_name:Hashable, q:float) -> float|None:
+        """
+        Returns a latency percentile of a task.
+
+        Args:
+            task_name (Hashable): Task name, or task and model.
+            q (float): Percentile between 0 and 1 (e.g. 0.95).
+
+        Returns:
+            float|None: The percentile in seconds, or None if there are not enough latencies yet.
+        """
+        with self.lock:
+            latencies = list(self.latencies.get(task_name, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return float(np.quantile(latencies, q))
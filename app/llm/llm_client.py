@@ -1,12 +1,31 @@
-from openai import AsyncOpenAI, AuthenticationError
-from config.config import OPENAI_API_KEY
+from openai import AsyncOpenAI, AuthenticationError, DefaultAsyncHttpxClient
+from config.config import OPENAI_API_KEY, EMBEDDING_CACHE_PATH, LLM_CACHE_PATH, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX_SIZE, LLM_MAX_RETRIES, LLM_RETRY_BASE_SEC, LLM_RETRY_MAX_SEC, \
+    LLM_TIMEOUT_SEC, LLM_DEFAULT_TIMEOUT_SEC, LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC, LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE, \
+    LLM_HTTP_KEEPALIVE_EXPIRY_SEC, LLM_HTTP2, LLM_HTTP_WARMUP_CONNECTIONS
 import openai
+import httpx
 import tiktoken
+import asyncio
+import hashlib
+import random
+import threading
+import weakref
+from typing import Any, Awaitable, Callable
 from datetime import datetime
 import time
 from models.entity import EntityList
 from models.question import Question
+from models.question_analysis import QuestionAnalysis
 from logs.logger import Logger
+from logs.tracer import Tracer
+from llm.llm_stream import LlmStream
+from data.embedding_cache import EmbeddingCache
+from data.llm_response_cache import LlmResponseCache
+from llm.embedding_batcher import EmbeddingBatcher
+from llm.rate_limiter import RateLimiter
+from llm.latency_tracker import LatencyTracker
+from llm.tracked_transport import TrackedTransport
+from llm.latency_budget import LatencyBudget
 
 
 class LlmClient:
@@ -17,27 +36,59 @@ class LlmClient:
     generate embeddings, calculate costs, and truncate prompts.
 
     Attributes:
-        client (AsyncOpenAI): Asynchronous OpenAI API client instance.
+        client (AsyncOpenAI): Asynchronous OpenAI API client of the running event loop, with the tuned connection pool.
         logger (Logger): Logger instance for logging API usage and errors.
+        embedding_cache (EmbeddingCache): Persistent cache of embeddings. None if it is disabled.
+        response_cache (LlmResponseCache): Persistent cache of structured LLM responses. None if it is disabled.
+        embedding_batcher (EmbeddingBatcher): Coalesces concurrent get_embedding() calls into multi-input requests. Shared by all instances of the process, None if it is disabled.
+        shared_batcher (EmbeddingBatcher): Embedding batcher shared by the process, created by get_embedding_batcher().
+        shared_batcher_lock (threading.Lock): Serializes the creation of the shared batcher.
         MODEL_INFO (dict): Pricing and limits for each model.
         RESPONSE_FORMAT (dict): Mapping of response format keys to data model classes.
+        RETRYABLE_ERRORS (tuple): OpenAI errors that are retried.
+        rate_limiter (RateLimiter): Limits the requests and tokens per minute of each model. Shared by all instances of the process.
+        latency_tracker (LatencyTracker): Recent latencies of each task and model, used to decide when to hedge a call. Shared by all instances of the process.
+        clients (WeakKeyDictionary): OpenAI client of each event loop. Shared by all instances of the process.
+        closing (set): Tasks closing the clients of the event loops that were closed.
 
     Methods:
+        get_embedding_batcher(): Returns the embedding batcher shared by the process.
+        get_client(): Returns the OpenAI client of the running event loop, creating it the first time.
+        close_client(): Closes a client and its connections.
+        warm_up(): Opens pooled connections to the API before the first calls.
         call_llm(): Calls an OpenAI model with an user and system prompt, logs the interaction and does not expect a structured output.
-        call_llm_structured(): Calls an OpenAI model with an user and system prompt, logs the interaction and expects a structured output.
-        get_embedding(): Calls the embedding endpoint to embed a text.
+        call_llm_stream(): Calls an OpenAI model like call_llm(), but returns a stream of the response's text deltas. The interaction is logged when the stream is completed.
+        call_llm_structured(): Calls an OpenAI model with an user and system prompt, logs the interaction and expects a structured output. Responses are cached.
+        get_embedding(): Calls the embedding endpoint to embed a text, or returns the cached vector. Concurrent calls are batched.
+        get_embeddings(): Embeds several texts with one request per chunk of inputs.
+        embed_chunk(): Sends one embeddings request with several inputs.
+        log_embedding(): Logs an embedding request.
         calculate_token_cost(): Calculates the total cost for the used tokens based on the model's price.
+        get_usage_tokens(): Returns the input, output and cached tokens reported by a response.
+        get_cached_tokens(): Returns the input tokens of a response that were served from the prompt prefix cache.
         truncate_prompt(): Shortens the user prompt if it exceeds the limit of the model it is going to be used on.
+        truncate_prompt_async(): Same as truncate_prompt() but tokenizes large prompts in a worker thread.
+        get_encoding(): Returns a cached tiktoken encoding.
+        count_static_tokens(): Returns the cached token count of a static text (e.g. a system prompt).
+        get_max_input_tokens(): Calculates the maximum user prompt tokens allowed for a model and system prompt.
+        estimate_tokens(): Estimates the input tokens of a call for the rate limiter.
+        send_request(): Sends a request through the rate limiter, retrying rate limit and transient errors.
+        send_hedged(): Sends a request with the deadline of its task, duplicating it if it is slower than usual.
+        get_timeout(): Returns the deadline of a call, capped by the question's latency budget.
+        close_losing_response(): Closes the response of a hedged request that lost.
+        get_hedge_cost(): Returns the extra cost of a duplicated request.
+        get_retry_delay(): Calculates the wait before a retry from the Retry-After header or a jittered backoff.
     """
 
     #Set API key
     openai.api_key = OPENAI_API_KEY
 
     #April 2025 pricing(US$) per 1,000 tokens for each model, encoding type and token usage limits. Max_content is the maximun tokens the model can use per call(input/output). Max_output is for the maximum token output allowed per call.
+    #Cached_input_price is the discounted price of the input tokens served from OpenAI's prompt prefix cache.
     MODEL_INFO = {
-        "gpt-4.1-mini": {"input_price": 0.0004, "output_price": 0.0016, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
-        "gpt-4.1-nano": {"input_price": 0.0001, "output_price": 0.0004, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
-        "gpt-4.1": {"input_price": 0.002, "output_price": 0.008, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
+        "gpt-4.1-mini": {"input_price": 0.0004, "cached_input_price": 0.0001, "output_price": 0.0016, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
+        "gpt-4.1-nano": {"input_price": 0.0001, "cached_input_price": 0.000025, "output_price": 0.0004, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
+        "gpt-4.1": {"input_price": 0.002, "cached_input_price": 0.0005, "output_price": 0.008, "max_context": 1047576, "max_output":32768, "encoding":"o200k_base"},
         "text-embedding-3-small": 0.00002,
         "text-embedding-3-large": 0.00013
     }
@@ -45,17 +96,141 @@ class LlmClient:
     #Mapping from response format name to data model class
     RESPONSE_FORMAT = {
         "entitylist": EntityList,
-        "question": Question
+        "question": Question,
+        "questionanalysis": QuestionAnalysis
     }
 
+    #Encoding of the embedding models, used to split the cost of a batch between its inputs
+    EMBEDDING_ENCODING = "cl100k_base"
+
+    #A token is at least one UTF-8 byte and a character is at most four, so len(prompt) * 4 is an upper bound of its token count
+    MAX_BYTES_PER_CHAR = 4
+
+    #Average characters per token of English text, used to estimate the tokens of a call without encoding it
+    CHARS_PER_TOKEN = 4
+
+    #Encodings and static text token counts shared by all instances of the process. The counts are keyed by the hash of the
+    #text and only the most recently used ones are kept
+    _encodings = {}
+    _static_token_counts = {}
+    STATIC_TOKEN_COUNTS_MAX = 256
+
+    #Rate limits apply to the whole API key, so the limiter is shared by all instances of the process
+    rate_limiter = RateLimiter()
+    latency_tracker = LatencyTracker()
+
+    #Concurrent embeddings of all the sessions are batched together, so the batcher is shared by all instances of the process
+    shared_batcher = None
+    shared_batcher_lock = threading.Lock()
+
+    #Connections are bound to the event loop that opened them, so each loop has its own client and connection pool, shared by all
+    #instances of the process. The GUI runs all its questions in one background loop, the clients of closed loops are closed
+    clients = weakref.WeakKeyDictionary()
+    closing = set()
+
+    #Errors worth retrying: rate limits, timeouts, connection errors and 5xx responses
+    RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
     def __init__(self):
         """
-        Initializes the LlmClient with a AsyncOpenAI instance for communicating with the OpenAI client and a Logger instance for logging data.
+        Initializes the LlmClient with a Logger instance for logging data, the persistent embedding and structured response caches,
+        and the embedding request batcher. The AsyncOpenAI client is created by get_client() for each event loop.
         """
-        self.client = AsyncOpenAI()
         self.logger = Logger()
+        self.embedding_cache = EmbeddingCache() if EMBEDDING_CACHE_PATH else None
+        self.response_cache = LlmResponseCache() if LLM_CACHE_PATH else None
+        self.embedding_batcher = self.get_embedding_batcher() if EMBEDDING_BATCH_WINDOW_MS > 0 else None
+
+    def get_embedding_batcher(self) -> EmbeddingBatcher:
+        """
+        Returns the embedding batcher shared by the process, creating it the first time. Its batches are sent with the embed_chunk()
+        of the instance that created it, all the instances use the same client and caches.
+
+        Returns:
+            EmbeddingBatcher: The shared batcher.
+        """
+        with LlmClient.shared_batcher_lock:
+            if LlmClient.shared_batcher is None:
+                LlmClient.shared_batcher = EmbeddingBatcher(self.embed_chunk, EMBEDDING_BATCH_WINDOW_MS, EMBEDDING_BATCH_MAX_SIZE)
+            return LlmClient.shared_batcher
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """
+        OpenAI client of the running event loop.
+        """
+        return self.get_client()
+
+    def get_client(self) -> AsyncOpenAI:
+        """
+        Returns the OpenAI client of the running event loop, creating it the first time. Its connection pool keeps up to
+        LLM_HTTP_MAX_KEEPALIVE idle connections alive for LLM_HTTP_KEEPALIVE_EXPIRY_SEC, and uses HTTP/2 if LLM_HTTP2 is enabled.
+        Retries are done by send_request(), so the ones of the OpenAI client are disabled. The clients of the loops that were
+        closed are removed and closed in the running loop.
+
+        Returns:
+            AsyncOpenAI: The OpenAI client.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None #Outside of a loop the client cannot send requests, so it is not shared
+
+        client = self.clients.get(loop) if loop is not None else None
+        if client is None:
+            if loop is not None:
+                for closed_loop in [other for other in list(self.clients.keys()) if other.is_closed()]:
+                    task = loop.create_task(self.close_client(self.clients.pop(closed_loop)))
+                    self.closing.add(task)
+                    task.add_done_callback(self.closing.discard)
+            limits = httpx.Limits(max_connections=LLM_HTTP_MAX_CONNECTIONS, max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE, keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY_SEC)
+            transport = TrackedTransport(httpx.AsyncHTTPTransport(limits=limits, http2=LLM_HTTP2))
+            client = AsyncOpenAI(max_retries=0, http_client=DefaultAsyncHttpxClient(transport=transport))
+            if loop is not None:
+                self.clients[loop] = client
+        return client
+
+    @staticmethod
+    async def close_client(client:AsyncOpenAI) -> None:
+        """
+        Closes a client and its pooled connections. The connections opened by a loop that was closed may fail to close
+        gracefully, their errors are ignored and their sockets are released.
+
+        Args:
+            client (AsyncOpenAI): The client to close.
+        """
+        try:
+            await client.close()
+        except Exception:
+            pass
 
-    async def call_llm(self, user_prompt:str, system_prompt:str, model:str="gpt-4.1", temperature:float=0.7, task_name:str = None)->tuple[str, float]:
+    async def warm_up(self, connections:int = LLM_HTTP_WARMUP_CONNECTIONS) -> float:
+        """
+        Opens pooled connections to the API with concurrent model list requests, which have no token cost, so the first
+        calls do not wait for the TCP and TLS handshakes. Errors are logged and ignored.
+
+        Args:
+            connections (int): Number of connections to open.
+
+        Returns:
+            float: Duration of the warm-up in seconds.
+        """
+        start_time = time.time()
+        if connections <= 0:
+            return 0.0
+        client = self.get_client()
+        results = await asyncio.gather(*(client.models.list() for _ in range(connections)), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            self.logger.log_error("LlmWarmupError", {
+                "connections": connections,
+                "failed": len(errors),
+                "error": str(errors[0]),
+            })
+        return time.time() - start_time
+
+    @Tracer.traced()
+    async def call_llm(self, user_prompt:str, system_prompt:str, model:str="gpt-4.1", temperature:float=0.7, task_name:str = None, log_extra:dict = None)->tuple[str, float]:
         """
         Calls an OpenAI LLM.
 
@@ -65,6 +240,7 @@ class LlmClient:
             model (str): OpenAI model name.
             temperature (float): Sampling temperature.
             task_name (str, optional): Logging task name.
+            log_extra (dict, optional): Additional task data added to the log entry.
 
         Returns:
             tuple[str, float]: The generated response and the cost.
@@ -77,25 +253,27 @@ class LlmClient:
             raise ValueError(f"Temperatura is out of bounds (0-2): {temperature}")
         
         #Calculate max allowed input tokens
-        max_tokens= self.MODEL_INFO[model]["max_context"] - self.MODEL_INFO[model]["max_output"]
-        truncated_prompt, truncated = self.truncate_prompt(user_prompt, self.MODEL_INFO[model]["encoding"], max_tokens)
+        max_tokens = self.get_max_input_tokens(model, system_prompt)
+        truncated_prompt, truncated = await self.truncate_prompt_async(user_prompt, self.MODEL_INFO[model]["encoding"], max_tokens)
 
+        estimated_tokens = self.estimate_tokens(model, system_prompt, truncated_prompt)
         try:
-            response = await self.client.responses.create(
+            response, request_stats = await self.send_hedged(model, estimated_tokens, lambda: self.client.responses.create(
                 model=model,
                 input=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": truncated_prompt}
                 ],
                 temperature=temperature,
-            )
+            ), task_name)
         except AuthenticationError as e:
             raise RuntimeError("The API key is invalid or it was not configured.") from e
 
-        input_tokens = response.usage.input_tokens
-        output_tokens = response.usage.output_tokens
+        input_tokens, output_tokens, cached_tokens = self.get_usage_tokens(response.usage)
+        self.rate_limiter.record_usage(model, estimated_tokens, input_tokens + output_tokens)
 
-        cost = self.calculate_token_cost(model,input_tokens, output_tokens)
+        hedge_cost = self.get_hedge_cost(model, input_tokens, request_stats)
+        cost = self.calculate_token_cost(model,input_tokens, output_tokens, cached_tokens=cached_tokens) + hedge_cost
         duration_sec = time.time() - start_time
 
         #Log LLM call data
@@ -111,16 +289,103 @@ class LlmClient:
             "temperature": temperature,
             "tokens": {
                 "input": input_tokens,
+                "cached": cached_tokens,
                 "output": output_tokens
             },
+            "prefix_cache_hit_ratio": cached_tokens / input_tokens,
             "cost": cost,
-            "log_duration_sec": duration_sec
+            "hedge_extra_cost": hedge_cost,
+            **request_stats,
+            "api_latency_sec": duration_sec - request_stats["queue_wait_sec"] - request_stats["retry_wait_sec"],
+            "log_duration_sec": duration_sec,
+            **(log_extra or {})
         })
         return response.output_text, cost
 
-    async def call_llm_structured(self, user_prompt: str, system_prompt:str, text_format:str, model:str ="gpt-4.1", temperature:float=0.7, task_name:str = None)->tuple[Question|EntityList, float]:
+    @Tracer.traced()
+    async def call_llm_stream(self, user_prompt:str, system_prompt:str, model:str="gpt-4.1", temperature:float=0.7, task_name:str = None, log_extra:dict = None)->LlmStream:
         """
-        Calls an OpenAI LLM with structured output parsing.
+        Calls an OpenAI LLM in streaming mode. The stream is opened with send_hedged(), and it must send its first event within
+        LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC and be completed within the deadline of the task, both capped by the question's latency budget.
+
+        Args:
+            user_prompt (str): The user's prompt text.
+            system_prompt (str): System-level prompt instructions.
+            model (str): OpenAI model name.
+            temperature (float): Sampling temperature.
+            task_name (str, optional): Logging task name.
+            log_extra (dict, optional): Additional task data added to the log entry.
+
+        Returns:
+            LlmStream: Asynchronous iterator of text deltas. Its cost is available once it is consumed.
+        """
+        start_time = time.time()
+        if model not in self.MODEL_INFO:
+            raise ValueError(f"Unknown model: {model}")
+        
+        if temperature < 0.0 or temperature > 2.0:
+            raise ValueError(f"Temperatura is out of bounds (0-2): {temperature}")
+        
+        #Calculate max allowed input tokens
+        max_tokens = self.get_max_input_tokens(model, system_prompt)
+        truncated_prompt, truncated = await self.truncate_prompt_async(user_prompt, self.MODEL_INFO[model]["encoding"], max_tokens)
+
+        estimated_tokens = self.estimate_tokens(model, system_prompt, truncated_prompt)
+        start = time.monotonic()
+        timeout = self.get_timeout(task_name)
+        try:
+            events, request_stats = await self.send_hedged(model, estimated_tokens, lambda: self.client.responses.create(
+                model=model,
+                input=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": truncated_prompt}
+                ],
+                temperature=temperature,
+                stream=True
+            ), task_name, stream=True)
+        except AuthenticationError as e:
+            raise RuntimeError("The API key is invalid or it was not configured.") from e
+
+        def on_complete(stream:LlmStream, response)->float:
+            input_tokens, output_tokens, cached_tokens = self.get_usage_tokens(response.usage)
+            self.rate_limiter.record_usage(model, estimated_tokens, input_tokens + output_tokens)
+            hedge_cost = self.get_hedge_cost(model, input_tokens, request_stats)
+            cost = self.calculate_token_cost(model,input_tokens, output_tokens, cached_tokens=cached_tokens) + hedge_cost
+
+            #Log LLM call data
+            self.logger.log_data({
+                "timestamp": datetime.now().isoformat(),
+                "log_type": "llm_call",
+                "task_name": task_name,
+                "model": model,
+                "system_prompt": system_prompt,
+                "user_prompt": truncated_prompt,
+                "response": stream.text,
+                "truncated": truncated,
+                "temperature": temperature,
+                "tokens": {
+                    "input": input_tokens,
+                    "cached": cached_tokens,
+                    "output": output_tokens
+                },
+                "prefix_cache_hit_ratio": cached_tokens / input_tokens,
+                "cost": cost,
+                "hedge_extra_cost": hedge_cost,
+                "streamed": True,
+                "time_to_first_token_sec": stream.time_to_first_token_sec,
+                **request_stats,
+                "api_latency_sec": stream.duration_sec - request_stats["queue_wait_sec"] - request_stats["retry_wait_sec"],
+                "log_duration_sec": stream.duration_sec,
+                **(log_extra or {})
+            })
+            return cost
+
+        return LlmStream(events, start_time, on_complete, deadline=start + timeout, first_event_deadline=start + min(timeout, LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC))
+
+    @Tracer.traced()
+    async def call_llm_structured(self, user_prompt: str, system_prompt:str, text_format:str, model:str ="gpt-4.1", temperature:float=0.7, task_name:str = None, log_extra:dict = None)->tuple[Question|EntityList|QuestionAnalysis, float]:
+        """
+        Calls an OpenAI LLM with structured output parsing. Responses of identical calls are reused from the response cache at no cost.
 
         Args:
             user_prompt (str): The user's input text.
@@ -129,9 +394,10 @@ class LlmClient:
             model (str): OpenAI model name.
             temperature (float): Sampling temperature.
             task_name (str, optional): Logging task name.
+            log_extra (dict, optional): Additional task data added to the log entry.
 
         Returns:
-            tuple[Question|EntityList, float]: Structured model response and its cost.
+            tuple[Question|EntityList|QuestionAnalysis, float]: Structured model response and its cost.
         """
         start_time = time.time()
         if model not in self.MODEL_INFO:
@@ -143,12 +409,38 @@ class LlmClient:
         if text_format not in self.RESPONSE_FORMAT:
             raise ValueError(f"Unknown output format: {text_format}")
 
+        #Reuse the response of an identical call if there is one
+        if self.response_cache is not None:
+            cached = await asyncio.to_thread(self.response_cache.get, model, system_prompt, user_prompt, temperature, text_format)
+            if cached is not None:
+                self.logger.log_data({
+                    "timestamp": datetime.now().isoformat(),
+                    "log_type": "llm_call",
+                    "task_name": task_name,
+                    "model": model,
+                    "system_prompt": system_prompt,
+                    "user_prompt": user_prompt,
+                    "response": cached,
+                    "truncated": False,
+                    "temperature": temperature,
+                    "tokens": {
+                        "input": 0,
+                        "output": 0
+                    },
+                    "cost": 0.0,
+                    "cache_hit": True,
+                    "log_duration_sec": time.time() - start_time,
+                    **(log_extra or {})
+                })
+                return self.RESPONSE_FORMAT[text_format].model_validate_json(cached), 0.0
+
         #Calculate max allowed input tokens
-        max_tokens= self.MODEL_INFO[model]["max_context"] - self.MODEL_INFO[model]["max_output"]
-        truncated_prompt, truncated = self.truncate_prompt(user_prompt, self.MODEL_INFO[model]["encoding"], max_tokens)
+        max_tokens = self.get_max_input_tokens(model, system_prompt)
+        truncated_prompt, truncated = await self.truncate_prompt_async(user_prompt, self.MODEL_INFO[model]["encoding"], max_tokens)
 
+        estimated_tokens = self.estimate_tokens(model, system_prompt, truncated_prompt)
         try:
-            response = await self.client.responses.parse(
+            response, request_stats = await self.send_hedged(model, estimated_tokens, lambda: self.client.responses.parse(
                 model=model,
                 input=[
                     {"role": "system", "content": system_prompt},
@@ -156,13 +448,18 @@ class LlmClient:
                 ],
                 temperature=temperature,
                 text_format=self.RESPONSE_FORMAT[text_format]
-            )
+            ), task_name)
         except AuthenticationError as e:
             raise RuntimeError("The API key is invalid or it was not configured.") from e
 
-        input_tokens = response.usage.input_tokens
-        output_tokens = response.usage.output_tokens
-        cost = self.calculate_token_cost(model,input_tokens, output_tokens)
+        input_tokens, output_tokens, cached_tokens = self.get_usage_tokens(response.usage)
+        self.rate_limiter.record_usage(model, estimated_tokens, input_tokens + output_tokens)
+        hedge_cost = self.get_hedge_cost(model, input_tokens, request_stats)
+        cost = self.calculate_token_cost(model,input_tokens, output_tokens, cached_tokens=cached_tokens) + hedge_cost
+        response_json = response.output_parsed.model_dump_json()
+
+        if self.response_cache is not None:
+            await asyncio.to_thread(self.response_cache.set, model, system_prompt, user_prompt, temperature, text_format, response_json)
         duration_sec = time.time() - start_time   
 
         #Log LLM call data
@@ -173,22 +470,31 @@ class LlmClient:
             "model": model,
             "system_prompt": system_prompt,
             "user_prompt": truncated_prompt,
-            "response": response.output_parsed.json(),
+            "response": response_json,
             "truncated": truncated,
             "temperature": temperature,
             "tokens": {
                 "input": input_tokens,
+                "cached": cached_tokens,
                 "output": output_tokens
             },
+            "prefix_cache_hit_ratio": cached_tokens / input_tokens,
             "cost": cost,
-            "log_duration_sec": duration_sec
+            "hedge_extra_cost": hedge_cost,
+            "cache_hit": False,
+            **request_stats,
+            "api_latency_sec": duration_sec - request_stats["queue_wait_sec"] - request_stats["retry_wait_sec"],
+            "log_duration_sec": duration_sec,
+            **(log_extra or {})
         })
         
         return response.output_parsed, cost
 
+    @Tracer.traced()
     async def get_embedding(self, text:str, model:str="text-embedding-3-large", task_name:str = None)->tuple[list[float],float]:
         """
-        Calls OpenAI's embedding endpoint to calculate the vector of the input text.
+        Calls OpenAI's embedding endpoint to calculate the vector of the input text. Vectors already in the embedding cache are reused at no cost,
+        and concurrent calls are coalesced into multi-input requests by the embedding batcher.
 
         Args:
             text (str): The input text to embed.
@@ -201,18 +507,153 @@ class LlmClient:
         start_time = time.time()
         if model not in self.MODEL_INFO:
             raise ValueError(f"Unknown model: {model}")
+
+        #Reuse the cached vector if there is one
+        if self.embedding_cache is not None:
+            embedding = await asyncio.to_thread(self.embedding_cache.get, model, text)
+            if embedding is not None:
+                self.log_embedding(task_name, model, text, 0, 0.0, time.time() - start_time, cache_hit=True)
+                return embedding, 0.0
+
+        if self.embedding_batcher is not None:
+            #The batch can be shared with other questions, each caller only waits until its own deadline
+            timeout = self.get_timeout(task_name)
+            try:
+                return await asyncio.wait_for(self.embedding_batcher.submit(model, text, task_name), timeout)
+            except TimeoutError:
+                self.logger.log_error("LlmTimeout", {"model": model, "task_name": task_name, "timeout_sec": timeout})
+                raise TimeoutError(f"The {task_name} embedding did not finish in {timeout} seconds") from None
+
+        embeddings, costs = await self.embed_chunk([text], model, task_name)
+        return embeddings[text], costs[text]
+
+    @Tracer.traced()
+    async def get_embeddings(self, texts:list[str], model:str="text-embedding-3-large", task_name:str = None)->tuple[list[list[float]], list[float]]:
+        """
+        Embeds several texts. Texts with the same embedding cache key (see EmbeddingCache.normalize()) are embedded once, cached
+        vectors are reused, and the rest are sent
+        in one request per chunk of EMBEDDING_BATCH_SIZE inputs. The cost of each request is split between its
+        inputs proportionally to their tokens.
+
+        Args:
+            texts (list[str]): The input texts to embed.
+            model (str): The embedding model to use.
+            task_name (str, optional): Logging task name.
+
+        Returns:
+            tuple[list[list[float]], list[float]]: The embedding vector and the cost of each text, in the same order as the input.
+                Repeated texts, texts with the same cache key as a previous one and cache hits cost 0.
+        """
+        if model not in self.MODEL_INFO:
+            raise ValueError(f"Unknown model: {model}")
+
+        embeddings = {}
+        costs = {}
+
+        #Deduplicate on the cache key, so texts that share a cache entry are embedded once, and look up the cache
+        keys = {text: self.embedding_cache.normalize(text) if self.embedding_cache is not None else text for text in texts}
+        unique = {}
+        for text in texts:
+            unique.setdefault(keys[text], text)
+        pending = []
+        for key, text in unique.items():
+            start_time = time.time()
+            cached = await asyncio.to_thread(self.embedding_cache.get, model, text) if self.embedding_cache is not None else None
+            if cached is not None:
+                embeddings[key] = cached
+                costs[key] = 0.0
+                self.log_embedding(task_name, model, text, 0, 0.0, time.time() - start_time, cache_hit=True)
+            else:
+                pending.append(text)
+
+        chunks = [pending[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(pending), EMBEDDING_BATCH_SIZE)]
+        for chunk_embeddings, chunk_costs in await asyncio.gather(*(self.embed_chunk(chunk, model, task_name) for chunk in chunks)):
+            for text, embedding in chunk_embeddings.items():
+                embeddings[keys[text]] = embedding
+                costs[keys[text]] = chunk_costs[text]
+
+        #Map the results back to the input order, only the first occurrence of a key is charged
+        charged = set()
+        result_costs = []
+        for text in texts:
+            result_costs.append(costs[keys[text]] if keys[text] not in charged else 0.0)
+            charged.add(keys[text])
+        return [embeddings[keys[text]] for text in texts], result_costs
+
+    @Tracer.traced()
+    async def embed_chunk(self, chunk:list[str], model:str, task_name:str, log_extra:dict = None)->tuple[dict, dict]:
+        """
+        Sends one embeddings request with several inputs, stores the vectors in the cache and logs each input.
+
+        Args:
+            chunk (list[str]): Unique texts to embed.
+            model (str): The embedding model to use.
+            task_name (str): Logging task name.
+            log_extra (dict, optional): Additional data added to the log entry of each input.
+
+        Returns:
+            tuple[dict, dict]: Mapping from text to its vector and mapping from text to its share of the cost.
+        """
+        start_time = time.time()
+
+        #Estimated tokens of each input, used by the rate limiter and to split the cost
+        if len(chunk) > 1 or self.rate_limiter.tpm_limit > 0:
+            encoding = self.get_encoding(self.EMBEDDING_ENCODING)
+            estimated_tokens = [max(len(encoding.encode(text)), 1) for text in chunk]
+        else:
+            estimated_tokens = [1]
+        estimated_total = sum(estimated_tokens)
+
+        timeout = self.get_timeout(task_name)
         try:
-            response = await self.client.embeddings.create(
+            response, request_stats = await asyncio.wait_for(self.send_request(model, estimated_total, lambda: self.client.embeddings.create(
                 model=model,
-                input=text
-            )
+                input=chunk
+            )), timeout)
         except AuthenticationError as e:
             raise RuntimeError("The API key is invalid or it was not configured.") from e
+        except TimeoutError:
+            self.logger.log_error("LlmTimeout", {"model": model, "task_name": task_name, "timeout_sec": timeout, "batch_size": len(chunk)})
+            raise TimeoutError(f"The {task_name} embeddings did not finish in {timeout} seconds") from None
         total_tokens = response.usage.total_tokens
+        self.rate_limiter.record_usage(model, estimated_total, total_tokens)
         cost = self.calculate_token_cost(model, total_tokens=total_tokens)
         duration_sec = time.time() - start_time
 
-        #Log embedding endpoint call data
+        embeddings = {}
+        costs = {}
+        #Results are matched by index, the API does not guarantee their order
+        for item in response.data:
+            text = chunk[item.index]
+            share = estimated_tokens[item.index] / estimated_total
+            embeddings[text] = item.embedding
+            costs[text] = cost * share
+
+            if self.embedding_cache is not None:
+                await asyncio.to_thread(self.embedding_cache.set, model, text, item.embedding)
+            self.log_embedding(task_name, model, text, round(total_tokens * share), costs[text], duration_sec, cache_hit=False, log_extra={
+                "batch_size": len(chunk),
+                **request_stats,
+                "api_latency_sec": duration_sec - request_stats["queue_wait_sec"] - request_stats["retry_wait_sec"],
+                **(log_extra or {})
+            })
+
+        return embeddings, costs
+
+    def log_embedding(self, task_name:str, model:str, text:str, total_tokens:int, cost:float, duration_sec:float, cache_hit:bool, log_extra:dict = None) -> None:
+        """
+        Logs an embedding request, including the embedding cache counters.
+
+        Args:
+            task_name (str): Logging task name.
+            model (str): The embedding model.
+            text (str): The embedded text.
+            total_tokens (int): Tokens used by the request. 0 for cache hits.
+            cost (float): Cost of the request. 0 for cache hits.
+            duration_sec (float): Duration of the request.
+            cache_hit (bool): If the vector came from the embedding cache.
+            log_extra (dict, optional): Additional data added to the log entry.
+        """
         self.logger.log_data({
             "timestamp": datetime.now().isoformat(),
             "log_type": "embedding",
@@ -221,19 +662,23 @@ class LlmClient:
             "input": text,
             "tokens": total_tokens,
             "cost": cost,
-            "log_duration_sec": duration_sec
+            "cache_hit": cache_hit,
+            "cache_hits": self.embedding_cache.hits if self.embedding_cache is not None else 0,
+            "cache_misses": self.embedding_cache.misses if self.embedding_cache is not None else 0,
+            "log_duration_sec": duration_sec,
+            **(log_extra or {})
         })
-        return response.data[0].embedding, cost
 
-    def calculate_token_cost(self, model:str, input_tokens:int=0, output_tokens:int=0, total_tokens:int=0) -> float:
+    def calculate_token_cost(self, model:str, input_tokens:int=0, output_tokens:int=0, total_tokens:int=0, cached_tokens:int=0) -> float:
         """
         Calculates the cost in US$ for a model call based on tokens used and model pricing.
 
         Args:
             model (str): Model name.
-            input_tokens (int): Number of input tokens.
+            input_tokens (int): Number of input tokens, including the cached ones.
             output_tokens (int): Number of output tokens.
             total_tokens (int): Used for embedding models.
+            cached_tokens (int): Input tokens served from the prompt prefix cache, charged at the cached input price.
 
         Returns:
             float: Cost in USD.
@@ -247,15 +692,101 @@ class LlmClient:
         if isinstance(pricing, float) and total_tokens > 0 and input_tokens == 0 and output_tokens == 0:
             return (total_tokens / 1000) * pricing
         #LLM model price
-        elif "input_price" in pricing and "output_price" in pricing and total_tokens == 0 and input_tokens > 0 and output_tokens > 0:
-            return (input_tokens / 1000) * pricing["input_price"] + (output_tokens / 1000) * pricing["output_price"]
+        elif "input_price" in pricing and "output_price" in pricing and total_tokens == 0 and input_tokens > 0 and output_tokens > 0 and 0 <= cached_tokens <= input_tokens:
+            return ((input_tokens - cached_tokens) / 1000) * pricing["input_price"] + (cached_tokens / 1000) * pricing["cached_input_price"] + (output_tokens / 1000) * pricing["output_price"]
         else:
             raise ValueError("Token values are incorrect.")
 
+    def get_usage_tokens(self, usage) -> tuple[int, int, int]:
+        """
+        Returns the tokens a completed response reports, so its cost can be calculated.
+
+        Args:
+            usage: Usage of a Responses API response.
+
+        Returns:
+            tuple[int, int, int]: Input, output and cached input tokens.
+
+        Raises:
+            ValueError: If the usage does not report its input or output tokens, since the cost of the call would be wrong.
+        """
+        input_tokens = getattr(usage, "input_tokens", None)
+        output_tokens = getattr(usage, "output_tokens", None)
+        if not input_tokens or not output_tokens:
+            raise ValueError(f"The response does not report its token usage: {usage}")
+        return input_tokens, output_tokens, self.get_cached_tokens(usage)
+
+    def get_cached_tokens(self, usage) -> int:
+        """
+        Returns the input tokens of a response that were served from OpenAI's prompt prefix cache.
+
+        Args:
+            usage: Usage of a Responses API response.
+
+        Returns:
+            int: Cached input tokens, 0 if the usage does not report them.
+        """
+        details = getattr(usage, "input_tokens_details", None)
+        return getattr(details, "cached_tokens", 0) or 0
+
+    def get_encoding(self, encoding_name:str) -> tiktoken.Encoding:
+        """
+        Returns the tiktoken encoding, loading it only the first time it is requested in the process.
+
+        Args:
+            encoding_name (str): Encoding name for tiktoken (e.g. o200k_base).
+
+        Returns:
+            tiktoken.Encoding: The encoding.
+        """
+        encoding = self._encodings.get(encoding_name)
+        if encoding is None:
+            encoding = tiktoken.get_encoding(encoding_name)
+            self._encodings[encoding_name] = encoding
+        return encoding
+
+    def count_static_tokens(self, text:str, encoding_name:str) -> int:
+        """
+        Counts the tokens of a static text, like a system prompt, only once per process. Must not be used with user input.
+        The counts of the STATIC_TOKEN_COUNTS_MAX most recently used texts are kept, keyed by the hash of the text.
+
+        Args:
+            text (str): Static text.
+            encoding_name (str): Encoding name for tiktoken.
+
+        Returns:
+            int: Number of tokens of the text.
+        """
+        key = (encoding_name, hashlib.sha256(text.encode("utf-8")).digest())
+        count = self._static_token_counts.pop(key, None)
+        if count is None:
+            count = len(self.get_encoding(encoding_name).encode(text))
+            if len(self._static_token_counts) >= self.STATIC_TOKEN_COUNTS_MAX:
+                self._static_token_counts.pop(next(iter(self._static_token_counts)), None)
+        #Inserted again at the end, so the first count is the least recently used one
+        self._static_token_counts[key] = count
+        return count
+
+    def get_max_input_tokens(self, model:str, system_prompt:str) -> int:
+        """
+        Calculates the maximum number of user prompt tokens for a model, leaving room for the output and the system prompt.
+
+        Args:
+            model (str): OpenAI model name.
+            system_prompt (str): System-level prompt instructions.
+
+        Returns:
+            int: Maximum number of user prompt tokens.
+        """
+        info = self.MODEL_INFO[model]
+        return info["max_context"] - info["max_output"] - self.count_static_tokens(system_prompt, info["encoding"])
+
     def truncate_prompt(self, prompt:str,model:str, max_tokens:int) -> tuple[str,bool]:
         """
         Truncates a prompt to fit within token limits for a model.
 
+        Prompts whose character length guarantees they are under the limit are returned without encoding them.
+
         Args:
             prompt (str): Full text prompt.
             model (str): Encoding model for tiktoken.
@@ -264,7 +795,11 @@ class LlmClient:
         Returns:
             str: Truncated prompt if necessary.
         """
-        encodig = tiktoken.get_encoding(model)
+        #Fast path: the prompt cannot exceed the limit
+        if len(prompt) * self.MAX_BYTES_PER_CHAR < max_tokens:
+            return prompt, False
+
+        encodig = self.get_encoding(model)
         tokens = encodig.encode(prompt)
 
         if len(tokens)<max_tokens:
@@ -272,3 +807,265 @@ class LlmClient:
         
         truncated = tokens[:max_tokens]
         return encodig.decode(truncated), True
+
+    async def truncate_prompt_async(self, prompt:str, model:str, max_tokens:int) -> tuple[str,bool]:
+        """
+        Truncates a prompt like truncate_prompt(), but the encoding of prompts that may exceed the limit is done in a worker thread to not block the event loop.
+
+        Args:
+            prompt (str): Full text prompt.
+            model (str): Encoding model for tiktoken.
+            max_tokens (int): Maximum number of tokens allowed.
+
+        Returns:
+            str: Truncated prompt if necessary.
+        """
+        if len(prompt) * self.MAX_BYTES_PER_CHAR < max_tokens:
+            return prompt, False
+        return await asyncio.to_thread(self.truncate_prompt, prompt, model, max_tokens)
+
+    def estimate_tokens(self, model:str, system_prompt:str, user_prompt:str) -> int:
+        """
+        Estimates the input tokens of a call, so the rate limiter can reserve them before it is sent. The cached token count of the
+        system prompt is used, and the user prompt is estimated from its length without encoding it in the event loop. The reservation
+        is corrected by record_usage() with the tokens the response reports.
+
+        Args:
+            model (str): OpenAI model name.
+            system_prompt (str): System-level prompt instructions.
+            user_prompt (str): The (truncated) user prompt.
+
+        Returns:
+            int: Estimated input tokens.
+        """
+        if self.rate_limiter.tpm_limit <= 0:
+            return 0
+        encoding_name = self.MODEL_INFO[model]["encoding"]
+        return self.count_static_tokens(system_prompt, encoding_name) + -(-len(user_prompt) // self.CHARS_PER_TOKEN)
+
+    @Tracer.traced()
+    async def send_request(self, model:str, estimated_tokens:int, send:Callable[[], Awaitable[Any]], on_send:Callable[[], None] = None) -> tuple[Any, dict]:
+        """
+        Sends a request once the rate limiter allows it. Rate limit errors, timeouts, connection errors and server errors
+        are retried up to LLM_MAX_RETRIES times, waiting the time given by get_retry_delay().
+
+        Args:
+            model (str): Model of the request.
+            estimated_tokens (int): Estimated tokens of the request.
+            send (Callable): Creates the request coroutine. Called once per attempt.
+            on_send (Callable, optional): Called when each attempt is sent, after its wait in the rate limiter.
+
+        Returns:
+            tuple[Any, dict]: The response and the request statistics:
+                - "queue_wait_sec": seconds waited in the rate limiter,
+                - "retry_wait_sec": seconds waited before retries,
+                - "retries": number of retries.
+        """
+        stats = {"queue_wait_sec": 0.0, "retry_wait_sec": 0.0, "retries": 0}
+        while True:
+            stats["queue_wait_sec"] += await self.rate_limiter.acquire(model, estimated_tokens)
+            if on_send is not None:
+                on_send()
+            try:
+                return await send(), stats
+            except self.RETRYABLE_ERRORS as e:
+                #A failed request does not use its tokens
+                self.rate_limiter.record_usage(model, estimated_tokens, 0)
+
+                #An exhausted quota will not recover by waiting
+                if stats["retries"] >= LLM_MAX_RETRIES or getattr(e, "code", None) == "insufficient_quota":
+                    raise
+
+                delay = self.get_retry_delay(e, stats["retries"])
+                if isinstance(e, openai.RateLimitError):
+                    #Hold the other calls of the model too
+                    self.rate_limiter.pause(model, delay)
+
+                self.logger.log_error("LlmRetry", {
+                    "model": model,
+                    "retry": stats["retries"] + 1,
+                    "delay_sec": delay,
+                    "error": str(e),
+                })
+                await asyncio.sleep(delay)
+                stats["retry_wait_sec"] += delay
+                stats["retries"] += 1
+
+    async def send_hedged(self, model:str, estimated_tokens:int, send:Callable[[], Awaitable[Any]], task_name:str, stream:bool = False) -> tuple[Any, dict]:
+        """
+        Sends a request with send_request() within the deadline of its task, or the time left of the question's latency budget if it
+        is shorter. If hedging is enabled and the request has not finished after the observed LLM_HEDGE_PERCENTILE latency of the
+        task and model, a duplicate is sent. The first successful response wins and the other request is cancelled. The hedge delay
+        and the recorded latency count from the moment the request is sent, so the wait in the rate limiter does not trigger hedges.
+
+        Args:
+            model (str): Model of the request.
+            estimated_tokens (int): Estimated tokens of the request.
+            send (Callable): Creates the request coroutine. Called once per request.
+            task_name (str): Task of the request, used to find its deadline and, with the model, its latency percentile.
+            stream (bool): If the request opens a stream. Its latency is the time to open it and it is tracked apart from the task's full calls.
+
+        Returns:
+            tuple[Any, dict]: The response and the statistics of send_request() of the winning request, plus:
+                - "timeout_sec": deadline of the call,
+                - "hedge_delay_sec": latency after which the duplicate was sent, None if it was not hedged,
+                - "hedged": if a duplicate was sent,
+                - "hedge_won": if the duplicate finished first,
+                - "hedge_loser_tokens": tokens of the other response if it also finished, None if it was cancelled.
+
+        Raises:
+            TimeoutError: If no request finishes before the deadline.
+        """
+        timeout = self.get_timeout(task_name)
+        latency_key = (f"{task_name}:stream" if stream else task_name, model)
+        hedge_delay = self.latency_tracker.percentile(latency_key, LLM_HEDGE_PERCENTILE) if LLM_HEDGE_ENABLED else None
+        start = time.monotonic()
+
+        #Time each request was last sent, once it left the rate limiter
+        send_times = [None, None]
+        primary_sent = asyncio.Event()
+        def on_send(index:int) -> Callable[[], None]:
+            def record() -> None:
+                send_times[index] = time.monotonic()
+                if index == 0:
+                    primary_sent.set()
+            return record
+
+        primary = asyncio.create_task(self.send_request(model, estimated_tokens, send, on_send(0)))
+        hedge = None
+        tasks = [primary]
+        try:
+            #Send the duplicate if the request is slower than usual since it was sent
+            if hedge_delay is not None:
+                sent_wait = asyncio.create_task(primary_sent.wait())
+                await asyncio.wait([primary, sent_wait], timeout=max(timeout - (time.monotonic() - start), 0), return_when=asyncio.FIRST_COMPLETED)
+                sent_wait.cancel()
+                hedge_at = send_times[0] + hedge_delay if send_times[0] is not None else None
+                if hedge_at is not None and hedge_at < start + timeout and not primary.done():
+                    await asyncio.wait(tasks, timeout=max(hedge_at - time.monotonic(), 0))
+                    if not primary.done():
+                        hedge = asyncio.create_task(self.send_request(model, estimated_tokens, send, on_send(1)))
+                        tasks.append(hedge)
+
+            pending = set(tasks)
+            while pending:
+                remaining = timeout - (time.monotonic() - start)
+                done, pending = await asyncio.wait(pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.logger.log_error("LlmTimeout", {
+                        "model": model,
+                        "task_name": task_name,
+                        "timeout_sec": timeout,
+                        "hedged": hedge is not None,
+                    })
+                    raise TimeoutError(f"The {task_name} call did not finish in {timeout} seconds")
+
+                #A failed request only loses if the other one succeeds
+                for task in tasks:
+                    if task in done and task.exception() is None:
+                        response, stats = task.result()
+                        self.latency_tracker.record(latency_key, time.monotonic() - send_times[tasks.index(task)])
+                        #If both finished together, the other response was also paid for and, if it is a stream, holds a connection
+                        loser = next((other for other in tasks if other is not task and other in done and other.exception() is None), None)
+                        loser_usage = await self.close_losing_response(loser.result()[0]) if loser is not None else None
+                        return response, {
+                            **stats,
+                            "timeout_sec": timeout,
+                            "hedge_delay_sec": hedge_delay if hedge is not None else None,
+                            "hedged": hedge is not None,
+                            "hedge_won": task is hedge,
+                            "hedge_loser_tokens": loser_usage
+                        }
+            raise primary.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_timeout(self, task_name:str) -> float:
+        """
+        Returns the deadline of a call of a task, capped by the time left of the question's latency budget.
+
+        Args:
+            task_name (str): Task of the call.
+
+        Returns:
+            float: Seconds the call can take.
+
+        Raises:
+            TimeoutError: If the deadline of the question has passed, so the call must not be sent.
+        """
+        timeout = LatencyBudget.cap_timeout(LLM_TIMEOUT_SEC.get(task_name, LLM_DEFAULT_TIMEOUT_SEC))
+        if timeout <= 0:
+            raise TimeoutError(f"The {task_name} call was not sent, the deadline of the question has passed")
+        return timeout
+
+    async def close_losing_response(self, response:Any) -> dict|None:
+        """
+        Closes the response of a hedged request that finished but lost, so a stream does not keep its connection open.
+
+        Args:
+            response: Response of the losing request.
+
+        Returns:
+            dict|None: Its "input", "cached" and "output" tokens, None if they are not known yet (e.g. an open stream).
+        """
+        close = getattr(response, "close", None)
+        if close is not None and asyncio.iscoroutinefunction(close):
+            try:
+                await close()
+            except Exception:
+                pass
+        try:
+            input_tokens, output_tokens, cached_tokens = self.get_usage_tokens(getattr(response, "usage", None))
+        except ValueError:
+            return None
+        return {"input": input_tokens, "cached": cached_tokens, "output": output_tokens}
+
+    def get_hedge_cost(self, model:str, input_tokens:int, stats:dict) -> float:
+        """
+        Returns the extra cost of a hedged call. If the losing request also finished, its logged tokens are charged. Otherwise it was
+        cancelled and is charged at least its input, which is the same as the winner's.
+
+        Args:
+            model (str): Model of the call.
+            input_tokens (int): Input tokens of the winning request.
+            stats (dict): Statistics returned by send_hedged().
+
+        Returns:
+            float: Extra cost in USD. 0 if the call was not hedged.
+        """
+        if not stats.get("hedged"):
+            return 0.0
+        loser_tokens = stats.get("hedge_loser_tokens")
+        if loser_tokens is not None:
+            return self.calculate_token_cost(model, loser_tokens["input"], loser_tokens["output"], cached_tokens=loser_tokens["cached"])
+        return (input_tokens / 1000) * self.MODEL_INFO[model]["input_price"]
+
+    def get_retry_delay(self, error:Exception, attempt:int) -> float:
+        """
+        Calculates the wait before retrying a failed request. The Retry-After header of the response is followed if
+        present, with a small jitter so waiting calls do not retry at the same time. Otherwise an exponential backoff with full jitter is used.
+
+        Args:
+            error (Exception): Error of the failed request.
+            attempt (int): Number of retries already done.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        retry_after = None
+        try:
+            if headers.get("retry-after-ms") is not None:
+                retry_after = float(headers["retry-after-ms"]) / 1000
+            elif headers.get("retry-after") is not None:
+                retry_after = float(headers["retry-after"])
+        except ValueError:
+            #Retry-After can also be an HTTP date, use the backoff in that case
+            retry_after = None
+
+        if retry_after is not None:
+            return retry_after + random.uniform(0, LLM_RETRY_BASE_SEC)
+        return random.uniform(0, min(LLM_RETRY_MAX_SEC, LLM_RETRY_BASE_SEC * 2 ** attempt))
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import AsyncIterator, Callable
+
+class LlmStreamError(Exception):
+    """
+    Raised when a streamed response fails, is cut short by the API ("response.failed", "response.incomplete" or "error"
+    events), or ends without being completed.
+
+    Attributes:
+        event_type (str): Type of the event that ended the stream, None if it ended without one.
+    """
+
+    def __init__(self, message:str, event_type:str = None):
+        super().__init__(message)
+        self.event_type = event_type
+
+class LlmStream:
+    """
+    Asynchronous iterator over the text deltas of a streamed LLM response.
+
+    The text, cost and timings are filled while the stream is consumed. When the response is completed
+    the on_complete callback is called once, so the caller can calculate the cost and log the call.
+
+    A stream that sends no event before its first event deadline, or is not completed before its deadline, is closed and raises
+    a TimeoutError, so a stalled connection does not hold the question. A stream that fails or ends before the response is
+    completed raises an LlmStreamError, and a stream that is not consumed to the end is closed, so its connection is released.
+
+    Attributes:
+        events (AsyncIterator): Stream of response events returned by the OpenAI client.
+        start_time (float): Time when the call was started.
+        on_complete (Callable): Called with the stream and the completed response. Returns the cost of the call.
+        text (str): Text received so far.
+        cost (float): Cost of the call. 0 until the stream is completed.
+        time_to_first_token_sec (float): Seconds from the start of the call to the first text delta.
+        duration_sec (float): Seconds from the start of the call to the completed response.
+        completed (bool): If the response was completed.
+        deadline (float): Monotonic time when the stream must be completed. None for no deadline.
+        first_event_deadline (float): Monotonic time when the first event must have arrived. None for no deadline.
+        received (bool): If an event arrived.
+
+    Methods:
+        get_timeout(): Returns the seconds left to receive the next event.
+        get_error_message(): Returns the reason given by a failure event.
+        close(): Closes the response stream.
+    """
+
+    def __init__(self, events:AsyncIterator, start_time:float, on_complete:Callable, deadline:float = None, first_event_deadline:float = None):
+        """
+        Initializes the LlmStream.
+
+        Args:
+            events (AsyncIterator): Stream of response events returned by the OpenAI client.
+            start_time (float): Time when the call was started.
+            on_complete (Callable): Called with the stream and the completed response. Returns the cost of the call.
+            deadline (float, optional): Monotonic time when the stream must be completed.
+            first_event_deadline (float, optional): Monotonic time when the first event must have arrived.
+        """
+        self.events = events
+        self.start_time = start_time
+        self.on_complete = on_complete
+        self.deadline = deadline
+        self.first_event_deadline = first_event_deadline
+        self.received = False
+        self.text = ""
+        self.cost = 0.0
+        self.time_to_first_token_sec = None
+        self.duration_sec = None
+        self.completed = False
+
+    async def __aiter__(self)->AsyncIterator[str]:
+        """
+        Yields each text delta as it arrives.
+
+        Yields:
+            str: Text delta.
+
+        Raises:
+            TimeoutError: If the next event does not arrive before the deadline.
+            LlmStreamError: If the response fails, is incomplete or the stream ends before it is completed.
+        """
+        events = aiter(self.events)
+        try:
+            while True:
+                timeout = self.get_timeout()
+                try:
+                    event = await asyncio.wait_for(anext(events), timeout)
+                except StopAsyncIteration:
+                    if not self.completed:
+                        raise LlmStreamError("The stream ended before the response was completed") from None
+                    return
+                except TimeoutError:
+                    stage = "the first event" if not self.received else "the end of the response"
+                    raise TimeoutError(f"The stream did not send {stage} in time") from None
+                self.received = True
+
+                if event.type == "response.output_text.delta":
+                    if self.time_to_first_token_sec is None:
+                        self.time_to_first_token_sec = time.time() - self.start_time
+                    self.text += event.delta
+                    yield event.delta
+                elif event.type == "response.completed":
+                    self.duration_sec = time.time() - self.start_time
+                    self.completed = True
+                    self.cost = self.on_complete(self, event.response)
+                elif event.type in ("response.failed", "response.incomplete", "error"):
+                    raise LlmStreamError(f"The stream ended with {event.type}: {self.get_error_message(event)}", event.type)
+        finally:
+            #Release the connection if the response was not completed, e.g. after an error or when the consumer stopped early
+            if not self.completed:
+                await self.close()
+
+    def get_error_message(self, event) -> str:
+        """
+        Returns the reason given by a failure event.
+
+        Args:
+            event: "response.failed", "response.incomplete" or "error" event.
+
+        Returns:
+            str: The error message, the incomplete reason or "unknown".
+        """
+        response = getattr(event, "response", None)
+        error = getattr(response, "error", None)
+        incomplete_details = getattr(response, "incomplete_details", None)
+        if error is not None:
+            return str(getattr(error, "message", error))
+        if incomplete_details is not None:
+            return str(getattr(incomplete_details, "reason", incomplete_details))
+        return str(getattr(event, "message", None) or "unknown")
+
+    def get_timeout(self) -> float|None:
+        """
+        Returns the seconds left to receive the next event.
+
+        Returns:
+            float|None: Seconds left, never negative. None if the stream has no deadline.
+        """
+        deadlines = [self.deadline] if self.deadline is not None else []
+        if not self.received and self.first_event_deadline is not None:
+            deadlines.append(self.first_event_deadline)
+        return max(min(deadlines) - time.monotonic(), 0.0) if deadlines else None
+
+    async def close(self) -> None:
+        """
+        Closes the response stream and its connection. Errors are ignored.
+        """
+        close = getattr(self.events, "close", None) or getattr(self.events, "aclose", None)
+        if close is None:
+            return
+        try:
+            await close()
+        except Exception:
+            pass
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from config.config import LLM_RPM_LIMIT, LLM_TPM_LIMIT
+from llm.token_bucket import TokenBucket
+
+class RateLimiter:
+    """
+    Per-model limiter of the requests and tokens sent to OpenAI per minute.
+
+    Each model has a request bucket and a token bucket. Calls reserve one request and their estimated tokens before
+    they are sent, and wait in order when a limit is reached instead of failing. Once the response arrives the token
+    bucket is corrected with the real usage.
+
+    Attributes:
+        rpm_limit (int): Requests per minute allowed for each model. 0 disables the limit.
+        tpm_limit (int): Tokens per minute allowed for each model. 0 disables the limit.
+        request_buckets (dict): Request bucket of each model.
+        token_buckets (dict): Token bucket of each model.
+        lock (threading.Lock): Serializes the creation of buckets between threads.
+
+    Methods:
+        acquire(): Reserves a request and its tokens, waiting until they are available.
+        record_usage(): Corrects the token reservation with the real usage.
+        pause(): Holds the calls of a model, e.g. after a rate limit error.
+        get_buckets(): Returns the buckets of a model, creating them the first time.
+    """
+
+    def __init__(self, rpm_limit:int = LLM_RPM_LIMIT, tpm_limit:int = LLM_TPM_LIMIT):
+        """
+        Initializes the RateLimiter.
+
+        Args:
+            rpm_limit (int): Requests per minute allowed for each model. 0 disables the limit.
+            tpm_limit (int): Tokens per minute allowed for each model. 0 disables the limit.
+        """
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.request_buckets = {}
+        self.token_buckets = {}
+        self.lock = threading.Lock()
+
+    async def acquire(self, model:str, tokens:int) -> float:
+        """
+        Reserves one request and the estimated tokens of a call, and waits until both are available.
+
+        Args:
+            model (str): Model of the call.
+            tokens (int): Estimated tokens of the call.
+
+        Returns:
+            float: Seconds waited in the queue.
+
+        Raises:
+            asyncio.CancelledError: If the call is cancelled while it waits. Its reservation is given back.
+        """
+        request_bucket, token_bucket = self.get_buckets(model)
+        wait = 0.0
+        if request_bucket is not None:
+            wait = max(wait, request_bucket.reserve(1))
+        if token_bucket is not None:
+            wait = max(wait, token_bucket.reserve(tokens))
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                #The call will not be sent, so the calls queued behind it must not wait for its reservation
+                if request_bucket is not None:
+                    request_bucket.adjust(-1)
+                if token_bucket is not None:
+                    token_bucket.adjust(-min(tokens, token_bucket.capacity))
+                raise
+        return wait
+
+    def record_usage(self, model:str, estimated_tokens:int, used_tokens:int) -> None:
+        """
+        Corrects the token reservation of a call with the tokens it really used.
+
+        Args:
+            model (str): Model of the call.
+            estimated_tokens (int): Tokens reserved before the call.
+            used_tokens (int): Tokens reported in the response usage.
+        """
+        _, token_bucket = self.get_buckets(model)
+        if token_bucket is not None:
+            token_bucket.adjust(used_tokens - estimated_tokens)
+
+    def pause(self, model:str, seconds:float) -> None:
+        """
+        Makes the next calls of a model wait at least the given time.
+
+        Args:
+            model (str): Model to pause.
+            seconds (float): Minimum seconds to wait.
+        """
+        for bucket in self.get_buckets(model):
+            if bucket is not None:
+                bucket.pause(seconds)
+
+    def get_buckets(self, model:str) -> tuple[TokenBucket|None, TokenBucket|None]:
+        """
+        Returns the request and token buckets of a model, creating them the first time.
+
+        Args:
+            model (str): Model name.
+
+        Returns:
+            tuple[TokenBucket|None, TokenBucket|None]: Request bucket and token bucket. None for disabled limits.
+        """
+        with self.lock:
+            if model not in self.request_buckets:
+                self.request_buckets[model] = TokenBucket(self.rpm_limit) if self.rpm_limit > 0 else None
+                self.token_buckets[model] = TokenBucket(self.tpm_limit) if self.tpm_limit > 0 else None
+            return self.request_buckets[model], self.token_buckets[model]
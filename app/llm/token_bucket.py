@@ -0,0 +1,82 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Token bucket that limits an amount per minute (requests or tokens).
+
+    The bucket holds up to one minute of capacity and refills continuously. Reservations are taken immediately,
+    even if the level goes below zero, and the caller waits the time needed to refill the deficit. This way callers
+    are served in order without holding a lock while they wait.
+
+    Attributes:
+        capacity (float): Amount allowed per minute.
+        rate (float): Amount refilled per second.
+        level (float): Available amount. Negative when there are reservations waiting for the refill.
+        updated (float): Time of the last refill.
+        lock (threading.Lock): Serializes the updates between threads.
+
+    Methods:
+        reserve(): Takes an amount and returns the seconds to wait before using it.
+        adjust(): Corrects a previous reservation with the real amount used.
+        pause(): Makes the next reservations wait at least a number of seconds.
+        refill(): Adds the amount refilled since the last update.
+    """
+
+    def __init__(self, capacity:float):
+        """
+        Initializes a full TokenBucket.
+
+        Args:
+            capacity (float): Amount allowed per minute.
+        """
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount:float) -> float:
+        """
+        Takes an amount from the bucket. Amounts over the capacity are reduced to the capacity so they can be served.
+
+        Args:
+            amount (float): Amount to take.
+
+        Returns:
+            float: Seconds to wait until the amount is available.
+        """
+        with self.lock:
+            self.refill()
+            self.level -= min(amount, self.capacity)
+            return max(-self.level / self.rate, 0.0)
+
+    def adjust(self, difference:float) -> None:
+        """
+        Corrects a previous reservation when the real amount used is known.
+
+        Args:
+            difference (float): Real amount minus reserved amount. Negative values give back the unused amount.
+        """
+        with self.lock:
+            self.refill()
+            self.level = min(self.level - difference, self.capacity)
+
+    def pause(self, seconds:float) -> None:
+        """
+        Empties the bucket so the next reservations wait at least the given time, e.g. after a rate limit error.
+
+        Args:
+            seconds (float): Minimum seconds to wait.
+        """
+        with self.lock:
+            self.refill()
+            self.level = min(self.level, -seconds * self.rate)
+
+    def refill(self) -> None:
+        """
+        Adds the amount refilled since the last update, up to the capacity. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        self.level = min(self.level + (now - self.updated) * self.rate, self.capacity)
+        self.updated = now
@@ -0,0 +1,86 @@
+from contextvars import ContextVar
+import httpx
+
+class TrackedTransport(httpx.AsyncBaseTransport):
+    """
+    HTTP transport that counts how many requests opened a new connection and how many reused a pooled one.
+
+    A request opens a new connection when the connection pool reports a TCP connect through the httpcore trace extension.
+    The counts are kept for the whole transport and, if start_counting() was called, for the current context, e.g. the
+    question being answered, including the tasks it starts.
+
+    Attributes:
+        transport (httpx.AsyncBaseTransport): Transport with the connection pool that sends the requests.
+        new_connections (int): Requests that opened a new connection.
+        reused_connections (int): Requests that reused a pooled connection.
+        context_counts (ContextVar): Counts of the current context. None if they are not being counted.
+
+    Methods:
+        handle_async_request(): Sends a request and counts its connection.
+        aclose(): Closes the pooled connections.
+        start_counting(): Starts counting the connections of the current context.
+    """
+
+    context_counts = ContextVar("connection_counts", default=None)
+
+    def __init__(self, transport:httpx.AsyncBaseTransport):
+        """
+        Initializes the TrackedTransport.
+
+        Args:
+            transport (httpx.AsyncBaseTransport): Transport with the connection pool that sends the requests.
+        """
+        self.transport = transport
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    async def handle_async_request(self, request:httpx.Request) -> httpx.Response:
+        """
+        Sends a request and counts whether it opened a new connection.
+
+        Args:
+            request (httpx.Request): Request to send.
+
+        Returns:
+            httpx.Response: The response.
+        """
+        opened = False
+        previous_trace = request.extensions.get("trace")
+
+        async def trace(event_name:str, info:dict) -> None:
+            nonlocal opened
+            if event_name == "connection.connect_tcp.started":
+                opened = True
+            if previous_trace is not None:
+                await previous_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        response = await self.transport.handle_async_request(request)
+
+        key = "new" if opened else "reused"
+        if opened:
+            self.new_connections += 1
+        else:
+            self.reused_connections += 1
+        counts = self.context_counts.get()
+        if counts is not None:
+            counts[key] += 1
+        return response
+
+    async def aclose(self) -> None:
+        """
+        Closes the pooled connections.
+        """
+        await self.transport.aclose()
+
+    @classmethod
+    def start_counting(cls) -> dict:
+        """
+        Starts counting the connections of the current context. Tasks started afterwards share the counts.
+
+        Returns:
+            dict: Counts of new ("new") and reused ("reused") connections, updated as requests are sent.
+        """
+        counts = {"new": 0, "reused": 0}
+        cls.context_counts.set(counts)
+        return counts
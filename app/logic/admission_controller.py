@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from config.config import ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT_SEC
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a question is not admitted, because the wait queue is full ("queue_full") or its deadline passed while it
+    waited ("timeout").
+
+    Attributes:
+        reason (str): "queue_full" or "timeout".
+    """
+
+    def __init__(self, reason:str):
+        super().__init__(f"Question not admitted: {reason}")
+        self.reason = reason
+
+class AdmissionController:
+    """
+    Limits how many questions run their pipeline at the same time, so an overload queues or rejects new questions instead of
+    slowing down all of them and exceeding the OpenAI rate limits.
+
+    A question runs at once if there is a free slot. Otherwise it waits in a bounded FIFO queue until a slot is released or its
+    deadline passes. When the queue is full it is rejected immediately. The controller is shared by all the orchestrators of the
+    process, whose questions can run in different event loops (e.g. one per batch run and the background loop of the GUI), so its state is
+    protected by a thread lock and slots are handed to the waiting questions in their own loops.
+
+    Attributes:
+        shared (AdmissionController): Controller shared by the process, created by get_shared().
+        max_in_flight (int): Maximum number of questions running at the same time.
+        max_queue (int): Maximum number of questions waiting for a slot.
+        queue_timeout (float): Default seconds a question can wait for a slot.
+        in_flight (int): Questions running now.
+        waiters (deque): Questions waiting for a slot, in arrival order.
+        lock (threading.Lock): Protects the slots and the queue.
+        stats (dict): Number of admitted and rejected questions, total and maximum wait, and maximum queue depth.
+
+    Methods:
+        admit(): Context manager that holds a slot while a question runs.
+        acquire(): Waits for a slot.
+        release(): Releases a slot, handing it to the first waiting question.
+        get_stats(): Returns the current queue depth, the questions in flight and the wait statistics.
+        get_shared(): Returns the controller shared by the process.
+    """
+
+    shared = None
+    shared_lock = threading.Lock()
+
+    def __init__(self, max_in_flight:int = ADMISSION_MAX_IN_FLIGHT, max_queue:int = ADMISSION_MAX_QUEUE, queue_timeout:float = ADMISSION_QUEUE_TIMEOUT_SEC):
+        """
+        Initializes the AdmissionController.
+
+        Args:
+            max_in_flight (int): Maximum number of questions running at the same time.
+            max_queue (int): Maximum number of questions waiting for a slot. 0 rejects the questions when all slots are taken.
+            queue_timeout (float): Default seconds a question can wait for a slot.
+        """
+        if max_in_flight < 1:
+            raise ValueError(f"At least 1 question must be able to run: {max_in_flight}")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiters = deque()
+        self.lock = threading.Lock()
+        self.stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "wait_sec": 0.0, "max_wait_sec": 0.0, "max_queue_depth": 0}
+
+    @asynccontextmanager
+    async def admit(self, timeout:float = None) -> AsyncIterator[float]:
+        """
+        Holds a slot while the question runs.
+
+        Args:
+            timeout (float, optional): Seconds the question can wait for a slot. The queue timeout by default.
+
+        Yields:
+            float: Seconds the question waited for its slot.
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait timed out.
+        """
+        wait = await self.acquire(timeout)
+        try:
+            yield wait
+        finally:
+            self.release()
+
+    async def acquire(self, timeout:float = None) -> float:
+        """
+        Waits for a slot. The caller must call release() when the question finishes.
+
+        Args:
+            timeout (float, optional): Seconds the question can wait for a slot. The queue timeout by default.
+
+        Returns:
+            float: Seconds the question waited for its slot.
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait timed out.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.time()
+        with self.lock:
+            if self.in_flight < self.max_in_flight and not self.waiters:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                return 0.0
+            if len(self.waiters) >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise AdmissionRejected("queue_full")
+            waiter = {"loop": asyncio.get_running_loop(), "future": asyncio.get_running_loop().create_future(), "granted": False}
+            self.waiters.append(waiter)
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self.waiters))
+
+        try:
+            await asyncio.wait_for(waiter["future"], max(timeout, 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self.lock:
+                granted = waiter["granted"]
+                if not granted:
+                    self.waiters.remove(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.stats["rejected_timeout"] += 1
+            if isinstance(e, asyncio.CancelledError):
+                if granted:
+                    self.release()
+                raise
+            if not granted:
+                raise AdmissionRejected("timeout")
+
+        #The slot was handed over by release()
+        wait = time.time() - start
+        with self.lock:
+            self.stats["admitted"] += 1
+            self.stats["wait_sec"] += wait
+            self.stats["max_wait_sec"] = max(self.stats["max_wait_sec"], wait)
+        return wait
+
+    def release(self) -> None:
+        """
+        Releases a slot. If questions are waiting, the slot is handed to the first one instead.
+        """
+        with self.lock:
+            if not self.waiters:
+                self.in_flight -= 1
+                return
+            waiter = self.waiters.popleft()
+            waiter["granted"] = True
+
+        def grant(future:asyncio.Future) -> None:
+            if not future.done():
+                future.set_result(True)
+        try:
+            waiter["loop"].call_soon_threadsafe(grant, waiter["future"])
+        except RuntimeError:
+            self.release() #The loop of the waiting question is closed, give the slot to the next one
+
+    def get_stats(self) -> dict:
+        """
+        Returns the current queue depth, the questions in flight and the wait statistics.
+
+        Returns:
+            dict: "in_flight", "queue_depth", number of "admitted" and rejected questions, "mean_wait_sec" of the admitted
+                questions, "max_wait_sec" and "max_queue_depth".
+        """
+        with self.lock:
+            admitted = self.stats["admitted"]
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": len(self.waiters),
+                "admitted": self.stats["admitted"],
+                "rejected_queue_full": self.stats["rejected_queue_full"],
+                "rejected_timeout": self.stats["rejected_timeout"],
+                "mean_wait_sec": self.stats["wait_sec"] / admitted if admitted else None,
+                "max_wait_sec": self.stats["max_wait_sec"],
+                "max_queue_depth": self.stats["max_queue_depth"]
+            }
+
+    @classmethod
+    def get_shared(cls) -> "AdmissionController":
+        """
+        Returns the controller shared by the process, creating it the first time with the configured limits.
+
+        Returns:
+            AdmissionController: The controller.
+        """
+        with cls.shared_lock:
+            if cls.shared is None:
+                cls.shared = cls()
+            return cls.shared
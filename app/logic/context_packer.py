@@ -0,0 +1,167 @@
+from config.config import CONTEXT_TOKEN_BUDGET
+import tiktoken
+
+class ContextPacker:
+    """
+    Fits the graph context used for the final answer generation into a token budget.
+
+    Entities and relationships are ranked by their similarity to the question's entities and by their degree
+    (number of relationships) in the query result, and the budget is filled greedily with the best ranked ones.
+
+    Attributes:
+        token_budget (int): Maximum number of context tokens.
+        SIMILARITY_WEIGHT (float): Weight of the similarity score in the ranking.
+        DEGREE_WEIGHT (float): Weight of the normalized node degree in the ranking.
+        MAX_BYTES_PER_CHAR (int): Used to calculate an upper bound of the tokens of a text without encoding it.
+
+    Methods:
+        pack(): Returns the context reduced to the token budget and the packing statistics.
+        rank_items(): Scores every entity, relationship and other entry of the context.
+        format_entity(): Formats an entity as a prompt line.
+        format_relationship(): Formats a relationship as a prompt line.
+        format_other(): Formats an additional information entry as a prompt line.
+    """
+
+    SIMILARITY_WEIGHT = 1.0
+    DEGREE_WEIGHT = 0.5
+    MAX_BYTES_PER_CHAR = 4
+
+    def __init__(self, token_budget:int = CONTEXT_TOKEN_BUDGET):
+        """
+        Initializes the ContextPacker with a token budget.
+
+        Args:
+            token_budget (int): Maximum number of context tokens.
+        """
+        self.token_budget = token_budget
+
+    def pack(self, context:dict, encoding:tiktoken.Encoding, node_scores:dict = None, token_budget:int = None)->tuple[dict, dict]:
+        """
+        Reduce the context to the token budget keeping the best ranked items. The "others" entries (counts, aggregations, etc.) are
+        usually the answer itself, so they always go first.
+
+        Args:
+            context (dict): Graph context including entities, relationships and other information.
+            encoding (tiktoken.Encoding): Encoding used to count the tokens of each item.
+            node_scores (dict, optional): Mapping from node name to its similarity with the question's entities.
+            token_budget (int, optional): Maximum number of context tokens of this call, the budget of the packer by default.
+
+        Returns:
+            tuple[dict, dict]: Packed context with the same structure as the input and packing statistics(kept/dropped items and tokens). kept_tokens is None if the context fit without encoding it.
+        """
+        token_budget = self.token_budget if token_budget is None else token_budget
+        items = self.rank_items(context, node_scores or {})
+
+        #Fast path: the whole context fits without counting tokens
+        if sum(len(item["line"]) for item in items) * self.MAX_BYTES_PER_CHAR <= token_budget:
+            return context, {
+                "token_budget": token_budget,
+                "kept_items": len(items),
+                "dropped_items": 0,
+                "kept_tokens": None,
+                "dropped_tokens": 0
+            }
+
+        #Fill the budget greedily, skipping items that do not fit in the remaining tokens
+        kept = set()
+        used_tokens = 0
+        dropped_tokens = 0
+        for item in sorted(items, key=lambda i: (i["kind"] != "other", -i["score"])):
+            tokens = len(encoding.encode(item["line"])) + 1 #+1 for the line break
+            if used_tokens + tokens <= token_budget:
+                kept.add(item["key"])
+                used_tokens += tokens
+            else:
+                dropped_tokens += tokens
+
+        #Rebuild the context keeping the original order
+        packed = {
+            "entities": {
+                category: {name: data for name, data in nodes.items() if ("entity", category, name) in kept}
+                for category, nodes in context["entities"].items()
+            },
+            "relationships": [rel for i, rel in enumerate(context["relationships"]) if ("relationship", i) in kept],
+            "others": {key: value for key, value in context["others"].items() if ("other", key) in kept}
+        }
+        return packed, {
+            "token_budget": token_budget,
+            "kept_items": len(kept),
+            "dropped_items": len(items) - len(kept),
+            "kept_tokens": used_tokens,
+            "dropped_tokens": dropped_tokens
+        }
+
+    def rank_items(self, context:dict, node_scores:dict)->list[dict]:
+        """
+        Score every item in the context. Entities are scored by similarity and normalized degree. Relationships are scored
+        with the average score of the entities they connect.
+
+        Args:
+            context (dict): Graph context including entities, relationships and other information.
+            node_scores (dict): Mapping from node name to its similarity with the question's entities.
+
+        Returns:
+            list[dict]: List of items with 'kind', 'key', 'line' and 'score' keys.
+        """
+        #Count how many relationships each node has in the result
+        degrees = {}
+        for rel in context["relationships"]:
+            degrees[rel["from"]] = degrees.get(rel["from"], 0) + 1
+            degrees[rel["to"]] = degrees.get(rel["to"], 0) + 1
+        max_degree = max(degrees.values(), default=0) or 1
+
+        entity_scores = {}
+        items = []
+        for category, nodes in context["entities"].items():
+            for name, data in nodes.items():
+                score = self.SIMILARITY_WEIGHT * node_scores.get(name, 0.0) + self.DEGREE_WEIGHT * degrees.get(name, 0) / max_degree
+                entity_scores[name] = max(score, entity_scores.get(name, 0.0))
+                items.append({"kind": "entity", "key": ("entity", category, name), "line": self.format_entity(name, data), "score": score})
+
+        for i, rel in enumerate(context["relationships"]):
+            score = (entity_scores.get(rel["from"], 0.0) + entity_scores.get(rel["to"], 0.0)) / 2
+            items.append({"kind": "relationship", "key": ("relationship", i), "line": self.format_relationship(rel), "score": score})
+
+        for key, value in context["others"].items():
+            items.append({"kind": "other", "key": ("other", key), "line": self.format_other(key, value), "score": 0.0})
+
+        return items
+
+    def format_entity(self, name:str, data:dict)->str:
+        """
+        Format an entity as a prompt line.
+
+        Args:
+            name (str): Node name.
+            data (dict): Node information (description, hypernym, labels and optional alternativeName).
+
+        Returns:
+            str: Formatted line.
+        """
+        alt_name = f"{data['alternativeName']}" if 'alternativeName' in data else ""
+        return f"-**{name}({alt_name};{data['hypernym']})**: {data['description']} [{', '.join(data['labels'])}]"
+
+    def format_relationship(self, rel:dict)->str:
+        """
+        Format a relationship as a prompt line.
+
+        Args:
+            rel (dict): Relationship with 'from', 'to' and 'type' keys.
+
+        Returns:
+            str: Formatted line.
+        """
+        return f"- {rel['from']} --[{rel['type']}]--> {rel['to']}"
+
+    def format_other(self, key:str, value)->str:
+        """
+        Format an additional information entry as a prompt line.
+
+        Args:
+            key (str): Name of the returned value (e.g. problemsCount).
+            value: Returned value.
+
+        Returns:
+            str: Formatted line.
+        """
+        return f"-{key}: {value}"
@@ -0,0 +1,73 @@
+import asyncio
+import time
+from typing import Callable
+from config.config import SEMANTIC_CACHE_GRAPH_CHECK_SEC
+from logs.logger import Logger
+
+class GraphFingerprint:
+    """
+    Last known fingerprint of the graph, a value that changes when the graph changes.
+
+    The cached results that depend on the graph (answers, similarity searches, parsed context) are keyed by it, so they are
+    not reused after the graph changes. Reading it never waits for the database: when the last check is older than check_sec
+    seconds, the fingerprint is refreshed by a background task in a worker thread, and the readers keep the last value until
+    it finishes. If the database cannot be read, the last value is kept, so a failed check never invalidates the caches.
+
+    Attributes:
+        fingerprint_fn (Callable): Returns the fingerprint of the graph. It blocks on the database.
+        check_sec (float): Minimum seconds between graph checks.
+        value: Last fingerprint, None until the first check succeeds.
+        last_check (float): Time of the last graph check.
+        task (asyncio.Task): Running background refresh, None if there is none.
+        logger (Logger): Logs the failed checks.
+
+    Methods:
+        get(): Returns the last fingerprint, starting a background refresh if it is too old.
+        refresh(): Reads the fingerprint of the graph in a worker thread.
+    """
+
+    def __init__(self, fingerprint_fn:Callable, check_sec:float = SEMANTIC_CACHE_GRAPH_CHECK_SEC):
+        """
+        Initializes the GraphFingerprint.
+
+        Args:
+            fingerprint_fn (Callable): Returns the fingerprint of the graph.
+            check_sec (float): Minimum seconds between graph checks.
+        """
+        self.fingerprint_fn = fingerprint_fn
+        self.check_sec = check_sec
+        self.value = None
+        self.last_check = 0.0
+        self.task = None
+        self.logger = Logger()
+
+    def get(self) -> str|None:
+        """
+        Returns the last fingerprint. If it is older than check_sec seconds, a background refresh is started in the running
+        event loop, and the fingerprint it reads is returned by the next calls.
+
+        Returns:
+            str|None: The fingerprint, None if the graph has not been read yet.
+        """
+        if self.task is None and time.time() - self.last_check >= self.check_sec:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return self.value
+            self.task = loop.create_task(self.refresh())
+            self.task.add_done_callback(lambda _: setattr(self, "task", None))
+        return self.value
+
+    async def refresh(self) -> str|None:
+        """
+        Reads the fingerprint of the graph in a worker thread. If it fails, the error is logged and the last value is kept.
+
+        Returns:
+            str|None: The fingerprint.
+        """
+        self.last_check = time.time()
+        try:
+            self.value = await asyncio.to_thread(self.fingerprint_fn)
+        except Exception as e:
+            self.logger.log_error("GraphFingerprintError", {"error": str(e)})
+        return self.value
@@ -0,0 +1,219 @@
+import asyncio
+import copy
+import json
+import os
+import re
+import numpy as np
+from config.config import INTENTS_PATH, INTENT_TOKEN_THRESHOLD, INTENT_EMBEDDING_THRESHOLD
+from data.embedding_cache import EmbeddingCache
+
+class IntentClassifier:
+    """
+    Recognizes the questions about the system itself (what it can answer, what it is...) so they are answered with a fixed
+    response, without the LLM and database calls of the pipeline.
+
+    Questions are matched locally with the examples of each intent: exactly, by the words they share, or by the similarity of
+    their embeddings when the question's embedding is already in the embedding cache. The embeddings of the examples are
+    computed once by embed_examples() and read from the embedding cache afterwards.
+
+    Attributes:
+        DEFAULT_INTENTS (dict): Intents used when they are not in the intents file, with their examples and response.
+        path (str): Path of the JSON file with the intents. Empty to use the default ones.
+        token_threshold (float): Minimum ratio of shared words (Jaccard index) to match an example.
+        embedding_threshold (float): Minimum cosine similarity of the embeddings to match an example.
+        embedding_cache (EmbeddingCache): Cache where the embeddings of the questions and examples are read. None to disable the embedding match.
+        model (str): Embedding model of the cached embeddings.
+        intents (dict): Examples and response of each intent.
+        examples (dict): Intent of each normalized example.
+        example_tokens (list[tuple]): Words and intent of each example.
+        example_names (list[str]): Intent of each row of the embedding matrix. None until the embeddings are loaded.
+        matrix (np.ndarray): Normalized embeddings of the examples found in the embedding cache, one per row.
+
+    Methods:
+        classify(): Returns the intent of a question, or None.
+        build_match(): Builds the result of classify() for an intent.
+        embed_examples(): Embeds the examples that are not in the embedding cache.
+        load_embeddings(): Reads the embeddings of the examples from the embedding cache.
+        load(): Reads the intents file.
+        normalize(): Normalizes a question or example.
+        normalize_vector(): Converts an embedding to a unit vector.
+    """
+
+    DEFAULT_INTENTS = {
+        "capabilities": {
+            "examples": [
+                "What can you answer?", "What can you do?", "What questions can you answer?", "What questions can I ask?",
+                "What kind of questions can I ask?", "What do you know?", "What topics do you cover?", "How can you help me?"
+            ],
+            "response": "I answer questions about a knowledge graph of technical and scientific research: the problems it describes, "
+                        "their contexts, goals and requirements, the technical solutions (artifact classes) proposed for them and the "
+                        "stakeholders involved. For example: \"What problems do developers face?\" or \"Which solutions address data loss?\""
+        },
+        "identity": {
+            "examples": [
+                "Who are you?", "What are you?", "How do you work?", "Where do your answers come from?", "What is your data source?"
+            ],
+            "response": "I am an assistant that answers with the information of a knowledge graph of technical and scientific research. "
+                        "Each question is turned into a query to the graph, and the answer only uses the data it returns."
+        },
+        "greeting": {
+            "examples": ["Hello", "Hi", "Hey", "Good morning", "Good afternoon", "Thanks", "Thank you"],
+            "response": "Hello! Ask me about the problems, goals, requirements, technical solutions or stakeholders of the knowledge graph."
+        }
+    }
+
+    def __init__(self, path:str = INTENTS_PATH, token_threshold:float = INTENT_TOKEN_THRESHOLD, embedding_threshold:float = INTENT_EMBEDDING_THRESHOLD,
+                 embedding_cache:EmbeddingCache = None, model:str = "text-embedding-3-large"):
+        """
+        Initializes the IntentClassifier with the intents of the file, or the default ones.
+
+        Args:
+            path (str): Path of the JSON file with the intents. Empty to use the default ones.
+            token_threshold (float): Minimum ratio of shared words to match an example. Over 1 disables the word match.
+            embedding_threshold (float): Minimum cosine similarity of the embeddings to match an example. Over 1 disables the embedding match.
+            embedding_cache (EmbeddingCache, optional): Cache of the question and example embeddings.
+            model (str): Embedding model of the cached embeddings, the one of the question embeddings.
+        """
+        self.path = path
+        self.token_threshold = token_threshold
+        self.embedding_threshold = embedding_threshold
+        self.embedding_cache = embedding_cache
+        self.model = model
+        self.intents = self.load()
+        self.examples = {self.normalize(example): name for name, intent in self.intents.items() for example in intent["examples"]}
+        self.example_tokens = [(set(example.split()), name) for example, name in self.examples.items()]
+        self.example_names = None
+        self.matrix = None
+
+    def classify(self, question:str) -> dict|None:
+        """
+        Returns the intent of a question, matching it with the examples without calling any API. It can read the embedding cache,
+        so async code runs it with asyncio.to_thread().
+
+        Args:
+            question (str): The question.
+
+        Returns:
+            dict|None: The "intent", its "response", how it matched ("exact", "tokens" or "embedding") and the "score" of the match,
+                or None if the question does not match any intent.
+        """
+        text = self.normalize(question)
+        if not text:
+            return None
+
+        #Same question as an example
+        if text in self.examples:
+            return self.build_match(self.examples[text], "exact", 1.0)
+
+        #Most of the words shared with an example
+        tokens = set(text.split())
+        score, name = max(((len(tokens & example) / len(tokens | example), name) for example, name in self.example_tokens), default=(0.0, None))
+        if score >= self.token_threshold:
+            return self.build_match(name, "tokens", score)
+
+        #Similar embedding, only if the question was already embedded
+        if self.embedding_cache is None or self.embedding_threshold > 1:
+            return None
+        if self.example_names is None:
+            self.load_embeddings()
+        embedding = self.embedding_cache.get(self.model, question) if self.matrix is not None else None
+        if embedding is None:
+            return None
+        similarities = self.matrix @ self.normalize_vector(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.embedding_threshold:
+            return self.build_match(self.example_names[best], "embedding", float(similarities[best]))
+        return None
+
+    def build_match(self, name:str, match:str, score:float) -> dict:
+        """
+        Builds the result of classify() for an intent.
+
+        Args:
+            name (str): Intent.
+            match (str): How the question matched.
+            score (float): Score of the match.
+
+        Returns:
+            dict: The intent, its response, the match and the score.
+        """
+        return {"intent": name, "response": self.intents[name]["response"], "match": match, "score": score}
+
+    async def embed_examples(self, llm_client) -> float:
+        """
+        Embeds the examples that are not in the embedding cache, which stores them, and loads the embedding matrix. The examples
+        are embedded normalized, like the sanitized questions.
+
+        Args:
+            llm_client (LlmClient): Client used to embed the examples.
+
+        Returns:
+            float: Cost of the embeddings, 0 if they were all cached.
+        """
+        if self.embedding_cache is None:
+            return 0.0
+        missing = await asyncio.to_thread(lambda: [example for example in self.examples if self.embedding_cache.get(self.model, example) is None])
+        cost = 0.0
+        if missing:
+            _, costs = await llm_client.get_embeddings(missing, model=self.model, task_name="intent_examples")
+            cost = sum(costs)
+        await asyncio.to_thread(self.load_embeddings)
+        return cost
+
+    def load_embeddings(self) -> None:
+        """
+        Reads the embeddings of the examples from the embedding cache and stacks them in a matrix. Examples that are not cached
+        are left out.
+        """
+        rows, names = [], []
+        for example, name in self.examples.items():
+            embedding = self.embedding_cache.get(self.model, example)
+            if embedding is not None:
+                rows.append(self.normalize_vector(embedding))
+                names.append(name)
+        self.example_names = names
+        self.matrix = np.vstack(rows) if rows else None
+
+    def load(self) -> dict:
+        """
+        Reads the intents file. Its intents are added to the default ones, replacing the fields of the ones with the same name.
+
+        Returns:
+            dict: Examples and response of each intent.
+        """
+        intents = copy.deepcopy(self.DEFAULT_INTENTS)
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for name, intent in json.load(f).items():
+                    intents.setdefault(name, {}).update(intent)
+        for name, intent in intents.items():
+            if not intent.get("examples") or not intent.get("response"):
+                raise ValueError(f"The intent {name} needs examples and a response")
+        return intents
+
+    def normalize(self, text:str) -> str:
+        """
+        Normalizes a question or example by removing the special characters, lowercasing it and collapsing whitespace, like
+        the sanitized questions.
+
+        Args:
+            text (str): Question or example.
+
+        Returns:
+            str: Normalized text.
+        """
+        return " ".join(re.sub(r'[^a-zA-Z0-9\s]', '', text).lower().split())
+
+    def normalize_vector(self, embedding:list[float]) -> np.ndarray:
+        """
+        Converts an embedding to a unit vector, so the dot product is the cosine similarity.
+
+        Args:
+            embedding (list[float]): Embedding vector.
+
+        Returns:
+            np.ndarray: Normalized float32 vector.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
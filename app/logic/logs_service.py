@@ -14,8 +14,24 @@ class LogsService:
     Methods:
         parse_logs(): Retrieves and parses logs from the system.
         get_log_statistics_by_type(): Computes statistics grouped by log type and task.
+        get_prefix_cache_hit_ratio(): Computes the share of input tokens served from the prompt prefix cache.
+        get_model_statistics_by_task(): Computes LLM call statistics grouped by task and model.
     """
 
+    #Responses that make the next step of the pipeline fail, by task (e.g. an empty query raises NoCypherError)
+    FAILED_RESPONSE_CHECKS = {
+        "cypher_generation": lambda response: not str(response or "").strip(),
+        "entity_extraction": lambda response: '"entities":[]' in str(response or "").replace(" ", "")
+    }
+
+    #Errors logged later in the same request that count as a failure of the task's response (joined by request_id)
+    FAILED_REQUEST_ERRORS = {
+        "question_validation": ["ValidationError", "InvalidQuestion"],
+        "entity_extraction": ["EntityExtractionError", "RetryNotFoundError"],
+        "question_analysis": ["QuestionAnalysisError", "InvalidQuestion", "RetryNotFoundError"],
+        "cypher_generation": ["NoCypherError", "RelatedNodesNotFoundError"]
+    }
+
     def __init__(self):
         """
         Initializes the LogsService with a LogReader instance for reading log files.
@@ -34,7 +50,9 @@ class LogsService:
             "register_query": [],
             "llm_call": [],
             "embedding": [],
-            "database": []
+            "database": [],
+            "analysis_comparison": [],
+            "speculation": []
         }
 
         #Assign logs to their corresponding categories based on 'log_type'
@@ -57,6 +75,7 @@ class LogsService:
                 - avg_cost: Average cost of logs/tasks with a 'cost' field.
                 - avg_duration_s: Average duration in seconds for logs/tasks with a 'log_duration_sec' field.
                 - count: Total number of log entries of that type/task.
+                - prefix_cache_hit_ratio: For tasks that log 'tokens', share of the input tokens served from the prompt prefix cache.
                 - df: Original DataFrame.
         """
         logs_by_type, _ = self.parse_logs()
@@ -96,6 +115,7 @@ class LogsService:
                         "avg_cost": task_df["cost"].mean() if "cost" in task_df else None,
                         "avg_duration_s": task_df["log_duration_sec"].mean() if "log_duration_sec" in task_df else None,
                         "count": len(task_df),
+                        "prefix_cache_hit_ratio": self.get_prefix_cache_hit_ratio(task_df),
                         "df": task_df
                     }
 
@@ -103,3 +123,88 @@ class LogsService:
 
         return stats
 
+    def get_prefix_cache_hit_ratio(self, df:pd.DataFrame) -> float|None:
+        """
+        Computes the share of the input tokens of some LLM calls that were served from OpenAI's prompt prefix cache.
+
+        Args:
+            df (pd.DataFrame): Log entries with a 'tokens' field.
+
+        Returns:
+            float|None: Cached input tokens divided by input tokens, None if the entries have no input tokens.
+        """
+        if "tokens" not in df:
+            return None
+        tokens = [t for t in df["tokens"] if isinstance(t, dict)]
+        input_tokens = sum(t.get("input", 0) for t in tokens)
+        if input_tokens == 0:
+            return None
+        return sum(t.get("cached", 0) for t in tokens) / input_tokens
+
+    def get_model_statistics_by_task(self, stats:dict = None, since:dict = None, error_logs:list[dict] = None) -> dict:
+        """
+        Computes the statistics of the LLM calls of each task and model, used to route tasks to models.
+        Responses reused from the cache are excluded, since they do not reflect the model's latency or cost.
+
+        A call failed if its response fails the check of its task (FAILED_RESPONSE_CHECKS), or if one of the errors of its
+        task (FAILED_REQUEST_ERRORS) was logged in the same request, e.g. the question was rejected or its query found nothing.
+
+        Args:
+            stats (dict, optional): Result of get_log_statistics_by_type(). Computed if it is not given.
+            since (dict, optional): ISO timestamp by task name. Only the calls of those tasks logged since then are counted,
+                e.g. since their canary started (ModelRouter.get_canary_starts()).
+            error_logs (list[dict], optional): Error log entries. Read from the error log if they are not given.
+
+        Returns:
+            dict: For each task, a dictionary with the statistics of each model:
+                - count: Number of calls.
+                - avg_duration_s: Average duration in seconds, including the queue and retry waits.
+                - p95_duration_s: 95th percentile of the duration in seconds.
+                - avg_api_latency_s: Average time waiting for the API in seconds, without the queue and retry waits.
+                - p95_api_latency_s: 95th percentile of the API latency in seconds.
+                - avg_cost: Average cost.
+                - failure_rate: Ratio of failed calls. None if the task has no way to detect failures.
+        """
+        if stats is None:
+            stats = self.get_log_statistics_by_type()
+        if "llm_call" not in stats:
+            return {}
+        if error_logs is None:
+            error_logs = self.reader.read_error_logs()
+
+        #Requests where each error type was logged
+        failed_requests = {}
+        for error in error_logs:
+            if error.get("request_id"):
+                failed_requests.setdefault(error.get("error_type"), set()).add(error["request_id"])
+
+        df = stats["llm_call"]["df"]
+        if "task_name" not in df.columns or "model" not in df.columns:
+            return {}
+        if "cache_hit" in df.columns:
+            df = df[df["cache_hit"] != True]
+        if since and "timestamp" in df.columns:
+            starts = pd.to_datetime(df["task_name"].map(since), errors="coerce")
+            df = df[starts.isna() | (pd.to_datetime(df["timestamp"], errors="coerce") >= starts)]
+
+        model_stats = {}
+        for (task_name, model), group in df.groupby(["task_name", "model"]):
+            check = self.FAILED_RESPONSE_CHECKS.get(task_name)
+            error_types = self.FAILED_REQUEST_ERRORS.get(task_name)
+            failed = pd.Series(False, index=group.index)
+            if check is not None and "response" in group:
+                failed |= group["response"].apply(check).astype(bool)
+            if error_types and "request_id" in group:
+                request_ids = set().union(*(failed_requests.get(error_type, set()) for error_type in error_types))
+                failed |= group["request_id"].isin(request_ids)
+            api_latency = pd.to_numeric(group["api_latency_sec"], errors="coerce") if "api_latency_sec" in group else None
+            model_stats.setdefault(task_name, {})[model] = {
+                "count": len(group),
+                "avg_duration_s": group["log_duration_sec"].mean() if "log_duration_sec" in group else None,
+                "p95_duration_s": group["log_duration_sec"].quantile(0.95) if "log_duration_sec" in group else None,
+                "avg_api_latency_s": api_latency.mean() if api_latency is not None and api_latency.notna().any() else None,
+                "p95_api_latency_s": api_latency.quantile(0.95) if api_latency is not None and api_latency.notna().any() else None,
+                "avg_cost": group["cost"].mean() if "cost" in group else None,
+                "failure_rate": failed.sum() / len(group) if check is not None or error_types else None
+            }
+        return model_stats
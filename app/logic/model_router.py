@@ -0,0 +1,174 @@
+import copy
+import json
+import os
+import random
+from datetime import datetime
+from config.config import MODEL_ROUTES_PATH, ROUTER_MIN_SAMPLES, ROUTER_MAX_FAILURE_INCREASE, ROUTER_MAX_LATENCY_RATIO
+from llm.llm_client import LlmClient
+
+class ModelRouter:
+    """
+    Chooses the model of each LLM task from a routing table.
+
+    Each task has a primary model and can have a canary model that receives a percentage of the calls. The canary is
+    compared with the primary model using the LLM call statistics of LogsService, only with the calls of both models made
+    since the canary started. If it is not slower, more expensive or more failure prone, its percentage is doubled until it
+    replaces the primary model. Otherwise it is rolled back. The canaries of tasks whose failures cannot be measured are
+    only rolled back automatically, never increased or promoted.
+
+    Attributes:
+        DEFAULT_ROUTES (dict): Routes used for the tasks that are not in the routes file.
+        path (str): Path of the JSON file where the routes are saved. Empty to keep them in memory.
+        routes (dict): Route of each task, with its model, canary model, canary percentage, the canary calls at the last update
+            and the time the canary started.
+
+    Methods:
+        route(): Chooses the model of a call.
+        set_canary(): Starts sending a percentage of the calls of a task to a model.
+        get_canary_starts(): Returns the time each canary started, to compute its statistics.
+        update_from_stats(): Promotes or rolls back the canaries from the logged statistics.
+        load(): Reads the routes file.
+        save(): Writes the routes file.
+    """
+
+    DEFAULT_ROUTES = {
+        task_name: {"model": "gpt-4.1", "canary_model": None, "canary_percent": 0.0, "canary_samples": 0, "canary_started_at": None}
+        for task_name in ["question_validation", "entity_extraction", "question_analysis", "cypher_generation", "rag_answer_generation"]
+    }
+
+    def __init__(self, path:str = MODEL_ROUTES_PATH):
+        """
+        Initializes the ModelRouter with the saved routes, or the default ones.
+
+        Args:
+            path (str): Path of the JSON file where the routes are saved. Empty to keep them in memory.
+        """
+        self.path = path
+        self.routes = self.load()
+
+    def route(self, task_name:str) -> tuple[str, str]:
+        """
+        Chooses the model of a call, sending the canary percentage of the calls to the canary model.
+
+        Args:
+            task_name (str): Task of the call.
+
+        Returns:
+            tuple[str, str]: The model and the route used ("primary" or "canary").
+        """
+        route = self.routes[task_name]
+        if route["canary_model"] and random.random() * 100 < route["canary_percent"]:
+            return route["canary_model"], "canary"
+        return route["model"], "primary"
+
+    def set_canary(self, task_name:str, model:str, percent:float) -> None:
+        """
+        Starts sending a percentage of the calls of a task to a canary model.
+
+        Args:
+            task_name (str): Task to route.
+            model (str): Canary model.
+            percent (float): Percentage of calls sent to the canary (0-100).
+        """
+        if task_name not in self.routes:
+            raise ValueError(f"Unknown task: {task_name}")
+        if model not in LlmClient.MODEL_INFO:
+            raise ValueError(f"Unknown model: {model}")
+        if percent < 0 or percent > 100:
+            raise ValueError(f"Canary percentage is out of bounds (0-100): {percent}")
+
+        self.routes[task_name].update({"canary_model": model, "canary_percent": percent, "canary_samples": 0, "canary_started_at": datetime.now().isoformat()})
+        self.save()
+
+    def get_canary_starts(self) -> dict:
+        """
+        Returns the time each canary started, so the statistics compared by update_from_stats() only have the calls made since then.
+
+        Returns:
+            dict: ISO timestamp of the start of the canary of each task that has one.
+        """
+        return {task_name: route["canary_started_at"] for task_name, route in self.routes.items()
+                if route.get("canary_model") and route.get("canary_started_at")}
+
+    def update_from_stats(self, model_stats:dict) -> list[dict]:
+        """
+        Compares each canary with its primary model once it has ROUTER_MIN_SAMPLES new calls since the last update.
+        A canary with a higher failure rate (over ROUTER_MAX_FAILURE_INCREASE), a higher average API latency (over
+        ROUTER_MAX_LATENCY_RATIO) or a higher average cost is rolled back. Otherwise its percentage is doubled, and at 100% it
+        becomes the primary model. If the task has no failure rate, the canary is held at its percentage instead, since a
+        cheaper and faster model could be giving worse responses.
+
+        Args:
+            model_stats (dict): Statistics by task and model of the calls made since each canary started, from
+                LogsService.get_model_statistics_by_task(since=get_canary_starts()).
+
+        Returns:
+            list[dict]: The decision of each updated task, with its task name, action ("rollback", "hold", "increase" or "promote") and reasons.
+        """
+        decisions = []
+        for task_name, route in self.routes.items():
+            canary = route["canary_model"]
+            if not canary or route["canary_percent"] <= 0:
+                continue
+
+            task_stats = model_stats.get(task_name, {})
+            canary_stats = task_stats.get(canary)
+            primary_stats = task_stats.get(route["model"])
+            if canary_stats is None or primary_stats is None or canary_stats["count"] - route["canary_samples"] < ROUTER_MIN_SAMPLES:
+                continue
+
+            reasons = []
+            has_failure_rate = canary_stats.get("failure_rate") is not None and primary_stats.get("failure_rate") is not None
+            if has_failure_rate and canary_stats["failure_rate"] > primary_stats["failure_rate"] + ROUTER_MAX_FAILURE_INCREASE:
+                reasons.append(f"failure rate {canary_stats['failure_rate']:.3f} vs {primary_stats['failure_rate']:.3f}")
+            #Compare the time spent in the API, since the queue and retry waits depend on the load, not on the model
+            canary_latency, primary_latency = canary_stats.get("avg_api_latency_s"), primary_stats.get("avg_api_latency_s")
+            if canary_latency is not None and primary_latency is not None and canary_latency > primary_latency * ROUTER_MAX_LATENCY_RATIO:
+                reasons.append(f"latency {canary_latency:.2f}s vs {primary_latency:.2f}s")
+            if canary_stats["avg_cost"] > primary_stats["avg_cost"]:
+                reasons.append(f"cost {canary_stats['avg_cost']:.6f} vs {primary_stats['avg_cost']:.6f}")
+
+            if reasons:
+                route.update({"canary_model": None, "canary_percent": 0.0, "canary_samples": 0, "canary_started_at": None})
+                action = "rollback"
+            elif not has_failure_rate:
+                route.update({"canary_samples": canary_stats["count"]})
+                reasons.append("no failure signal for this task")
+                action = "hold"
+            elif route["canary_percent"] * 2 >= 100:
+                route.update({"model": canary, "canary_model": None, "canary_percent": 0.0, "canary_samples": 0, "canary_started_at": None})
+                action = "promote"
+            else:
+                route.update({"canary_percent": route["canary_percent"] * 2, "canary_samples": canary_stats["count"]})
+                action = "increase"
+            decisions.append({"task_name": task_name, "model": canary, "action": action, "reasons": reasons})
+
+        if decisions:
+            self.save()
+        return decisions
+
+    def load(self) -> dict:
+        """
+        Reads the routes file. Tasks missing from the file use the default routes.
+
+        Returns:
+            dict: Route of each task.
+        """
+        routes = copy.deepcopy(self.DEFAULT_ROUTES)
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for task_name, route in json.load(f).items():
+                    routes.setdefault(task_name, {}).update(route)
+        return routes
+
+    def save(self) -> None:
+        """
+        Writes the routes file, if there is one.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.routes, f, indent=2)
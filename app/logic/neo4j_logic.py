@@ -11,6 +11,7 @@ class Neo4jLogic:
         generate_similarity_queries(): Generate label-based similarity queries.
         generate_similarity_queries_no_label(): Generate similarity queries ignoring node labels.
         parse_similarity_results(): Parse similarity search results grouped by entity types.
+        parse_similarity_scores(): Parse the best similarity score of each node found by similarity search.
         parse_related_nodes_results(): Parse related node records into structured data.
         remove_duplicate_text(): Remove duplicate semicolon-separated segments in a string.
         remove_duplicate_text_in_list(): Clean and deduplicate a list of strings.
@@ -122,6 +123,23 @@ class Neo4jLogic:
 
         return parsed
 
+    def parse_similarity_scores(self, results: list[dict]) -> dict:
+        """
+        Parse the results from a batch of similarity queries, keeping the best similarity score of each node.
+
+        Args:
+            results (list[dict]): List of result dicts returned from Neo4j APOC cypher calls.
+
+        Returns:
+            dict: Mapping from node name to its highest similarity. (e.g. {"world hunger": 0.82, "improve agriculture technology": 0.71})
+        """
+        scores = {}
+        for item in results:
+            data = item["value"]  #Contains 'name', 'similarity', 'labels'
+            scores[data["name"]] = max(data["similarity"], scores.get(data["name"], 0.0))
+
+        return scores
+
     def parse_related_nodes_results(self, records: list[dict]) -> dict:
         """
         Parse related node records from Neo4j query results into structured entities, relationships, and other info. Removes duplicates.
@@ -1,15 +1,37 @@
-from cache import AsyncTTL
 from data.neo4j_client import Neo4jClient
+from data.answer_cache import AnswerCache
+from data.stage_cache import StageCache
 from logic.llm_tasks import LlmTasks
 from logs.logger import Logger
+from logs.tracer import Tracer
 from logic. neo4j_logic import Neo4jLogic
+from logic.semantic_cache import SemanticCache
+from logic.graph_fingerprint import GraphFingerprint
+from logic.pii_detector import PiiDetector
+from logic.intent_classifier import IntentClassifier
+from logic.pii_pool import PiiPool
+from logic.admission_controller import AdmissionController, AdmissionRejected
+from logic.stage import Stage, StageStop
+from logic.stage_graph import StageGraph
+from llm.tracked_transport import TrackedTransport
+from llm.latency_budget import LatencyBudget
+from config.config import ANSWER_CACHE_PATH, STAGE_CACHE_PATH, SEMANTIC_CACHE_ENABLED, QUESTION_ANALYSIS_MODE, QUESTION_ANALYSIS_SHADOW_PERCENT, SPECULATION_POLICY, ADMISSION_MAX_IN_FLIGHT, \
+    REQUEST_DEADLINE_SEC, DEADLINE_SKIP_RETRY_SEC, DEADLINE_FAST_MODEL_SEC, DEADLINE_FAST_MODEL, DEADLINE_CAP_CONTEXT_SEC, DEADLINE_CONTEXT_TOKEN_BUDGET, \
+    DEADLINE_PARTIAL_ANSWER_SEC, DEADLINE_PARTIAL_ANSWER_ITEMS, INTENT_FAST_PATH
 import time
+import hashlib
+import inspect
+from array import array
 from datetime import datetime
 from models.entity import EntityList, Entity
 from models.question import Question
 import re
 import json
-from presidio_analyzer import AnalyzerEngine
+import random
+import asyncio
+from contextlib import aclosing
+from functools import partial
+from typing import Any, AsyncIterator, Callable
 
 class Orchestrator:
     """
@@ -23,12 +45,46 @@ class Orchestrator:
         llm_tasks (LlmTasks): Handles tasks involving the language model.
         neo4j_logic (Neo4jLogic): Handles the queries sent to the database and the responses received.
         logger (Logger): Used for logging data and errors during question processing.
-        pii_analyzer (AnalyzerEngine): Detects personally identifiable information (PII) in user input.
+        pii_detector (PiiDetector): Detects personally identifiable information (PII) in user input.
+        pii_pool (PiiPool): Worker pool where the PII checks of the pipeline run, outside of the event loop.
+        admission_controller (AdmissionController): Limits the questions answered at the same time, shared by the process. None if disabled.
+        graph_fingerprint (GraphFingerprint): Last known fingerprint of the graph, which keys the cached results that depend on it.
+        answer_cache (AnswerCache): Persistent answers to previous questions, shared by all processes. None if disabled.
+        stage_cache (StageCache): Persistent intermediate results of the stages, reused by different questions. None if disabled.
+        semantic_cache (SemanticCache): Answers to previous similar questions. None if disabled.
+        analysis_mode (str): "combined" to validate the question and extract its entities in one LLM call, "separate" for two calls.
+        speculation_policy (str): "off" to run the stages of steps 1 to 4 in order, "cancel" or "discard" to run them concurrently and cancel or ignore the unneeded work.
+        speculative_tasks (set): Discarded speculative tasks that are still running.
+        speculation_counts (dict): Number of speculative runs ("attempts") and how many of them were used ("successes").
 
     Methods:
+        warm_up(): Opens the connections to the OpenAI API before the first question.
         contains_pii(text): Detects whether the input contains PII.
         sanitize_input(text): Cleans input by removing special characters.
         process_question(userQuestion): Full RAG pipeline for processing and answering a user's question.
+        answer_question(userQuestion): Same as process_question, returning the cost and stage timings with the answer.
+        run_question(userQuestion, admission_wait): Pipeline of answer_question, once the question is admitted.
+        process_question_stream(userQuestion, deadline_sec): Same as process_question, but streams the final answer.
+        run_question_stream(userQuestion, admission_wait): Pipeline of process_question_stream, once the question is admitted.
+        log_admission_rejected(error): Logs a question that was not admitted.
+        get_answer_options(): Returns how the final answer is generated with the time left of the question's deadline.
+        build_partial_answer(related_nodes, node_scores): Builds an answer from the best ranked context without the LLM.
+        retrieve_context(userQuestion): Stages of the pipeline that retrieve the context to answer a question.
+        build_stage_graph(): Builds the graph of stages of the pipeline with the current settings.
+        check_pii_stage(state), sanitize_stage(state), intent_stage(state), answer_cache_stage(state), semantic_cache_stage(state), validate_stage(state), extract_stage(state),
+        analyze_stage(state), embed_stage(state), similarity_stage(state), retry_stage(state), cypher_generation_stage(state),
+        cypher_execution_stage(state), answer_stage(state): Stages of the pipeline.
+        stop_if_invalid(question): Stops the pipeline if the question is not valid.
+        get_question_text(state): Returns the validated or the sanitized question of the pipeline state.
+        get_queries_for_logging(queries): Removes the embeddings from similarity queries.
+        run_cached(stage, key, call): Returns the cached result of a stage input, or calls the stage and caches its result.
+        hash_embedding(embedding): Hashes an embedding to use it in a cache key.
+        log_speculation(state, timings, report, wall_time): Logs the outcome and the time saved of a speculative run.
+        drop_speculative(tasks): Cancels or discards speculative work that is not needed.
+        analyze_question(question): Validates the question and extracts its entities with the configured path.
+        run_combined_analysis(question): Validates the question and extracts its entities in one LLM call.
+        run_separate_analysis(question): Validates the question and then extracts its entities.
+        log_analysis_comparison(question, results): Logs how much the combined and separate paths agree.
     """
 
     def __init__(self):
@@ -42,11 +98,44 @@ class Orchestrator:
         self.llm_tasks = LlmTasks()
         self.neo4j_logic = Neo4jLogic()
         self.logger = Logger()
-        self.pii_analyzer = AnalyzerEngine()
+        self.pii_detector = PiiDetector()
+        self.pii_pool = PiiPool()
+        self.pii_pool.warm_up()
+        self.admission_controller = AdmissionController.get_shared() if ADMISSION_MAX_IN_FLIGHT > 0 else None
+        self.graph_fingerprint = GraphFingerprint(self.neo4j_client.get_graph_fingerprint)
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_PATH else None
+        self.stage_cache = StageCache() if STAGE_CACHE_PATH else None
+        self.semantic_cache = SemanticCache(fingerprint_fn=self.graph_fingerprint.get) if SEMANTIC_CACHE_ENABLED else None
+        self.intent_classifier = IntentClassifier(embedding_cache=self.llm_tasks.llm_client.embedding_cache) if INTENT_FAST_PATH else None
+        self.analysis_mode = QUESTION_ANALYSIS_MODE
+        self.speculation_policy = SPECULATION_POLICY
+        self.speculative_tasks = set()
+        self.speculation_counts = {"attempts": 0, "successes": 0}
+
+    async def warm_up(self) -> float:
+        """
+        Open the connections to the OpenAI API before the first question, so it does not wait for the handshakes, read the graph
+        fingerprint, and embed the examples of the intent fast path that are not in the embedding cache.
+
+        Returns:
+            float: Duration of the connection warm-up in seconds.
+        """
+        duration = await self.llm_tasks.llm_client.warm_up()
+        await self.graph_fingerprint.refresh()
+        if self.intent_classifier is not None:
+            try:
+                await self.intent_classifier.embed_examples(self.llm_tasks.llm_client)
+            except RuntimeError:
+                raise
+            except Exception as e:
+                #The examples are still matched by their words
+                self.logger.log_error("IntentEmbeddingError", {"error": str(e)})
+        return duration
 
     def contains_pii(self, text: str) -> bool:
         """
-        Check if a given text contains any PII (Personally Identifiable Information).
+        Check if a given text contains any PII (Personally Identifiable Information). Pattern recognizers run first and
+        the NLP detection of names only runs when they find nothing.
         
         Args:
             text (str): The input text to analyze.
@@ -54,22 +143,7 @@ class Orchestrator:
         Returns:
             bool: True if PII is detected, False otherwise.
         """
-        #PII entities to block
-        PII_ENTITIES = [
-            "EMAIL_ADDRESS",
-            "PHONE_NUMBER",
-            "CREDIT_CARD",
-            "IBAN_CODE",
-            "PERSON",
-            "IP_ADDRESS",
-            "MEDICAL_LICENSE",
-            "URL",
-            "CRYPTO",
-            "ES_NIF",
-            "ES_NIE"
-        ]
-        results = self.pii_analyzer.analyze(text=text, entities=PII_ENTITIES, language='en')
-        return len(results) > 0
+        return self.pii_detector.contains_pii(text)
 
     def sanitize_input(self, text: str) -> str:
         """
@@ -84,8 +158,7 @@ class Orchestrator:
         cleaned = re.sub(r'[^a-zA-Z0-9\s]', '', text) 
         return cleaned.strip()
 
-    @AsyncTTL(time_to_live=3600, maxsize=1024)
-    async def process_question(self, userQuestion: str) -> str:
+    async def process_question(self, userQuestion: str, deadline_sec: float = None) -> str:
         """
         Process a user's natural language question and generate a natural language response
         using only the information contained in the graph database.
@@ -100,121 +173,581 @@ class Orchestrator:
         7. Executes the query and parses the results.
         8. Generates a natural language response based on the retrieved information.
 
-        Caches results using AsyncTTL with a 1-hour TTL and a maximum size of 1024 entries.
+        Answers are cached in the answer cache, shared by all processes, and questions that cannot be answered are cached for a shorter time.
+        With a deadline, the steps degrade when the time left runs low (see get_answer_options()).
 
         Args:
             userQuestion (str): The question asked by the user.
+            deadline_sec (float, optional): Seconds to answer the question, REQUEST_DEADLINE_SEC by default. 0 for no deadline.
 
         Returns:
             str: Final answer generated based on the retrieved data or an error message.
         """
+        result = await self.answer_question(userQuestion, deadline_sec)
+        return result["answer"]
+
+    @Tracer.traced("question", root=True)
+    async def answer_question(self, userQuestion: str, deadline_sec: float = None) -> dict:
+        """
+        Run the pipeline of process_question() and return the answer with its cost and timings. Each call is traced as a request.
+        The question waits for a free slot of the admission controller, and is rejected with a busy message if the wait queue is
+        full or its wait times out. The deadline of the question starts before the wait.
+
+        Args:
+            userQuestion (str): The question asked by the user.
+            deadline_sec (float, optional): Seconds to answer the question, REQUEST_DEADLINE_SEC by default. 0 for no deadline.
+
+        Returns:
+            dict: The result of run_question(). Rejected questions have the busy message as answer and the "rejected" reason.
+        """
+        with LatencyBudget.start_budget(REQUEST_DEADLINE_SEC if deadline_sec is None else deadline_sec):
+            if self.admission_controller is None:
+                return await self.run_question(userQuestion)
+            start = time.time()
+            try:
+                async with self.admission_controller.admit(LatencyBudget.cap_timeout(self.admission_controller.queue_timeout)) as admission_wait:
+                    return await self.run_question(userQuestion, admission_wait)
+            except AdmissionRejected as e:
+                self.log_admission_rejected(e)
+                return {"answer": "The service is busy, try again in a moment.", "cost": None, "duration_sec": time.time()-start, "stage_timings": {}, "connections": {"new": 0, "reused": 0}, "rejected": e.reason}
+
+    async def run_question(self, userQuestion: str, admission_wait: float = None) -> dict:
+        """
+        Run the pipeline of process_question() and return the answer with its cost and timings.
+
+        Args:
+            userQuestion (str): The question asked by the user.
+            admission_wait (float, optional): Seconds the question waited for the admission controller.
+
+        Returns:
+            dict: A dictionary with:
+                - "answer": final answer or the message of the step that stopped the pipeline,
+                - "cost": cost of the pipeline, None if it stopped before the final answer or the answer was cached,
+                - "duration_sec": duration of the pipeline,
+                - "stage_timings": duration of each step that ran, in seconds,
+                - "connections": API requests that opened a new connection ("new") or reused a pooled one ("reused").
+        """
         start = time.time()
-        total_cost = 0
+        stage_timings = {}
+        connections = TrackedTransport.start_counting()
+        budget = LatencyBudget.get_current()
 
-        #1. Block personal information and sanitize the input.
-        #Check if the questions contains PII
-        if self.contains_pii(userQuestion):
-            self.logger.log_error("InvalidQuestionPII", {
-                    "question": "PII containing question"
-                })
-            return "Invalid question, contains PII or other unauthorized text, try again."
-        
-        #Sanitize the user's input
-        sanitized_question = self.sanitize_input(userQuestion)
-        if len(sanitized_question) == 0:
-            return "Invalid question, try again."
+        #1-7. Retrieve the context from the database
+        message, state = await self.retrieve_context(userQuestion, stage_timings)
+        if message is not None:
+            return {"answer": message, "cost": None, "duration_sec": time.time()-start, "stage_timings": stage_timings, "connections": connections}
 
-        #2. Validate the question
-        try:      
-            question, cost = await self.llm_tasks.validate_question(sanitized_question)
-            
-            # If validation fails, log the error and inform the user
-            if not question.is_valid:           
-                self.logger.log_error("InvalidQuestion", {
-                    "question": question.value,
-                    "reason": question.reasoning, 
-                })
-                return f"Your question is not valid. Reason: {question.reasoning}"
-        except RuntimeError as e:
-            raise 
-        except Exception as e:
-            self.logger.log_error("ValidationError", {
-                    "question": sanitized_question,
-                    "error": str(e), 
-                })
-            raise
-        total_cost +=cost
-        
-        #3. Extract entities from the question
+        #8. Generate the final answer in natural languague
+        await self.build_stage_graph().run(state, ["answer"], stage_timings)
+        question = state["question"]
+        final_answer = state["final_answer"]
+        total_cost = state["total_cost"]
+
+        end = time.time()
+        elapsed_time = end-state["start"]
+
+        #Cache the answer for the same and similar questions, unless it is a partial answer or the graph it came from is unknown
+        if self.answer_cache is not None and not state.get("partial_answer") and state["graph"] is not None:
+            await asyncio.to_thread(self.answer_cache.set, state["sanitized_question"], final_answer, elapsed_time, graph=state["graph"])
+        if self.semantic_cache is not None and not state.get("partial_answer"):
+            self.semantic_cache.add(state["sanitized_question"], state["question_embedding"], final_answer, elapsed_time)
+
+        #Log the response generation's performance
+        self.logger.log_data({
+            "timestamp": datetime.now().isoformat(),
+            "log_type": "register_query",
+            "user_prompt": question.value,
+            "final_response": final_answer,
+            **state.get("analysis", {}),
+            "cache_hit": False,
+            "cache_hit_rate": self.semantic_cache.hit_rate() if self.semantic_cache is not None else None,
+            "answer_cache_hit_rate": self.answer_cache.hit_rate() if self.answer_cache is not None else None,
+            "stage_timings": stage_timings,
+            "cached_stages": state.get("cached_stages", []),
+            "resumed_from": state.get("resumed_from"),
+            "connections": connections,
+            "pii_pool": self.pii_pool.get_stats(),
+            "admission_wait_sec": admission_wait,
+            "admission": self.admission_controller.get_stats() if self.admission_controller is not None else None,
+            "deadline_sec": budget.deadline_sec if budget is not None else None,
+            "degradations": budget.degradations if budget is not None else [],
+            "log_duration_sec": elapsed_time,
+            "cost": total_cost
+        })
+
+        return {"answer": final_answer, "cost": total_cost, "duration_sec": elapsed_time, "stage_timings": stage_timings, "connections": connections}
+
+    @Tracer.traced("question_stream", root=True)
+    async def process_question_stream(self, userQuestion: str, deadline_sec: float = None) -> AsyncIterator[str]:
+        """
+        Same pipeline as process_question(), but the final answer is yielded as it is generated. Each call is traced as a request.
+        Error messages of the previous steps, cached answers, partial answers and the busy message of rejected questions are yielded
+        as a single chunk.
+
+        Args:
+            userQuestion (str): The question asked by the user.
+            deadline_sec (float, optional): Seconds to answer the question, REQUEST_DEADLINE_SEC by default. 0 for no deadline.
+
+        Yields:
+            str: Chunks of the final answer or an error message.
+        """
+        with LatencyBudget.start_budget(REQUEST_DEADLINE_SEC if deadline_sec is None else deadline_sec):
+            if self.admission_controller is None:
+                async with aclosing(self.run_question_stream(userQuestion)) as deltas:
+                    async for delta in deltas:
+                        yield delta
+                return
+            try:
+                async with self.admission_controller.admit(LatencyBudget.cap_timeout(self.admission_controller.queue_timeout)) as admission_wait:
+                    async with aclosing(self.run_question_stream(userQuestion, admission_wait)) as deltas:
+                        async for delta in deltas:
+                            yield delta
+            except AdmissionRejected as e:
+                self.log_admission_rejected(e)
+                yield "The service is busy, try again in a moment."
+
+    async def run_question_stream(self, userQuestion: str, admission_wait: float = None) -> AsyncIterator[str]:
+        """
+        Pipeline of process_question_stream(), once the question is admitted.
+
+        Args:
+            userQuestion (str): The question asked by the user.
+            admission_wait (float, optional): Seconds the question waited for the admission controller.
+
+        Yields:
+            str: Chunks of the final answer or an error message.
+        """
+        #1-7. Retrieve the context from the database
+        stage_timings = {}
+        connections = TrackedTransport.start_counting()
+        budget = LatencyBudget.get_current()
+        message, state = await self.retrieve_context(userQuestion, stage_timings)
+        if message is not None:
+            yield message
+            return
+        question = state["question"]
+        related_nodes = state["related_nodes"]
+        total_cost = state["total_cost"]
+
+        #8. Stream the final answer in natural languague, or the partial answer if there is no time left to generate it
+        first_delta_time = None
+        start_answer = time.time()
+        options = self.get_answer_options()
         try:
-            extracted_entities, cost = await self.llm_tasks.extract_entities(question.value)
+            if options["partial"]:
+                raise TimeoutError("No time left to generate the answer")
+            stream = await self.llm_tasks.generate_final_answer_stream(question.value, related_nodes, state["node_scores"], model=options["model"], token_budget=options["token_budget"])
+            #Close the stream even if the consumer stops reading the answer before it is completed
+            async with aclosing(aiter(stream)) as deltas:
+                async for delta in deltas:
+                    if first_delta_time is None:
+                        first_delta_time = time.time()
+                    yield delta
+            stage_timings["answer"] = time.time()-start_answer
         except RuntimeError as e:
             raise
-        except Exception as e:
-            self.logger.log_error("EntityExtractionError", {
+        except TimeoutError as e:
+            if first_delta_time is not None or not (options["partial"] or (budget is not None and budget.expired())):
+                self.logger.log_error("ResponseGenerationError", {
                     "question": question.value,
-                    "error": str(e), 
+                    "context": related_nodes,
+                    "error": str(e),
                 })
+                raise
+            if not options["partial"]:
+                budget.degrade("partial_answer", reason="timeout")
+            partial_answer = self.build_partial_answer(related_nodes, state["node_scores"])
+            stage_timings["answer"] = time.time()-start_answer
+            first_delta_time = time.time()
+            yield partial_answer
+            stream = None
+        except Exception as e:
+            self.logger.log_error("ResponseGenerationError", {
+                "question": question.value,
+                "context": related_nodes,
+                "error": str(e), 
+            })
             raise
-        total_cost +=cost
-        
-        #4. Generate embeddings for the extracted entities
+        total_cost += stream.cost if stream is not None else 0
+        final_answer = stream.text if stream is not None else partial_answer
+
+        end = time.time()
+        elapsed_time = end-state["start"]
+
+        #Cache the answer for the same and similar questions, unless it is a partial answer or the graph it came from is unknown
+        if self.answer_cache is not None and stream is not None and stream.completed and state["graph"] is not None:
+            await asyncio.to_thread(self.answer_cache.set, state["sanitized_question"], stream.text, elapsed_time, graph=state["graph"])
+        if self.semantic_cache is not None and stream is not None and stream.completed:
+            self.semantic_cache.add(state["sanitized_question"], state["question_embedding"], stream.text, elapsed_time)
+
+        #Log the response generation's performance
+        self.logger.log_data({
+            "timestamp": datetime.now().isoformat(),
+            "log_type": "register_query",
+            "user_prompt": question.value,
+            "final_response": final_answer,
+            "streamed": True,
+            **state.get("analysis", {}),
+            "cache_hit": False,
+            "cache_hit_rate": self.semantic_cache.hit_rate() if self.semantic_cache is not None else None,
+            "answer_cache_hit_rate": self.answer_cache.hit_rate() if self.answer_cache is not None else None,
+            "time_to_first_token_sec": first_delta_time-state["start"] if first_delta_time else None,
+            "stage_timings": stage_timings,
+            "cached_stages": state.get("cached_stages", []),
+            "resumed_from": state.get("resumed_from"),
+            "connections": connections,
+            "pii_pool": self.pii_pool.get_stats(),
+            "admission_wait_sec": admission_wait,
+            "admission": self.admission_controller.get_stats() if self.admission_controller is not None else None,
+            "deadline_sec": budget.deadline_sec if budget is not None else None,
+            "degradations": budget.degradations if budget is not None else [],
+            "log_duration_sec": elapsed_time,
+            "cost": total_cost
+        })
+
+    def log_admission_rejected(self, error: AdmissionRejected) -> None:
+        """
+        Log a question that was not admitted, with the queue depth and wait statistics of the admission controller.
+
+        Args:
+            error (AdmissionRejected): The rejection.
+        """
+        self.logger.log_error("AdmissionRejected", {
+                "reason": error.reason,
+                **self.admission_controller.get_stats()
+            })
+
+    async def retrieve_context(self, userQuestion: str, stage_timings: dict = None) -> tuple[str|None, dict|None]:
+        """
+        Run the stages of the pipeline that retrieve the context needed to answer the question (steps 1 to 7 of process_question()).
+
+        Args:
+            userQuestion (str): The question asked by the user.
+            stage_timings (dict, optional): Dictionary where the duration of each stage is stored, also when the pipeline stops.
+
+        Returns:
+            tuple[str|None, dict|None]: A message for the user if the pipeline has to stop, or None and the pipeline state, a dictionary with:
+                - "question": validated Question,
+                - "related_nodes": parsed context from the database,
+                - "node_scores": similarity of each node found by similarity search,
+                - "sanitized_question": sanitized user question,
+                - "question_embedding": embedding of the sanitized question, None if the semantic cache is disabled,
+                - "graph": fingerprint of the graph the context came from, None if it is unknown or the answer cache is disabled,
+                - "analysis": path and duration of the question validation and entity extraction,
+                - "total_cost": cost of the stages,
+                - "cached_stages": stages served from the stage cache,
+                - "resumed_from": first stage that was not served from the stage cache, None if it is disabled,
+                - "start": start time of the pipeline.
+        """
+        start = time.time()
+        stage_timings = {} if stage_timings is None else stage_timings
+        graph = self.build_stage_graph()
+        state = {"user_question": userQuestion, "total_cost": 0, "start": start}
+        timings = {}
+
         try:
-            extracted_entities.entities, cost = await self.llm_tasks.generate_entity_embeddings(extracted_entities.entities)
+            message, report = await graph.run(state, [stage.name for stage in graph.stages if stage.name != "answer"], timings, self.drop_speculative)
+        finally:
+            stage_timings.update(timings)
+            if "pii_queue_wait" in state:
+                stage_timings["pii_queue"] = state["pii_queue_wait"]
+        if self.speculation_policy != "off":
+            self.log_speculation(state, timings, report, time.time()-start)
+        if message is not None:
+            #Cache the messages of questions the graph has no data for, until it changes. Invalid questions are already cached by the
+            #LLM response cache, and PII and empty questions depend on the original input. Without the graph fingerprint nothing is cached
+            if self.answer_cache is not None and report["stopped_by"] in ("retry", "cypher_gen", "cypher_exec") and state["graph"] is not None:
+                await asyncio.to_thread(self.answer_cache.set, state["sanitized_question"], message, time.time()-start, negative=True, graph=state["graph"])
+            return message, None
 
-            #Filter the entities that have a value
-            entities_with_value = [e for e in extracted_entities.entities if e.value is not None]
-            
-            total_cost += cost
-        except RuntimeError as e:
-            raise 
-        except Exception as e:
-                self.logger.log_error("EmbeddingError", {
-                    "question": question.value,
-                    "error": str(e), 
+        #The first stage that was not served from the stage cache is the one the question resumed from
+        cached = report["cached"]
+        resumed_from = next((stage.name for stage in graph.stages if cached.get(stage.name) is False), "answer" if cached else None)
+
+        analysis_stats = state.get("analysis")
+        if analysis_stats is None:
+            durations = [timings[name] for name in ("validate", "extract") if name in timings]
+            analysis_stats = {"analysis_path": "separate", "analysis_duration_sec": max(durations) if self.speculation_policy != "off" else sum(durations)}
+
+        return None, {
+            "question": state["question"],
+            "related_nodes": state["related_nodes"],
+            "node_scores": state["node_scores"],
+            "sanitized_question": state["sanitized_question"],
+            "question_embedding": state.get("question_embedding"),
+            "graph": state.get("graph"),
+            "analysis": analysis_stats,
+            "total_cost": state["total_cost"],
+            "cached_stages": [name for name, hit in cached.items() if hit],
+            "resumed_from": resumed_from,
+            "start": start
+        }
+
+    def build_stage_graph(self) -> StageGraph:
+        """
+        Build the graph of stages of the pipeline with the current settings (semantic cache, analysis mode and speculation policy).
+
+        Stages are declared in the order of process_question(), which is the order their checks are resolved. With the "off" speculation
+        policy each stage of steps 1 to 4 waits for the previous one; otherwise they only wait for the data they need and the local checks,
+        so the semantic cache lookup, the validation and the entity extraction run at the same time. The stages that call an API or write
+        to a cache or log always wait for the PII check, so a question with PII never leaves the process; only the sanitization runs
+        while it is checked.
+
+        Returns:
+            StageGraph: The graph of stages.
+        """
+        speculative = self.speculation_policy != "off"
+        local_checks = ["pii"] #Checks without API calls that stop the pipeline, the stages with API calls always wait for them
+
+        def after(name:str) -> list[str]:
+            return [name] if not speculative else sorted(set(local_checks))
+
+        #1. Block personal information and sanitize the input, the PII check uses the original input
+        stages = [
+            Stage("pii", self.check_pii_stage, ["user_question"], ["pii_checked", "pii_queue_wait"], error_type="PiiCheckError"),
+            Stage("sanitize", self.sanitize_stage, ["user_question"], ["sanitized_question"], after=after("pii"))
+        ]
+        previous = "sanitize"
+
+        #Answer the questions about the system itself with the response of their intent
+        if self.intent_classifier is not None:
+            stages.append(Stage("intent", self.intent_stage, ["sanitized_question"], ["intent_checked"], after=after(previous)))
+            local_checks.append("intent")
+            previous = "intent"
+
+        #Answer from the answer cache if the same question was already answered
+        if self.answer_cache is not None:
+            stages.append(Stage("answer_cache", self.answer_cache_stage, ["sanitized_question"], ["answer_cache_checked", "graph"], after=after(previous)))
+            previous = "answer_cache"
+
+        #Answer from the semantic cache if a similar question was already answered
+        if self.semantic_cache is not None:
+            stages.append(Stage("semantic_cache", self.semantic_cache_stage, ["sanitized_question"], ["question_embedding"], after=after(previous),
+                                error_type="QuestionEmbeddingError", error_details=lambda state: {"question": state["sanitized_question"]}))
+            previous = "semantic_cache"
+
+        #2-3. Validate the question and extract its entities
+        if self.analysis_mode == "separate" and QUESTION_ANALYSIS_SHADOW_PERCENT == 0:
+            #With speculation the entities are extracted from the sanitized question while it is validated
+            source = "sanitized_question" if speculative else "question"
+            stages += [
+                Stage("validate", self.validate_stage, ["sanitized_question"], ["question"], after=after(previous),
+                      error_type="ValidationError", error_details=lambda state: {"question": state["sanitized_question"]}),
+                Stage("extract", partial(self.extract_stage, source=source), [source], ["extracted_entities"], after=after(previous),
+                      error_type="EntityExtractionError", error_details=lambda state: {"question": self.get_question_text(state)})
+            ]
+        else:
+            stages.append(Stage("analyze", self.analyze_stage, ["sanitized_question"], ["question", "extracted_entities", "analysis"], after=after(previous)))
+
+        stages += [
+            #4. Generate embeddings for the extracted entities
+            Stage("embed", self.embed_stage, ["extracted_entities"], ["entities"],
+                  error_type="EmbeddingError", error_details=lambda state: {"question": self.get_question_text(state)}),
+            #5. Do a similarity search in the database. First with entity types, and if there are no results, a free search
+            Stage("similarity", self.similarity_stage, ["question", "entities"], ["similar_nodes", "not_found", "similarity_scores"],
+                  error_type="SimilarityError", error_details=lambda state: {
+                      "question": state["question"].value,
+                      "entities": [entity.value for entity in state["entities"] if entity.value is not None],
+                      "entity_types": [entity.type for entity in state["entities"] if entity.value is not None],
+                  }),
+            Stage("retry", self.retry_stage, ["question", "similar_nodes", "not_found", "similarity_scores"], ["relevant_nodes", "node_scores"],
+                  error_type="RetryError", error_details=lambda state: {
+                      "question": state["question"].value,
+                      "entities": [entity.value for entity in state["not_found"]],
+                  }),
+            #6. Generate a Cypher query based on the retrieved nodes
+            Stage("cypher_gen", self.cypher_generation_stage, ["question", "relevant_nodes"], ["cypher_query"],
+                  error_type="CypherGenerationError", error_details=lambda state: {"question": state["question"].value, "nodes": state["relevant_nodes"]}),
+            #7. Execute the Cypher query and parse the results
+            Stage("cypher_exec", self.cypher_execution_stage, ["question", "relevant_nodes", "cypher_query"], ["related_nodes"],
+                  error_type="DatabaseQueryError", error_details=lambda state: {"question": state["question"].value, "query": state["cypher_query"]}),
+            #8. Generate the final answer in natural languague
+            Stage("answer", self.answer_stage, ["question", "related_nodes", "node_scores"], ["final_answer"],
+                  error_type="ResponseGenerationError", error_details=lambda state: {"question": state["question"].value, "context": state["related_nodes"]})
+        ]
+        return StageGraph(stages, self.logger)
+
+    async def check_pii_stage(self, state: dict) -> dict:
+        """
+        Stage "pii": stop the pipeline if the question contains PII. The check runs in the PII worker pool so it does not block
+        the event loop. If no worker is free before the queue timeout, the question is rejected.
+        """
+        try:
+            contains_pii, queue_wait = await self.pii_pool.run(self.pii_detector.contains_pii, state["user_question"])
+        except TimeoutError as e:
+            self.logger.log_error("PiiCheckTimeout", {
+                    "error": str(e),
+                    "pii_pool": self.pii_pool.get_stats()
                 })
-                raise
-        
-        #5. Do a similarity search in the database
-        try:       
-            if entities_with_value:
-                start_sim = time.time()
-                queries = self.neo4j_logic.generate_similarity_queries(entities_with_value)
-                db_results = self.neo4j_client.execute_multiple_queries(queries)
-                similarity_results = self.neo4j_logic.parse_similarity_results(db_results)
-
-                end_sim = time.time()
-
-                #Prepare queries for logging without embedding value
-                queries_for_logging = []
-                for q in queries:
-                    q_log = q.copy()
-                    if "params" in q_log:
-                        q_log["params"] = {k: v for k, v in q_log["params"].items() if k != "embedding"}
-                    queries_for_logging.append(q_log)
-
-                #Log the similarity search's performance
+            raise StageStop("The service is busy, try again in a moment.")
+        if contains_pii:
+            self.logger.log_error("InvalidQuestionPII", {
+                    "question": "PII containing question"
+                })
+            raise StageStop("Invalid question, contains PII or other unauthorized text, try again.")
+        return {"pii_checked": True, "pii_queue_wait": queue_wait}
+
+    async def sanitize_stage(self, state: dict) -> dict:
+        """
+        Stage "sanitize": sanitize the question and stop the pipeline if nothing is left.
+        """
+        sanitized_question = self.sanitize_input(state["user_question"])
+        if len(sanitized_question) == 0:
+            raise StageStop("Invalid question, try again.")
+        return {"sanitized_question": sanitized_question}
+
+    async def intent_stage(self, state: dict) -> dict:
+        """
+        Stage "intent": stop the pipeline with the fixed response of a question about the system itself, recognized without API calls.
+        """
+        match = await asyncio.to_thread(self.intent_classifier.classify, state["sanitized_question"])
+        if match is None:
+            return {"intent_checked": True}
+
+        elapsed_time = time.time()-state["start"]
+        self.logger.log_data({
+            "timestamp": datetime.now().isoformat(),
+            "log_type": "register_query",
+            "user_prompt": state["sanitized_question"],
+            "final_response": match["response"],
+            "cache_hit": False,
+            "intent": match["intent"],
+            "intent_match": match["match"],
+            "intent_score": match["score"],
+            "log_duration_sec": elapsed_time,
+            "cost": 0
+        })
+        raise StageStop(match["response"])
+
+    async def answer_cache_stage(self, state: dict) -> dict:
+        """
+        Stage "answer_cache": stop the pipeline with the cached answer of the same question. The answers are keyed by the graph
+        fingerprint, so the cache is not used until it is known.
+        """
+        graph = self.graph_fingerprint.get()
+        entry = await asyncio.to_thread(self.answer_cache.get, state["sanitized_question"], graph) if graph is not None else None
+        if entry is None:
+            return {"answer_cache_checked": True, "graph": graph}
+
+        elapsed_time = time.time()-state["start"]
+        self.logger.log_data({
+            "timestamp": datetime.now().isoformat(),
+            "log_type": "register_query",
+            "user_prompt": state["sanitized_question"],
+            "final_response": entry["answer"],
+            "cache_hit": True,
+            "cache": "answer",
+            "negative": entry["negative"],
+            "latency_saved_sec": max(entry["duration_sec"]-elapsed_time, 0.0),
+            "answer_cache_hit_rate": self.answer_cache.hit_rate(),
+            "log_duration_sec": elapsed_time,
+            "cost": 0
+        })
+        raise StageStop(entry["answer"])
+
+    async def semantic_cache_stage(self, state: dict) -> dict:
+        """
+        Stage "semantic_cache": embed the sanitized question and stop the pipeline with the cached answer of a similar question.
+        """
+        question_embedding, cost = await self.llm_tasks.embed_question(state["sanitized_question"])
+        entry, similarity = self.semantic_cache.lookup(question_embedding)
+        if entry is not None:
+            elapsed_time = time.time()-state["start"]
+            self.logger.log_data({
+                "timestamp": datetime.now().isoformat(),
+                "log_type": "register_query",
+                "user_prompt": state["sanitized_question"],
+                "final_response": entry["answer"],
+                "cache_hit": True,
+                "cached_question": entry["question"],
+                "similarity": similarity,
+                "latency_saved_sec": max(entry["duration_sec"]-elapsed_time, 0.0),
+                "cache_hit_rate": self.semantic_cache.hit_rate(),
+                "log_duration_sec": elapsed_time,
+                "cost": cost
+            })
+            raise StageStop(entry["answer"])
+        return {"question_embedding": question_embedding, "cost": cost}
+
+    async def validate_stage(self, state: dict) -> dict:
+        """
+        Stage "validate": validate the question and stop the pipeline if it is not valid.
+        """
+        sanitized_question = state["sanitized_question"]
+        question, cost = await self.llm_tasks.validate_question(sanitized_question)
+        self.stop_if_invalid(question)
+        return {"question": question, "cost": cost}
+
+    async def extract_stage(self, state: dict, source: str) -> dict:
+        """
+        Stage "extract": extract the entities of the validated question, or of the sanitized question when it runs speculatively.
+        """
+        text = state["question"].value if source == "question" else state[source]
+        extracted_entities, cost = await self.llm_tasks.extract_entities(text)
+        return {"extracted_entities": extracted_entities, "cost": cost}
+
+    async def analyze_stage(self, state: dict) -> dict:
+        """
+        Stage "analyze": validate the question and extract its entities with analyze_question(), and stop the pipeline if it is not valid.
+        """
+        question, extracted_entities, cost, analysis_stats = await self.analyze_question(state["sanitized_question"])
+        self.stop_if_invalid(question)
+        return {"question": question, "extracted_entities": extracted_entities, "analysis": analysis_stats, "cost": cost}
+
+    def stop_if_invalid(self, question: Question) -> None:
+        """
+        If validation fails, log the error and stop the pipeline to inform the user.
+
+        Args:
+            question (Question): The validated question.
+        """
+        if not question.is_valid:
+            self.logger.log_error("InvalidQuestion", {
+                "question": question.value,
+                "reason": question.reasoning,
+            })
+            raise StageStop(f"Your question is not valid. Reason: {question.reasoning}")
+
+    async def embed_stage(self, state: dict) -> dict:
+        """
+        Stage "embed": generate the embeddings of the extracted entities.
+        """
+        entities, cost = await self.llm_tasks.generate_entity_embeddings(state["extracted_entities"].entities)
+        return {"entities": entities, "cost": cost}
+
+    async def similarity_stage(self, state: dict) -> dict:
+        """
+        Stage "similarity": search the nodes similar to the entities that have a value, within their entity type.
+        """
+        question = state["question"]
+        entities_with_value = [e for e in state["entities"] if e.value is not None]
+
+        similarity_results = {}
+        node_scores = {} #Similarity of each found node, used to rank the final answer's context
+        cached = None
+        if entities_with_value:
+            start_sim = time.time()
+            queries = self.neo4j_logic.generate_similarity_queries(entities_with_value)
+            key = sorted([entity.type, self.hash_embedding(entity.embedding)] for entity in entities_with_value)
+            db_results, _, cached = await self.run_cached("similarity", key, lambda: (self.neo4j_client.execute_multiple_queries(queries), 0), graph=True)
+            similarity_results = self.neo4j_logic.parse_similarity_results(db_results)
+            node_scores = self.neo4j_logic.parse_similarity_scores(db_results)
+            end_sim = time.time()
+
+            #Log the similarity search's performance
+            if not cached:
                 self.logger.log_data({
                     "timestamp": datetime.now().isoformat(),
                     "log_type": "database",
                     "task_name": "similarity_calculation",
                     "user_prompt": question.value,
-                    "cypher_query": json.dumps([query for query in queries_for_logging]),
+                    "cypher_query": json.dumps(self.get_queries_for_logging(queries)),
                     "final_response": json.dumps(similarity_results),
                     "log_duration_sec": end_sim-start_sim,
                 })
-        except Exception as e:
-                self.logger.log_error("SimilarityError", {
-                    "question": question.value,
-                    "entities": [entity.value for entity in entities_with_value],
-                    "entity_types": [entity.type for entity in entities_with_value],
-                    "error": str(e), 
-                })
-                raise
 
         #Organize the retreived information for the Cypher query generation
-        all_relevant_nodes = {} 
-        entities_with_no_value = [e for e in extracted_entities.entities if e.value is None]
+        all_relevant_nodes = {}
         not_found_list = []
         for entity in entities_with_value:
             if entity.type in similarity_results:
@@ -222,86 +755,92 @@ class Orchestrator:
             else:
                 #Save the entity to try again with another method.
                 not_found_list.append(entity)
-                
-        for entity in entities_with_no_value:
-            all_relevant_nodes[entity.type] = None
 
-        #If there were entities not found, try again.
-        if len(not_found_list) > 0:
-            try:
-                #Try semantic search but with all entity types/labels
-                start_sim = time.time()
+        for entity in state["entities"]:
+            if entity.value is None:
+                all_relevant_nodes[entity.type] = None
 
-                queries = self.neo4j_logic.generate_similarity_queries_no_label(not_found_list)
-                db_results = self.neo4j_client.execute_multiple_queries(queries)
-                similarity_results = self.neo4j_logic.parse_similarity_results(db_results)
+        return {"similar_nodes": all_relevant_nodes, "not_found": not_found_list, "similarity_scores": node_scores, "cached": cached}
 
-                end_sim = time.time()
+    async def retry_stage(self, state: dict) -> dict:
+        """
+        Stage "retry": search the entities not found by the similarity stage again, with all the entity types, and stop the pipeline
+        if nothing is found.
+        """
+        question = state["question"]
+        not_found_list = state["not_found"]
+        all_relevant_nodes = dict(state["similar_nodes"])
+        node_scores = dict(state["similarity_scores"])
+        if not not_found_list:
+            return {"relevant_nodes": all_relevant_nodes, "node_scores": node_scores}
 
-                #Prepare queries for logging without embedding value
-                queries_for_logging = []
-                for q in queries:
-                    q_log = q.copy()
-                    if "params" in q_log:
-                        q_log["params"] = {k: v for k, v in q_log["params"].items() if k != "embedding"}
-                    queries_for_logging.append(q_log)
+        #Without time left, answer with the nodes already found instead of searching the missing ones
+        budget = LatencyBudget.get_current()
+        if budget is not None and any(all_relevant_nodes.values()) and budget.remaining() < DEADLINE_SKIP_RETRY_SEC:
+            budget.degrade("skip_retry", entities=[entity.value for entity in not_found_list])
+            return {"relevant_nodes": all_relevant_nodes, "node_scores": node_scores}
 
-                #Log the retry's performance
-                self.logger.log_data({
-                    "timestamp": datetime.now().isoformat(),
-                    "log_type": "database",
-                    "task_name": "similarity_retry",
-                    "user_prompt": question.value,
-                    "cypher_query": json.dumps([query for query in queries_for_logging]),
-                    "final_response": json.dumps(similarity_results),
-                    "log_duration_sec": end_sim-start_sim,
-                })
+        #Try semantic search but with all entity types/labels
+        start_sim = time.time()
+        queries = self.neo4j_logic.generate_similarity_queries_no_label(not_found_list)
+        key = sorted(self.hash_embedding(entity.embedding) for entity in not_found_list)
+        db_results, _, cached = await self.run_cached("retry", key, lambda: (self.neo4j_client.execute_multiple_queries(queries), 0), graph=True)
+        similarity_results = self.neo4j_logic.parse_similarity_results(db_results)
+        for name, score in self.neo4j_logic.parse_similarity_scores(db_results).items():
+            node_scores[name] = max(score, node_scores.get(name, 0.0))
+        end_sim = time.time()
 
-                if not similarity_results:
-                    #If the database didn't find any information about an entity, log the error and inform the user
-                    self.logger.log_error("RetryNotFoundError", {
-                            "question": question.value,
-                            "entity": [ent.value for ent in not_found_list],
-                        })
-                    return f"No data found, even after retry."
-                for label in similarity_results.keys():
-                    all_relevant_nodes[label] = similarity_results[label]
-            except Exception as e:
-                self.logger.log_error("RetryError", {
-                    "question": question.value,
-                    "entities": [ent.value for ent in not_found_list],
-                    "error": str(e), 
-                })
-                raise
+        #Log the retry's performance
+        if not cached:
+            self.logger.log_data({
+                "timestamp": datetime.now().isoformat(),
+                "log_type": "database",
+                "task_name": "similarity_retry",
+                "user_prompt": question.value,
+                "cypher_query": json.dumps(self.get_queries_for_logging(queries)),
+                "final_response": json.dumps(similarity_results),
+                "log_duration_sec": end_sim-start_sim,
+            })
 
-        #6. Generate a Cypher query based on the retrieved nodes
-        try:
-            cypher_query, cost = await self.llm_tasks.create_cypher_query(question.value, all_relevant_nodes)
-            if cypher_query == "":
-                self.logger.log_error("NoCypherError", {
+        if not similarity_results:
+            #If the database didn't find any information about an entity, log the error and inform the user
+            self.logger.log_error("RetryNotFoundError", {
                     "question": question.value,
-                    "nodes": all_relevant_nodes,
-                })
-                return "Query generation returned nothing, try another question."
-        except RuntimeError as e:
-            raise 
-        except Exception as e:
-                self.logger.log_error("CypherGenerationError", {
-                    "question": question.value,
-                    "nodes": all_relevant_nodes,
-                    "error": str(e), 
+                    "entity": [ent.value for ent in not_found_list],
                 })
-                raise
-        total_cost +=cost
+            raise StageStop("No data found, even after retry.")
+        for label in similarity_results.keys():
+            all_relevant_nodes[label] = similarity_results[label]
+        return {"relevant_nodes": all_relevant_nodes, "node_scores": node_scores, "cached": cached}
 
-        #7. Execute the Cypher query and parse the results
-        try:
-            start_db = time.time()
-            db_results = self.neo4j_client.execute_query(cypher_query)
-            related_nodes = self.neo4j_logic.parse_related_nodes_results(db_results)
-            end_db = time.time()
+    async def cypher_generation_stage(self, state: dict) -> dict:
+        """
+        Stage "cypher_gen": generate a Cypher query from the question and the relevant nodes, and stop the pipeline if it is empty.
+        """
+        question = state["question"].value
+        key = {"question": question, "nodes": state["relevant_nodes"]}
+        cypher_query, cost, cached = await self.run_cached("cypher_gen", key, lambda: self.llm_tasks.create_cypher_query(question, state["relevant_nodes"]))
+        if cypher_query == "":
+            self.logger.log_error("NoCypherError", {
+                "question": state["question"].value,
+                "nodes": state["relevant_nodes"],
+            })
+            raise StageStop("Query generation returned nothing, try another question.")
+        return {"cypher_query": cypher_query, "cost": cost, "cached": cached}
+
+    async def cypher_execution_stage(self, state: dict) -> dict:
+        """
+        Stage "cypher_exec": execute the Cypher query, parse the results and stop the pipeline if they are empty.
+        """
+        question = state["question"]
+        cypher_query = state["cypher_query"]
+        start_db = time.time()
+        related_nodes, _, cached = await self.run_cached("cypher_exec", cypher_query,
+                                                         lambda: (self.neo4j_logic.parse_related_nodes_results(self.neo4j_client.execute_query(cypher_query)), 0), graph=True)
+        end_db = time.time()
 
-            #Log the query execution's performance
+        #Log the query execution's performance
+        if not cached:
             self.logger.log_data({
                 "timestamp": datetime.now().isoformat(),
                 "log_type": "database",
@@ -311,49 +850,340 @@ class Orchestrator:
                 "final_response": json.dumps(related_nodes),
                 "log_duration_sec": end_db-start_db,
             })
-        except Exception as e:
-            self.logger.log_error("DatabaseQueryError", {
-                "question": question.value,
-                "query": cypher_query,
-                "error": str(e), 
-            })
-            raise
-        
+
         # If the result is empty, inform the user.
         entities_empty = all(not v for v in related_nodes["entities"].values())
         if entities_empty and not related_nodes["relationships"] and not related_nodes["others"]:
             self.logger.log_error("RelatedNodesNotFoundError", {
                         "question": question.value,
                         "query": cypher_query,
-                        "nodes": all_relevant_nodes, 
+                        "nodes": state["relevant_nodes"],
                     })
-            return "No available information. Please, reword your question or try another one."
+            raise StageStop("No available information. Please, reword your question or try another one.")
+        return {"related_nodes": related_nodes, "cached": cached}
 
-        #8. Generate the final answer in natural languague
+    async def answer_stage(self, state: dict) -> dict:
+        """
+        Stage "answer": generate the final answer in natural language from the related nodes. When the deadline of the question is
+        close, it is generated with a faster model and a smaller context, or replaced by a partial answer.
+        """
+        options = self.get_answer_options()
+        partial_answer = {"final_answer": None, "cost": 0, "partial_answer": True}
+        if options["partial"]:
+            partial_answer["final_answer"] = self.build_partial_answer(state["related_nodes"], state["node_scores"])
+            return partial_answer
+        try:
+            final_answer, cost = await self.llm_tasks.generate_final_answer(state["question"].value, state["related_nodes"], state["node_scores"],
+                                                                            model=options["model"], token_budget=options["token_budget"])
+        except TimeoutError:
+            budget = LatencyBudget.get_current()
+            if budget is None or not budget.expired():
+                raise
+            budget.degrade("partial_answer", reason="timeout")
+            partial_answer["final_answer"] = self.build_partial_answer(state["related_nodes"], state["node_scores"])
+            return partial_answer
+        return {"final_answer": final_answer, "cost": cost}
+
+    def get_answer_options(self) -> dict:
+        """
+        Return how the final answer has to be generated with the time left of the question's deadline, recording the degradations
+        in its latency budget. With little time the answer uses a faster model and a smaller context, and without enough time
+        for an LLM call a partial answer is built instead.
+
+        Returns:
+            dict: "partial" if a partial answer has to be built, and the "model" and "token_budget" of the answer (None for the defaults).
+        """
+        options = {"partial": False, "model": None, "token_budget": None}
+        budget = LatencyBudget.get_current()
+        if budget is None:
+            return options
+        remaining = budget.remaining()
+        if remaining < DEADLINE_PARTIAL_ANSWER_SEC:
+            budget.degrade("partial_answer", reason="deadline")
+            options["partial"] = True
+            return options
+        if remaining < DEADLINE_FAST_MODEL_SEC:
+            budget.degrade("fast_model", model=DEADLINE_FAST_MODEL)
+            options["model"] = DEADLINE_FAST_MODEL
+        if remaining < DEADLINE_CAP_CONTEXT_SEC:
+            budget.degrade("cap_context", token_budget=DEADLINE_CONTEXT_TOKEN_BUDGET)
+            options["token_budget"] = DEADLINE_CONTEXT_TOKEN_BUDGET
+        return options
+
+    def build_partial_answer(self, related_nodes: dict, node_scores: dict) -> str:
+        """
+        Build an answer without the LLM from the best ranked items of the context, ranked like the context packer does, when there
+        is no time left to generate the final answer.
+
+        Args:
+            related_nodes (dict): Parsed context from the database.
+            node_scores (dict): Similarity of each node found by similarity search. Can be None.
+
+        Returns:
+            str: The partial answer.
+        """
+        packer = self.llm_tasks.context_packer
+        items = sorted(packer.rank_items(related_nodes, node_scores or {}), key=lambda i: (i["kind"] != "other", -i["score"]))
+        lines = "\n".join(item["line"] for item in items[:DEADLINE_PARTIAL_ANSWER_ITEMS])
+        return f"There was no time to write a full answer. This is the most relevant information found:\n{lines}"
+
+    def get_question_text(self, state: dict) -> str:
+        """
+        Return the validated question of the pipeline state, or the sanitized one if it has not been validated yet.
+
+        Args:
+            state (dict): The pipeline state.
+
+        Returns:
+            str: The question.
+        """
+        return state["question"].value if "question" in state else state.get("sanitized_question")
+
+    def get_queries_for_logging(self, queries: list[dict]) -> list[dict]:
+        """
+        Prepare similarity queries for logging without their embedding value.
+
+        Args:
+            queries (list[dict]): The queries with their parameters.
+
+        Returns:
+            list[dict]: Copies of the queries without the "embedding" parameter.
+        """
+        queries_for_logging = []
+        for q in queries:
+            q_log = q.copy()
+            if "params" in q_log:
+                q_log["params"] = {k: v for k, v in q_log["params"].items() if k != "embedding"}
+            queries_for_logging.append(q_log)
+        return queries_for_logging
+
+    async def run_cached(self, stage: str, key: Any, call: Callable, encode: Callable = None, decode: Callable = None,
+                         graph: bool = False) -> tuple[Any, float, bool|None]:
+        """
+        Return the cached result of a stage input, or call the stage and cache its result. Empty results are not cached,
+        so a question that found nothing tries again. The results of stages that read the graph are keyed by its fingerprint too,
+        so they are not reused after it changes, and they are not cached while the fingerprint is unknown.
+
+        Args:
+            stage (str): Name of the stage.
+            key (Any): JSON serializable input of the stage.
+            call (Callable): Returns the result and its cost, or a coroutine that does.
+            encode (Callable, optional): Converts the result to JSON serializable data.
+            decode (Callable, optional): Converts the cached data back to the result.
+            graph (bool): Whether the result depends on the graph.
+
+        Returns:
+            tuple[Any, float, bool|None]: The result, its cost (0 if it was cached) and whether it was cached (None if the stage cache is disabled).
+        """
+        stage_cache = self.stage_cache
+        if stage_cache is not None and graph:
+            fingerprint = self.graph_fingerprint.get()
+            key = {"graph": fingerprint, "input": key}
+            stage_cache = stage_cache if fingerprint is not None else None
+        if stage_cache is not None:
+            value = await asyncio.to_thread(self.stage_cache.get, stage, key)
+            if value is not None:
+                return (decode(value) if decode is not None else value), 0, True
+
+        result = call()
+        if inspect.isawaitable(result):
+            result = await result
+        result, cost = result
+
+        if self.stage_cache is None:
+            return result, cost, None
+        if result and stage_cache is not None:
+            await asyncio.to_thread(self.stage_cache.set, stage, key, encode(result) if encode is not None else result)
+        return result, cost, False
+
+    def hash_embedding(self, embedding: list[float]) -> str:
+        """
+        Hash an embedding as float32, so vectors from the API and from the embedding cache get the same hash.
+
+        Args:
+            embedding (list[float]): Embedding vector.
+
+        Returns:
+            str: SHA-256 hash of the vector.
+        """
+        return hashlib.sha256(array("f", embedding).tobytes()).hexdigest()
+
+    def log_speculation(self, state: dict, timings: dict, report: dict, wall_time: float) -> None:
+        """
+        Log the outcome of a speculative run of the pipeline and the time saved by running its stages concurrently.
+
+        Args:
+            state (dict): The pipeline state.
+            timings (dict): Duration of each stage that finished.
+            report (dict): Report of the stage graph run.
+            wall_time (float): Duration of the run.
+        """
+        outcome = report["stopped_by"] or "used"
+        self.speculation_counts["attempts"] += 1
+        self.speculation_counts["successes"] += outcome == "used"
+        self.logger.log_data({
+            "timestamp": datetime.now().isoformat(),
+            "log_type": "speculation",
+            "user_prompt": state.get("sanitized_question"),
+            "policy": self.speculation_policy,
+            "outcome": outcome,
+            "stage_durations": dict(timings),
+            "dropped_stages": report["dropped"],
+            "time_saved_sec": max(sum(timings.values()) - wall_time, 0.0),
+            "success_rate": self.speculation_counts["successes"] / self.speculation_counts["attempts"],
+            "log_duration_sec": wall_time
+        })
+
+    def drop_speculative(self, tasks: list[asyncio.Task]) -> None:
+        """
+        Drop speculative work that is not needed. With the "cancel" policy the tasks are cancelled, with "discard" they finish
+        in the background (e.g. filling the embedding cache) and their results are ignored.
+
+        Args:
+            tasks (list[asyncio.Task]): Running tasks to drop.
+        """
+        for task in tasks:
+            #Keep a reference until the task finishes and retrieve its exception so it is not reported as unhandled
+            self.speculative_tasks.add(task)
+            task.add_done_callback(self.speculative_tasks.discard)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            if self.speculation_policy != "discard":
+                task.cancel()
+
+    async def analyze_question(self, question: str) -> tuple[Question, EntityList|None, float, dict]:
+        """
+        Validate the question and extract its entities (steps 2 and 3 of process_question()) with the path set in analysis_mode.
+        A QUESTION_ANALYSIS_SHADOW_PERCENT of the questions also run the other path at the same time, to log how much both paths agree.
+
+        Args:
+            question (str): The sanitized question.
+
+        Returns:
+            tuple[Question, EntityList|None, float, dict]: The validated question, its entities (None if the question was not valid
+                in the separate path), the cost of the calls and the analysis statistics ("analysis_path" and "analysis_duration_sec").
+        """
+        paths = {"combined": self.run_combined_analysis, "separate": self.run_separate_analysis}
+        if self.analysis_mode not in paths:
+            raise ValueError(f"Unknown question analysis mode: {self.analysis_mode}")
+
+        async def timed(path:str) -> tuple[tuple, float]:
+            start = time.time()
+            result = await paths[path](question)
+            return result, time.time() - start
+
+        if random.random() * 100 >= QUESTION_ANALYSIS_SHADOW_PERCENT:
+            (validated, entities, cost), duration = await timed(self.analysis_mode)
+            return validated, entities, cost, {"analysis_path": self.analysis_mode, "analysis_duration_sec": duration}
+
+        #Shadow run: both paths run concurrently, only the configured one is used
+        shadow_mode = "separate" if self.analysis_mode == "combined" else "combined"
+        primary, shadow = await asyncio.gather(timed(self.analysis_mode), timed(shadow_mode), return_exceptions=True)
+        if isinstance(primary, BaseException):
+            raise primary
+        (validated, entities, cost), duration = primary
+        if not isinstance(shadow, BaseException):
+            self.log_analysis_comparison(question, {self.analysis_mode: primary, shadow_mode: shadow})
+            cost += shadow[0][2]
+        return validated, entities, cost, {"analysis_path": self.analysis_mode, "analysis_duration_sec": duration}
+
+    async def run_combined_analysis(self, question: str) -> tuple[Question, EntityList, float]:
+        """
+        Validate the question and extract its entities in a single LLM call.
+
+        Args:
+            question (str): The sanitized question.
+
+        Returns:
+            tuple[Question, EntityList, float]: The validated question, its entities and the cost.
+        """
         try:
-            final_answer, cost = await self.llm_tasks.generate_final_answer(question.value, related_nodes)
+            return await self.llm_tasks.analyze_question(question)
         except RuntimeError as e:
             raise
         except Exception as e:
-            self.logger.log_error("ResponseGenerationError", {
-                "question": question.value,
-                "context": related_nodes,
-                "error": str(e), 
-            })
+            self.logger.log_error("QuestionAnalysisError", {
+                    "question": question,
+                    "error": str(e), 
+                })
             raise
-        total_cost +=cost
 
-        end = time.time()
-        elapsed_time = end-start
+    async def run_separate_analysis(self, question: str) -> tuple[Question, EntityList|None, float]:
+        """
+        Validate the question and, if it is valid, extract its entities with a second LLM call. With speculation enabled both calls
+        run at the same time, and the extraction is dropped if the question is not valid.
+
+        Args:
+            question (str): The sanitized question.
+
+        Returns:
+            tuple[Question, EntityList|None, float]: The validated question, its entities (None if it is not valid) and the cost.
+        """
+        async def extract(text:str) -> tuple[EntityList, float]:
+            try:
+                return await self.llm_tasks.extract_entities(text)
+            except RuntimeError as e:
+                raise
+            except Exception as e:
+                self.logger.log_error("EntityExtractionError", {
+                        "question": text,
+                        "error": str(e), 
+                    })
+                raise
+
+        #With speculation the entities are extracted from the sanitized question while it is validated
+        extraction = asyncio.create_task(extract(question)) if self.speculation_policy != "off" else None
+
+        #2. Validate the question
+        try:      
+            validated, cost = await self.llm_tasks.validate_question(question)
+        except RuntimeError as e:
+            if extraction is not None:
+                self.drop_speculative([extraction])
+            raise 
+        except Exception as e:
+            if extraction is not None:
+                self.drop_speculative([extraction])
+            self.logger.log_error("ValidationError", {
+                    "question": question,
+                    "error": str(e), 
+                })
+            raise
+        if not validated.is_valid:
+            if extraction is not None:
+                self.drop_speculative([extraction])
+            return validated, None, cost
+        
+        #3. Extract entities from the question
+        extracted_entities, extraction_cost = await (extraction if extraction is not None else extract(validated.value))
+        return validated, extracted_entities, cost + extraction_cost
+
+    def log_analysis_comparison(self, question: str, results: dict) -> None:
+        """
+        Log the latency of the combined and separate paths and how much their results agree.
+
+        Args:
+            question (str): The sanitized question.
+            results (dict): Result and duration of each path, by path name.
+        """
+        (combined_question, combined_entities, combined_cost), combined_duration = results["combined"]
+        (separate_question, separate_entities, separate_cost), separate_duration = results["separate"]
+
+        def entity_set(entities:EntityList|None) -> set:
+            return {(entity.type, (entity.value or "").lower()) for entity in entities.entities} if entities is not None else set()
+
+        combined_set = entity_set(combined_entities)
+        separate_set = entity_set(separate_entities)
+        union = combined_set | separate_set
 
-        #Log the response generation's performance
         self.logger.log_data({
             "timestamp": datetime.now().isoformat(),
-            "log_type": "register_query",
-            "user_prompt": question.value,
-            "final_response": final_answer,
-            "log_duration_sec": elapsed_time,
-            "cost": total_cost
+            "log_type": "analysis_comparison",
+            "user_prompt": question,
+            "analysis_path": self.analysis_mode,
+            "combined_duration_sec": combined_duration,
+            "separate_duration_sec": separate_duration,
+            "combined_cost": combined_cost,
+            "separate_cost": separate_cost,
+            "validity_agrees": combined_question.is_valid == separate_question.is_valid,
+            "entity_agreement": len(combined_set & separate_set) / len(union) if union else 1.0
         })
-
-        return final_answer
@@ -0,0 +1,230 @@
+import hashlib
+import ipaddress
+import re
+import threading
+from config.config import PII_SPACY_MODEL
+
+class PiiDetector:
+    """
+    Tiered detector of personally identifiable information (PII) in the user questions.
+
+    The first tier runs precompiled regular expressions with checksum validation (Luhn, IBAN, NIF/NIE letters, Bitcoin
+    addresses, DEA numbers) and returns as soon as one matches. Only questions without pattern PII reach the second tier,
+    a Presidio analyzer with just the spaCy recognizer of PERSON names. It is loaded the first time it is needed and
+    shared by all the detectors of the process, so each orchestrator does not load its own NLP model.
+
+    Attributes:
+        ENTITIES (list[str]): PII entities that are blocked.
+        PATTERNS (list[tuple]): Entity type, compiled pattern and validation function of each pattern recognizer.
+        person_analyzers (dict): Shared Presidio analyzers of PERSON names, by spaCy model.
+        lock (threading.Lock): Serializes the loading of the analyzers between threads.
+        spacy_model (str): spaCy model used to detect names.
+
+    Methods:
+        contains_pii(): Returns whether a text contains PII.
+        detect(): Returns the type of the first PII found in a text.
+        find_pattern_pii(): Runs the pattern recognizers.
+        contains_person(): Runs the PERSON recognizer.
+        get_person_analyzer(): Returns the shared PERSON analyzer, loading it if needed.
+        is_luhn_valid(), is_iban_valid(), is_es_nif_valid(), is_es_nie_valid(), is_ip_valid(), is_crypto_valid(),
+        is_medical_license_valid(), is_phone_valid(): Validation functions of the patterns.
+    """
+
+    ENTITIES = ["EMAIL_ADDRESS", "PHONE_NUMBER", "CREDIT_CARD", "IBAN_CODE", "PERSON", "IP_ADDRESS", "MEDICAL_LICENSE", "URL", "CRYPTO", "ES_NIF", "ES_NIE"]
+
+    person_analyzers = {}
+    lock = threading.Lock()
+
+    def __init__(self, spacy_model:str = PII_SPACY_MODEL):
+        """
+        Initializes the PiiDetector. The PERSON analyzer is not loaded until a question needs it.
+
+        Args:
+            spacy_model (str): spaCy model used to detect names.
+        """
+        self.spacy_model = spacy_model
+
+    def contains_pii(self, text:str) -> bool:
+        """
+        Check if a text contains PII.
+
+        Args:
+            text (str): The input text to analyze.
+
+        Returns:
+            bool: True if PII is detected, False otherwise.
+        """
+        return self.detect(text) is not None
+
+    def detect(self, text:str) -> str|None:
+        """
+        Return the type of the first PII found, running the pattern recognizers before the PERSON recognizer.
+
+        Args:
+            text (str): The input text to analyze.
+
+        Returns:
+            str|None: Entity type of the PII (e.g. "EMAIL_ADDRESS", "PERSON"), or None if there is none.
+        """
+        entity = self.find_pattern_pii(text)
+        if entity is not None:
+            return entity
+        return "PERSON" if self.contains_person(text) else None
+
+    def find_pattern_pii(self, text:str) -> str|None:
+        """
+        Run the pattern recognizers and return the type of the first match that passes its validation.
+
+        Args:
+            text (str): The input text to analyze.
+
+        Returns:
+            str|None: Entity type of the PII, or None if there is none.
+        """
+        for entity, pattern, validate in self.PATTERNS:
+            for match in pattern.finditer(text):
+                if validate is None or validate(match.group(0)):
+                    return entity
+        return None
+
+    def contains_person(self, text:str) -> bool:
+        """
+        Run the PERSON recognizer of the spaCy model.
+
+        Args:
+            text (str): The input text to analyze.
+
+        Returns:
+            bool: True if a name is detected, False otherwise.
+        """
+        results = self.get_person_analyzer().analyze(text=text, entities=["PERSON"], language="en")
+        return len(results) > 0
+
+    def get_person_analyzer(self):
+        """
+        Return the Presidio analyzer with only the PERSON recognizer, loading it the first time. Analyzers are shared by all the
+        detectors of the process that use the same spaCy model.
+
+        Returns:
+            AnalyzerEngine: The analyzer.
+        """
+        with self.lock:
+            if self.spacy_model not in self.person_analyzers:
+                from presidio_analyzer import AnalyzerEngine, RecognizerRegistry
+                from presidio_analyzer.nlp_engine import SpacyNlpEngine
+                from presidio_analyzer.predefined_recognizers import SpacyRecognizer
+
+                registry = RecognizerRegistry(recognizers=[SpacyRecognizer(supported_language="en", supported_entities=["PERSON"])])
+                nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": self.spacy_model}])
+                self.person_analyzers[self.spacy_model] = AnalyzerEngine(registry=registry, nlp_engine=nlp_engine, supported_languages=["en"])
+            return self.person_analyzers[self.spacy_model]
+
+    @staticmethod
+    def is_luhn_valid(text:str) -> bool:
+        """
+        Validate a credit card number with the Luhn checksum.
+        """
+        digits = [int(c) for c in text if c.isdigit()]
+        if not 13 <= len(digits) <= 19:
+            return False
+        total = 0
+        for i, digit in enumerate(reversed(digits)):
+            if i % 2 == 1:
+                digit = digit * 2 - 9 if digit > 4 else digit * 2
+            total += digit
+        return total % 10 == 0
+
+    @staticmethod
+    def is_iban_valid(text:str) -> bool:
+        """
+        Validate an IBAN with its mod 97 checksum. The pattern can take the start of the next word, so shorter candidates are also checked.
+        """
+        iban = re.sub(r"\s", "", text).upper()
+        for length in range(min(len(iban), 34), 14, -1):
+            rearranged = iban[4:length] + iban[:4]
+            if int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1:
+                return True
+        return False
+
+    @staticmethod
+    def is_es_nif_valid(text:str) -> bool:
+        """
+        Validate a Spanish NIF with its control letter.
+        """
+        nif = text.replace("-", "").upper()
+        return "TRWAGMYFPDXBNJZSQVHLCKE"[int(nif[:8]) % 23] == nif[8]
+
+    @staticmethod
+    def is_es_nie_valid(text:str) -> bool:
+        """
+        Validate a Spanish NIE with its control letter.
+        """
+        nie = text.replace("-", "").upper()
+        return PiiDetector.is_es_nif_valid(str("XYZ".index(nie[0])) + nie[1:])
+
+    @staticmethod
+    def is_ip_valid(text:str) -> bool:
+        """
+        Validate an IPv4 or IPv6 address.
+        """
+        try:
+            ipaddress.ip_address(text)
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def is_crypto_valid(text:str) -> bool:
+        """
+        Validate a Bitcoin address with its Base58Check or Bech32 checksum.
+        """
+        if text.lower().startswith("bc1"):
+            address = text.lower()
+            charset = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+            values = [charset.find(c) for c in address[3:]]
+            if -1 in values or len(values) < 7:
+                return False
+            checksum = 1
+            for value in [3, 3, 0, 2, 3] + values: #Expanded "bc" prefix followed by the data
+                top = checksum >> 25
+                checksum = (checksum & 0x1ffffff) << 5 ^ value
+                for i, generator in enumerate([0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]):
+                    checksum ^= generator if (top >> i) & 1 else 0
+            return checksum in (1, 0x2bc830a3) #Bech32 and Bech32m
+
+        alphabet = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+        number = 0
+        for c in text:
+            if c not in alphabet:
+                return False
+            number = number * 58 + alphabet.index(c)
+        decoded = number.to_bytes(25, "big") if number < 1 << 200 else b""
+        return len(decoded) == 25 and hashlib.sha256(hashlib.sha256(decoded[:-4]).digest()).digest()[:4] == decoded[-4:]
+
+    @staticmethod
+    def is_medical_license_valid(text:str) -> bool:
+        """
+        Validate a DEA registration number with its check digit.
+        """
+        digits = [int(c) for c in text[-7:]]
+        return (digits[0] + digits[2] + digits[4] + 2 * (digits[1] + digits[3] + digits[5])) % 10 == digits[6]
+
+    @staticmethod
+    def is_phone_valid(text:str) -> bool:
+        """
+        Validate that a phone number candidate has between 9 and 15 digits.
+        """
+        return 9 <= sum(c.isdigit() for c in text) <= 15
+
+    PATTERNS = [
+        ("EMAIL_ADDRESS", re.compile(r"\b[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}\b", re.IGNORECASE), None),
+        ("URL", re.compile(r"\b(?:https?://|www\d{0,3}\.)\S+|\b[a-z0-9-]+(?:\.[a-z0-9-]+)*\.(?:com|org|edu|gov|es|eu|io|co\.uk)(?:/\S*)?(?!\w)", re.IGNORECASE), None),
+        ("IBAN_CODE", re.compile(r"\b[a-z]{2}\d{2}(?: ?[a-z0-9]){11,30}\b", re.IGNORECASE), is_iban_valid),
+        ("CREDIT_CARD", re.compile(r"\b(?:\d[ -]?){12,18}\d\b"), is_luhn_valid),
+        ("ES_NIF", re.compile(r"\b\d{8}-?[a-z]\b", re.IGNORECASE), is_es_nif_valid),
+        ("ES_NIE", re.compile(r"\b[xyz]-?\d{7}-?[a-z]\b", re.IGNORECASE), is_es_nie_valid),
+        ("IP_ADDRESS", re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|(?<![\w:])(?:[0-9a-f]{0,4}:){2,7}[0-9a-f]{0,4}(?![\w:])", re.IGNORECASE), is_ip_valid),
+        ("CRYPTO", re.compile(r"\b(?:[13][a-km-zA-HJ-NP-Z1-9]{25,34}|bc1[a-z0-9]{11,71})\b", re.IGNORECASE), is_crypto_valid),
+        ("MEDICAL_LICENSE", re.compile(r"\b[abcdefghjklmprstux][a-z9]\d{7}\b", re.IGNORECASE), is_medical_license_valid),
+        ("PHONE_NUMBER", re.compile(r"(?<![\w.])(?:\+|00)?\d(?:[ ().-]{0,2}\d){8,14}(?![\w.])"), is_phone_valid),
+    ]
@@ -0,0 +1,171 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+from config.config import PII_POOL_MODE, PII_POOL_WORKERS, PII_POOL_QUEUE_TIMEOUT_SEC, PII_SPACY_MODEL
+from logic.pii_detector import PiiDetector
+
+class PiiPool:
+    """
+    Worker pool that runs the PII checks outside of the event loop, so the CPU-bound analysis does not block the other questions.
+
+    In "thread" mode the workers share the analyzer of the process. In "process" mode each worker process loads its own analyzer
+    and the checks run in parallel on several CPUs. The analyzer is loaded when a worker starts, not by the first question it checks.
+    Executors are shared by all the pools of the process with the same settings, and warm_up() starts their workers in the background.
+
+    A check that waits longer than the queue timeout for a free worker is removed from the queue and raises a TimeoutError. The checks
+    wait for the workers to load their analyzer before they are queued, so the loading does not count against the queue timeout. The
+    time each check waits in the queue is measured.
+
+    Attributes:
+        executors (dict): Executor of each mode, number of workers and spaCy model, shared by all instances of the process.
+        warm_ups (dict): Futures of the tasks that start the workers of each executor.
+        lock (threading.Lock): Serializes the creation of the executors.
+        mode (str): "thread" or "process".
+        workers (int): Number of workers.
+        queue_timeout (float): Seconds a check can wait for a free worker.
+        spacy_model (str): spaCy model loaded by the workers.
+        stats (dict): Number of checks and timeouts, and total and maximum queue wait in seconds.
+
+    Methods:
+        run(): Runs a check in the pool and returns its result and queue wait.
+        warm_up(): Starts the workers and loads their analyzer in the background.
+        get_executor(): Returns the shared executor, creating it the first time.
+        get_stats(): Returns the statistics of the checks with the mean queue wait.
+        init_worker(): Loads the analyzer of a worker.
+        call(): Runs a check in a worker and measures how long it waited.
+    """
+
+    executors = {}
+    warm_ups = {}
+    lock = threading.Lock()
+
+    def __init__(self, mode:str = PII_POOL_MODE, workers:int = PII_POOL_WORKERS, queue_timeout:float = PII_POOL_QUEUE_TIMEOUT_SEC, spacy_model:str = PII_SPACY_MODEL):
+        """
+        Initializes the PiiPool. The executor is created by warm_up() or the first check.
+
+        Args:
+            mode (str): "thread" or "process".
+            workers (int): Number of workers.
+            queue_timeout (float): Seconds a check can wait for a free worker.
+            spacy_model (str): spaCy model loaded by the workers.
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown PII pool mode: {mode}")
+        if workers < 1:
+            raise ValueError(f"The PII pool needs at least 1 worker: {workers}")
+        self.mode = mode
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.spacy_model = spacy_model
+        self.stats = {"checks": 0, "timeouts": 0, "queue_wait_sec": 0.0, "max_queue_wait_sec": 0.0}
+
+    async def run(self, check:Callable[[str], Any], text:str) -> tuple[Any, float]:
+        """
+        Runs a check in the pool once its workers are ready. A check that already started is always awaited, even after the queue timeout.
+
+        Args:
+            check (Callable): Check to run, e.g. PiiDetector.contains_pii. In "process" mode it must be picklable.
+            text (str): Text to check.
+
+        Returns:
+            tuple[Any, float]: Result of the check and seconds it waited for a free worker.
+
+        Raises:
+            TimeoutError: The check waited longer than the queue timeout and was not run.
+        """
+        await asyncio.gather(*(asyncio.wrap_future(warm_up) for warm_up in self.warm_up()))
+        future = self.get_executor().submit(PiiPool.call, check, text, time.time())
+        wrapped = asyncio.wrap_future(future)
+        try:
+            result, queue_wait = await asyncio.wait_for(asyncio.shield(wrapped), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.cancel():
+                self.stats["timeouts"] += 1
+                raise TimeoutError(f"The PII check waited more than {self.queue_timeout}s for a free worker.")
+            result, queue_wait = await wrapped
+
+        self.stats["checks"] += 1
+        self.stats["queue_wait_sec"] += queue_wait
+        self.stats["max_queue_wait_sec"] = max(self.stats["max_queue_wait_sec"], queue_wait)
+        return result, queue_wait
+
+    def warm_up(self) -> list[Future]:
+        """
+        Starts the workers of the pool and loads their analyzer in the background, the first time it is called for the pool settings.
+        Each worker of a process pool is spawned by its own task.
+
+        Returns:
+            list[Future]: Tasks that start the workers, done when the workers are ready.
+        """
+        key = (self.mode, self.workers, self.spacy_model)
+        executor = self.get_executor()
+        with self.lock:
+            if key not in self.warm_ups:
+                self.warm_ups[key] = [executor.submit(PiiPool.init_worker, self.spacy_model) for _ in range(self.workers)]
+            return self.warm_ups[key]
+
+    def get_executor(self) -> Executor:
+        """
+        Returns the executor of the pool settings, creating it the first time.
+
+        Returns:
+            Executor: Thread or process pool executor.
+        """
+        key = (self.mode, self.workers, self.spacy_model)
+        with self.lock:
+            if key not in self.executors:
+                if self.mode == "thread":
+                    executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pii", initializer=PiiPool.init_worker, initargs=(self.spacy_model,))
+                else:
+                    #Forking a process with threads (e.g. the GUI server) is unsafe, the workers start a new interpreter
+                    executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=PiiPool.init_worker, initargs=(self.spacy_model,))
+                self.executors[key] = executor
+            return self.executors[key]
+
+    def get_stats(self) -> dict:
+        """
+        Returns the statistics of the checks run by this pool.
+
+        Returns:
+            dict: Number of checks and timeouts, and mean and maximum queue wait in seconds.
+        """
+        checks = self.stats["checks"]
+        return {
+            "checks": checks,
+            "timeouts": self.stats["timeouts"],
+            "mean_queue_wait_sec": self.stats["queue_wait_sec"] / checks if checks else None,
+            "max_queue_wait_sec": self.stats["max_queue_wait_sec"]
+        }
+
+    @staticmethod
+    def init_worker(spacy_model:str) -> None:
+        """
+        Loads the PERSON analyzer of a worker. If it cannot be loaded, the error is raised by the checks that need it. It is the
+        initializer of the workers and the task of warm_up(), which returns at once in a worker that already loaded it.
+
+        Args:
+            spacy_model (str): spaCy model to load.
+        """
+        try:
+            PiiDetector(spacy_model).get_person_analyzer()
+        except Exception:
+            pass
+
+    @staticmethod
+    def call(check:Callable[[str], Any], text:str, submitted:float) -> tuple[Any, float]:
+        """
+        Runs a check in a worker.
+
+        Args:
+            check (Callable): Check to run.
+            text (str): Text to check.
+            submitted (float): Time the check was sent to the pool.
+
+        Returns:
+            tuple[Any, float]: Result of the check and seconds it waited for a free worker.
+        """
+        queue_wait = max(time.time() - submitted, 0.0)
+        return check(text), queue_wait
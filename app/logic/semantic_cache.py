@@ -0,0 +1,177 @@
+import time
+from typing import Callable
+import numpy as np
+from config.config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SEC, SEMANTIC_CACHE_GRAPH_CHECK_SEC
+
+class SemanticCache:
+    """
+    In-memory cache of answers to previous questions, searched by the similarity of the question embeddings.
+
+    A question whose embedding is similar enough to a previously answered one gets the same answer. Entries expire after a
+    time to live, the least recently used ones are evicted when the cache is full, and all of them are removed if the graph changes.
+
+    Attributes:
+        threshold (float): Minimum cosine similarity to reuse an answer.
+        max_entries (int): Maximum number of cached answers.
+        ttl (float): Seconds an answer is kept.
+        fingerprint_fn (Callable): Returns a value that changes when the graph changes, without blocking (e.g. GraphFingerprint.get).
+            None to disable graph invalidation.
+        graph_check_sec (float): Minimum seconds between graph checks.
+        entries (list[dict]): Cached answers with their question, answer, duration and timestamps.
+        matrix (np.ndarray): Normalized embeddings of the entries, one per row.
+        fingerprint: Last graph fingerprint.
+        last_graph_check (float): Time of the last graph check.
+        hits (int): Number of hits.
+        misses (int): Number of misses.
+
+    Methods:
+        lookup(): Returns the most similar cached entry over the threshold.
+        add(): Caches the answer to a question.
+        check_graph(): Clears the cache if the graph changed.
+        remove_expired(): Removes the entries older than the time to live.
+        clear(): Removes all the entries.
+        hit_rate(): Returns the ratio of hits over lookups.
+        rebuild_matrix(): Stacks the entry embeddings in a matrix.
+        normalize(): Converts an embedding to a unit vector.
+    """
+
+    def __init__(self, threshold:float = SEMANTIC_CACHE_THRESHOLD, max_entries:int = SEMANTIC_CACHE_MAX_ENTRIES, ttl:float = SEMANTIC_CACHE_TTL_SEC,
+                 fingerprint_fn:Callable = None, graph_check_sec:float = SEMANTIC_CACHE_GRAPH_CHECK_SEC):
+        """
+        Initializes the SemanticCache.
+
+        Args:
+            threshold (float): Minimum cosine similarity to reuse an answer.
+            max_entries (int): Maximum number of cached answers.
+            ttl (float): Seconds an answer is kept.
+            fingerprint_fn (Callable, optional): Returns a value that changes when the graph changes.
+            graph_check_sec (float): Minimum seconds between graph checks.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fingerprint_fn = fingerprint_fn
+        self.graph_check_sec = graph_check_sec
+        self.entries = []
+        self.matrix = None
+        self.fingerprint = None
+        self.last_graph_check = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, embedding:list[float]) -> tuple[dict|None, float]:
+        """
+        Finds the cached question most similar to the given embedding.
+
+        Args:
+            embedding (list[float]): Embedding of the new question.
+
+        Returns:
+            tuple[dict|None, float]: The cached entry (None if no question is similar enough) and the best similarity.
+        """
+        self.check_graph()
+        self.remove_expired()
+        if not self.entries:
+            self.misses += 1
+            return None, 0.0
+
+        similarities = self.matrix @ self.normalize(embedding)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None, similarity
+
+        entry = self.entries[best]
+        entry["last_used"] = time.time()
+        self.hits += 1
+        return entry, similarity
+
+    def add(self, question:str, embedding:list[float], answer:str, duration_sec:float) -> None:
+        """
+        Caches the answer to a question, evicting the least recently used entry if the cache is full.
+
+        Args:
+            question (str): The answered question.
+            embedding (list[float]): Embedding of the question.
+            answer (str): Final answer.
+            duration_sec (float): Time it took to answer, used to report the latency saved by hits.
+        """
+        now = time.time()
+        if len(self.entries) >= self.max_entries:
+            oldest = min(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+            self.entries.pop(oldest)
+
+        self.entries.append({
+            "question": question,
+            "embedding": self.normalize(embedding),
+            "answer": answer,
+            "duration_sec": duration_sec,
+            "created": now,
+            "last_used": now
+        })
+        self.rebuild_matrix()
+
+    def check_graph(self) -> None:
+        """
+        Clears the cache if the graph fingerprint changed since the last check. The graph is checked at most once every graph_check_sec seconds.
+        If the fingerprint cannot be read, or is not known yet, the cache is kept.
+        """
+        if self.fingerprint_fn is None or time.time() - self.last_graph_check < self.graph_check_sec:
+            return
+        self.last_graph_check = time.time()
+        try:
+            fingerprint = self.fingerprint_fn()
+        except Exception:
+            return
+        if fingerprint is None:
+            return
+        if self.fingerprint is not None and fingerprint != self.fingerprint:
+            self.clear()
+        self.fingerprint = fingerprint
+
+    def remove_expired(self) -> None:
+        """
+        Removes the entries older than the time to live.
+        """
+        limit = time.time() - self.ttl
+        if any(entry["created"] < limit for entry in self.entries):
+            self.entries = [entry for entry in self.entries if entry["created"] >= limit]
+            self.rebuild_matrix()
+
+    def clear(self) -> None:
+        """
+        Removes all the entries.
+        """
+        self.entries = []
+        self.matrix = None
+
+    def hit_rate(self) -> float:
+        """
+        Returns the ratio of hits over lookups.
+
+        Returns:
+            float: Hit rate, 0 if there were no lookups.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def rebuild_matrix(self) -> None:
+        """
+        Stacks the entry embeddings in a matrix to compare them all at once.
+        """
+        self.matrix = np.vstack([entry["embedding"] for entry in self.entries]) if self.entries else None
+
+    def normalize(self, embedding:list[float]) -> np.ndarray:
+        """
+        Converts an embedding to a unit vector, so the dot product is the cosine similarity.
+
+        Args:
+            embedding (list[float]): Embedding vector.
+
+        Returns:
+            np.ndarray: Normalized float32 vector.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,61 @@
+from typing import Any, Awaitable, Callable
+
+class StageStop(Exception):
+    """
+    Raised by a stage to stop the pipeline with a message for the user (e.g. an invalid question or no data found).
+
+    Attributes:
+        message (str): Message returned to the user.
+    """
+
+    def __init__(self, message:str):
+        """
+        Initializes the StageStop.
+
+        Args:
+            message (str): Message returned to the user.
+        """
+        super().__init__(message)
+        self.message = message
+
+class Stage:
+    """
+    Named step of a StageGraph with its declared inputs and outputs.
+
+    The stage runs when the stages producing its inputs and the stages listed in "after" have finished. It receives the
+    pipeline state and returns a dictionary with its outputs. An optional "cost" key is added to the cost of the pipeline, and
+    stages that use a cache can add a "cached" key telling whether the outputs were served from it.
+
+    Attributes:
+        name (str): Name of the stage.
+        run (Callable): Asynchronous function that receives the state and returns the outputs.
+        inputs (list[str]): State keys the stage reads.
+        outputs (list[str]): State keys the stage writes. The stage is skipped if all of them are already in the state.
+        after (list[str]): Stages that must finish before this one, without passing it any data.
+        error_type (str): Error log type of the exceptions of the stage. None if the stage logs its own errors.
+        error_details (Callable): Returns the details of the error log from the state.
+    """
+
+    def __init__(self, name:str, run:Callable[[dict], Awaitable[dict]], inputs:list[str], outputs:list[str], after:list[str] = None,
+                 error_type:str = None, error_details:Callable[[dict], dict[str, Any]] = None):
+        """
+        Initializes the Stage.
+
+        Args:
+            name (str): Name of the stage.
+            run (Callable): Asynchronous function that receives the state and returns the outputs.
+            inputs (list[str]): State keys the stage reads.
+            outputs (list[str]): State keys the stage writes.
+            after (list[str], optional): Stages that must finish before this one, without passing it any data.
+            error_type (str, optional): Error log type of the exceptions of the stage. None if the stage logs its own errors.
+            error_details (Callable, optional): Returns the details of the error log from the state.
+        """
+        if not outputs:
+            raise ValueError(f"Stage {name} has no outputs.")
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after or [])
+        self.error_type = error_type
+        self.error_details = error_details
@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Callable
+from logic.stage import Stage, StageStop
+from logs.logger import Logger
+from logs.tracer import Tracer
+
+class StageGraph:
+    """
+    Pipeline expressed as a directed acyclic graph of stages, run by an asynchronous scheduler.
+
+    Every stage starts as soon as its inputs and its "after" stages are ready, so independent stages run concurrently.
+    Each stage is timed and its exceptions are logged in the same way. When a stage stops the pipeline (StageStop) or fails,
+    the stages declared before it keep running, because their stop or error comes first, and the stages declared after it
+    are dropped. This keeps the messages of a concurrent graph the same as the ones of a sequential one.
+
+    Stages whose outputs are already in the state are skipped, so a pipeline can be resumed from a partial state.
+    Each stage runs in a task named after it and, if the request is traced, in its own span.
+
+    Attributes:
+        stages (list[Stage]): Stages in declaration order.
+        logger (Logger): Logger of the stage errors.
+        producers (dict): Stage that writes each state key.
+
+    Methods:
+        run(): Runs the stages on a state.
+        run_stage(): Runs one stage in its span.
+        get_dependencies(): Returns the stages a stage waits for.
+        check_cycles(): Raises an error if the stages depend on each other in a cycle.
+        drop(): Cancels the running stages that are not needed.
+    """
+
+    def __init__(self, stages:list[Stage], logger:Logger = None):
+        """
+        Initializes the StageGraph and checks that its stages form a valid graph.
+
+        Args:
+            stages (list[Stage]): Stages in declaration order. Earlier stages have priority when several stop the pipeline.
+            logger (Logger, optional): Logger of the stage errors.
+        """
+        self.stages = list(stages)
+        self.logger = logger if logger is not None else Logger()
+        self.producers = {}
+
+        names = [stage.name for stage in self.stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicated stage names: {names}")
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"{output} is written by {self.producers[output].name} and {stage.name}")
+                self.producers[output] = stage
+            for name in stage.after:
+                if name not in names:
+                    raise ValueError(f"Stage {stage.name} runs after an unknown stage: {name}")
+        self.check_cycles()
+
+    async def run(self, state:dict, stages:list[str] = None, timings:dict = None, on_drop:Callable[[list[asyncio.Task]], None] = None) -> tuple[str|None, dict]:
+        """
+        Runs the stages on the state. Their outputs are written into the state and their costs are added to state["total_cost"].
+
+        Args:
+            state (dict): Pipeline state with the inputs of the first stages.
+            stages (list[str], optional): Names of the stages to run. All of them by default.
+            timings (dict, optional): Dictionary where the duration of each stage is stored.
+            on_drop (Callable, optional): Receives the running tasks of the stages that are dropped. They are cancelled by default.
+
+        Returns:
+            tuple[str|None, dict]: The message of the stage that stopped the pipeline, or None if it finished, and a report with:
+                - "stopped_by": name of the stage that stopped the pipeline, or None,
+                - "skipped": stages whose outputs were already in the state,
+                - "dropped": stages that were running when the pipeline stopped,
+                - "costs": cost of each stage,
+                - "cached": whether each stage that uses a cache was served from it.
+        """
+        timings = {} if timings is None else timings
+        on_drop = on_drop if on_drop is not None else self.drop
+        selected = [stage for stage in self.stages if stages is None or stage.name in stages]
+        todo = [stage for stage in selected if not all(output in state for output in stage.outputs)]
+        todo_names = {stage.name for stage in todo}
+        report = {"stopped_by": None, "skipped": [stage.name for stage in selected if stage.name not in todo_names], "dropped": [], "costs": {}, "cached": {}}
+
+        #Every input must be in the state or be written by a stage that runs
+        for stage in todo:
+            for key in stage.inputs:
+                if key not in state and (key not in self.producers or self.producers[key].name not in todo_names):
+                    raise ValueError(f"Stage {stage.name} needs {key}, which is not in the state or written by a stage that runs.")
+
+        order = {stage.name: index for index, stage in enumerate(self.stages)}
+        finished = set()
+        running = {}
+        started = {}
+        outcome = None #(stage, exception) of the first stage, in declaration order, that stopped or failed
+
+        try:
+            while True:
+                #Start the stages that are ready and come before the one that stopped the pipeline
+                for stage in todo:
+                    if stage.name in started or (outcome is not None and order[stage.name] > order[outcome[0].name]):
+                        continue
+                    if all(dependency in finished for dependency in self.get_dependencies(stage, todo_names)):
+                        task = asyncio.create_task(self.run_stage(stage, state), name=f"stage:{stage.name}")
+                        running[task] = stage
+                        started[stage.name] = time.time()
+
+                if not running:
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    timings[stage.name] = time.time() - started[stage.name]
+                    try:
+                        outputs = task.result()
+                    except StageStop as stop:
+                        error = stop
+                    except RuntimeError as e:
+                        error = e
+                    except Exception as e:
+                        error = e
+                        if stage.error_type is not None:
+                            details = stage.error_details(state) if stage.error_details is not None else {}
+                            self.logger.log_error(stage.error_type, {**details, "stage": stage.name, "error": str(e)})
+                    else:
+                        cost = outputs.pop("cost", 0) or 0
+                        cached = outputs.pop("cached", None)
+                        missing = [output for output in stage.outputs if output not in outputs]
+                        if missing:
+                            error = ValueError(f"Stage {stage.name} did not return {missing}")
+                        else:
+                            state.update(outputs)
+                            state["total_cost"] = state.get("total_cost", 0) + cost
+                            report["costs"][stage.name] = cost
+                            if cached is not None:
+                                report["cached"][stage.name] = cached
+                            finished.add(stage.name)
+                            continue
+
+                    if outcome is None or order[stage.name] < order[outcome[0].name]:
+                        outcome = (stage, error)
+
+                #Drop the running stages that come after the one that stopped the pipeline
+                if outcome is not None:
+                    dropped = [task for task, stage in running.items() if order[stage.name] > order[outcome[0].name]]
+                    if dropped:
+                        report["dropped"] += [running.pop(task).name for task in dropped]
+                        on_drop(dropped)
+        finally:
+            #The run was cancelled or a stage could not be handled
+            if running:
+                on_drop(list(running))
+
+        if outcome is None:
+            return None, report
+        stage, error = outcome
+        report["stopped_by"] = stage.name
+        if isinstance(error, StageStop):
+            return error.message, report
+        raise error
+
+    async def run_stage(self, stage:Stage, state:dict) -> dict:
+        """
+        Runs one stage in its span of the request trace.
+
+        Args:
+            stage (Stage): The stage.
+            state (dict): Pipeline state.
+
+        Returns:
+            dict: Outputs of the stage.
+        """
+        with Tracer.span(f"stage:{stage.name}"):
+            return await stage.run(state)
+
+    def get_dependencies(self, stage:Stage, names:set[str] = None) -> set[str]:
+        """
+        Returns the stages a stage waits for: the ones that write its inputs and the ones in its "after" list.
+
+        Args:
+            stage (Stage): The stage.
+            names (set[str], optional): Only return these stages, e.g. the ones that still have to run.
+
+        Returns:
+            set[str]: Names of the stages.
+        """
+        dependencies = {self.producers[key].name for key in stage.inputs if key in self.producers} | set(stage.after)
+        return dependencies if names is None else dependencies & names
+
+    def check_cycles(self) -> None:
+        """
+        Raises a ValueError if the stages depend on each other in a cycle.
+        """
+        stages = {stage.name: stage for stage in self.stages}
+        visiting, visited = set(), set()
+
+        def visit(name:str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"The stages have a cycle through {name}")
+            visiting.add(name)
+            for dependency in self.get_dependencies(stages[name]):
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in stages:
+            visit(name)
+
+    def drop(self, tasks:list[asyncio.Task]) -> None:
+        """
+        Cancels the running stages that are not needed, retrieving their exceptions so they are not reported as unhandled.
+
+        Args:
+            tasks (list[asyncio.Task]): Running tasks of the stages.
+        """
+        for task in tasks:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            task.cancel()
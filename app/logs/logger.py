@@ -1,13 +1,15 @@
 import json
 import os
 from datetime import datetime
+from logs.tracer import Tracer
 
 class Logger:
     """
     Logs both application data and errors in JSON Lines format.
 
     This class writes logs about data and errors that happen in the system. 
-    The data can be used to analyze different types of metrics.
+    The data can be used to analyze different types of metrics. Entries written while a request is traced
+    have its request and span IDs.
 
     Attributes:
         LOG_DIR (str): Directory where log files are stored.
@@ -37,7 +39,7 @@ class Logger:
         if not isinstance(data, dict):
             raise TypeError("log_data expects a dictionary")
         with open(self.DATA_LOG, "a", encoding="utf-8") as f:
-            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            f.write(json.dumps({**data, **Tracer.get_log_context()}, ensure_ascii=False) + "\n")
 
     def log_error(self, error_type: str, error_details: dict) -> None:
         """
@@ -52,7 +54,8 @@ class Logger:
         data = {
             "timestamp": datetime.now().isoformat(),
             "error_type": error_type,
-            "details": error_details
+            "details": error_details,
+            **Tracer.get_log_context()
         }
         with open(self.ERROR_LOG, "a", encoding="utf-8") as f:
             f.write(json.dumps(data, ensure_ascii=False) + "\n")
\ No newline at end of file
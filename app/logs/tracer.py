@@ -0,0 +1,288 @@
+import asyncio
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Iterator
+from config.config import TRACE_DIR, TRACE_FORMAT
+
+class Tracer:
+    """
+    Records a tree of timed spans for each request, so the stages and external calls of one question can be seen together.
+
+    The trace and the current span are kept in context variables, so they follow the question through its tasks and the threads
+    started with asyncio.to_thread() without passing them as arguments. A request is traced from the outermost trace() or traced()
+    function marked as a root, and the spans opened inside it are nested under the span that was current when they started.
+    Spans outside of a trace are not recorded.
+
+    When the request finishes, its trace is written to TRACE_DIR in the Chrome trace event format ("chrome"), which can be opened
+    in chrome://tracing or Perfetto, or in the OpenTelemetry OTLP JSON format ("otel"). An empty TRACE_DIR disables the export.
+
+    Attributes:
+        TRACE_DIR (str): Directory where the traces are written. Empty to disable the export.
+        TRACE_FORMAT (str): "chrome" or "otel".
+        current_trace (ContextVar): Trace of the current request. None outside of a request.
+        current_span (ContextVar): Span the new spans are nested under. None outside of a request.
+
+    Methods:
+        trace(): Traces a request, or opens a span if a request is already traced.
+        span(): Opens a span in the current trace.
+        traced(): Decorator that runs a function in a span.
+        get_request_id(): Returns the ID of the current request.
+        get_log_context(): Returns the request and span IDs to add to the log entries.
+        export(): Writes a trace to TRACE_DIR.
+        to_chrome(): Converts a trace to the Chrome trace event format.
+        to_otel(): Converts a trace to the OpenTelemetry OTLP JSON format.
+        get_lane(): Returns the name of the task or thread that runs a span.
+    """
+
+    TRACE_DIR = TRACE_DIR
+    TRACE_FORMAT = TRACE_FORMAT
+
+    current_trace = ContextVar("current_trace", default=None)
+    current_span = ContextVar("current_span", default=None)
+
+    @classmethod
+    @contextmanager
+    def trace(cls, name:str, **attributes) -> Iterator[dict]:
+        """
+        Traces a request. If a request is already traced in this context, it opens a span in its trace instead.
+
+        Args:
+            name (str): Name of the root span.
+            **attributes: Attributes of the root span.
+
+        Yields:
+            dict: The root span. Attributes can be added to it while the request runs.
+        """
+        if cls.current_trace.get() is not None:
+            with cls.span(name, **attributes) as span:
+                yield span
+            return
+
+        trace = {"request_id": uuid.uuid4().hex, "start": datetime.now().isoformat(), "spans": []}
+        trace_token = cls.current_trace.set(trace)
+        try:
+            with cls.span(name, **attributes) as span:
+                yield span
+        finally:
+            try:
+                cls.current_trace.reset(trace_token)
+            except ValueError:
+                cls.current_trace.set(None) #Exited in another context, e.g. a stream closed by another task
+            if cls.TRACE_DIR:
+                cls.export(trace)
+
+    @classmethod
+    @contextmanager
+    def span(cls, name:str, **attributes) -> Iterator[dict|None]:
+        """
+        Opens a span in the current trace, nested under the current span. Errors raised inside it are recorded and raised.
+
+        Args:
+            name (str): Name of the span.
+            **attributes: Attributes of the span.
+
+        Yields:
+            dict|None: The span, or None outside of a request.
+        """
+        trace = cls.current_trace.get()
+        if trace is None:
+            yield None
+            return
+
+        parent = cls.current_span.get()
+        span = {
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent["span_id"] if parent is not None else None,
+            "name": name,
+            "lane": cls.get_lane(),
+            "start_ns": time.time_ns(),
+            "end_ns": None,
+            "attributes": dict(attributes),
+            "error": None
+        }
+        trace["spans"].append(span)
+        span_token = cls.current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span["end_ns"] = time.time_ns()
+            try:
+                cls.current_span.reset(span_token)
+            except ValueError:
+                cls.current_span.set(parent)
+
+    @classmethod
+    def traced(cls, name:str = None, root:bool = False) -> Callable:
+        """
+        Decorator that runs a function, coroutine function or asynchronous generator function in a span.
+
+        Args:
+            name (str, optional): Name of the span. The qualified name of the function by default.
+            root (bool): Whether the function starts the trace of a request if none is active.
+
+        Returns:
+            Callable: The decorator.
+        """
+        def decorator(function:Callable) -> Callable:
+            span_name = name or function.__qualname__
+            open_span = cls.trace if root else cls.span
+
+            if inspect.isasyncgenfunction(function):
+                @functools.wraps(function)
+                async def generator_wrapper(*args, **kwargs):
+                    #Close the generator inside its span when the consumer stops early
+                    with open_span(span_name):
+                        async with aclosing(function(*args, **kwargs)) as items:
+                            async for item in items:
+                                yield item
+                return generator_wrapper
+
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def coroutine_wrapper(*args, **kwargs):
+                    with open_span(span_name):
+                        return await function(*args, **kwargs)
+                return coroutine_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with open_span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def get_request_id(cls) -> str|None:
+        """
+        Returns the ID of the current request.
+
+        Returns:
+            str|None: The request ID, or None outside of a request.
+        """
+        trace = cls.current_trace.get()
+        return trace["request_id"] if trace is not None else None
+
+    @classmethod
+    def get_log_context(cls) -> dict:
+        """
+        Returns the request and span IDs to add to the log entries, so they can be joined with the spans of their trace.
+
+        Returns:
+            dict: "request_id" and "span_id", or an empty dictionary outside of a request.
+        """
+        trace = cls.current_trace.get()
+        if trace is None:
+            return {}
+        span = cls.current_span.get()
+        return {"request_id": trace["request_id"], "span_id": span["span_id"] if span is not None else None}
+
+    @classmethod
+    def export(cls, trace:dict) -> str:
+        """
+        Writes a trace to TRACE_DIR in the configured format.
+
+        Args:
+            trace (dict): The trace.
+
+        Returns:
+            str: Path of the trace file.
+        """
+        os.makedirs(cls.TRACE_DIR, exist_ok=True)
+        data = cls.to_otel(trace) if cls.TRACE_FORMAT == "otel" else cls.to_chrome(trace)
+        path = os.path.join(cls.TRACE_DIR, f"{trace['start'][:19].replace(':', '')}-{trace['request_id']}.{cls.TRACE_FORMAT}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+    @classmethod
+    def to_chrome(cls, trace:dict) -> dict:
+        """
+        Converts a trace to the Chrome trace event format. Each task or thread is shown as a thread of the request.
+
+        Args:
+            trace (dict): The trace.
+
+        Returns:
+            dict: Trace events with complete ("X") events for the spans and metadata ("M") events for the thread names.
+        """
+        lanes = {}
+        events = []
+        for span in list(trace["spans"]):
+            tid = lanes.setdefault(span["lane"], len(lanes) + 1)
+            end_ns = span["end_ns"] if span["end_ns"] is not None else time.time_ns()
+            events.append({
+                "name": span["name"],
+                "ph": "X",
+                "ts": span["start_ns"] / 1000,
+                "dur": (end_ns - span["start_ns"]) / 1000,
+                "pid": 1,
+                "tid": tid,
+                "args": {**span["attributes"], "span_id": span["span_id"], "parent_id": span["parent_id"], "error": span["error"]}
+            })
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}} for lane, tid in lanes.items()]
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"request {trace['request_id']}"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"request_id": trace["request_id"]}}
+
+    @classmethod
+    def to_otel(cls, trace:dict) -> dict:
+        """
+        Converts a trace to the OpenTelemetry OTLP JSON format, using the request ID as the trace ID.
+
+        Args:
+            trace (dict): The trace.
+
+        Returns:
+            dict: Resource spans with one span per recorded span.
+        """
+        def to_value(value) -> dict:
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)}
+
+        spans = []
+        for span in list(trace["spans"]):
+            attributes = {**span["attributes"], "thread.name": span["lane"]}
+            spans.append({
+                "traceId": trace["request_id"],
+                "spanId": span["span_id"],
+                "parentSpanId": span["parent_id"] or "",
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span["start_ns"]),
+                "endTimeUnixNano": str(span["end_ns"] if span["end_ns"] is not None else time.time_ns()),
+                "attributes": [{"key": key, "value": to_value(value)} for key, value in attributes.items()],
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 0}
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "rag-graph"}}]},
+            "scopeSpans": [{"scope": {"name": "logs.tracer"}, "spans": spans}]
+        }]}
+
+    @staticmethod
+    def get_lane() -> str:
+        """
+        Returns the name of the asyncio task, or of the thread outside of a task, that runs the current code.
+
+        Returns:
+            str: Name of the task or thread.
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return task.get_name() if task is not None else threading.current_thread().name
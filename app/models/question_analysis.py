@@ -0,0 +1,37 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from models.entity import Entity, EntityList
+from models.question import Question
+
+class QuestionAnalysis(BaseModel):
+    """
+    A model representing the validation of a user question and the entities extracted from it, returned by a single LLM call.
+
+    Attributes:
+        value (str): The text of the user's question, corrected if it is orthographically incorrect.
+        is_valid (bool): Indicates whether the question passed validation.
+        reasoning (Optional[str]): Explanation for why the question is invalid.
+        entities (list[Entity]): Entities extracted from the question. Empty if it is not valid.
+    """
+    value: str = Field(...,description="The question's text")
+    is_valid: bool = Field(...,description="If the question is valid or not")
+    reasoning: Optional[str] = Field(...,description="The reason the question is not valid")
+    entities: list[Entity] = Field(...,description="List of entities extracted from the question.")
+
+    def to_question(self) -> Question:
+        """
+        Returns the validation part of the analysis.
+
+        Returns:
+            Question: The question and its validation result.
+        """
+        return Question(value=self.value, is_valid=self.is_valid, reasoning=self.reasoning)
+
+    def to_entity_list(self) -> EntityList:
+        """
+        Returns the extraction part of the analysis.
+
+        Returns:
+            EntityList: The extracted entities.
+        """
+        return EntityList(entities=self.entities)
@@ -0,0 +1,16 @@
+import argparse
+from presentation.pii_benchmark import PiiBenchmark
+
+#Command line entry point to compare the tiered PII detector with the full Presidio analyzer.
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency of the tiered PII detector against the full Presidio analyzer.")
+    parser.add_argument("input", nargs="?", help="Text file with one question per line. Built-in sample questions are used if it is not given.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times each question is analyzed by each detector.")
+    args = parser.parse_args()
+
+    benchmark = PiiBenchmark()
+    questions = benchmark.load_questions(args.input) if args.input else PiiBenchmark.SAMPLE_QUESTIONS
+    benchmark.print_summary(benchmark.run(questions, repeat=args.repeat))
+
+if __name__ == "__main__":
+    main()
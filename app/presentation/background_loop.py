@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine
+
+class BackgroundLoop:
+    """
+    Event loop that runs for the whole life of the process in a daemon thread.
+
+    The GUI reruns its script in a new thread on every interaction, and running each question with asyncio.run() created a new loop
+    per question. The OpenAI clients and their connection pools are bound to the loop that created them, so no connection was
+    reused between questions. Running every question of every session in this loop keeps one client and one warm connection pool.
+
+    Attributes:
+        shared (BackgroundLoop): Loop shared by the process, created by get_shared().
+        shared_lock (threading.Lock): Serializes the creation of the shared loop.
+        loop (asyncio.AbstractEventLoop): The event loop.
+        thread (threading.Thread): Thread that runs the loop.
+
+    Methods:
+        submit(): Schedules a coroutine in the loop.
+        run(): Runs a coroutine in the loop and waits for its result.
+        get_shared(): Returns the loop shared by the process.
+    """
+
+    shared = None
+    shared_lock = threading.Lock()
+
+    def __init__(self):
+        """
+        Initializes the BackgroundLoop and starts its thread.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="background-loop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine:Coroutine) -> Future:
+        """
+        Schedules a coroutine in the loop without waiting for it.
+
+        Args:
+            coroutine (Coroutine): Coroutine to run.
+
+        Returns:
+            Future: Thread-safe future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine:Coroutine) -> Any:
+        """
+        Runs a coroutine in the loop and waits for its result. It must not be called from the loop's thread.
+
+        Args:
+            coroutine (Coroutine): Coroutine to run.
+
+        Returns:
+            Any: Result of the coroutine. Its exceptions are raised.
+        """
+        return self.submit(coroutine).result()
+
+    @classmethod
+    def get_shared(cls) -> "BackgroundLoop":
+        """
+        Returns the loop shared by the process, starting it the first time.
+
+        Returns:
+            BackgroundLoop: The loop.
+        """
+        with cls.shared_lock:
+            if cls.shared is None:
+                cls.shared = cls()
+            return cls.shared
@@ -0,0 +1,202 @@
+import asyncio
+import csv
+import json
+import os
+import time
+import numpy as np
+from logic.orchestrator import Orchestrator
+
+class BatchRunner:
+    """
+    Answers the questions of a JSONL or CSV file offline, e.g. evaluation sets or precomputed FAQs.
+
+    Questions are normalized like in the GUI and deduplicated, and they are answered with a bounded number of concurrent
+    pipelines. Each answer is appended to the output JSONL as soon as it is ready, so an interrupted run can be resumed:
+    questions already answered in the output file are skipped, and the ones that failed are tried again.
+
+    Attributes:
+        orchestrator (Orchestrator): Pipeline used to answer the questions.
+        concurrency (int): Maximum number of questions answered at the same time.
+
+    Methods:
+        run(): Answers the questions of an input file and writes them to an output file.
+        load_questions(): Reads the questions of a JSONL or CSV file.
+        load_checkpoint(): Reads the questions already answered in an output file.
+        answer(): Answers one question and builds its output record.
+        summarize(): Calculates the throughput and latency percentiles of a run.
+        print_summary(): Prints the summary of a run.
+    """
+
+    def __init__(self, orchestrator:Orchestrator = None, concurrency:int = 4):
+        """
+        Initializes the BatchRunner.
+
+        Args:
+            orchestrator (Orchestrator, optional): Pipeline used to answer the questions. A new one is created if it is not given.
+            concurrency (int): Maximum number of questions answered at the same time.
+        """
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1: {concurrency}")
+        self.orchestrator = orchestrator if orchestrator is not None else Orchestrator()
+        self.concurrency = concurrency
+
+    async def run(self, input_path:str, output_path:str) -> dict:
+        """
+        Answers the questions of an input file that are not answered in the output file yet.
+
+        Args:
+            input_path (str): JSONL or CSV file with the questions.
+            output_path (str): JSONL file where the answers are appended.
+
+        Returns:
+            dict: Summary of the run, see summarize().
+        """
+        questions = self.load_questions(input_path)
+
+        #Group duplicated questions so each one is answered once
+        pending = {}
+        for item in questions:
+            pending.setdefault(item["question"], []).append(item["id"])
+        duplicates = len(questions) - len(pending)
+
+        #Skip the questions answered by a previous run
+        answered = self.load_checkpoint(output_path)
+        pending = {question: ids for question, ids in pending.items() if question not in answered}
+        skipped = len(questions) - duplicates - len(pending)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        records = []
+        if pending:
+            await self.orchestrator.warm_up()
+        start = time.time()
+
+        with open(output_path, "a", encoding="utf-8") as f:
+            async def worker(question:str, ids:list) -> None:
+                async with semaphore:
+                    record = await self.answer(question, ids)
+                #Write each answer as soon as it is ready, so it is kept if the run is interrupted
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                records.append(record)
+
+            await asyncio.gather(*(worker(question, ids) for question, ids in pending.items()))
+
+        return self.summarize(records, time.time() - start, duplicates, skipped)
+
+    def load_questions(self, path:str) -> list[dict]:
+        """
+        Reads the questions of a JSONL file (one object with a "question" field per line) or a CSV file (with a "question" column).
+        An optional "id" field identifies each question, otherwise its line number is used.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            list[dict]: Questions with their "id" and normalized "question". Empty questions are ignored.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in (".jsonl", ".csv"):
+            raise ValueError(f"Unsupported question file, use .jsonl or .csv: {path}")
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if extension == ".jsonl":
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+
+        questions = []
+        for number, row in enumerate(rows, start=1):
+            if "question" not in row:
+                raise ValueError(f"Row {number} of {path} has no question field.")
+            #Same normalization as the GUI
+            question = str(row["question"] or "").lower().strip()
+            if question:
+                questions.append({"id": row["id"] if row.get("id") not in (None, "") else number, "question": question})
+        return questions
+
+    def load_checkpoint(self, path:str) -> set[str]:
+        """
+        Reads the questions already answered in an output file. Records with an error are not counted.
+
+        Args:
+            path (str): Path of the output JSONL file.
+
+        Returns:
+            set[str]: Answered questions.
+        """
+        answered = set()
+        if not os.path.exists(path):
+            return answered
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue #Last line of an interrupted run
+                if "error" not in record:
+                    answered.add(record["question"])
+        return answered
+
+    async def answer(self, question:str, ids:list) -> dict:
+        """
+        Answers one question. Errors and rejections of the admission controller are stored in the record so the question is
+        tried again on the next run, except for RuntimeError (e.g. invalid API key) that stops the run.
+
+        Args:
+            question (str): The normalized question.
+            ids (list): Ids of the input rows with this question.
+
+        Returns:
+            dict: Output record with the ids, question, answer, cost, duration, stage timings and connection counts, or the error.
+        """
+        start = time.time()
+        try:
+            result = await self.orchestrator.answer_question(question)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            return {"ids": ids, "question": question, "error": str(e), "duration_sec": time.time() - start}
+        if result.get("rejected"):
+            #Not admitted because the process is overloaded, try it again on the next run
+            return {"ids": ids, "question": question, "error": f"Not admitted: {result['rejected']}", "duration_sec": time.time() - start}
+        return {"ids": ids, "question": question, **result}
+
+    def summarize(self, records:list[dict], wall_time:float, duplicates:int, skipped:int) -> dict:
+        """
+        Calculates the summary of a run.
+
+        Args:
+            records (list[dict]): Output records of the run.
+            wall_time (float): Duration of the run in seconds.
+            duplicates (int): Duplicated input questions.
+            skipped (int): Questions skipped because they were already answered.
+
+        Returns:
+            dict: Number of answered, failed, duplicated and skipped questions, throughput (questions per second),
+                latency percentiles (p50, p90, p99) in seconds and total cost.
+        """
+        answered = [record for record in records if "error" not in record]
+        latencies = [record["duration_sec"] for record in answered]
+        return {
+            "answered": len(answered),
+            "failed": len(records) - len(answered),
+            "duplicates": duplicates,
+            "skipped": skipped,
+            "wall_time_sec": wall_time,
+            "throughput_qps": len(records) / wall_time if wall_time > 0 else 0.0,
+            "latency_p50_sec": float(np.percentile(latencies, 50)) if latencies else None,
+            "latency_p90_sec": float(np.percentile(latencies, 90)) if latencies else None,
+            "latency_p99_sec": float(np.percentile(latencies, 99)) if latencies else None,
+            "total_cost": sum(record["cost"] or 0 for record in answered)
+        }
+
+    def print_summary(self, summary:dict) -> None:
+        """
+        Prints the summary of a run.
+
+        Args:
+            summary (dict): Summary returned by run().
+        """
+        print(f"Answered: {summary['answered']}  Failed: {summary['failed']}  Duplicates: {summary['duplicates']}  Skipped (already answered): {summary['skipped']}")
+        print(f"Wall time: {summary['wall_time_sec']:.2f}s  Throughput: {summary['throughput_qps']:.2f} questions/s  Total cost: ${summary['total_cost']:.6f}")
+        if summary["latency_p50_sec"] is not None:
+            print(f"Latency p50: {summary['latency_p50_sec']:.2f}s  p90: {summary['latency_p90_sec']:.2f}s  p99: {summary['latency_p99_sec']:.2f}s")
@@ -1,6 +1,7 @@
-import asyncio
+import queue
 import streamlit as st
 from logic.orchestrator import Orchestrator
+from presentation.background_loop import BackgroundLoop
 from logic.logs_service import LogsService
 from logs.logger import Logger
 import pandas as pd
@@ -18,9 +19,12 @@ class GUI():
         logger (Logger): Logging utility to capture errors.
         orchestrator (Orchestrator): Backend orchestrator handling the core RAG logic.
         log_service (LogsService): Service for retrieving and displaying log data and statistics.
+        background_loop (BackgroundLoop): Event loop of the process where the questions of all sessions run.
 
     Methods:
         start_interface(): Launches the Streamlit interface with options for querying, logs, history, and statistics.
+        ask(): Answers a question in the background loop and renders the answer in a placeholder as it is generated.
+        stream_response(): Streams the answer of a question into a queue.
     """
     
     def __init__(self): 
@@ -28,9 +32,11 @@ class GUI():
         Initializes the GUI interface by setting up essential backend services in the Streamlit session state.
 
         Ensures that the Logger, Orchestrator, and LogsService instances are created and accessible globally
-        within the session. Handles and logs Neo4j connection errors.
+        within the session. Handles and logs Neo4j connection errors. The questions run in the event loop shared by the process,
+        and the connections of a new Orchestrator are opened in the background.
         """
         self.neo4j_error = ""     
+        self.background_loop = BackgroundLoop.get_shared()
         if "logger" not in st.session_state:
             st.session_state.logger = Logger()
         self.logger = st.session_state.logger
@@ -38,6 +44,7 @@ class GUI():
         if "orchestrator" not in st.session_state:
             try:
                 st.session_state.orchestrator = Orchestrator()
+                self.background_loop.submit(st.session_state.orchestrator.warm_up())
             except RuntimeError as e:
                 if "[NEO4J_CONNECTION_ERROR]" in str(e):
                     self.neo4j_error = "Error: Cound not connect to the database. Please, verify the server ir running and the credentials are correct."
@@ -51,6 +58,41 @@ class GUI():
         self.log_service = st.session_state.log_service
 
 
+    def ask(self, question:str, placeholder) -> str:
+        """
+        Answers a question in the background loop and renders the answer in the placeholder as its tokens arrive. The placeholder
+        is written from the script thread, Streamlit elements cannot be updated from the loop's thread.
+
+        Args:
+            question (str): The user's question.
+            placeholder: Streamlit placeholder where the answer is written.
+
+        Returns:
+            str: The complete answer.
+        """
+        deltas = queue.Queue()
+        future = self.background_loop.submit(self.stream_response(question, deltas))
+        response = ""
+        while (delta := deltas.get()) is not None:
+            response += delta
+            placeholder.markdown(response)
+        future.result() #Raises the errors of the pipeline
+        return response
+
+    async def stream_response(self, question:str, deltas:queue.Queue) -> None:
+        """
+        Processes a question and puts the deltas of its answer in a queue as they arrive, followed by None when it ends.
+
+        Args:
+            question (str): The user's question.
+            deltas (queue.Queue): Queue where the deltas are put.
+        """
+        try:
+            async for delta in self.orchestrator.process_question_stream(question):
+                deltas.put(delta)
+        finally:
+            deltas.put(None)
+
     def start_interface(self) -> None:
         """
         Launches the Streamlit user interface for the RAG (Retrieval-Augmented Generation) system.
@@ -115,8 +157,8 @@ class GUI():
                         with st.spinner("Processing...", show_time=True):
                                 response_placeholder = st.empty() #Placeholder to dynamically display response
                                 try:
-                                    #Call the backend to process the question
-                                    response = asyncio.run(self.orchestrator.process_question(question.lower().strip()))
+                                    #Call the backend to process the question and render the answer as it arrives
+                                    response = self.ask(question.lower().strip(), response_placeholder)
 
                                     #Save question-response to session history
                                     st.session_state.history.append({
@@ -163,7 +205,7 @@ class GUI():
                 st.subheader("Logs")
 
                 #Select log type to display
-                log_category = st.radio("Select log type", ["Queries", "LLM Calls", "Embeddings", "Database", "Errors"])
+                log_category = st.radio("Select log type", ["Queries", "LLM Calls", "Embeddings", "Database", "Analysis Comparison", "Speculation", "Errors"])
 
                 #Retrieve logs from system
                 logs_by_type, error_logs = self.log_service.parse_logs()
@@ -177,6 +219,10 @@ class GUI():
                     data = logs_by_type["embedding"]
                 elif log_category == "Database":
                     data = logs_by_type["database"]
+                elif log_category == "Analysis Comparison":
+                    data = logs_by_type["analysis_comparison"]
+                elif log_category == "Speculation":
+                    data = logs_by_type["speculation"]
                 elif log_category == "Errors":
                     data = error_logs
 
@@ -191,6 +237,24 @@ class GUI():
             elif page == "Statistics":
                 stats_by_type = self.log_service.get_log_statistics_by_type()
 
+                #Model of each task and the statistics used to promote or roll back canaries
+                st.subheader("Model Routing")
+                router = self.orchestrator.llm_tasks.model_router
+                model_stats = self.log_service.get_model_statistics_by_task(stats_by_type)
+                if st.button("Update routes from logs"):
+                    decisions = router.update_from_stats(self.log_service.get_model_statistics_by_task(stats_by_type, since=router.get_canary_starts()))
+                    if decisions:
+                        for decision in decisions:
+                            st.success(f"{decision['task_name']}: {decision['action']} {decision['model']} {', '.join(decision['reasons'])}")
+                    else:
+                        st.info("No canary has enough new calls to update the routes.")
+                st.dataframe(pd.DataFrame.from_dict(router.routes, orient="index"))
+                if model_stats:
+                    st.dataframe(pd.DataFrame([
+                        {"task_name": task_name, "model": model, **model_stat}
+                        for task_name, models in model_stats.items() for model, model_stat in models.items()
+                    ]))
+
                 if stats_by_type:
                     st.subheader("Log Statistics by Type")
 
@@ -214,6 +278,10 @@ class GUI():
                                     col1.metric("Average Cost ($)", f"{task_stat['avg_cost']:.8f}")
                                     col2.metric("Total Cost ($)", f"{task_stat['total_cost']:.8f}")
 
+                                #If the task logs its tokens, show how many input tokens were served from the prompt prefix cache
+                                if task_stat.get("prefix_cache_hit_ratio") is not None:
+                                    st.metric("Prompt Prefix Cache Hit Ratio", f"{task_stat['prefix_cache_hit_ratio']:.1%}")
+
                                 task_df = df[df["task_name"] == selected_task].copy()
 
                                 if "cost" in task_df.columns:
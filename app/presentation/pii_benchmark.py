@@ -0,0 +1,141 @@
+import time
+import numpy as np
+from logic.pii_detector import PiiDetector
+
+class PiiBenchmark:
+    """
+    Compares the latency and the results of the tiered PII detector with the full Presidio analyzer used before it.
+
+    Both detectors are loaded and warmed up with one question before measuring, so the times do not include the loading of the
+    spaCy models. Questions without PII are the common case and the ones that reach the PERSON recognizer.
+
+    Attributes:
+        SAMPLE_QUESTIONS (list[str]): Questions used when no file is given, normalized like in the GUI.
+        detector (PiiDetector): Tiered detector.
+        analyzer (AnalyzerEngine): Full Presidio analyzer with all the recognizers.
+
+    Methods:
+        run(): Measures both detectors on a list of questions.
+        load_questions(): Reads a text file with one question per line.
+        summarize(): Calculates the latency percentiles of a detector.
+        print_summary(): Prints the summary of a run.
+    """
+
+    SAMPLE_QUESTIONS = [
+        "what is the capital of spain?",
+        "which museums are in madrid?",
+        "what was the population of barcelona in 2020?",
+        "which rivers cross the region of andalusia?",
+        "how many universities are there in valencia?",
+        "when was the bridge of alcantara built?",
+        "what is the email of the museum? write to info@museum.com",
+        "call me at +34 612 345 678 about the tour",
+        "my card is 4111 1111 1111 1111, is the ticket refundable?",
+        "send the refund to es91 2100 0418 4502 0005 1332",
+        "my nif is 12345678z, can i visit the palace?",
+        "the server 192.168.1.10 returns an error",
+        "see https://example.org/page for the details",
+        "who is john smith from the city council?",
+    ]
+
+    def __init__(self, detector:PiiDetector = None, analyzer = None):
+        """
+        Initializes the PiiBenchmark.
+
+        Args:
+            detector (PiiDetector, optional): Tiered detector. A new one is created if it is not given.
+            analyzer (AnalyzerEngine, optional): Full Presidio analyzer. A new one is created if it is not given.
+        """
+        if analyzer is None:
+            from presidio_analyzer import AnalyzerEngine
+            analyzer = AnalyzerEngine()
+        self.detector = detector if detector is not None else PiiDetector()
+        self.analyzer = analyzer
+
+    def run(self, questions:list[str], repeat:int = 5) -> dict:
+        """
+        Measures both detectors on a list of questions.
+
+        Args:
+            questions (list[str]): Questions to analyze.
+            repeat (int): Number of times each question is analyzed by each detector.
+
+        Returns:
+            dict: Summary with the latency of each detector ("tiered" and "full"), the number of questions resolved by the
+                pattern recognizers and the questions where both detectors disagree.
+        """
+        if not questions:
+            raise ValueError("There are no questions to analyze.")
+        #Load the models before measuring
+        self.detector.contains_pii(questions[0])
+        self.analyzer.analyze(text=questions[0], entities=PiiDetector.ENTITIES, language="en")
+
+        tiered_times, full_times = [], []
+        pattern_hits, disagreements = 0, []
+        for question in questions:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                tiered = self.detector.detect(question)
+                tiered_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                full = self.analyzer.analyze(text=question, entities=PiiDetector.ENTITIES, language="en")
+                full_times.append(time.perf_counter() - start)
+
+            pattern_hits += tiered is not None and tiered != "PERSON"
+            if (tiered is not None) != (len(full) > 0):
+                disagreements.append({"question": question, "tiered": tiered, "full": sorted({result.entity_type for result in full})})
+
+        return {
+            "questions": len(questions),
+            "repeat": repeat,
+            "pattern_hits": pattern_hits,
+            "tiered": self.summarize(tiered_times),
+            "full": self.summarize(full_times),
+            "disagreements": disagreements
+        }
+
+    def load_questions(self, path:str) -> list[str]:
+        """
+        Reads a text file with one question per line, normalized like in the GUI.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            list[str]: The questions. Empty lines are ignored.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.lower().strip() for line in f if line.strip()]
+
+    def summarize(self, times:list[float]) -> dict:
+        """
+        Calculates the latency percentiles of a detector.
+
+        Args:
+            times (list[float]): Duration of each analysis in seconds.
+
+        Returns:
+            dict: Mean, p50 and p95 latency in milliseconds.
+        """
+        return {
+            "mean_ms": float(np.mean(times)) * 1000,
+            "p50_ms": float(np.percentile(times, 50)) * 1000,
+            "p95_ms": float(np.percentile(times, 95)) * 1000
+        }
+
+    def print_summary(self, summary:dict) -> None:
+        """
+        Prints the summary of a run.
+
+        Args:
+            summary (dict): Summary returned by run().
+        """
+        print(f"Questions: {summary['questions']} x {summary['repeat']}  Resolved by the pattern recognizers: {summary['pattern_hits']}")
+        for name in ("tiered", "full"):
+            latency = summary[name]
+            print(f"{name:>6}: mean {latency['mean_ms']:.3f}ms  p50 {latency['p50_ms']:.3f}ms  p95 {latency['p95_ms']:.3f}ms")
+        print(f"Speedup (mean): {summary['full']['mean_ms'] / max(summary['tiered']['mean_ms'], 1e-9):.1f}x")
+        print(f"Disagreements: {len(summary['disagreements'])}")
+        for disagreement in summary["disagreements"]:
+            print(f"  {disagreement['question']!r}: tiered={disagreement['tiered']} full={disagreement['full']}")
@@ -0,0 +1,13 @@
+import pytest
+import app.logs.logger
+import logs.logger
+
+@pytest.fixture(autouse=True)
+def temporary_logs(tmp_path, monkeypatch):
+    """
+    Writes the data and error logs of each test to a temporary directory, so the tests do not append to app/logs.
+    The logger module is patched under both of its import paths (app.logs and logs).
+    """
+    for logger in (app.logs.logger.Logger, logs.logger.Logger):
+        monkeypatch.setattr(logger, "DATA_LOG", str(tmp_path / "data.jsonl"))
+        monkeypatch.setattr(logger, "ERROR_LOG", str(tmp_path / "errors.jsonl"))
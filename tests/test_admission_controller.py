@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import pytest
+from logic.admission_controller import AdmissionController, AdmissionRejected
+
+@pytest.mark.asyncio
+async def test_admit_queues_over_limit_in_arrival_order():
+    """
+    Test that questions over the in-flight limit wait and get the released slots in arrival order.
+
+    Verifies:
+        - Questions under the limit are admitted without waiting.
+        - Waiting questions run in arrival order as slots are released, never more than the limit at the same time.
+        - The wait and the maximum queue depth are reported.
+    """
+    controller = AdmissionController(max_in_flight=2, max_queue=5, queue_timeout=5)
+    order, running, peak = [], 0, 0
+
+    async def question(name):
+        nonlocal running, peak
+        async with controller.admit() as wait:
+            running += 1
+            peak = max(peak, running)
+            order.append(name)
+            await asyncio.sleep(0.05)
+            running -= 1
+            return wait
+
+    waits = await asyncio.gather(*(question(i) for i in range(5)))
+
+    assert order == [0, 1, 2, 3, 4]
+    assert peak == 2
+    assert waits[0] == 0 and waits[4] >= 0.09
+    stats = controller.get_stats()
+    assert stats["admitted"] == 5 and stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert stats["max_queue_depth"] == 3
+    assert stats["max_wait_sec"] >= 0.09
+
+@pytest.mark.asyncio
+async def test_admit_rejects_when_queue_is_full_or_wait_times_out():
+    """
+    Test that questions are rejected when the queue is full, or when their wait reaches the deadline.
+
+    Verifies:
+        - A question that finds the queue full is rejected at once with "queue_full".
+        - A waiting question is rejected with "timeout" and leaves the queue.
+        - The slot is free again once the running question finishes.
+    """
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    await controller.acquire()
+
+    waiting = asyncio.create_task(controller.acquire(timeout=0.1))
+    await asyncio.sleep(0.01)
+    with pytest.raises(AdmissionRejected) as full:
+        await controller.acquire()
+    assert full.value.reason == "queue_full"
+
+    with pytest.raises(AdmissionRejected) as timeout:
+        await waiting
+    assert timeout.value.reason == "timeout"
+    assert controller.get_stats()["queue_depth"] == 0
+
+    controller.release()
+    assert await controller.acquire(timeout=0) == 0.0
+    stats = controller.get_stats()
+    assert stats["rejected_queue_full"] == 1 and stats["rejected_timeout"] == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_keep_a_slot():
+    """
+    Test that a waiting question that is cancelled leaves the queue and does not take the released slot.
+
+    Verifies:
+        - After the cancellation, the released slot goes to the next question.
+    """
+    controller = AdmissionController(max_in_flight=1, max_queue=2, queue_timeout=5)
+    await controller.acquire()
+    cancelled = asyncio.create_task(controller.acquire())
+    waiting = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0.01)
+
+    cancelled.cancel()
+    await asyncio.sleep(0.01)
+    controller.release()
+
+    assert await asyncio.wait_for(waiting, 1) >= 0
+    assert controller.get_stats()["in_flight"] == 1
+
+@pytest.mark.asyncio
+async def test_slots_are_handed_to_questions_in_other_event_loops():
+    """
+    Test that a slot released in one event loop wakes up a question waiting in another one, like the questions of the GUI.
+
+    Verifies:
+        - The question of the other loop is admitted after the release.
+    """
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    await controller.acquire()
+    result = {}
+
+    def other_loop():
+        result["wait"] = asyncio.run(controller.acquire())
+
+    thread = threading.Thread(target=other_loop)
+    thread.start()
+    while controller.get_stats()["queue_depth"] == 0:
+        await asyncio.sleep(0.01)
+    controller.release()
+    await asyncio.to_thread(thread.join, 2)
+
+    assert result["wait"] > 0
+    assert controller.get_stats()["in_flight"] == 1
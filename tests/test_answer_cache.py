@@ -0,0 +1,70 @@
+from app.data.answer_cache import AnswerCache
+
+#-------get / set------
+def test_set_and_get_normalized_question(tmp_path):
+    """
+    Test that a question is found with different case and whitespace.
+
+    Verifies:
+        - The stored answer is returned for the normalized question.
+        - The hit is counted in the hit rate.
+    """
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=60, max_bytes=10000)
+    cache.set("What problems  do developers face", "They face latency issues.", 5.0)
+
+    entry = cache.get("what problems do developers face ")
+
+    assert entry["answer"] == "They face latency issues."
+    assert entry["negative"] is False
+    assert entry["duration_sec"] == 5.0
+    assert cache.get("What problems do testers face") is None
+    assert cache.hit_rate() == 0.5
+
+def test_answers_are_keyed_by_graph(tmp_path):
+    """
+    Test that an answer is only returned for the graph it came from.
+
+    Verifies:
+        - The answer is found with the same graph fingerprint.
+        - It is not found after the graph changes.
+    """
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=60, max_bytes=10000)
+    cache.set("What problems do developers face", "No available information.", 5.0, negative=True, graph=(10, 20))
+
+    assert cache.get("what problems do developers face", (10, 20))["negative"] is True
+    assert cache.get("what problems do developers face", (11, 20)) is None
+    assert cache.get("what problems do developers face") is None
+
+def test_negative_results_use_their_ttl(tmp_path):
+    """
+    Test that negative results expire with their own time to live.
+
+    Verifies:
+        - An expired negative result is not returned while an answer with a longer TTL is.
+    """
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=-1, max_bytes=10000)
+    cache.set("Who won the match", "Your question is not valid.", 1.0, negative=True)
+    cache.set("What problems do developers face", "They face latency issues.", 5.0)
+
+    assert cache.get("Who won the match") is None
+    assert cache.get("What problems do developers face") is not None
+
+def test_cache_is_shared_and_bounded_by_size(tmp_path):
+    """
+    Test that caches using the same file share their answers and respect the size limit.
+
+    Verifies:
+        - An answer stored by one instance is read by another one, like another process.
+        - The least recently used answers are evicted when the size limit is exceeded.
+    """
+    path = str(tmp_path / "answers.db")
+    writer = AnswerCache(path, ttl=60, negative_ttl=60, max_bytes=300)
+    reader = AnswerCache(path, ttl=60, negative_ttl=60, max_bytes=300)
+
+    writer.set("first question", "a" * 100, 1.0)
+    assert reader.get("first question")["answer"] == "a" * 100
+
+    writer.set("second question", "b" * 100, 1.0)
+    writer.set("third question", "c" * 100, 1.0)
+    assert reader.get("first question") is None
+    assert writer.store.total_bytes() <= 300
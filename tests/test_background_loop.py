@@ -0,0 +1,36 @@
+import asyncio
+import threading
+import pytest
+from presentation.background_loop import BackgroundLoop
+
+def test_questions_run_in_one_long_lived_loop(mocker):
+    """
+    Test that the coroutines submitted from several threads run in the same event loop, in its own thread.
+
+    Verifies:
+        - get_shared() returns the same instance every time.
+        - The coroutines run from two threads get the same loop, which is not closed after them.
+        - The coroutines run in the thread of the loop and their errors are raised to the caller.
+    """
+    mocker.patch.object(BackgroundLoop, "shared", None)
+    background_loop = BackgroundLoop.get_shared()
+    assert BackgroundLoop.get_shared() is background_loop
+
+    async def current():
+        return asyncio.get_running_loop(), threading.current_thread().name
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(background_loop.run(current()))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[0] == results[1] == (background_loop.loop, "background-loop")
+    assert not background_loop.loop.is_closed()
+
+    async def fail():
+        raise ValueError("Failed")
+    with pytest.raises(ValueError):
+        background_loop.run(fail())
+    background_loop.loop.call_soon_threadsafe(background_loop.loop.stop)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import pytest
+from app.presentation.batch_runner import BatchRunner
+
+def build_runner(mocker, answer_question, concurrency=2):
+    orchestrator = mocker.Mock()
+    orchestrator.answer_question = mocker.AsyncMock(side_effect=answer_question)
+    orchestrator.warm_up = mocker.AsyncMock(return_value=0.1)
+    return BatchRunner(orchestrator, concurrency=concurrency)
+
+async def fake_answer(question):
+    return {"answer": f"answer to {question}", "cost": 0.01, "duration_sec": 1.0, "stage_timings": {"cypher_generation": 0.5}}
+
+#------load_questions-------
+def test_load_questions_jsonl_and_csv(tmp_path):
+    """
+    Test that questions are read from JSONL and CSV files.
+
+    Verifies:
+        - Questions are normalized like in the GUI and empty ones are ignored.
+        - The id field is used if present, otherwise the row number.
+        - Other extensions are rejected.
+    """
+    jsonl = tmp_path / "questions.jsonl"
+    jsonl.write_text('{"id": "q1", "question": " What problems do developers face? "}\n\n{"question": ""}\n{"question": "What goals exist?"}\n')
+    csv_file = tmp_path / "questions.csv"
+    csv_file.write_text("id,question\na,What goals exist?\n")
+    runner = BatchRunner(object(), concurrency=1)
+
+    assert runner.load_questions(str(jsonl)) == [
+        {"id": "q1", "question": "what problems do developers face?"},
+        {"id": 3, "question": "what goals exist?"}
+    ]
+    assert runner.load_questions(str(csv_file)) == [{"id": "a", "question": "what goals exist?"}]
+    with pytest.raises(ValueError):
+        runner.load_questions(str(tmp_path / "questions.txt"))
+
+#------run-------
+@pytest.mark.asyncio
+async def test_run_deduplicates_and_writes_answers(mocker, tmp_path):
+    """
+    Test that duplicated questions are answered once and every answer is written with its cost and timings.
+
+    Verifies:
+        - Each unique question is answered once, with the ids of all its rows.
+        - The output records have the answer, cost and stage timings.
+        - The summary counts the duplicates and has the throughput and latency percentiles.
+    """
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text("\n".join(json.dumps({"id": i, "question": q}) for i, q in enumerate(["What goals exist?", "what goals exist?", "What problems exist?"])))
+    output_path = tmp_path / "answers.jsonl"
+    runner = build_runner(mocker, fake_answer)
+
+    summary = await runner.run(str(input_path), str(output_path))
+
+    assert runner.orchestrator.answer_question.await_count == 2
+    records = {r["question"]: r for r in map(json.loads, output_path.read_text().splitlines())}
+    assert records["what goals exist?"]["ids"] == [0, 1]
+    assert records["what problems exist?"]["stage_timings"] == {"cypher_generation": 0.5}
+    assert summary["answered"] == 2
+    assert summary["duplicates"] == 1
+    assert summary["latency_p50_sec"] == 1.0
+    assert summary["total_cost"] == pytest.approx(0.02)
+    assert summary["throughput_qps"] > 0
+
+@pytest.mark.asyncio
+async def test_run_resumes_from_checkpoint(mocker, tmp_path):
+    """
+    Test that a second run only answers the questions that were not answered or failed.
+
+    Verifies:
+        - Questions answered in the output file are skipped.
+        - Failed questions are stored with their error and tried again on the next run.
+    """
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text('{"question": "What goals exist?"}\n{"question": "What problems exist?"}\n')
+    output_path = tmp_path / "answers.jsonl"
+
+    async def failing_answer(question):
+        if question == "what problems exist?":
+            raise ValueError("Database unavailable")
+        return await fake_answer(question)
+
+    first = await build_runner(mocker, failing_answer).run(str(input_path), str(output_path))
+    runner = build_runner(mocker, fake_answer)
+    second = await runner.run(str(input_path), str(output_path))
+
+    assert first["answered"] == 1 and first["failed"] == 1
+    runner.orchestrator.answer_question.assert_awaited_once_with("what problems exist?")
+    assert second["skipped"] == 1 and second["answered"] == 1
+    lines = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert lines[1]["error"] == "Database unavailable"
+
+@pytest.mark.asyncio
+async def test_run_retries_questions_rejected_by_admission_control(mocker, tmp_path):
+    """
+    Test that questions rejected by the admission controller are stored as failed, so they are tried again.
+
+    Verifies:
+        - The rejection reason is stored as the error and the question is counted as failed.
+    """
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text('{"question": "What goals exist?"}\n')
+    output_path = tmp_path / "answers.jsonl"
+
+    async def rejected_answer(question):
+        return {"answer": "The service is busy, try again in a moment.", "cost": None, "duration_sec": 0.0, "stage_timings": {}, "rejected": "queue_full"}
+
+    summary = await build_runner(mocker, rejected_answer).run(str(input_path), str(output_path))
+
+    assert summary["failed"] == 1
+    assert json.loads(output_path.read_text().splitlines()[0])["error"] == "Not admitted: queue_full"
+
+@pytest.mark.asyncio
+async def test_run_bounds_concurrency(mocker, tmp_path):
+    """
+    Test that no more than the configured number of questions are answered at the same time.
+
+    Verifies:
+        - The maximum number of concurrent pipelines is the concurrency.
+    """
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text("\n".join(json.dumps({"question": f"question {i}"}) for i in range(6)))
+    running = {"now": 0, "max": 0}
+
+    async def slow_answer(question):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        return await fake_answer(question)
+
+    await build_runner(mocker, slow_answer, concurrency=2).run(str(input_path), str(tmp_path / "answers.jsonl"))
+
+    assert running["max"] == 2
+
+@pytest.mark.asyncio
+async def test_run_stops_on_runtime_error(mocker, tmp_path):
+    """
+    Test that a RuntimeError (e.g. an invalid API key) stops the run instead of being stored as a failed question.
+
+    Verifies:
+        - The RuntimeError is raised.
+    """
+    input_path = tmp_path / "questions.jsonl"
+    input_path.write_text('{"question": "What goals exist?"}\n')
+
+    async def no_key(question):
+        raise RuntimeError("The API key is invalid or it was not configured.")
+
+    with pytest.raises(RuntimeError):
+        await build_runner(mocker, no_key).run(str(input_path), str(tmp_path / "answers.jsonl"))
@@ -0,0 +1,114 @@
+from app.logic.context_packer import ContextPacker
+
+class FakeEncoding:
+    """
+    Encoding that counts one token per word, to keep the tests independent of tiktoken files.
+    """
+    def encode(self, text):
+        return text.split()
+
+def build_context():
+    return {
+        "entities": {
+            "problems": {
+                "Data Loss": {"description": "Loss of critical information.", "labels": ["problem"], "hypernym": "problem hyper"},
+                "Slow Builds": {"description": "Builds take too long.", "labels": ["problem"], "hypernym": "problem hyper"}
+            },
+            "goals": {
+                "Data Integrity": {"description": "Ensure no data is lost.", "labels": ["goal"], "hypernym": "goal hyper"}
+            }
+        },
+        "relationships": [
+            {"from": "Data Loss", "to": "Data Integrity", "type": "informs"}
+        ],
+        "others": {"problemsCount": 2}
+    }
+
+#-------pack------
+def test_pack_fits_budget_without_encoding(mocker):
+    """
+    Test that a context under the budget is returned unchanged.
+
+    Verifies:
+        - The context is not modified.
+        - The encoding is not used.
+        - Nothing is dropped.
+    """
+    encoding = mocker.Mock()
+    context = build_context()
+
+    packed, stats = ContextPacker(token_budget=100000).pack(context, encoding)
+
+    encoding.encode.assert_not_called()
+    assert packed == context
+    assert stats["dropped_items"] == 0
+    assert stats["dropped_tokens"] == 0
+
+def test_pack_keeps_best_ranked_items():
+    """
+    Test that a context over the budget keeps the best ranked items.
+
+    Verifies:
+        - Others entries are kept first.
+        - The entity with the highest similarity is kept over the rest.
+        - Dropped items and tokens are reported.
+        - The kept tokens are within the budget.
+    """
+    packer = ContextPacker(token_budget=12)
+    context = build_context()
+
+    packed, stats = packer.pack(context, FakeEncoding(), node_scores={"Slow Builds": 0.9})
+
+    assert packed["others"] == {"problemsCount": 2}
+    assert "Slow Builds" in packed["entities"]["problems"]
+    assert "Data Loss" not in packed["entities"]["problems"]
+    assert packed["entities"]["goals"] == {}
+    assert stats["dropped_items"] == 3
+    assert stats["dropped_tokens"] > 0
+    assert stats["kept_tokens"] <= 12
+
+def test_pack_uses_token_budget_of_the_call():
+    """
+    Test that the token budget of a call replaces the one of the packer.
+
+    Verifies:
+        - A context that fits the packer budget is reduced to the smaller budget of the call.
+        - The statistics report the budget of the call.
+    """
+    packer = ContextPacker(token_budget=100000)
+
+    packed, stats = packer.pack(build_context(), FakeEncoding(), node_scores={"Slow Builds": 0.9}, token_budget=12)
+
+    assert "Data Loss" not in packed["entities"]["problems"]
+    assert stats["token_budget"] == 12
+    assert stats["kept_tokens"] <= 12
+
+#-------rank_items------
+def test_rank_items_uses_degree_and_similarity():
+    """
+    Test that entities are ranked by similarity and degree, and relationships by their entities.
+
+    Verifies:
+        - Connected entities score higher than isolated ones with the same similarity.
+        - Relationships get the average score of their entities.
+    """
+    packer = ContextPacker()
+    items = packer.rank_items(build_context(), {})
+    scores = {item["key"]: item["score"] for item in items}
+
+    assert scores[("entity", "problems", "Data Loss")] > scores[("entity", "problems", "Slow Builds")]
+    assert scores[("relationship", 0)] == (scores[("entity", "problems", "Data Loss")] + scores[("entity", "goals", "Data Integrity")]) / 2
+
+#-------format------
+def test_format_lines():
+    """
+    Test the prompt line format of each type of item.
+
+    Verifies:
+        - Entities, relationships and others are formatted as in the final answer prompt.
+    """
+    packer = ContextPacker()
+
+    assert packer.format_entity("X", {"description": "d", "labels": ["problem"], "hypernym": "h", "alternativeName": "Y"}) == "-**X(Y;h)**: d [problem]"
+    assert packer.format_relationship({"from": "A", "to": "B", "type": "informs"}) == "- A --[informs]--> B"
+    assert packer.format_other("count", 3) == "-count: 3"
@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from app.llm.embedding_batcher import EmbeddingBatcher
+
+def build_embed_chunk(calls):
+    async def embed_chunk(chunk, model, task_name, log_extra=None):
+        calls.append(chunk)
+        return {text: [float(len(text))] for text in chunk}, {text: 0.1 for text in chunk}
+    return embed_chunk
+
+#-------submit------
+@pytest.mark.asyncio
+async def test_submit_coalesces_concurrent_calls():
+    """
+    Test that concurrent calls within the window are sent in one request.
+
+    Verifies:
+        - Only one request is sent, with the unique texts.
+        - Each caller gets the vector of its text.
+        - The cost of a repeated text is split between its callers.
+    """
+    calls = []
+    batcher = EmbeddingBatcher(build_embed_chunk(calls), window_ms=20, max_size=10)
+
+    results = await asyncio.gather(
+        batcher.submit("model", "a"),
+        batcher.submit("model", "bb"),
+        batcher.submit("model", "a")
+    )
+
+    assert calls == [["a", "bb"]]
+    assert [embedding for embedding, _ in results] == [[1.0], [2.0], [1.0]]
+    assert [cost for _, cost in results] == pytest.approx([0.05, 0.1, 0.05])
+
+@pytest.mark.asyncio
+async def test_submit_charges_callers_still_waiting():
+    """
+    Test that a caller cancelled before its batch is sent is not charged, so the cost of its text is not lost.
+
+    Verifies:
+        - The caller still waiting for a repeated text gets its whole cost.
+    """
+    batcher = EmbeddingBatcher(build_embed_chunk([]), window_ms=20, max_size=10)
+
+    first = asyncio.create_task(batcher.submit("model", "a"))
+    second = asyncio.create_task(batcher.submit("model", "a"))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == ([1.0], 0.1)
+
+@pytest.mark.asyncio
+async def test_submit_sends_full_batch_without_waiting():
+    """
+    Test that a batch that reaches the size cap is sent immediately.
+
+    Verifies:
+        - Texts over the cap go to a new request.
+    """
+    calls = []
+    batcher = EmbeddingBatcher(build_embed_chunk(calls), window_ms=10000, max_size=2)
+
+    first = asyncio.gather(batcher.submit("model", "a"), batcher.submit("model", "b"))
+    await asyncio.wait_for(first, timeout=1)
+
+    assert calls == [["a", "b"]]
+
+@pytest.mark.asyncio
+async def test_submit_propagates_errors():
+    """
+    Test that a failed request raises the error in every caller.
+
+    Verifies:
+        - All callers get the exception.
+    """
+    async def failing_embed_chunk(chunk, model, task_name, log_extra=None):
+        raise RuntimeError("The API key is invalid or it was not configured.")
+    batcher = EmbeddingBatcher(failing_embed_chunk, window_ms=5, max_size=10)
+
+    results = await asyncio.gather(batcher.submit("model", "a"), batcher.submit("model", "b"), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_send_cancels_its_callers():
+    """
+    Test that the callers of a batch whose send is cancelled do not wait forever.
+
+    Verifies:
+        - Every caller of the cancelled batch gets a CancelledError.
+    """
+    started = asyncio.Event()
+    async def stalled_embed_chunk(chunk, model, task_name, log_extra=None):
+        started.set()
+        await asyncio.sleep(30)
+    batcher = EmbeddingBatcher(stalled_embed_chunk, window_ms=5, max_size=10)
+
+    callers = asyncio.gather(batcher.submit("model", "a"), batcher.submit("model", "b"), return_exceptions=True)
+    await asyncio.wait_for(started.wait(), timeout=1)
+    for task in batcher.tasks:
+        task.cancel()
+    results = await asyncio.wait_for(callers, timeout=1)
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+@pytest.mark.asyncio
+async def test_submit_is_shared_by_several_event_loops():
+    """
+    Test that a batcher shared by callers in different event loops sends the batches of each loop apart.
+
+    Verifies:
+        - A batch pending in one loop is answered while another loop uses the batcher.
+        - Each loop gets its own request.
+    """
+    calls = []
+    batcher = EmbeddingBatcher(build_embed_chunk(calls), window_ms=100, max_size=10)
+
+    pending = asyncio.ensure_future(batcher.submit("model", "a"))
+    other = await asyncio.to_thread(lambda: asyncio.run(batcher.submit("model", "bb")))
+    embedding, _ = await asyncio.wait_for(pending, timeout=1)
+
+    assert other[0] == [2.0]
+    assert embedding == [1.0]
+    assert sorted(calls) == [["a"], ["bb"]]
@@ -0,0 +1,30 @@
+from app.data.embedding_cache import EmbeddingCache
+
+#-------get / set------
+def test_set_and_get_normalized_text(tmp_path):
+    """
+    Test that vectors are shared by texts that only differ in case and whitespace.
+
+    Verifies:
+        - The vector is returned for the normalized text.
+        - Values are stored as float32.
+    """
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=10000)
+    cache.set("text-embedding-3-large", "Software  Developers", [0.5, 0.25, -1.0])
+
+    assert cache.get("text-embedding-3-large", " software developers") == [0.5, 0.25, -1.0]
+    assert cache.store.total_bytes() == 3 * 4
+
+def test_get_is_keyed_by_model(tmp_path):
+    """
+    Test that vectors of different models are not mixed.
+
+    Verifies:
+        - A vector cached for one model is a miss for another.
+        - The miss is counted.
+    """
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_bytes=10000)
+    cache.set("text-embedding-3-large", "developers", [0.5])
+
+    assert cache.get("text-embedding-3-small", "developers") is None
+    assert cache.misses == 1
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import pytest
+from logic.graph_fingerprint import GraphFingerprint
+
+#------get---------
+@pytest.mark.asyncio
+async def test_get_refreshes_in_the_background():
+    """
+    Test that reading the fingerprint never waits for the database.
+
+    Verifies:
+        - A stale fingerprint is returned at once and a background refresh is started.
+        - The refresh reads the graph outside of the event loop thread.
+        - The next call returns the new fingerprint without starting another refresh.
+    """
+    threads = []
+    def fingerprint_fn():
+        threads.append(threading.current_thread())
+        return (10, 20)
+    fingerprint = GraphFingerprint(fingerprint_fn, check_sec=3600)
+
+    assert fingerprint.get() is None
+    assert fingerprint.task is not None
+    await fingerprint.task
+    await asyncio.sleep(0)
+
+    assert fingerprint.get() == (10, 20)
+    assert fingerprint.task is None
+    assert len(threads) == 1 and threads[0] is not threading.current_thread()
+
+#------refresh---------
+@pytest.mark.asyncio
+async def test_refresh_keeps_the_last_fingerprint_on_errors(mocker):
+    """
+    Test that a failed graph check is logged and does not change the fingerprint.
+
+    Verifies:
+        - The last fingerprint is kept.
+        - The error is logged.
+    """
+    fingerprints = iter([(10, 20), ConnectionError("Neo4j is down")])
+    def fingerprint_fn():
+        fingerprint = next(fingerprints)
+        if isinstance(fingerprint, Exception):
+            raise fingerprint
+        return fingerprint
+    fingerprint = GraphFingerprint(fingerprint_fn)
+    fingerprint.logger.log_error = mocker.Mock()
+
+    assert await fingerprint.refresh() == (10, 20)
+    assert await fingerprint.refresh() == (10, 20)
+    fingerprint.logger.log_error.assert_called_once_with("GraphFingerprintError", {"error": "Neo4j is down"})
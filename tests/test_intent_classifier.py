@@ -0,0 +1,110 @@
+import json
+import pytest
+from logic.intent_classifier import IntentClassifier
+
+class FakeEmbeddingCache:
+    """
+    Embedding cache in memory, keyed by the lowercased text like EmbeddingCache.
+    """
+    def __init__(self, vectors=None):
+        self.vectors = {text.lower(): vector for text, vector in (vectors or {}).items()}
+
+    def get(self, model, text):
+        return self.vectors.get(text.lower())
+
+    def set(self, model, text, embedding):
+        self.vectors[text.lower()] = embedding
+
+def test_classify_matches_examples_exactly_and_by_words():
+    """
+    Test that questions are matched with the examples of the default intents without embeddings.
+
+    Verifies:
+        - A question equal to an example, ignoring case and punctuation, is an exact match with the intent's response.
+        - A question that shares most of its words with an example matches by tokens.
+        - Questions about the graph do not match.
+    """
+    classifier = IntentClassifier(path="")
+
+    match = classifier.classify("what can you answer")
+    assert match["intent"] == "capabilities" and match["match"] == "exact" and match["score"] == 1.0
+    assert match["response"] == IntentClassifier.DEFAULT_INTENTS["capabilities"]["response"]
+
+    match = classifier.classify("So what questions can you answer")
+    assert match["intent"] == "capabilities" and match["match"] == "tokens"
+
+    assert classifier.classify("What can you tell me about data loss") is None
+    assert classifier.classify("What problems do developers face") is None
+    assert classifier.classify("") is None
+
+def test_classify_matches_cached_question_embeddings():
+    """
+    Test that a question whose embedding is cached matches the most similar example embedding.
+
+    Verifies:
+        - A paraphrase without shared words matches by embedding over the threshold.
+        - A question under the threshold, or without a cached embedding, does not match.
+    """
+    cache = FakeEmbeddingCache({
+        "who are you": [1.0, 0.0, 0.0],
+        "what can you answer": [0.0, 1.0, 0.0],
+        "Tell me about yourself": [0.99, 0.1, 0.0],
+        "Explain microservices": [0.0, 0.0, 1.0]
+    })
+    classifier = IntentClassifier(path="", embedding_cache=cache)
+
+    match = classifier.classify("Tell me about yourself")
+    assert match["intent"] == "identity" and match["match"] == "embedding" and match["score"] > 0.9
+    assert classifier.classify("Explain microservices") is None
+    assert classifier.classify("Describe your architecture") is None
+
+@pytest.mark.asyncio
+async def test_embed_examples_only_embeds_missing_examples(mocker):
+    """
+    Test that the examples are embedded once, normalized, and loaded from the embedding cache.
+
+    Verifies:
+        - Only the examples that are not cached are embedded.
+        - The cost of the embeddings is returned and nothing is embedded when all of them are cached.
+    """
+    cache = FakeEmbeddingCache({"hello": [1.0, 0.0]})
+    classifier = IntentClassifier(path="", embedding_cache=cache)
+    async def get_embeddings(texts, model, task_name):
+        for text in texts:
+            cache.set(model, text, [0.0, 1.0])
+        return [[0.0, 1.0]] * len(texts), [0.001] * len(texts)
+    llm_client = mocker.Mock()
+    llm_client.get_embeddings = mocker.AsyncMock(side_effect=get_embeddings)
+
+    cost = await classifier.embed_examples(llm_client)
+
+    texts = llm_client.get_embeddings.call_args[0][0]
+    assert "hello" not in texts and "what can you answer" in texts
+    assert cost == pytest.approx(0.001 * len(texts))
+    assert classifier.matrix.shape[0] == len(classifier.examples)
+    assert await classifier.embed_examples(llm_client) == 0.0
+    llm_client.get_embeddings.assert_called_once()
+
+def test_intents_file_adds_and_replaces_intents(tmp_path):
+    """
+    Test that the intents file adds intents and replaces the fields of the default ones.
+
+    Verifies:
+        - A new intent is matched with its response.
+        - A default intent keeps its examples when only its response is replaced.
+        - An intent without response is rejected.
+    """
+    path = tmp_path / "intents.json"
+    path.write_text(json.dumps({
+        "languages": {"examples": ["Which languages do you speak?"], "response": "Only English."},
+        "greeting": {"response": "Hi there!"}
+    }))
+
+    classifier = IntentClassifier(path=str(path))
+
+    assert classifier.classify("Which languages do you speak")["response"] == "Only English."
+    assert classifier.classify("Hello")["response"] == "Hi there!"
+
+    path.write_text(json.dumps({"empty": {"examples": ["Ping"]}}))
+    with pytest.raises(ValueError):
+        IntentClassifier(path=str(path))
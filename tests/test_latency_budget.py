@@ -0,0 +1,47 @@
+import asyncio
+import time
+import pytest
+from llm.latency_budget import LatencyBudget
+
+def test_budget_counts_down_and_records_degradations():
+    """
+    Test that the budget reports the time left and records the degradations with it.
+
+    Verifies:
+        - The time left decreases from the deadline and the budget expires when it passes.
+        - Degradations are recorded in order with their details and the time left.
+    """
+    budget = LatencyBudget(0.05)
+    assert 0 < budget.remaining() <= 0.05
+    assert not budget.expired()
+
+    budget.degrade("fast_model", model="gpt-4.1-mini")
+    time.sleep(0.06)
+    budget.degrade("partial_answer")
+
+    assert budget.expired()
+    assert [d["name"] for d in budget.degradations] == ["fast_model", "partial_answer"]
+    assert budget.degradations[0]["model"] == "gpt-4.1-mini"
+    assert budget.degradations[1]["remaining_sec"] < 0
+
+@pytest.mark.asyncio
+async def test_start_budget_is_seen_by_tasks_and_caps_timeouts():
+    """
+    Test that the budget of a question is visible in the tasks it starts, caps the timeouts and is removed when it finishes.
+
+    Verifies:
+        - A task started inside the budget sees the same budget.
+        - Timeouts are reduced to the time left, and never negative.
+        - Without deadline there is no budget and timeouts are unchanged.
+    """
+    with LatencyBudget.start_budget(0.5) as budget:
+        assert await asyncio.create_task(asyncio.to_thread(LatencyBudget.get_current)) is budget
+        assert LatencyBudget.cap_timeout(30) <= 0.5
+        assert LatencyBudget.cap_timeout(0.1) == 0.1
+        budget.start -= 1
+        assert LatencyBudget.cap_timeout(30) == 0.0
+    assert LatencyBudget.get_current() is None
+
+    with LatencyBudget.start_budget(0) as budget:
+        assert budget is None
+        assert LatencyBudget.cap_timeout(30) == 30
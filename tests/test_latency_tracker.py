@@ -0,0 +1,46 @@
+import pytest
+from app.llm.latency_tracker import LatencyTracker
+
+#-------percentile------
+def test_percentile_of_recent_latencies():
+    """
+    Test the latency percentile of a task.
+
+    Verifies:
+        - The percentile is calculated from the recorded latencies of the task.
+        - Other tasks are not mixed.
+    """
+    tracker = LatencyTracker(window=100, min_samples=5)
+    for seconds in range(1, 101):
+        tracker.record("task_a", float(seconds))
+    tracker.record("task_b", 1000.0)
+
+    assert tracker.percentile("task_a", 0.95) == pytest.approx(95.05)
+    assert tracker.percentile("task_a", 0.5) == pytest.approx(50.5)
+
+def test_percentile_needs_min_samples():
+    """
+    Test that no percentile is given until there are enough latencies.
+
+    Verifies:
+        - None is returned under min_samples.
+    """
+    tracker = LatencyTracker(window=100, min_samples=3)
+    tracker.record("task", 1.0)
+    tracker.record("task", 2.0)
+
+    assert tracker.percentile("task", 0.95) is None
+    assert tracker.percentile("unknown", 0.95) is None
+
+def test_record_keeps_window():
+    """
+    Test that only the most recent latencies are used.
+
+    Verifies:
+        - The oldest latencies are discarded when the window is full.
+    """
+    tracker = LatencyTracker(window=3, min_samples=1)
+    for seconds in [100.0, 1.0, 1.0, 1.0]:
+        tracker.record("task", seconds)
+
+    assert tracker.percentile("task", 1.0) == 1.0
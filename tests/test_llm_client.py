@@ -1,6 +1,20 @@
 import pytest
+import asyncio
+import time
 import tiktoken
+import httpx
+import openai
+from types import SimpleNamespace
 from app.llm.llm_client import LlmClient
+from app.llm.rate_limiter import RateLimiter
+from app.llm.latency_tracker import LatencyTracker
+from llm.latency_budget import LatencyBudget
+from llm.llm_stream import LlmStreamError
+from llm.embedding_batcher import EmbeddingBatcher
+from data.embedding_cache import EmbeddingCache
+from llm.tracked_transport import TrackedTransport
+from app.config.config import LLM_MAX_RETRIES, LLM_RETRY_BASE_SEC, LLM_RETRY_MAX_SEC, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE
+from app.models.question import Question
 
 test_client = LlmClient()
 
@@ -19,6 +33,22 @@ def test_calculate_token_cost_llm():
     assert round(cost, 6) == round(expected_cost, 6)
 
 
+def test_calculate_token_cost_llm_with_cached_tokens():
+    """
+    Test that cached input tokens are charged at the discounted price.
+
+    Verifies:
+        - The cached tokens use cached_input_price and the rest of the input uses input_price.
+        - More cached tokens than input tokens are rejected.
+    """
+    cost = test_client.calculate_token_cost("gpt-4.1", input_tokens=1000, output_tokens=500, cached_tokens=800)
+    expected_cost = (200/1000) * 0.002 + (800/1000) * 0.0005 + (500/1000) * 0.008
+
+    assert round(cost, 6) == round(expected_cost, 6)
+    with pytest.raises(ValueError):
+        test_client.calculate_token_cost("gpt-4.1", input_tokens=100, output_tokens=10, cached_tokens=200)
+
+
 def test_calculate_token_cost_embedding():
     """
     Test cost calculation for an embedding model.
@@ -91,6 +121,135 @@ def test_truncate_prompt_exceeds_limit():
     assert token_count == 10 
     assert truncated is True
 
+def test_truncate_prompt_fast_path_skips_encoding(mocker):
+    """
+    Test that a prompt that cannot exceed the limit by its length is not encoded.
+
+    Verifies:
+        - The encoding is never requested.
+        - Prompt does not change and 'truncated' flag is False.
+    """
+    mock_encoding = mocker.patch.object(test_client, "get_encoding")
+    prompt = "a" * 100
+
+    result, truncated = test_client.truncate_prompt(prompt, "o200k_base", max_tokens=1000)
+
+    mock_encoding.assert_not_called()
+    assert result == prompt
+    assert truncated is False
+
+@pytest.mark.asyncio
+async def test_truncate_prompt_async_encodes_in_thread(mocker):
+    """
+    Test that a prompt that may exceed the limit is truncated in a worker thread.
+
+    Verifies:
+        - asyncio.to_thread is used to call truncate_prompt.
+        - The result of truncate_prompt is returned.
+    """
+    mock_to_thread = mocker.patch("app.llm.llm_client.asyncio.to_thread", new_callable=mocker.AsyncMock, return_value=("short", True))
+
+    result, truncated = await test_client.truncate_prompt_async("long text " * 10, "o200k_base", max_tokens=10)
+
+    mock_to_thread.assert_called_once_with(test_client.truncate_prompt, "long text " * 10, "o200k_base", 10)
+    assert result == "short"
+    assert truncated is True
+
+#-------get_encoding / count_static_tokens------
+def test_get_encoding_is_cached(mocker):
+    """
+    Test that encodings are loaded only once per process.
+
+    Verifies:
+        - tiktoken.get_encoding is called once for repeated requests.
+        - The same encoding object is returned.
+    """
+    mocker.patch.dict(LlmClient._encodings, clear=True)
+    mock_get = mocker.patch("app.llm.llm_client.tiktoken.get_encoding", return_value=mocker.Mock())
+
+    first = test_client.get_encoding("o200k_base")
+    second = test_client.get_encoding("o200k_base")
+
+    mock_get.assert_called_once_with("o200k_base")
+    assert first is second
+
+def test_count_static_tokens_is_cached(mocker):
+    """
+    Test that the token count of static text is calculated only once.
+
+    Verifies:
+        - The text is encoded once.
+        - The cached count is returned afterwards.
+    """
+    mocker.patch.dict(LlmClient._static_token_counts, clear=True)
+    encoding = mocker.Mock()
+    encoding.encode.return_value = [1, 2, 3]
+    mocker.patch.object(test_client, "get_encoding", return_value=encoding)
+
+    assert test_client.count_static_tokens("System prompt", "o200k_base") == 3
+    assert test_client.count_static_tokens("System prompt", "o200k_base") == 3
+    encoding.encode.assert_called_once_with("System prompt")
+
+def test_count_static_tokens_keeps_the_most_recently_used(mocker):
+    """
+    Test that the static token counts are bounded and keyed by the hash of the text.
+
+    Verifies:
+        - The cache never has more than STATIC_TOKEN_COUNTS_MAX counts.
+        - The least recently used count is evicted, and a recently read one is kept.
+        - The keys do not have the text.
+    """
+    mocker.patch.dict(LlmClient._static_token_counts, clear=True)
+    mocker.patch.object(LlmClient, "STATIC_TOKEN_COUNTS_MAX", 2)
+    encoding = mocker.Mock()
+    encoding.encode.return_value = [1, 2, 3]
+    mocker.patch.object(test_client, "get_encoding", return_value=encoding)
+
+    test_client.count_static_tokens("first prompt", "o200k_base")
+    test_client.count_static_tokens("second prompt", "o200k_base")
+    test_client.count_static_tokens("first prompt", "o200k_base")
+    test_client.count_static_tokens("third prompt", "o200k_base")
+    assert len(LlmClient._static_token_counts) == 2
+
+    encoding.encode.reset_mock()
+    test_client.count_static_tokens("first prompt", "o200k_base")
+    encoding.encode.assert_not_called()
+    test_client.count_static_tokens("second prompt", "o200k_base")
+    encoding.encode.assert_called_once_with("second prompt")
+    assert all("prompt" not in str(key) for key in LlmClient._static_token_counts)
+
+def test_estimate_tokens_does_not_encode_user_prompt(mocker):
+    """
+    Test that the reservation of a call is estimated from the length of the user prompt.
+
+    Verifies:
+        - The user prompt is not encoded, only the system prompt is counted.
+        - The estimate is the system prompt tokens plus one token per four characters, rounded up.
+        - Nothing is estimated without a tokens per minute limit.
+    """
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=30000))
+    mock_count = mocker.patch.object(test_client, "count_static_tokens", return_value=50)
+    mock_encoding = mocker.patch.object(test_client, "get_encoding")
+
+    assert test_client.estimate_tokens("gpt-4.1", "System prompt", "x" * 401) == 151
+    mock_count.assert_called_once_with("System prompt", "o200k_base")
+    mock_encoding.assert_not_called()
+
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    assert test_client.estimate_tokens("gpt-4.1", "System prompt", "x" * 401) == 0
+
+def test_get_max_input_tokens_subtracts_system_prompt(mocker):
+    """
+    Test that the system prompt tokens are reserved from the model's input limit.
+
+    Verifies:
+        - Max input tokens are max_context - max_output - system prompt tokens.
+    """
+    mocker.patch.object(test_client, "count_static_tokens", return_value=50)
+    info = test_client.MODEL_INFO["gpt-4.1"]
+
+    assert test_client.get_max_input_tokens("gpt-4.1", "System prompt") == info["max_context"] - info["max_output"] - 50
+
 #-----call_llm------
 @pytest.mark.asyncio
 async def test_call_llm_raises_value_errors(): 
@@ -109,6 +268,157 @@ async def test_call_llm_raises_value_errors():
     with pytest.raises(ValueError):
         await test_client.call_llm(prompt, system_prompt, temperature=3.0)
 
+#-----call_llm_stream------
+async def fake_events():
+    yield SimpleNamespace(type="response.created")
+    yield SimpleNamespace(type="response.output_text.delta", delta="Hello")
+    yield SimpleNamespace(type="response.output_text.delta", delta=" world")
+    yield SimpleNamespace(type="response.completed", response=SimpleNamespace(usage=SimpleNamespace(input_tokens=1000, output_tokens=500)))
+
+@pytest.mark.asyncio
+async def test_call_llm_stream_yields_deltas_and_logs(mocker):
+    """
+    Test that a streamed call yields the text deltas and logs the call when completed.
+
+    Verifies:
+        - Text deltas are yielded in order.
+        - The text and cost are available after consuming the stream.
+        - The log entry includes time to first token and total duration.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=fake_events())
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    stream = await test_client.call_llm_stream("Hello", "Greetings", task_name="test_stream")
+    deltas = [delta async for delta in stream]
+
+    assert deltas == ["Hello", " world"]
+    assert stream.text == "Hello world"
+    assert round(stream.cost, 6) == round(test_client.calculate_token_cost("gpt-4.1", 1000, 500), 6)
+    log = mock_log.call_args[0][0]
+    assert log["response"] == "Hello world"
+    assert log["time_to_first_token_sec"] is not None
+    assert log["log_duration_sec"] >= log["time_to_first_token_sec"]
+
+async def stalled_events(first_events):
+    for event in first_events:
+        yield event
+    await asyncio.sleep(30) #The connection stalls
+    yield SimpleNamespace(type="response.completed")
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("first_events, timeouts", [
+    ([], {"first_event": 0.2, "task": 5, "budget": 5}),
+    ([SimpleNamespace(type="response.output_text.delta", delta="Hello")], {"first_event": 5, "task": 0.2, "budget": 5}),
+    ([SimpleNamespace(type="response.output_text.delta", delta="Hello")], {"first_event": 5, "task": 5, "budget": 0.2}),
+])
+async def test_call_llm_stream_times_out_when_stalled(mocker, first_events, timeouts):
+    """
+    Test that a stream that stops sending events is closed when its first event, task or question deadline passes.
+
+    Verifies:
+        - A stream without a first event raises a TimeoutError after the first event timeout.
+        - A stream that stalls after its first delta raises a TimeoutError after the task deadline or the latency budget.
+        - The stream does not wait for the stalled event.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client, "latency_tracker", LatencyTracker(window=10, min_samples=5))
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=stalled_events(first_events))
+    mocker.patch("app.llm.llm_client.LLM_STREAM_FIRST_EVENT_TIMEOUT_SEC", timeouts["first_event"])
+    mocker.patch.dict("app.llm.llm_client.LLM_TIMEOUT_SEC", {"test_stream": timeouts["task"]})
+
+    start = time.monotonic()
+    deltas = []
+    with LatencyBudget.start_budget(timeouts["budget"]):
+        stream = await test_client.call_llm_stream("Hello", "Greetings", task_name="test_stream")
+        with pytest.raises(TimeoutError):
+            async for delta in stream:
+                deltas.append(delta)
+
+    assert deltas == [event.delta for event in first_events]
+    assert time.monotonic() - start < 2
+    assert not stream.completed
+
+@pytest.mark.asyncio
+async def test_call_llm_stream_raises_value_errors(): 
+    """
+    Test that the expected errors are raised.
+
+    Verifies:
+        - Unknown model raises ValueError
+        - Temperature above 2 raises ValueError
+    """
+    with pytest.raises(ValueError):
+        await test_client.call_llm_stream("Hello", "Greetings", "unknown model")
+    with pytest.raises(ValueError):
+        await test_client.call_llm_stream("Hello", "Greetings", temperature=3.0)
+
+def closing_events(events, closed):
+    async def generate():
+        try:
+            for event in events:
+                yield event
+        finally:
+            closed.append(True)
+    return generate()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("last_event", [
+    SimpleNamespace(type="response.failed", response=SimpleNamespace(error=SimpleNamespace(message="server_error"), incomplete_details=None)),
+    SimpleNamespace(type="response.incomplete", response=SimpleNamespace(error=None, incomplete_details=SimpleNamespace(reason="max_output_tokens"))),
+    SimpleNamespace(type="error", message="rate_limit_exceeded"),
+    None
+])
+async def test_call_llm_stream_raises_when_not_completed(mocker, last_event):
+    """
+    Test that a stream that fails or ends before the response is completed raises instead of ending normally.
+
+    Verifies:
+        - Failed, incomplete and error events raise an LlmStreamError with their reason.
+        - A stream that ends without a completed event raises an LlmStreamError.
+        - The call is not logged and the stream is closed.
+    """
+    closed = []
+    events = [SimpleNamespace(type="response.output_text.delta", delta="Hello")] + ([last_event] if last_event is not None else [])
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=closing_events(events, closed))
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    stream = await test_client.call_llm_stream("Hello", "Greetings", task_name="test_stream")
+    with pytest.raises(LlmStreamError) as error:
+        async for delta in stream:
+            pass
+
+    if last_event is not None:
+        assert error.value.event_type == last_event.type
+        assert stream.get_error_message(last_event) in str(error.value)
+    assert not stream.completed
+    mock_log.assert_not_called()
+    assert closed == [True]
+
+@pytest.mark.asyncio
+async def test_call_llm_stream_closes_when_consumer_stops(mocker):
+    """
+    Test that a stream whose consumer stops reading before it is completed is closed.
+
+    Verifies:
+        - Closing the iterator closes the response stream.
+        - The call is not logged.
+    """
+    closed = []
+    events = [SimpleNamespace(type="response.output_text.delta", delta="Hello"), SimpleNamespace(type="response.output_text.delta", delta=" world")]
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=closing_events(events, closed))
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    stream = await test_client.call_llm_stream("Hello", "Greetings", task_name="test_stream")
+    deltas = aiter(stream)
+    assert await anext(deltas) == "Hello"
+    await deltas.aclose()
+
+    assert closed == [True]
+    mock_log.assert_not_called()
+
 #-----call_llm_structured------
 @pytest.mark.asyncio
 async def test_call_llm_structured_raises_value_errors(): 
@@ -130,6 +440,51 @@ async def test_call_llm_structured_raises_value_errors():
     with pytest.raises(ValueError):
         await test_client.call_llm_structured(prompt, system_prompt, text_format="unknown")
 
+@pytest.mark.asyncio
+async def test_call_llm_structured_cache_hit(mocker):
+    """
+    Test that the cached response of an identical structured call is returned without calling the API.
+
+    Verifies:
+        - The API is not called.
+        - The response is parsed into the response format.
+        - The cost is 0 and the log entry is marked as a cache hit.
+    """
+    mocker.patch.object(test_client, "response_cache", mocker.Mock())
+    test_client.response_cache.get.return_value = '{"value": "What problems are there?", "is_valid": true, "reasoning": null}'
+    mock_parse = mocker.patch.object(test_client.client.responses, "parse", new_callable=mocker.AsyncMock)
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    response, cost = await test_client.call_llm_structured("What problems are there?", "Greetings", text_format="question")
+
+    mock_parse.assert_not_called()
+    assert response.model_dump() == Question(value="What problems are there?", is_valid=True, reasoning=None).model_dump()
+    assert cost == 0.0
+    assert mock_log.call_args[0][0]["cache_hit"] is True
+
+@pytest.mark.asyncio
+async def test_call_llm_structured_cache_miss_stores_response(mocker):
+    """
+    Test that the response of a structured call that is not cached is stored.
+
+    Verifies:
+        - The API is called.
+        - The response JSON is stored with the call parameters.
+    """
+    mocker.patch.object(test_client, "response_cache", mocker.Mock())
+    test_client.response_cache.get.return_value = None
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    parsed = Question(value="Q", is_valid=True, reasoning=None)
+    response = SimpleNamespace(usage=SimpleNamespace(input_tokens=10, output_tokens=5), output_parsed=parsed)
+    mocker.patch.object(test_client.client.responses, "parse", new_callable=mocker.AsyncMock, return_value=response)
+    mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    result, cost = await test_client.call_llm_structured("Q", "Greetings", text_format="question")
+
+    test_client.response_cache.set.assert_called_once_with("gpt-4.1", "Greetings", "Q", 0.7, "question", parsed.model_dump_json())
+    assert result == parsed
+    assert cost > 0
+
 #-----get_embedding------
 @pytest.mark.asyncio
 async def test_get_embedding_raises_value_errors():
@@ -142,4 +497,549 @@ async def test_get_embedding_raises_value_errors():
     prompt="Text"
 
     with pytest.raises(ValueError):
-        await test_client.get_embedding(prompt, model="unknown")
\ No newline at end of file
+        await test_client.get_embedding(prompt, model="unknown")
+
+@pytest.mark.asyncio
+async def test_get_embedding_cache_hit(mocker):
+    """
+    Test that a cached embedding is returned without calling the API.
+
+    Verifies:
+        - The API is not called.
+        - The cost is 0.
+        - The log entry is marked as a cache hit.
+    """
+    mocker.patch.object(test_client, "embedding_cache", mocker.Mock(hits=1, misses=0))
+    test_client.embedding_cache.get.return_value = [0.1, 0.2]
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", new_callable=mocker.AsyncMock)
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    embedding, cost = await test_client.get_embedding("developers")
+
+    mock_create.assert_not_called()
+    assert embedding == [0.1, 0.2]
+    assert cost == 0.0
+    assert mock_log.call_args[0][0]["cache_hit"] is True
+
+@pytest.mark.asyncio
+async def test_get_embedding_cache_miss_stores_vector(mocker):
+    """
+    Test that an embedding that is not cached is requested and stored.
+
+    Verifies:
+        - The API is called.
+        - The vector is stored in the cache.
+        - The log entry is marked as a cache miss.
+    """
+    mocker.patch.object(test_client, "embedding_cache", mocker.Mock(hits=0, misses=1))
+    test_client.embedding_cache.get.return_value = None
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=2), data=[SimpleNamespace(index=0, embedding=[0.3, 0.4])])
+    mocker.patch.object(test_client.client.embeddings, "create", new_callable=mocker.AsyncMock, return_value=response)
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    embedding, cost = await test_client.get_embedding("developers")
+
+    test_client.embedding_cache.set.assert_called_once_with("text-embedding-3-large", "developers", [0.3, 0.4])
+    assert embedding == [0.3, 0.4]
+    assert cost > 0
+    assert mock_log.call_args[0][0]["cache_hit"] is False
+
+#-----get_embeddings------
+@pytest.mark.asyncio
+async def test_get_embeddings_batches_and_deduplicates(mocker):
+    """
+    Test that several texts are embedded with a single request without duplicates.
+
+    Verifies:
+        - One request is sent with the unique texts.
+        - Vectors are mapped back to the input order by index.
+        - The cost is split between the inputs and repeated texts cost 0.
+    """
+    mocker.patch.object(test_client, "embedding_cache", None)
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=1000), data=[
+        SimpleNamespace(index=1, embedding=[0.2]),
+        SimpleNamespace(index=0, embedding=[0.1])
+    ])
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", new_callable=mocker.AsyncMock, return_value=response)
+    mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    embeddings, costs = await test_client.get_embeddings(["developers", "architecture", "developers"])
+
+    mock_create.assert_called_once_with(model="text-embedding-3-large", input=["developers", "architecture"])
+    assert embeddings == [[0.1], [0.2], [0.1]]
+    assert round(sum(costs), 8) == round(test_client.calculate_token_cost("text-embedding-3-large", total_tokens=1000), 8)
+    assert costs[2] == 0.0
+
+@pytest.mark.asyncio
+async def test_get_embeddings_deduplicates_on_cache_key(mocker, tmp_path):
+    """
+    Test that texts that only differ in case or whitespace are embedded once, since they share an embedding cache entry.
+
+    Verifies:
+        - One input is sent for texts with the same cache key.
+        - Every text gets the vector and only the first one is charged.
+    """
+    mocker.patch.object(test_client, "embedding_cache", EmbeddingCache(path=str(tmp_path / "embeddings.db")))
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=10), data=[SimpleNamespace(index=0, embedding=[0.5])])
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", new_callable=mocker.AsyncMock, return_value=response)
+    mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    embeddings, costs = await test_client.get_embeddings(["Developers", "developers ", "Developers"])
+
+    mock_create.assert_called_once_with(model="text-embedding-3-large", input=["Developers"])
+    assert embeddings == [[0.5], [0.5], [0.5]]
+    assert costs[0] > 0 and costs[1:] == [0.0, 0.0]
+
+@pytest.mark.asyncio
+async def test_get_embeddings_splits_in_chunks(mocker):
+    """
+    Test that the inputs are split in chunks of EMBEDDING_BATCH_SIZE.
+
+    Verifies:
+        - One request is sent per chunk.
+    """
+    mocker.patch.object(test_client, "embedding_cache", None)
+    mocker.patch("app.llm.llm_client.EMBEDDING_BATCH_SIZE", 2)
+    async def create(model, input):
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=len(input)), data=[SimpleNamespace(index=i, embedding=[float(i)]) for i in range(len(input))])
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", side_effect=create)
+    mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    embeddings, _ = await test_client.get_embeddings(["a", "b", "c"])
+
+    assert mock_create.call_count == 2
+    assert embeddings == [[0.0], [1.0], [0.0]]
+
+@pytest.mark.asyncio
+async def test_get_embeddings_empty_list(mocker):
+    """
+    Test that no request is sent for an empty list.
+
+    Verifies:
+        - The API is not called.
+        - Empty lists are returned.
+    """
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", new_callable=mocker.AsyncMock)
+
+    assert await test_client.get_embeddings([]) == ([], [])
+    mock_create.assert_not_called()
+
+
+#-----send_request------
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, headers=headers, request=request), body=None)
+
+@pytest.mark.asyncio
+async def test_send_request_retries_rate_limit_errors(mocker):
+    """
+    Test that a rate limited request is retried after the time given by the Retry-After header.
+
+    Verifies:
+        - The request is sent again and its response returned.
+        - The retry wait follows Retry-After and is reported apart from the queue wait.
+        - The retry is logged.
+    """
+    mock_sleep = mocker.patch("app.llm.llm_client.asyncio.sleep", new_callable=mocker.AsyncMock)
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mock_error = mocker.patch("app.llm.llm_client.Logger.log_error")
+    send = mocker.AsyncMock(side_effect=[rate_limit_error({"retry-after": "2"}), "response"])
+
+    response, stats = await test_client.send_request("gpt-4.1", 100, send)
+
+    assert response == "response"
+    assert send.call_count == 2
+    assert stats["retries"] == 1
+    assert 2 <= stats["retry_wait_sec"] <= 2 + LLM_RETRY_BASE_SEC
+    assert stats["queue_wait_sec"] == 0.0
+    mock_sleep.assert_awaited_once()
+    assert mock_error.call_args[0][0] == "LlmRetry"
+
+@pytest.mark.asyncio
+async def test_send_request_gives_up_after_max_retries(mocker):
+    """
+    Test that a request that keeps failing raises the last error.
+
+    Verifies:
+        - The request is tried LLM_MAX_RETRIES + 1 times.
+    """
+    mocker.patch("app.llm.llm_client.asyncio.sleep", new_callable=mocker.AsyncMock)
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mocker.patch("app.llm.llm_client.Logger.log_error")
+    send = mocker.AsyncMock(side_effect=rate_limit_error({}))
+
+    with pytest.raises(openai.RateLimitError):
+        await test_client.send_request("gpt-4.1", 100, send)
+    assert send.call_count == LLM_MAX_RETRIES + 1
+
+@pytest.mark.asyncio
+async def test_send_request_does_not_retry_other_errors(mocker):
+    """
+    Test that errors that can not be fixed by waiting are raised immediately.
+
+    Verifies:
+        - Non retryable errors are not retried.
+    """
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    send = mocker.AsyncMock(side_effect=ValueError("bad request"))
+
+    with pytest.raises(ValueError):
+        await test_client.send_request("gpt-4.1", 100, send)
+    assert send.call_count == 1
+
+def test_get_retry_delay_backoff_without_header():
+    """
+    Test the jittered exponential backoff used when there is no Retry-After header.
+
+    Verifies:
+        - The delay is between 0 and the exponential bound, capped by LLM_RETRY_MAX_SEC.
+    """
+    error = rate_limit_error({})
+
+    for attempt in range(8):
+        delay = test_client.get_retry_delay(error, attempt)
+        assert 0 <= delay <= min(LLM_RETRY_MAX_SEC, LLM_RETRY_BASE_SEC * 2 ** attempt)
+
+def test_get_retry_delay_uses_retry_after_ms():
+    """
+    Test that the millisecond Retry-After header of OpenAI is preferred.
+
+    Verifies:
+        - The delay starts at the header value.
+    """
+    delay = test_client.get_retry_delay(rate_limit_error({"retry-after-ms": "1500", "retry-after": "9"}), 0)
+
+    assert 1.5 <= delay <= 1.5 + LLM_RETRY_BASE_SEC
+
+@pytest.mark.asyncio
+async def test_call_llm_logs_queue_wait_and_api_latency(mocker):
+    """
+    Test that the queue wait of the rate limiter is logged apart from the API latency.
+
+    Verifies:
+        - The log has the queue wait, retries and API latency.
+        - The API latency does not include the queue wait.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.rate_limiter, "acquire", new_callable=mocker.AsyncMock, return_value=3.0)
+    response = SimpleNamespace(usage=SimpleNamespace(input_tokens=10, output_tokens=5), output_text="Hi")
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=response)
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    await test_client.call_llm("Hello", "Greetings")
+
+    log = mock_log.call_args[0][0]
+    assert log["queue_wait_sec"] == 3.0
+    assert log["retries"] == 0
+    assert log["api_latency_sec"] == pytest.approx(log["log_duration_sec"] - 3.0)
+
+@pytest.mark.asyncio
+async def test_call_llm_logs_cached_tokens(mocker):
+    """
+    Test that the cached input tokens reported in the usage are logged and priced.
+
+    Verifies:
+        - The log has the cached tokens and the prefix cache hit ratio.
+        - The returned cost uses the cached input price.
+        - Usages without input token details count as no cached tokens.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.rate_limiter, "acquire", new_callable=mocker.AsyncMock, return_value=0.0)
+    usage = SimpleNamespace(input_tokens=2000, output_tokens=100, input_tokens_details=SimpleNamespace(cached_tokens=1536))
+    response = SimpleNamespace(usage=usage, output_text="Hi")
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=response)
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    _, cost = await test_client.call_llm("Hello", "Greetings")
+
+    log = mock_log.call_args[0][0]
+    assert log["tokens"]["cached"] == 1536
+    assert log["prefix_cache_hit_ratio"] == pytest.approx(0.768)
+    assert cost == pytest.approx(test_client.calculate_token_cost("gpt-4.1", 2000, 100, cached_tokens=1536))
+    assert test_client.get_cached_tokens(SimpleNamespace(input_tokens=10, output_tokens=5)) == 0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("usage", [SimpleNamespace(input_tokens=0, output_tokens=0), SimpleNamespace(output_tokens=3), None])
+async def test_call_llm_raises_without_token_usage(mocker, usage):
+    """
+    Test that a response that does not report its token usage fails instead of being logged with a wrong cost.
+
+    Verifies:
+        - Zero, missing or absent token counts raise a ValueError.
+        - The call is not logged.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    mocker.patch.object(test_client.rate_limiter, "acquire", new_callable=mocker.AsyncMock, return_value=0.0)
+    mocker.patch.object(test_client.client.responses, "create", new_callable=mocker.AsyncMock, return_value=SimpleNamespace(usage=usage, output_text="Hi"))
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    with pytest.raises(ValueError, match="token usage"):
+        await test_client.call_llm("Hello", "Greetings")
+    mock_log.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_embedding_waits_within_latency_budget(mocker):
+    """
+    Test that an embedding is not awaited beyond the deadline of the question.
+
+    Verifies:
+        - A batched embedding that does not arrive before the latency budget raises a TimeoutError and is logged.
+        - No embedding is requested once the deadline has passed.
+    """
+    async def slow_create(**kwargs):
+        await asyncio.sleep(30)
+    mocker.patch.object(test_client, "embedding_cache", None)
+    mocker.patch.object(test_client, "embedding_batcher", EmbeddingBatcher(test_client.embed_chunk, 1, 10))
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mock_create = mocker.patch.object(test_client.client.embeddings, "create", side_effect=slow_create)
+    mock_error = mocker.patch("app.llm.llm_client.Logger.log_error")
+
+    start = time.monotonic()
+    with LatencyBudget.start_budget(0.2):
+        with pytest.raises(TimeoutError):
+            await test_client.get_embedding("developers")
+        assert time.monotonic() - start < 2
+        assert mock_error.call_args[0][0] == "LlmTimeout"
+
+        await asyncio.sleep(0.2)
+        mock_create.reset_mock()
+        with pytest.raises(TimeoutError):
+            await test_client.get_embedding("stakeholders")
+    mock_create.assert_not_called()
+    for task in test_client.embedding_batcher.tasks:
+        task.cancel() #The batch itself only stops at the deadline of its task
+
+#-----get_client------
+@pytest.mark.asyncio
+async def test_get_client_is_shared_per_event_loop():
+    """
+    Test that the OpenAI client and its connection pool are shared by the instances of the same event loop.
+
+    Verifies:
+        - Two LlmClient instances get the same client in the same loop.
+        - The client uses the tracked transport with the configured keep-alive pool.
+        - A new loop gets its own client.
+        - The embedding batcher is shared by the instances.
+    """
+    other = LlmClient()
+    client = test_client.get_client()
+
+    assert other.client is client
+    assert other.embedding_batcher is test_client.embedding_batcher
+    transport = client._client._transport
+    assert isinstance(transport, TrackedTransport)
+    pool = transport.transport._pool
+    assert pool._max_connections == LLM_HTTP_MAX_CONNECTIONS
+    assert pool._max_keepalive_connections == LLM_HTTP_MAX_KEEPALIVE
+
+    new_loop_client = await asyncio.to_thread(lambda: asyncio.run(get_client_async(other)))
+    assert new_loop_client is not client
+
+async def get_client_async(llm_client):
+    return llm_client.get_client()
+
+@pytest.mark.asyncio
+async def test_get_client_closes_clients_of_closed_loops(mocker):
+    """
+    Test that the clients of the event loops that were closed are removed and closed when a new loop gets its client.
+
+    Verifies:
+        - The client of a closed loop is removed from the shared clients.
+        - Its close() is awaited in the new loop.
+    """
+    other = LlmClient()
+    closed_loop = asyncio.new_event_loop()
+    closed_loop.close()
+    old_client = mocker.Mock(close=mocker.AsyncMock())
+    mocker.patch.object(LlmClient, "clients", {closed_loop: old_client})
+
+    await asyncio.to_thread(lambda: asyncio.run(get_client_async(other)))
+    await asyncio.sleep(0) #Runs the close task of the current loop if the closed client was swept by it
+
+    assert closed_loop not in LlmClient.clients
+    old_client.close.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_warm_up_logs_errors(mocker):
+    """
+    Test that the warm-up sends one request per connection and only logs its errors.
+
+    Verifies:
+        - The model list is requested once per connection.
+        - A failed request is logged and not raised.
+    """
+    mock_list = mocker.patch.object(test_client.client.models, "list", new_callable=mocker.AsyncMock, side_effect=[None, ValueError("Connection refused")])
+    mock_error = mocker.patch("app.llm.llm_client.Logger.log_error")
+
+    duration = await test_client.warm_up(connections=2)
+
+    assert mock_list.await_count == 2
+    assert duration >= 0
+    assert mock_error.call_args[0][0] == "LlmWarmupError"
+    assert mock_error.call_args[0][1]["failed"] == 1
+
+#-----send_hedged------
+def build_send(delays, calls):
+    async def request(index, delay):
+        await asyncio.sleep(delay)
+        return f"response {index}"
+
+    def send():
+        index = len(calls)
+        calls.append(index)
+        return request(index, delays[index])
+    return send
+
+@pytest.mark.asyncio
+async def test_send_hedged_duplicate_wins(mocker):
+    """
+    Test that a call slower than the observed percentile is duplicated and the fastest response wins.
+
+    Verifies:
+        - A second request is sent after the hedge delay.
+        - The response of the duplicate is returned and the statistics record the hedge.
+    """
+    tracker = LatencyTracker(window=10, min_samples=1)
+    tracker.record(("hedge_task", "gpt-4.1"), 0.05)
+    mocker.patch.object(test_client, "latency_tracker", tracker)
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mocker.patch("app.llm.llm_client.LLM_HEDGE_ENABLED", True)
+    calls = []
+
+    response, stats = await test_client.send_hedged("gpt-4.1", 10, build_send([5, 0], calls), "hedge_task")
+
+    assert calls == [0, 1]
+    assert response == "response 1"
+    assert stats["hedged"] is True
+    assert stats["hedge_won"] is True
+    assert stats["hedge_delay_sec"] == pytest.approx(0.05)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream", [False, True])
+async def test_send_hedged_closes_losing_response(mocker, stream):
+    """
+    Test that when both requests of a hedged call finish together, the losing response is closed and its usage is logged.
+
+    Verifies:
+        - The primary response wins.
+        - The losing response is closed.
+        - Its tokens are returned when known, and charged as the hedge cost.
+        - An open stream has no tokens yet and is charged the estimate.
+    """
+    tracker = LatencyTracker(window=10, min_samples=1)
+    tracker.record(("hedge_task:stream" if stream else "hedge_task", "gpt-4.1"), 0.05)
+    mocker.patch.object(test_client, "latency_tracker", tracker)
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mocker.patch("app.llm.llm_client.LLM_HEDGE_ENABLED", True)
+    usage = None if stream else SimpleNamespace(input_tokens=1000, output_tokens=500)
+    responses = [SimpleNamespace(name="primary", usage=usage, close=mocker.AsyncMock()), SimpleNamespace(name="hedge", usage=usage, close=mocker.AsyncMock())]
+    finished = asyncio.Event()
+    calls = []
+    async def request(index):
+        if index == 1:
+            finished.set()
+        await finished.wait()
+        return responses[index]
+    def send():
+        calls.append(len(calls))
+        return request(calls[-1])
+
+    response, stats = await test_client.send_hedged("gpt-4.1", 10, send, "hedge_task", stream=stream)
+
+    assert response.name == "primary"
+    responses[0].close.assert_not_awaited()
+    responses[1].close.assert_awaited_once()
+    if stream:
+        assert stats["hedge_loser_tokens"] is None
+        assert test_client.get_hedge_cost("gpt-4.1", 1000, stats) == pytest.approx(0.002)
+    else:
+        assert stats["hedge_loser_tokens"] == {"input": 1000, "cached": 0, "output": 500}
+        assert test_client.get_hedge_cost("gpt-4.1", 1000, stats) == pytest.approx(test_client.calculate_token_cost("gpt-4.1", 1000, 500))
+
+@pytest.mark.asyncio
+async def test_send_hedged_without_enough_samples(mocker):
+    """
+    Test that calls are not hedged until the task has a latency percentile.
+
+    Verifies:
+        - Only one request is sent.
+        - The latency of the call is recorded.
+    """
+    tracker = LatencyTracker(window=10, min_samples=5)
+    mocker.patch.object(test_client, "latency_tracker", tracker)
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mocker.patch("app.llm.llm_client.LLM_HEDGE_ENABLED", True)
+    calls = []
+
+    response, stats = await test_client.send_hedged("gpt-4.1", 10, build_send([0.01], calls), "new_task")
+
+    assert calls == [0]
+    assert response == "response 0"
+    assert stats["hedged"] is False
+    assert len(tracker.latencies[("new_task", "gpt-4.1")]) == 1
+
+@pytest.mark.asyncio
+async def test_send_hedged_ignores_rate_limiter_wait(mocker):
+    """
+    Test that the wait in the rate limiter does not count as latency of the call.
+
+    Verifies:
+        - A request that waits longer than the hedge delay in the rate limiter, but answers quickly once sent, is not hedged.
+        - The recorded latency only counts the time since the request was sent, under the key of its task and model.
+    """
+    async def acquire(model, tokens):
+        await asyncio.sleep(0.2)
+        return 0.2
+    tracker = LatencyTracker(window=10, min_samples=1)
+    tracker.record(("queued_task", "gpt-4.1"), 0.05)
+    mocker.patch.object(test_client, "latency_tracker", tracker)
+    mocker.patch.object(test_client, "rate_limiter", mocker.Mock(acquire=acquire))
+    mocker.patch("app.llm.llm_client.LLM_HEDGE_ENABLED", True)
+    calls = []
+
+    response, stats = await test_client.send_hedged("gpt-4.1", 10, build_send([0.01], calls), "queued_task")
+
+    assert calls == [0]
+    assert stats["hedged"] is False
+    assert stats["queue_wait_sec"] == 0.2
+    assert tracker.latencies[("queued_task", "gpt-4.1")][-1] < 0.15
+    assert ("queued_task", "gpt-4.1-mini") not in tracker.latencies
+
+@pytest.mark.asyncio
+async def test_send_hedged_raises_on_deadline(mocker):
+    """
+    Test that a call that does not finish before the deadline of its task is cancelled.
+
+    Verifies:
+        - TimeoutError is raised and logged.
+    """
+    mocker.patch.object(test_client, "latency_tracker", LatencyTracker(window=10, min_samples=5))
+    mocker.patch.object(test_client, "rate_limiter", RateLimiter(rpm_limit=0, tpm_limit=0))
+    mocker.patch.dict("app.llm.llm_client.LLM_TIMEOUT_SEC", {"slow_task": 0.05})
+    mock_error = mocker.patch("app.llm.llm_client.Logger.log_error")
+
+    with pytest.raises(TimeoutError):
+        await test_client.send_hedged("gpt-4.1", 10, build_send([5], []), "slow_task")
+    assert mock_error.call_args[0][0] == "LlmTimeout"
+
+@pytest.mark.asyncio
+async def test_call_llm_logs_hedge_extra_cost(mocker):
+    """
+    Test that the extra cost of a hedged call is logged and included in its cost.
+
+    Verifies:
+        - hedge_extra_cost is the input cost of the duplicate.
+        - The returned cost includes it.
+    """
+    mocker.patch.object(test_client, "get_max_input_tokens", return_value=1000)
+    response = SimpleNamespace(usage=SimpleNamespace(input_tokens=1000, output_tokens=500), output_text="Hi")
+    stats = {"queue_wait_sec": 0.0, "retry_wait_sec": 0.0, "retries": 0, "timeout_sec": 60, "hedge_delay_sec": 1.0, "hedged": True, "hedge_won": True}
+    mocker.patch.object(test_client, "send_hedged", new_callable=mocker.AsyncMock, return_value=(response, stats))
+    mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    _, cost = await test_client.call_llm("Hello", "Greetings")
+
+    log = mock_log.call_args[0][0]
+    assert log["hedge_extra_cost"] == pytest.approx(0.002)
+    assert log["hedged"] is True
+    assert cost == pytest.approx(test_client.calculate_token_cost("gpt-4.1", 1000, 500) + 0.002)
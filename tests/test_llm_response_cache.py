@@ -0,0 +1,44 @@
+from app.data.llm_response_cache import LlmResponseCache
+
+#-------get / set------
+def test_set_and_get(tmp_path):
+    """
+    Test that the response of an identical call is returned.
+
+    Verifies:
+        - The stored JSON is returned for the same call.
+        - The hit is counted.
+    """
+    cache = LlmResponseCache(str(tmp_path / "llm.db"), ttl=60, max_bytes=10000)
+    cache.set("gpt-4.1", "system", "user", 0.7, "question", '{"value": "q"}')
+
+    assert cache.get("gpt-4.1", "system", "user", 0.7, "question") == '{"value": "q"}'
+    assert cache.hits == 1
+
+def test_get_misses_on_any_difference(tmp_path):
+    """
+    Test that calls with any different parameter do not share the response.
+
+    Verifies:
+        - Different model, prompts, temperature or format miss.
+    """
+    cache = LlmResponseCache(str(tmp_path / "llm.db"), ttl=60, max_bytes=10000)
+    cache.set("gpt-4.1", "system", "user", 0.7, "question", '{"value": "q"}')
+
+    assert cache.get("gpt-4.1-mini", "system", "user", 0.7, "question") is None
+    assert cache.get("gpt-4.1", "other", "user", 0.7, "question") is None
+    assert cache.get("gpt-4.1", "system", "other", 0.7, "question") is None
+    assert cache.get("gpt-4.1", "system", "user", 0.3, "question") is None
+    assert cache.get("gpt-4.1", "system", "user", 0.7, "entitylist") is None
+
+def test_get_expired(tmp_path):
+    """
+    Test that responses expire after the TTL.
+
+    Verifies:
+        - An expired response is not returned.
+    """
+    cache = LlmResponseCache(str(tmp_path / "llm.db"), ttl=-1, max_bytes=10000)
+    cache.set("gpt-4.1", "system", "user", 0.7, "question", '{"value": "q"}')
+
+    assert cache.get("gpt-4.1", "system", "user", 0.7, "question") is None
@@ -1,6 +1,7 @@
 import pytest
 from app.logic.llm_tasks import LlmTasks
 from app.models.question import Question
+from app.models.question_analysis import QuestionAnalysis
 from app.models.entity import *
 import json
 
@@ -122,6 +123,46 @@ async def test_extract_entities_with_null_values(mocker):
     assert (p.value is None for p in problem)
     assert (a.value is None for a in artifactClass)
 
+#----------analyze_question---------
+@pytest.mark.asyncio
+async def test_analyze_question_splits_response(mocker):
+    """
+    Test that the combined analysis is returned as a validated question and its entity list.
+
+    Verifies:
+        - One structured call is made with the question analysis format.
+        - The Question and EntityList have the values of the response.
+    """
+    analysis = QuestionAnalysis(value="What problems do developers face?", is_valid=True, reasoning=None,
+                                entities=[{"value": "developers", "type": "stakeholder", "embedding": None}])
+    mock_call = mocker.patch.object(test_tasks.llm_client, "call_llm_structured", new_callable=mocker.AsyncMock, return_value=(analysis, 0.01))
+
+    question, entities, cost = await test_tasks.analyze_question("What problms do developers face")
+
+    assert mock_call.call_args.kwargs["text_format"] == "questionanalysis"
+    assert mock_call.call_args.kwargs["task_name"] == "question_analysis"
+    assert question.model_dump() == {"value": "What problems do developers face?", "is_valid": True, "reasoning": None}
+    assert [entity.value for entity in entities.entities] == ["developers"]
+    assert cost == 0.01
+
+@pytest.mark.asyncio
+async def test_analyze_question_invalid(mocker):
+    """
+    Test that a question outside the domain is marked as invalid by the combined analysis.
+
+    Verifies:
+        - The question is flagged as invalid with a reasoning.
+        - No entities are extracted.
+    """
+    mocker.patch("app.llm.llm_client.Logger.log_data")
+
+    question, entities, cost = await test_tasks.analyze_question("What is the weather in Paris?")
+
+    assert question.is_valid is False
+    assert isinstance(question.reasoning, str)
+    assert entities.entities == []
+    assert isinstance(cost, float)
+
 #--------generate_entity_embedding----------
 @pytest.mark.asyncio
 async def test_generate_entity_embeddings_with_valid_entities(mocker):
@@ -133,6 +174,7 @@ async def test_generate_entity_embeddings_with_valid_entities(mocker):
         - Total cost is greater than 0.
     """
     mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+    mocker.patch.object(test_tasks.llm_client, "embedding_cache", None) #Cached embeddings have no cost
 
     entities = [Entity(value="AI", type=EntityEnum.context, embedding=None), Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)]
 
@@ -158,6 +200,7 @@ async def test_generate_entity_embeddings_with_none_values(mocker):
         - The cost is not zero.
     """
     mock_log = mocker.patch("app.llm.llm_client.Logger.log_data")
+    mocker.patch.object(test_tasks.llm_client, "embedding_cache", None) #Cached embeddings have no cost
 
     entities = [Entity(value="AI", type=EntityEnum.context, embedding=None), Entity(value=None, type=EntityEnum.problem, embedding=None)]
 
@@ -353,6 +396,58 @@ def test_enrich_prompt_basic_structure():
     assert "### OTHERS" in prompt
     assert "-note: Some general note" in prompt
 
+def test_enrich_prompt_static_prefix_and_question_last():
+    """
+    Test that the final answer prompt keeps its static instructions first and the question last.
+
+    Verifies:
+        - Prompts of different questions and contexts share the same system prompt.
+        - The user prompt starts with the static instructions.
+        - The question is after the context.
+    """
+    context_a = {"entities": {"problem": {"Latency": {"description": "Slow", "labels": ["problem"], "alternativeName": [], "hypernym": []}}}, "relationships": [], "others": {}}
+    context_b = {"entities": {}, "relationships": [], "others": {"count": 3}}
+
+    prompt_a, system_a = test_tasks.enrich_prompt("What problems exist?", context_a)
+    prompt_b, system_b = test_tasks.enrich_prompt("How many goals are there?", context_b)
+
+    assert system_a == system_b
+    assert prompt_a.startswith("Use the following information to answer the question.")
+    assert prompt_a.index("### ENTITIES") < prompt_a.index("### QUESTION")
+    assert prompt_a.index("### QUESTION") > prompt_a.index("### OTHERS")
+    assert prompt_a.rstrip().endswith("What problems exist?")
+
+
+@pytest.mark.asyncio
+async def test_task_prompts_share_cacheable_static_prefix(mocker):
+    """
+    Test that every task sends its static instructions in the system prompt and only the dynamic data in the user prompt.
+
+    Verifies:
+        - The system prompt of a task is the same for different questions and has its static instructions.
+        - The prompts have no shared guide added before the instructions of the task.
+        - The user prompt ends with the question and has no static instructions.
+    """
+    structured = mocker.patch.object(test_tasks.llm_client, "call_llm_structured", new_callable=mocker.AsyncMock,
+                                     return_value=(QuestionAnalysis(value="q", is_valid=False, reasoning="", entities=[]), 0.0))
+    plain = mocker.patch.object(test_tasks.llm_client, "call_llm", new_callable=mocker.AsyncMock, return_value=("", 0.0))
+
+    calls = []
+    for question in ["What problems do developers face?", "What goals are there?"]:
+        await test_tasks.validate_question(question)
+        await test_tasks.extract_entities(question)
+        await test_tasks.analyze_question(question)
+        await test_tasks.create_cypher_query(question, {"problem": None})
+        calls += [(call.args[0], call.args[1], question) for call in structured.call_args_list + plain.call_args_list]
+        structured.reset_mock()
+        plain.reset_mock()
+
+    for prompt, system_prompt, question in calls:
+        assert system_prompt.startswith("You are") and "# TASK" in system_prompt
+        assert prompt.rstrip().endswith(question)
+        assert "# TASK" not in prompt and "# EXAMPLES" not in prompt
+    assert [system for _, system, _ in calls[:4]] == [system for _, system, _ in calls[4:]]
+
 def test_enrich_prompt_with_alternative_name():
     """
     Test inclusion of alternative names in the enriched prompt.
@@ -4,6 +4,7 @@ import tempfile
 import pytest
 from unittest.mock import patch
 from app.logs.logger import Logger
+from logs.tracer import Tracer
 
 test_logger = Logger()
 
@@ -34,6 +35,32 @@ def test_log_data_basic():
         assert data["message"] == "test log"
         assert data["value"] == 123
 
+def test_log_entries_have_request_ids_in_traced_requests():
+    """
+    Test that the entries written while a request is traced have its request and span IDs.
+
+    Verifies:
+        - Data and error entries have the request ID and the ID of the current span.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data_path = os.path.join(tmpdir, "data.jsonl")
+        error_path = os.path.join(tmpdir, "errors.jsonl")
+
+        with patch("app.logs.logger.Logger.DATA_LOG", data_path), patch("app.logs.logger.Logger.ERROR_LOG", error_path), \
+             patch.object(Tracer, "TRACE_DIR", ""):
+            with Tracer.trace("question") as span:
+                test_logger.log_data({"log_type": "llm_call"})
+                test_logger.log_error("ValidationError", {"question": "q"})
+                request_id = Tracer.get_request_id()
+
+            with open(data_path, "r", encoding="utf-8") as f:
+                data = json.loads(f.readline())
+            with open(error_path, "r", encoding="utf-8") as f:
+                error = json.loads(f.readline())
+
+    assert data["request_id"] == error["request_id"] == request_id
+    assert data["span_id"] == error["span_id"] == span["span_id"]
+
 def test_log_data_with_empty_dict():
     """
     Test that logging an empty dictionary still writes a valid JSON line.
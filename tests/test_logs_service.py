@@ -1,3 +1,4 @@
+import pytest
 import pandas as pd
 from unittest.mock import patch
 from app.logic.logs_service import LogsService
@@ -128,4 +129,113 @@ def test_get_log_statistics_by_type_with_task_names():
     assert emb_stats["tasks"]["task_A"]["count"] == 2
     assert emb_stats["tasks"]["task_A"]["total_cost"] == 5.0
     assert emb_stats["tasks"]["task_B"]["count"] == 1
-    assert emb_stats["tasks"]["task_B"]["total_cost"] == 1.0
\ No newline at end of file
+    assert emb_stats["tasks"]["task_B"]["total_cost"] == 1.0
+def test_get_log_statistics_by_type_prefix_cache_hit_ratio():
+    """
+    Test that the prompt prefix cache hit ratio is computed per task from the logged tokens.
+
+    Verifies:
+        - The ratio is the cached input tokens divided by the input tokens of the task.
+        - Entries without cached tokens count as misses.
+        - Tasks without logged tokens have no ratio.
+    """
+    entries = [
+        {"log_type": "llm_call", "cost": 0.1, "log_duration_sec": 1.0, "task_name": "cypher_generation", "tokens": {"input": 2000, "cached": 1024, "output": 10}},
+        {"log_type": "llm_call", "cost": 0.1, "log_duration_sec": 1.0, "task_name": "cypher_generation", "tokens": {"input": 2000, "output": 10}},
+        {"log_type": "llm_call", "cost": 0.1, "log_duration_sec": 1.0, "task_name": "question_validation", "cache_hit": True}
+    ]
+
+    with patch("app.logic.logs_service.LogReader.read_data_logs", return_value=entries), patch("app.logic.logs_service.LogReader.read_error_logs", return_value=[]):
+        stats = test_log_serv.get_log_statistics_by_type()
+
+    tasks = stats["llm_call"]["tasks"]
+    assert tasks["cypher_generation"]["prefix_cache_hit_ratio"] == pytest.approx(0.256)
+    assert tasks["question_validation"]["prefix_cache_hit_ratio"] is None
+
+#------get_model_statistics_by_task-------
+def test_get_model_statistics_by_task():
+    """
+    Test that LLM call statistics are grouped by task and model, with the downstream failure rate.
+
+    Verifies:
+        - Each model of a task has its own count, latency and cost.
+        - Empty Cypher queries count as failures.
+        - Cached responses are excluded.
+    """
+    entries = [
+        {"log_type": "llm_call", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (n) RETURN n", "cost": 0.02, "log_duration_sec": 2.0},
+        {"log_type": "llm_call", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (p) RETURN p", "cost": 0.02, "log_duration_sec": 4.0},
+        {"log_type": "llm_call", "task_name": "cypher_generation", "model": "gpt-4.1-mini", "response": "", "cost": 0.005, "log_duration_sec": 1.0},
+        {"log_type": "llm_call", "task_name": "cypher_generation", "model": "gpt-4.1-mini", "response": "MATCH (n) RETURN n", "cost": 0.005, "log_duration_sec": 1.0},
+        {"log_type": "llm_call", "task_name": "question_validation", "model": "gpt-4.1", "response": "{}", "cost": 0.0, "log_duration_sec": 0.0, "cache_hit": True}
+    ]
+
+    with patch("app.logic.logs_service.LogReader.read_data_logs", return_value=entries), patch("app.logic.logs_service.LogReader.read_error_logs", return_value=[]):
+        model_stats = test_log_serv.get_model_statistics_by_task()
+
+    assert set(model_stats) == {"cypher_generation"}
+    primary = model_stats["cypher_generation"]["gpt-4.1"]
+    canary = model_stats["cypher_generation"]["gpt-4.1-mini"]
+    assert primary["count"] == 2
+    assert primary["avg_duration_s"] == 3.0
+    assert primary["failure_rate"] == 0
+    assert canary["failure_rate"] == 0.5
+    assert round(canary["avg_cost"], 3) == 0.005
+
+def test_get_model_statistics_by_task_since_canary_start():
+    """
+    Test that the statistics of a task only count the calls of both models made since its canary started.
+
+    Verifies:
+        - The calls of the task logged before the start are excluded for every model.
+        - Tasks without a start time count all their calls.
+    """
+    entries = [
+        {"log_type": "llm_call", "timestamp": "2025-01-01T10:00:00", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (n) RETURN n", "cost": 0.02, "log_duration_sec": 9.0},
+        {"log_type": "llm_call", "timestamp": "2025-01-01T10:00:00", "task_name": "cypher_generation", "model": "gpt-4.1-mini", "response": "", "cost": 0.005, "log_duration_sec": 9.0},
+        {"log_type": "llm_call", "timestamp": "2025-01-02T10:00:00", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (n) RETURN n", "cost": 0.02, "log_duration_sec": 2.0},
+        {"log_type": "llm_call", "timestamp": "2025-01-02T10:00:00", "task_name": "cypher_generation", "model": "gpt-4.1-mini", "response": "MATCH (n) RETURN n", "cost": 0.005, "log_duration_sec": 1.0},
+        {"log_type": "llm_call", "timestamp": "2025-01-01T10:00:00", "task_name": "question_validation", "model": "gpt-4.1", "response": "{}", "cost": 0.01, "log_duration_sec": 1.0}
+    ]
+
+    with patch("app.logic.logs_service.LogReader.read_data_logs", return_value=entries), patch("app.logic.logs_service.LogReader.read_error_logs", return_value=[]):
+        model_stats = test_log_serv.get_model_statistics_by_task(since={"cypher_generation": "2025-01-02T00:00:00"})
+
+    assert model_stats["cypher_generation"]["gpt-4.1"]["count"] == 1
+    assert model_stats["cypher_generation"]["gpt-4.1"]["avg_duration_s"] == 2.0
+    assert model_stats["cypher_generation"]["gpt-4.1-mini"]["failure_rate"] == 0
+    assert model_stats["question_validation"]["gpt-4.1"]["count"] == 1
+
+def test_get_model_statistics_by_task_joins_request_errors():
+    """
+    Test that the errors logged later in the same request count as failures of the task's calls.
+
+    Verifies:
+        - A call is failed if an error of its task was logged with the same request_id.
+        - Errors of other tasks or requests are not counted.
+        - Tasks without a failure check have no failure rate.
+        - The API latency is averaged apart from the duration.
+    """
+    entries = [
+        {"log_type": "llm_call", "request_id": "r1", "task_name": "question_validation", "model": "gpt-4.1", "response": "{}", "cost": 0.01, "log_duration_sec": 3.0, "api_latency_sec": 1.0},
+        {"log_type": "llm_call", "request_id": "r2", "task_name": "question_validation", "model": "gpt-4.1", "response": "{}", "cost": 0.01, "log_duration_sec": 5.0, "api_latency_sec": 2.0},
+        {"log_type": "llm_call", "request_id": "r1", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (n) RETURN n", "cost": 0.02, "log_duration_sec": 1.0},
+        {"log_type": "llm_call", "request_id": "r2", "task_name": "cypher_generation", "model": "gpt-4.1", "response": "MATCH (n) RETURN n", "cost": 0.02, "log_duration_sec": 1.0},
+        {"log_type": "llm_call", "request_id": "r2", "task_name": "rag_answer_generation", "model": "gpt-4.1", "response": "Answer", "cost": 0.03, "log_duration_sec": 2.0}
+    ]
+    errors = [
+        {"error_type": "InvalidQuestion", "request_id": "r1", "details": {}},
+        {"error_type": "RelatedNodesNotFoundError", "request_id": "r2", "details": {}},
+        {"error_type": "NoCypherError", "details": {}}
+    ]
+
+    with patch("app.logic.logs_service.LogReader.read_data_logs", return_value=entries), patch("app.logic.logs_service.LogReader.read_error_logs", return_value=errors):
+        model_stats = test_log_serv.get_model_statistics_by_task()
+
+    validation = model_stats["question_validation"]["gpt-4.1"]
+    assert validation["failure_rate"] == 0.5
+    assert validation["avg_api_latency_s"] == 1.5
+    assert validation["avg_duration_s"] == 4.0
+    assert model_stats["cypher_generation"]["gpt-4.1"]["failure_rate"] == 0.5
+    assert model_stats["cypher_generation"]["gpt-4.1"]["avg_api_latency_s"] is None
+    assert model_stats["rag_answer_generation"]["gpt-4.1"]["failure_rate"] is None
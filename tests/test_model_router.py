@@ -0,0 +1,180 @@
+import json
+import pytest
+from app.logic.model_router import ModelRouter
+from app.config.config import ROUTER_MIN_SAMPLES
+
+def build_stats(primary, canary, task_name="question_validation"):
+    base = {"count": ROUTER_MIN_SAMPLES, "avg_duration_s": 1.0, "p95_duration_s": 2.0, "avg_api_latency_s": 1.0, "p95_api_latency_s": 2.0, "avg_cost": 0.01, "failure_rate": 0.0}
+    return {task_name: {"gpt-4.1": {**base, **primary}, "gpt-4.1-mini": {**base, **canary}}}
+
+#-------route------
+def test_route_defaults_to_primary_model():
+    """
+    Test that tasks without a canary use their primary model.
+
+    Verifies:
+        - The default model and primary route are returned.
+    """
+    router = ModelRouter(path="")
+
+    assert router.route("cypher_generation") == ("gpt-4.1", "primary")
+
+def test_route_sends_canary_percentage(mocker):
+    """
+    Test that the canary percentage of the calls goes to the canary model.
+
+    Verifies:
+        - Calls under the percentage use the canary, the rest the primary model.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+
+    mocker.patch("app.logic.model_router.random.random", return_value=0.05)
+    assert router.route("question_validation") == ("gpt-4.1-mini", "canary")
+    mocker.patch("app.logic.model_router.random.random", return_value=0.5)
+    assert router.route("question_validation") == ("gpt-4.1", "primary")
+
+def test_set_canary_raises_value_errors():
+    """
+    Test that invalid canaries are rejected.
+
+    Verifies:
+        - Unknown tasks, unknown models and percentages out of bounds raise ValueError.
+    """
+    router = ModelRouter(path="")
+
+    with pytest.raises(ValueError):
+        router.set_canary("unknown_task", "gpt-4.1-mini", 10)
+    with pytest.raises(ValueError):
+        router.set_canary("question_validation", "unknown-model", 10)
+    with pytest.raises(ValueError):
+        router.set_canary("question_validation", "gpt-4.1-mini", 150)
+
+#-------get_canary_starts------
+def test_get_canary_starts_restarts_with_each_canary():
+    """
+    Test that the start of a canary is recorded, so its statistics only count the calls made since then.
+
+    Verifies:
+        - Only the tasks with a canary have a start time.
+        - Setting the canary again restarts it.
+        - A rolled back canary has no start time.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+    first = router.get_canary_starts()
+
+    assert list(first) == ["question_validation"]
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+    assert router.get_canary_starts()["question_validation"] >= first["question_validation"]
+
+    router.update_from_stats(build_stats({"failure_rate": 0.01}, {"failure_rate": 0.2}))
+    assert router.get_canary_starts() == {}
+    assert router.routes["question_validation"]["canary_started_at"] is None
+
+#-------update_from_stats------
+def test_update_from_stats_increases_healthy_canary():
+    """
+    Test that a canary as good as the primary model gets more traffic.
+
+    Verifies:
+        - The canary percentage is doubled.
+        - The canary needs new calls before the next update.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+    stats = build_stats({}, {"avg_cost": 0.002, "avg_api_latency_s": 0.8})
+
+    decisions = router.update_from_stats(stats)
+
+    assert decisions[0]["action"] == "increase"
+    assert router.routes["question_validation"]["canary_percent"] == 20
+    assert router.update_from_stats(stats) == []
+
+def test_update_from_stats_promotes_canary():
+    """
+    Test that a healthy canary at 50% or more replaces the primary model.
+
+    Verifies:
+        - The canary becomes the primary model.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 50)
+
+    decisions = router.update_from_stats(build_stats({}, {"avg_cost": 0.002}))
+
+    assert decisions[0]["action"] == "promote"
+    assert router.route("question_validation") == ("gpt-4.1-mini", "primary")
+
+def test_update_from_stats_rolls_back_failing_canary():
+    """
+    Test that a canary with more downstream failures is rolled back.
+
+    Verifies:
+        - The canary is removed and the reason is reported.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+
+    decisions = router.update_from_stats(build_stats({"failure_rate": 0.01}, {"failure_rate": 0.2, "avg_cost": 0.002}))
+
+    assert decisions[0]["action"] == "rollback"
+    assert "failure rate" in decisions[0]["reasons"][0]
+    assert router.routes["question_validation"]["canary_model"] is None
+
+def test_update_from_stats_compares_api_latency():
+    """
+    Test that the canary latency is compared without the queue and retry waits.
+
+    Verifies:
+        - A canary with a longer duration but the same API latency is not rolled back.
+        - A canary with a higher API latency is rolled back.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("question_validation", "gpt-4.1-mini", 10)
+
+    decisions = router.update_from_stats(build_stats({}, {"avg_duration_s": 5.0}))
+    assert decisions[0]["action"] == "increase"
+
+    stats = build_stats({}, {"count": 2 * ROUTER_MIN_SAMPLES, "avg_api_latency_s": 5.0})
+    decisions = router.update_from_stats(stats)
+    assert decisions[0]["action"] == "rollback"
+    assert "latency" in decisions[0]["reasons"][0]
+
+def test_update_from_stats_holds_canary_without_failure_signal():
+    """
+    Test that the canary of a task whose failures are not measured is never increased or promoted automatically.
+
+    Verifies:
+        - A cheaper canary is held at its percentage, with the reason reported.
+        - It can still be rolled back.
+    """
+    router = ModelRouter(path="")
+    router.set_canary("rag_answer_generation", "gpt-4.1-mini", 50)
+
+    decisions = router.update_from_stats(build_stats({"failure_rate": None}, {"failure_rate": None, "avg_cost": 0.002}, task_name="rag_answer_generation"))
+
+    assert decisions[0]["action"] == "hold"
+    assert decisions[0]["reasons"] == ["no failure signal for this task"]
+    assert router.routes["rag_answer_generation"]["model"] == "gpt-4.1"
+    assert router.routes["rag_answer_generation"]["canary_percent"] == 50
+
+    stats = build_stats({"failure_rate": None}, {"count": 2 * ROUTER_MIN_SAMPLES, "failure_rate": None, "avg_cost": 0.02}, task_name="rag_answer_generation")
+    assert router.update_from_stats(stats)[0]["action"] == "rollback"
+
+#-------save/load------
+def test_routes_are_saved_and_loaded(tmp_path):
+    """
+    Test that the routing table is persisted.
+
+    Verifies:
+        - A new router reads the saved routes.
+    """
+    path = str(tmp_path / "routes.json")
+    router = ModelRouter(path=path)
+    router.set_canary("cypher_generation", "gpt-4.1-nano", 5)
+
+    loaded = ModelRouter(path=path)
+
+    assert loaded.routes["cypher_generation"]["canary_model"] == "gpt-4.1-nano"
+    assert json.load(open(path))["cypher_generation"]["canary_percent"] == 5
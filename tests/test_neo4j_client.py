@@ -122,6 +122,45 @@ def test_execute_multiple_queries_with_params():
     assert isinstance(stakeholder_result["name"], str)
     assert stakeholder_result["name"] == "developers"
 
+#------get_graph_fingerprint------
+def test_get_graph_fingerprint_checksum():
+    """
+    Test that the graph fingerprint is a checksum of the graph.
+
+    Verifies:
+        - It is a SHA-256 hex digest.
+        - It is the same while the graph does not change.
+    """
+    fingerprint = test_client.get_graph_fingerprint()
+
+    assert isinstance(fingerprint, str) and len(fingerprint) == 64
+    assert test_client.get_graph_fingerprint() == fingerprint
+
+def test_get_graph_fingerprint_changes_with_edits(mocker):
+    """
+    Test that editing the graph without changing its counts changes the fingerprint.
+
+    Verifies:
+        - Editing a node property changes it.
+        - Replacing a relationship by another one changes it.
+    """
+    def fingerprint(nodes, relationships):
+        session = mocker.MagicMock()
+        session.__enter__.return_value.run.side_effect = [nodes, relationships]
+        mocker.patch.object(test_client, "driver", mocker.Mock(session=mocker.Mock(return_value=session)))
+        return test_client.get_graph_fingerprint()
+
+    nodes = [{"id": "1", "labels": ["problem"], "properties": {"name": "latency", "embedding": None}},
+             {"id": "2", "labels": ["stakeholder"], "properties": {"name": "developers", "embedding": None}}]
+    edited = [nodes[0], {"id": "2", "labels": ["stakeholder"], "properties": {"name": "testers", "embedding": None}}]
+    concerns = [{"id": "3", "type": "concerns", "start": "1", "end": "2", "properties": {}}]
+    informs = [{"id": "4", "type": "informs", "start": "1", "end": "2", "properties": {}}]
+
+    original = fingerprint(nodes, concerns)
+    assert fingerprint(nodes, concerns) == original
+    assert fingerprint(edited, concerns) != original
+    assert fingerprint(nodes, informs) != original
+
 @pytest.fixture(scope="session", autouse=True)
 def teardown_driver():
     """
@@ -126,6 +126,24 @@ def test_parse_similarity_results_empty_results():
 
     assert parsed == {}
 
+#------parse_similarity_scores---------
+def test_parse_similarity_scores_keeps_highest_score():
+    """
+    Test that parse_similarity_scores keeps the best similarity of each node.
+
+    Verifies:
+        - Each node appears once.
+        - A node found by several queries keeps its highest similarity.
+    """
+    fake_results = [
+        {"value": {"name": "Item A", "similarity": 0.7, "labels": ["goal"]}},
+        {"value": {"name": "Item A", "similarity": 0.9, "labels": ["goal"]}},
+        {"value": {"name": "Item B", "similarity": 0.75, "labels": ["problem"]}}
+    ]
+    scores = test_logic.parse_similarity_scores(fake_results)
+
+    assert scores == {"Item A": 0.9, "Item B": 0.75}
+
 #------parse_related_nodes_results---------
 def test_parse_related_nodes_results_others_and_deduplication():
     """
@@ -1,11 +1,30 @@
 from unittest.mock import AsyncMock
+import asyncio
+import time
 import pytest
 import json
 from logic.orchestrator import Orchestrator
 from app.models.entity import Entity, EntityList ,EntityEnum
 from app.models.question import Question
+from llm.llm_stream import LlmStream
+from logic.semantic_cache import SemanticCache
+from data.answer_cache import AnswerCache
+from data.stage_cache import StageCache
+from logic.graph_fingerprint import GraphFingerprint
+from logic.admission_controller import AdmissionController
+from logic.intent_classifier import IntentClassifier
+from logic.stage import StageStop
+from llm.latency_budget import LatencyBudget
+from config.config import DEADLINE_FAST_MODEL, DEADLINE_CONTEXT_TOKEN_BUDGET
+from types import SimpleNamespace
 
 test_orchestrator = Orchestrator()
+test_orchestrator.answer_cache = None #Tested separately, the pipeline tests must not read answers cached by previous runs
+test_orchestrator.stage_cache = None #Tested separately, the pipeline tests must not read results cached by previous runs
+test_orchestrator.semantic_cache = None #Tested separately, so the pipeline tests always run every step
+test_orchestrator.intent_classifier = None #Tested separately, so the pipeline tests always run every step
+test_orchestrator.analysis_mode = "separate" #The pipeline tests mock the two-call path, the combined path is tested separately
+test_orchestrator.speculation_policy = "off" #The pipeline tests check which steps run after a failed check, speculation is tested separately
 
 #------contains_pii---------
 def test_contains_pii_positive():
@@ -54,13 +73,59 @@ async def test_process_question_rejects_pii(mocker):
     Verifies:
         - PII is rejected and the corresponding message is sent.
     """
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = True)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = True)
     mock_log = mocker.patch("logic.orchestrator.Logger.log_error")
     response = await test_orchestrator.process_question("test@gmail.com")
 
     assert "Invalid question, contains PII or other unauthorized text, try again." in response
     mock_log.assert_called()
 
+@pytest.mark.asyncio
+async def test_process_question_rejects_when_pii_pool_is_busy(mocker):
+    """
+    Test that a question whose PII check cannot get a free worker is rejected instead of skipping the check.
+
+    Verifies:
+        - The busy message is returned and the question is not validated.
+        - The timeout is logged with the statistics of the pool.
+    """
+    mocker.patch("logic.orchestrator.PiiPool.run", side_effect=TimeoutError("The PII check waited more than 5s for a free worker."))
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+    mock_log = mocker.patch("logic.orchestrator.Logger.log_error")
+
+    response = await test_orchestrator.process_question("what problems do developers face?")
+
+    assert response == "The service is busy, try again in a moment."
+    mock_validate.assert_not_called()
+    assert mock_log.call_args[0][0] == "PiiCheckTimeout"
+    assert "pii_pool" in mock_log.call_args[0][1]
+
+@pytest.mark.asyncio
+async def test_process_question_rejects_when_not_admitted(mocker):
+    """
+    Test that a question that is not admitted gets the busy message without running the pipeline.
+
+    Verifies:
+        - The busy message is returned and the PII check does not run.
+        - The rejection is logged with its reason and the queue statistics.
+        - The rejection reason is returned by answer_question.
+    """
+    controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    await controller.acquire()
+    mocker.patch.object(test_orchestrator, "admission_controller", controller)
+    mock_pii = mocker.patch("logic.orchestrator.PiiDetector.contains_pii")
+    mock_log = mocker.patch("logic.orchestrator.Logger.log_error")
+
+    response = await test_orchestrator.process_question("what problems do developers face?")
+    result = await test_orchestrator.answer_question("what problems do developers face?")
+
+    assert response == "The service is busy, try again in a moment."
+    assert result["rejected"] == "queue_full"
+    mock_pii.assert_not_called()
+    assert mock_log.call_args[0][0] == "AdmissionRejected"
+    assert mock_log.call_args[0][1]["reason"] == "queue_full"
+    assert mock_log.call_args[0][1]["in_flight"] == 1
+
 @pytest.mark.asyncio
 async def test_process_question_empty_after_sanitize(mocker):
     """
@@ -70,7 +135,7 @@ async def test_process_question_empty_after_sanitize(mocker):
         - Rejected empty question sends the corresponding message.
     """
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value = "")
 
     response = await test_orchestrator.process_question("!!!")
@@ -90,7 +155,7 @@ async def test_process_question_entity_not_found_in_db_first_try(mocker):
     valid_q = Question(value="What is X?", is_valid=True, reasoning=None)
     entities = [Entity(value="nonexistent", type="goal", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value="What is X")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value=(valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value=(EntityList(entities=entities), 0.1))
@@ -133,7 +198,7 @@ async def test_process_question_entity_not_found_in_db_all_tries(mocker):
     valid_q = Question(value="What is Y?", is_valid=True, reasoning=None)
     entities = [Entity(value="nonexistent", type="goal", embedding=[0.1, 0.2, 0.3])]
     
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value = "What is Y")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value = (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value = (EntityList(entities=entities), 0.1))
@@ -164,7 +229,7 @@ async def test_process_question_empty_cypher_query(mocker):
     valid_q = Question(value="Insert a new node of type stakeholder called People", is_valid=True, reasoning=None)
     entities = [Entity(value="People", type="stakeholder", embedding=[0.1, 0.2, 0.3])]
     
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value = "Insert a new node of type stakeholder called People")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value = (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value = (EntityList(entities=entities), 0.1))
@@ -196,7 +261,7 @@ async def test_process_question_no_related_nodes(mocker):
     valid_q = Question(value="How to fix it?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value = "How to fix it")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value = (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value = (EntityList(entities=entities), 0.1))
@@ -229,7 +294,7 @@ async def test_process_question_basic_path(mocker):
         - Related nodes are parsed correctly.
         - Final natural language answer is generated including relevant data.
     """
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value = False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value = False)
     
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value = "What problems do developers face")
 
@@ -319,7 +384,7 @@ async def test_process_question_raises_on_generate_final_answer(mocker):
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -358,7 +423,7 @@ async def test_process_question_raises_on_execute_query(mocker):
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -395,7 +460,7 @@ async def test_process_question_raises_on_create_cypher_query(mocker):
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -431,7 +496,7 @@ async def test_process_question_raises_on_execute_multiple_queries_second(mocker
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -466,7 +531,7 @@ async def test_process_question_raises_on_execute_multiple_queries_first(mocker)
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -498,7 +563,7 @@ async def test_process_question_raises_on_generate_entity_embeddings(mocker):
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
     entities = [Entity(value="X", type="problem", embedding=[0.1, 0.2, 0.3])]
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value= (EntityList(entities=entities), 0.1))
@@ -527,7 +592,7 @@ async def test_process_question_raises_on_extract_entities(mocker):
 
     valid_q = Question(value="What problems?", is_valid=True, reasoning=None)
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value= (valid_q, 0.1))
     mocker.patch("logic.orchestrator.LlmTasks.extract_entities", side_effect=Exception("Mock error"))
@@ -553,7 +618,7 @@ async def test_process_question_raises_on_validate_question(mocker):
         - Error is logged
     """
 
-    mocker.patch("logic.orchestrator.Orchestrator.contains_pii", return_value= False)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value= False)
     mocker.patch("logic.orchestrator.Orchestrator.sanitize_input", return_value= "What problems?")
     mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=Exception("Mock error"))
 
@@ -589,3 +654,762 @@ async def test_process_question_complete_with_valid_question(mocker):
     assert "developers" in response.lower() or "software" in response.lower()
     assert "problem" in response.lower() 
     test_orchestrator.logger.log_data.assert_called()
+
+#------process_question_stream---------
+@pytest.mark.asyncio
+async def test_process_question_stream_yields_message(mocker):
+    """
+    Test that a message from the retrieval steps is streamed as a single chunk.
+
+    Verifies:
+        - The message is the only chunk.
+        - The final answer is not generated.
+    """
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=("Invalid question, try again.", None))
+    mock_answer = mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer_stream")
+
+    chunks = [chunk async for chunk in test_orchestrator.process_question_stream("!!!")]
+
+    assert chunks == ["Invalid question, try again."]
+    mock_answer.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_question_stream_yields_answer(mocker):
+    """
+    Test that the final answer is streamed and the query is registered when it is completed.
+
+    Verifies:
+        - The answer deltas are yielded in order.
+        - The register_query log has the complete answer, the total cost and the time to first token.
+    """
+    async def events():
+        yield SimpleNamespace(type="response.output_text.delta", delta="They face ")
+        yield SimpleNamespace(type="response.output_text.delta", delta="latency issues.")
+        yield SimpleNamespace(type="response.completed", response=None)
+
+    state = {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "related_nodes": {"entities": {}, "relationships": [], "others": {}},
+        "node_scores": {},
+        "total_cost": 0.3,
+        "start": 0.0
+    }
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=(None, state))
+    mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer_stream", return_value=LlmStream(events(), 0.0, lambda stream, response: 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    chunks = [chunk async for chunk in test_orchestrator.process_question_stream("What problems do developers face?")]
+
+    assert chunks == ["They face ", "latency issues."]
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["final_response"] == "They face latency issues."
+    assert round(log["cost"], 2) == 0.31
+    assert log["time_to_first_token_sec"] is not None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stop_early", [False, True])
+async def test_process_question_stream_does_not_register_unfinished_answer(mocker, stop_early):
+    """
+    Test that a streamed answer that fails or is not read to the end is neither cached nor registered.
+
+    Verifies:
+        - A failed response raises and its error is logged.
+        - A consumer that stops early closes the answer stream.
+        - The query is not registered and the answer is not cached.
+    """
+    closed = []
+    async def events():
+        try:
+            yield SimpleNamespace(type="response.output_text.delta", delta="They face ")
+            yield SimpleNamespace(type="response.failed", response=SimpleNamespace(error=SimpleNamespace(message="server_error")))
+        finally:
+            closed.append(True)
+
+    state = {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "sanitized_question": "What problems do developers face",
+        "related_nodes": {"entities": {}, "relationships": [], "others": {}},
+        "node_scores": {},
+        "total_cost": 0.3,
+        "start": 0.0,
+        "graph": "abc"
+    }
+    cache = mocker.Mock()
+    mocker.patch.object(test_orchestrator, "answer_cache", cache)
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=(None, state))
+    mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer_stream", return_value=LlmStream(events(), 0.0, lambda stream, response: 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+    test_orchestrator.logger.log_error = mocker.Mock()
+
+    chunks = test_orchestrator.process_question_stream("What problems do developers face?")
+    if stop_early:
+        assert await anext(chunks) == "They face "
+        await chunks.aclose()
+    else:
+        with pytest.raises(Exception, match="response.failed"):
+            async for chunk in chunks:
+                pass
+        assert test_orchestrator.logger.log_error.call_args[0][0] == "ResponseGenerationError"
+
+    assert closed == [True]
+    test_orchestrator.logger.log_data.assert_not_called()
+    cache.set.assert_not_called()
+
+#------semantic cache---------
+@pytest.mark.asyncio
+async def test_process_question_semantic_cache_hit(mocker):
+    """
+    Test that a question similar to an answered one is answered from the semantic cache.
+
+    Verifies:
+        - The cached answer is returned without validating the question.
+        - The register_query log marks the hit with the cached question and similarity.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600)
+    cache.add("what problems do developers face", [1.0, 0.0], "They face latency issues.", 5.0)
+    mocker.patch.object(test_orchestrator, "semantic_cache", cache)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.embed_question", return_value=([0.99, 0.05], 0.001))
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    message, state = await test_orchestrator.retrieve_context("Which problems do developers face?")
+
+    assert message == "They face latency issues."
+    assert state is None
+    mock_validate.assert_not_called()
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["cache_hit"] is True
+    assert log["cached_question"] == "what problems do developers face"
+    assert log["similarity"] > 0.9
+    assert log["latency_saved_sec"] > 0
+
+@pytest.mark.asyncio
+async def test_process_question_semantic_cache_miss_stores_answer(mocker):
+    """
+    Test that an answered question is added to the semantic cache.
+
+    Verifies:
+        - The final answer is cached with the question embedding.
+        - The register_query log marks the miss.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600)
+    mocker.patch.object(test_orchestrator, "semantic_cache", cache)
+    state = {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "related_nodes": {"entities": {}, "relationships": [], "others": {}},
+        "node_scores": {},
+        "sanitized_question": "What problems do developers face",
+        "question_embedding": [0.0, 1.0],
+        "total_cost": 0.3,
+        "start": 0.0
+    }
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=(None, state))
+    mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer", return_value=("They face latency issues.", 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    response = await test_orchestrator.process_question("What problems do developers face? (semantic cache miss)")
+
+    assert response == "They face latency issues."
+    assert len(cache.entries) == 1
+    assert cache.entries[0]["question"] == "What problems do developers face"
+    assert test_orchestrator.logger.log_data.call_args[0][0]["cache_hit"] is False
+
+#------answer cache---------
+@pytest.mark.asyncio
+async def test_answer_cache_hit_skips_the_pipeline(mocker, tmp_path):
+    """
+    Test that a question answered before, written differently, is answered from the answer cache.
+
+    Verifies:
+        - The cached answer is returned without validating the question.
+        - The register_query log marks the hit with the answer cache and its hit rate.
+    """
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=60, max_bytes=10000)
+    cache.set("What problems do developers face", "They face latency issues.", 5.0, graph=(10, 20))
+    mocker.patch.object(test_orchestrator, "answer_cache", cache)
+    mocker.patch.object(test_orchestrator, "graph_fingerprint", GraphFingerprint(lambda: (10, 20)))
+    await test_orchestrator.graph_fingerprint.refresh()
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    response = await test_orchestrator.process_question("what problems do developers face?")
+
+    assert response == "They face latency issues."
+    mock_validate.assert_not_called()
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["cache_hit"] is True
+    assert log["cache"] == "answer"
+    assert log["answer_cache_hit_rate"] == 1.0
+
+@pytest.mark.asyncio
+async def test_answer_cache_stores_negative_results_but_not_pii(mocker, tmp_path):
+    """
+    Test which messages of a stopped pipeline are cached.
+
+    Verifies:
+        - The message of a question without data in the graph is cached as a negative result of the current graph.
+        - The message of an invalid question is not cached, the LLM response cache already has its validation.
+        - The message of a question with PII is not cached.
+    """
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=60, max_bytes=10000)
+    mocker.patch.object(test_orchestrator, "answer_cache", cache)
+    mocker.patch.object(test_orchestrator, "graph_fingerprint", GraphFingerprint(lambda: (10, 20)))
+    await test_orchestrator.graph_fingerprint.refresh()
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=lambda question: (Question(value=question, is_valid=True, reasoning=None), 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value=(EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)]), 0.01))
+    mock_context_stages(mocker)
+    mocker.patch("logic.orchestrator.Neo4jLogic.parse_related_nodes_results", return_value={"entities": {}, "relationships": [], "others": {}})
+    test_orchestrator.logger.log_error = mocker.Mock()
+
+    message, _ = await test_orchestrator.retrieve_context("What do developers eat?")
+
+    assert cache.get("What do developers eat", (10, 20)) == {"question": "what do developers eat", "answer": message, "negative": True, "duration_sec": pytest.approx(0, abs=1)}
+    assert cache.get("What do developers eat", (11, 20)) is None
+
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value=(Question(value="Who won the match?", is_valid=False, reasoning="Not technical"), 0.01))
+    message, _ = await test_orchestrator.retrieve_context("Who won the match?")
+    assert message.startswith("Your question is not valid.")
+    assert cache.get("Who won the match", (10, 20)) is None
+
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=True)
+    message, _ = await test_orchestrator.retrieve_context("My email is pedro@gmail.com")
+    assert message.startswith("Invalid question, contains PII")
+    assert cache.get("My email is pedrogmailcom", (10, 20)) is None
+
+@pytest.mark.asyncio
+async def test_answer_cache_is_skipped_without_graph_fingerprint(mocker, tmp_path):
+    """
+    Test that nothing is read from or written to the answer cache while the graph fingerprint is unknown.
+
+    Verifies:
+        - The answer is not cached under a key without the graph.
+        - The cache is not looked up.
+        - Once the fingerprint is known, the answer is cached under it.
+    """
+    def fingerprint_fn():
+        raise ConnectionError("Neo4j is down")
+
+    cache = AnswerCache(str(tmp_path / "answers.db"), ttl=60, negative_ttl=60, max_bytes=10000)
+    mocker.patch.object(test_orchestrator, "answer_cache", cache)
+    mocker.patch.object(test_orchestrator, "graph_fingerprint", GraphFingerprint(fingerprint_fn, check_sec=3600))
+    test_orchestrator.graph_fingerprint.logger.log_error = mocker.Mock()
+    await test_orchestrator.graph_fingerprint.refresh()
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=lambda question: (Question(value=question, is_valid=True, reasoning=None), 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value=(EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)]), 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer", return_value=("They face latency issues.", 0.01))
+    mock_context_stages(mocker)
+    mock_get = mocker.spy(cache, "get")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    response = await test_orchestrator.process_question("What problems do developers face?")
+
+    assert response == "They face latency issues."
+    mock_get.assert_not_called()
+    assert cache.store.total_bytes() == 0
+
+    test_orchestrator.graph_fingerprint.fingerprint_fn = lambda: "abc"
+    await test_orchestrator.graph_fingerprint.refresh()
+    await test_orchestrator.process_question("What problems do developers face?")
+    assert cache.get("What problems do developers face", "abc")["answer"] == "They face latency issues."
+
+#------stage cache---------
+@pytest.mark.asyncio
+async def test_stage_cache_reuses_the_stages_of_another_question(mocker, tmp_path):
+    """
+    Test that a different question that reaches the same stage inputs reuses their cached results.
+
+    Verifies:
+        - A question with the same entities and Cypher query does not search the database again.
+        - The state tells which stages were cached and the stage the question resumed from.
+        - Asking the first question again resumes from the final answer. The question analysis is not in the stage cache.
+        - After the graph changes, the database is searched again.
+    """
+    fingerprints = iter([(10, 20), (11, 20)])
+    mocker.patch.object(test_orchestrator, "stage_cache", StageCache(str(tmp_path / "stages.db"), ttl=60, max_bytes=100000))
+    mocker.patch.object(test_orchestrator, "graph_fingerprint", GraphFingerprint(lambda: next(fingerprints), check_sec=3600))
+    await test_orchestrator.graph_fingerprint.refresh()
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=lambda question: (Question(value=question, is_valid=True, reasoning=None), 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value=(EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)]), 0.01))
+    mock_context_stages(mocker)
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    _, first = await test_orchestrator.retrieve_context("What problems do developers face?")
+    _, second = await test_orchestrator.retrieve_context("Which problems affect developers?")
+
+    assert first["cached_stages"] == [] and first["resumed_from"] == "similarity"
+    assert second["cached_stages"] == ["similarity", "cypher_exec"]
+    assert second["resumed_from"] == "cypher_gen"
+    assert second["related_nodes"] == first["related_nodes"]
+    test_orchestrator.neo4j_client.execute_multiple_queries.assert_called_once()
+    test_orchestrator.neo4j_client.execute_query.assert_called_once()
+
+    _, again = await test_orchestrator.retrieve_context("What problems do developers face?")
+    assert again["resumed_from"] == "answer"
+    assert again["question"].value == "What problems do developers face"
+    assert mock_validate.call_count == 3
+
+    await test_orchestrator.graph_fingerprint.refresh()
+    _, changed = await test_orchestrator.retrieve_context("What problems do developers face?")
+    assert changed["cached_stages"] == ["cypher_gen"] and changed["resumed_from"] == "similarity"
+    assert test_orchestrator.neo4j_client.execute_query.call_count == 2
+
+#------question analysis---------
+@pytest.mark.asyncio
+async def test_analyze_question_combined_path(mocker):
+    """
+    Test that the combined path validates the question and extracts its entities with one call.
+
+    Verifies:
+        - The separate tasks are not called.
+        - The analysis statistics have the path and its duration.
+    """
+    valid_q = Question(value="What problems do developers face?", is_valid=True, reasoning=None)
+    entities = EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)])
+    mocker.patch.object(test_orchestrator, "analysis_mode", "combined")
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.LlmTasks.analyze_question", return_value=(valid_q, entities, 0.02))
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+
+    question, extracted, cost, stats = await test_orchestrator.analyze_question("What problems do developers face")
+
+    assert question.is_valid is True
+    assert extracted.entities[0].value == "developers"
+    assert cost == 0.02
+    assert stats["analysis_path"] == "combined"
+    assert stats["analysis_duration_sec"] >= 0
+    mock_validate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_analyze_question_separate_path_stops_on_invalid(mocker):
+    """
+    Test that the separate path does not extract entities from an invalid question.
+
+    Verifies:
+        - Entity extraction is not called and no entities are returned.
+    """
+    invalid_q = Question(value="Who won the match?", is_valid=False, reasoning="Not technical")
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value=(invalid_q, 0.01))
+    mock_extract = mocker.patch("logic.orchestrator.LlmTasks.extract_entities")
+
+    question, extracted, cost, stats = await test_orchestrator.analyze_question("Who won the match")
+
+    assert question.is_valid is False
+    assert extracted is None
+    assert stats["analysis_path"] == "separate"
+    mock_extract.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_analyze_question_shadow_logs_comparison(mocker):
+    """
+    Test that a shadow run executes both paths and logs how much they agree.
+
+    Verifies:
+        - The configured path's result is used and both costs are counted.
+        - The comparison log has the duration of each path, the validity agreement and the entity agreement.
+    """
+    valid_q = Question(value="What problems do developers face?", is_valid=True, reasoning=None)
+    combined_entities = EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None), Entity(value=None, type=EntityEnum.problem, embedding=None)])
+    separate_entities = EntityList(entities=[Entity(value="Developers", type=EntityEnum.stakeholder, embedding=None)])
+    mocker.patch.object(test_orchestrator, "analysis_mode", "combined")
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 100)
+    mocker.patch("logic.orchestrator.LlmTasks.analyze_question", return_value=(valid_q, combined_entities, 0.02))
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value=(valid_q, 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", return_value=(separate_entities, 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    question, extracted, cost, stats = await test_orchestrator.analyze_question("What problems do developers face")
+
+    assert extracted == combined_entities
+    assert round(cost, 2) == 0.04
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["log_type"] == "analysis_comparison"
+    assert log["validity_agrees"] is True
+    assert log["entity_agreement"] == 0.5
+    assert log["combined_duration_sec"] >= 0 and log["separate_duration_sec"] >= 0
+
+#------speculative execution---------
+def mock_context_stages(mocker):
+    """
+    Mock the database and LLM calls of the stages after the question analysis, so a question goes through the whole pipeline.
+    """
+    mocker.patch("logic.orchestrator.LlmTasks.generate_entity_embeddings", return_value=([Entity(value="developers", type=EntityEnum.stakeholder, embedding=[0.1])], 0.01))
+    mocker.patch("logic.orchestrator.Neo4jLogic.generate_similarity_queries", return_value=[{"query": "query", "params": {"embedding": [0.1]}}])
+    mocker.patch("logic.orchestrator.Neo4jClient.execute_multiple_queries", return_value=[{"value": {"name": "developers", "similarity": 0.7, "labels": ["stakeholder"]}}])
+    mocker.patch("logic.orchestrator.Neo4jLogic.parse_similarity_results", return_value={"stakeholder": ["developers"]})
+    mocker.patch("logic.orchestrator.LlmTasks.create_cypher_query", return_value=("MATCH ...", 0.01))
+    mocker.patch("logic.orchestrator.Neo4jClient.execute_query", return_value={"records": {"record": "Info"}})
+    mocker.patch("logic.orchestrator.Neo4jLogic.parse_related_nodes_results", return_value={
+        "entities": {"stakeholder": {"developers": "info"}}, "relationships": [], "others": {}
+    })
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["cancel", "discard"])
+async def test_speculation_does_not_send_question_before_pii_check(mocker, policy):
+    """
+    Test that with speculation a question is not sent to OpenAI, or looked up in the caches, until the PII check clears it.
+
+    Verifies:
+        - The PII message is returned.
+        - The validation, extraction, question embedding and answer cache lookup never start.
+        - The speculation log records the stage that stopped the pipeline and nothing to drop.
+    """
+    mocker.patch.object(test_orchestrator, "speculation_policy", policy)
+    mocker.patch.object(test_orchestrator, "answer_cache", mocker.Mock())
+    mocker.patch.object(test_orchestrator, "semantic_cache", mocker.Mock())
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", side_effect=lambda text: time.sleep(0.05) or True)
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+    mock_extract = mocker.patch("logic.orchestrator.LlmTasks.extract_entities")
+    mock_embed = mocker.patch("logic.orchestrator.LlmTasks.embed_question")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    message, state = await asyncio.wait_for(test_orchestrator.retrieve_context("My email is pedro@gmail.com"), 5)
+
+    assert message == "Invalid question, contains PII or other unauthorized text, try again."
+    assert state is None
+    for mock in (mock_validate, mock_extract, mock_embed, test_orchestrator.answer_cache.get):
+        mock.assert_not_called()
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["log_type"] == "speculation"
+    assert log["outcome"] == "pii"
+    assert log["dropped_stages"] == []
+
+@pytest.mark.asyncio
+async def test_speculation_discard_lets_dropped_work_finish(mocker):
+    """
+    Test that the "discard" policy ignores the speculative work instead of cancelling it.
+
+    Verifies:
+        - The validation message is returned while the extraction is still running.
+        - The extraction finishes in the background and is released afterwards.
+    """
+    finished = asyncio.Event()
+    async def slow_extraction(question):
+        await asyncio.sleep(0.1)
+        finished.set()
+        return EntityList(entities=[]), 0.01
+    mocker.patch.object(test_orchestrator, "speculation_policy", "discard")
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", return_value=(Question(value="Who won the match?", is_valid=False, reasoning="Not technical"), 0.01))
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", side_effect=slow_extraction)
+    test_orchestrator.logger.log_data = mocker.Mock()
+    test_orchestrator.logger.log_error = mocker.Mock()
+
+    message, _ = await test_orchestrator.retrieve_context("Who won the match?")
+    assert message.startswith("Your question is not valid")
+    assert len(test_orchestrator.speculative_tasks) == 1
+
+    await asyncio.wait_for(finished.wait(), 1)
+    await asyncio.sleep(0)
+    assert len(test_orchestrator.speculative_tasks) == 0
+
+@pytest.mark.asyncio
+async def test_speculation_cancels_extraction_on_invalid_question(mocker):
+    """
+    Test that the separate path extracts entities while validating, and drops the extraction of an invalid question.
+
+    Verifies:
+        - Entity extraction starts before the validation finishes.
+        - The extraction is cancelled and no entities are returned.
+    """
+    cancelled = asyncio.Event()
+    async def slow_extraction(question):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    async def slow_validation(question):
+        await asyncio.sleep(0.05)
+        return Question(value="Who won the match?", is_valid=False, reasoning="Not technical"), 0.01
+    mocker.patch.object(test_orchestrator, "speculation_policy", "cancel")
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=slow_validation)
+    mock_extract = mocker.patch("logic.orchestrator.LlmTasks.extract_entities", side_effect=slow_extraction)
+
+    question, extracted, cost = await test_orchestrator.run_separate_analysis("Who won the match")
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+    assert question.is_valid is False
+    assert extracted is None
+    mock_extract.assert_called_once_with("Who won the match")
+
+@pytest.mark.asyncio
+async def test_speculation_cancels_extract_stage_on_invalid_question(mocker):
+    """
+    Test that the pipeline extracts entities while validating, and cancels the extraction of an invalid question.
+
+    Verifies:
+        - The validation message is returned.
+        - The extract stage runs on the sanitized question and is cancelled.
+    """
+    cancelled = asyncio.Event()
+    async def slow_extraction(question):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    async def slow_validation(question):
+        await asyncio.sleep(0.05)
+        return Question(value="Who won the match?", is_valid=False, reasoning="Not technical"), 0.01
+    mocker.patch.object(test_orchestrator, "speculation_policy", "cancel")
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=slow_validation)
+    mock_extract = mocker.patch("logic.orchestrator.LlmTasks.extract_entities", side_effect=slow_extraction)
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    message, state = await asyncio.wait_for(test_orchestrator.retrieve_context("Who won the match?"), 5)
+    await asyncio.wait_for(cancelled.wait(), 1)
+
+    assert message == "Your question is not valid. Reason: Not technical"
+    mock_extract.assert_called_once_with("Who won the match")
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["outcome"] == "validate"
+    assert log["dropped_stages"] == ["extract"]
+
+@pytest.mark.asyncio
+async def test_speculation_logs_time_saved(mocker):
+    """
+    Test that a question that passes every check uses the speculative results and logs the time saved.
+
+    Verifies:
+        - The validation and the entity extraction overlap, so the stages take longer in total than the wall time.
+        - The speculation log records the "used" outcome, the stage durations and the success rate.
+    """
+    async def slow_validation(question):
+        await asyncio.sleep(0.2)
+        return Question(value=question, is_valid=True, reasoning=None), 0.01
+    async def slow_extraction(question):
+        await asyncio.sleep(0.2)
+        return EntityList(entities=[Entity(value="developers", type=EntityEnum.stakeholder, embedding=None)]), 0.01
+    mocker.patch.object(test_orchestrator, "speculation_policy", "cancel")
+    mocker.patch.object(test_orchestrator, "speculation_counts", {"attempts": 1, "successes": 0})
+    mocker.patch("logic.orchestrator.QUESTION_ANALYSIS_SHADOW_PERCENT", 0)
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mocker.patch("logic.orchestrator.LlmTasks.validate_question", side_effect=slow_validation)
+    mocker.patch("logic.orchestrator.LlmTasks.extract_entities", side_effect=slow_extraction)
+    mock_context_stages(mocker)
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    message, state = await test_orchestrator.retrieve_context("What problems do developers face?")
+
+    assert message is None
+    assert state["analysis"]["analysis_path"] == "separate"
+    assert state["total_cost"] == pytest.approx(0.04)
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["outcome"] == "used"
+    assert {"pii", "sanitize", "validate", "extract", "embed", "similarity", "retry", "cypher_gen", "cypher_exec"} == set(log["stage_durations"])
+    assert log["time_saved_sec"] > 0.1
+    assert log["success_rate"] == 0.5
+
+#------answer_question---------
+@pytest.mark.asyncio
+async def test_answer_question_returns_cost_and_stage_timings(mocker):
+    """
+    Test that answer_question returns the answer with its cost and the duration of each step.
+
+    Verifies:
+        - The timings of the context steps and the final answer generation are returned and logged.
+        - A pipeline that stops early returns its message without cost.
+    """
+    state = {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "related_nodes": {"entities": {}, "relationships": [], "others": {}},
+        "node_scores": {},
+        "sanitized_question": "What problems do developers face",
+        "question_embedding": None,
+        "total_cost": 0.3,
+        "start": time.time()
+    }
+    async def retrieve(userQuestion, stage_timings):
+        stage_timings["cypher_generation"] = 0.5
+        return None, state
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", side_effect=retrieve)
+    mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer", return_value=("They face latency issues.", 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    result = await test_orchestrator.answer_question("What problems do developers face?")
+
+    assert result["answer"] == "They face latency issues."
+    assert result["cost"] == pytest.approx(0.31)
+    assert set(result["stage_timings"]) == {"cypher_generation", "answer"}
+    assert test_orchestrator.logger.log_data.call_args[0][0]["stage_timings"] == result["stage_timings"]
+
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=("Invalid question, try again.", None))
+    result = await test_orchestrator.answer_question("???")
+    assert result["answer"] == "Invalid question, try again."
+    assert result["cost"] is None
+
+#------latency budget---------
+def build_answer_state():
+    """
+    Build the pipeline state of a question whose context was retrieved.
+    """
+    return {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "related_nodes": {
+            "entities": {"stakeholders": {"developers": {"description": "People writing code.", "labels": ["stakeholder"], "hypernym": "team members"}}},
+            "relationships": [],
+            "others": {"problemsCount": 3}
+        },
+        "node_scores": {"developers": 0.9},
+        "sanitized_question": "What problems do developers face",
+        "question_embedding": None,
+        "graph": None,
+        "total_cost": 0.3,
+        "start": time.time()
+    }
+
+@pytest.mark.asyncio
+async def test_retry_is_skipped_when_deadline_is_close(mocker):
+    """
+    Test that the retry without labels is skipped when the deadline is close and some nodes were already found.
+
+    Verifies:
+        - The database is not queried and the nodes already found are used.
+        - The "skip_retry" degradation is recorded with the entities not found.
+        - The retry still runs when no node was found.
+    """
+    mock_db = mocker.patch("logic.orchestrator.Neo4jClient.execute_multiple_queries", return_value=[])
+    mocker.patch("logic.orchestrator.Neo4jLogic.generate_similarity_queries_no_label", return_value=[])
+    test_orchestrator.logger.log_data = mocker.Mock()
+    test_orchestrator.logger.log_error = mocker.Mock()
+    state = {
+        "question": Question(value="What problems do developers face?", is_valid=True, reasoning=None),
+        "similar_nodes": {"stakeholder": ["developers"], "problem": None},
+        "not_found": [Entity(value="problems", type=EntityEnum.problem, embedding=[0.1])],
+        "similarity_scores": {"developers": 0.9}
+    }
+
+    with LatencyBudget.start_budget(5) as budget:
+        outputs = await test_orchestrator.retry_stage(state)
+        assert outputs["relevant_nodes"] == {"stakeholder": ["developers"], "problem": None}
+        mock_db.assert_not_called()
+        assert budget.degradations[0]["name"] == "skip_retry"
+        assert budget.degradations[0]["entities"] == ["problems"]
+
+        state["similar_nodes"] = {"problem": None}
+        with pytest.raises(StageStop):
+            await test_orchestrator.retry_stage(state)
+        mock_db.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_answer_question_uses_fast_model_and_smaller_context_near_deadline(mocker):
+    """
+    Test that the final answer is generated with the faster model and the smaller context when the deadline is close.
+
+    Verifies:
+        - The answer is generated with the fast model and the capped token budget.
+        - The register_query log has the deadline and the degradations that fired.
+    """
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", side_effect=lambda *args: (None, build_answer_state()))
+    mock_answer = mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer", return_value=("They face latency issues.", 0.01))
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    result = await test_orchestrator.answer_question("What problems do developers face?", deadline_sec=5)
+
+    assert result["answer"] == "They face latency issues."
+    assert mock_answer.call_args.kwargs == {"model": DEADLINE_FAST_MODEL, "token_budget": DEADLINE_CONTEXT_TOKEN_BUDGET}
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["deadline_sec"] == 5
+    assert [d["name"] for d in log["degradations"]] == ["fast_model", "cap_context"]
+
+    await test_orchestrator.answer_question("What problems do developers face?", deadline_sec=0)
+    assert mock_answer.call_args.kwargs == {"model": None, "token_budget": None}
+    assert test_orchestrator.logger.log_data.call_args[0][0]["degradations"] == []
+
+@pytest.mark.asyncio
+async def test_answer_question_returns_partial_answer_without_time_left(mocker):
+    """
+    Test that a partial answer is built from the context when there is no time to generate the final answer.
+
+    Verifies:
+        - Without time for the LLM call, it is not called and the partial answer has the best ranked context.
+        - A generation that times out once the deadline passed also returns the partial answer.
+        - Partial answers are not cached.
+    """
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", side_effect=lambda *args: (None, build_answer_state()))
+    mock_answer = mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer", return_value=("They face latency issues.", 0.01))
+    mocker.patch.object(test_orchestrator, "answer_cache", mocker.Mock())
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    result = await test_orchestrator.answer_question("What problems do developers face?", deadline_sec=1)
+
+    mock_answer.assert_not_called()
+    assert result["answer"].startswith("There was no time to write a full answer.")
+    assert "problemsCount" in result["answer"] and "developers" in result["answer"]
+    assert result["cost"] == pytest.approx(0.3)
+    assert test_orchestrator.logger.log_data.call_args[0][0]["degradations"][0]["reason"] == "deadline"
+
+    async def timeout(*args, **kwargs):
+        LatencyBudget.get_current().start -= 100
+        raise TimeoutError("The rag_answer_generation call did not finish")
+    mock_answer.side_effect = timeout
+
+    result = await test_orchestrator.answer_question("What problems do developers face?", deadline_sec=60)
+
+    assert result["answer"].startswith("There was no time to write a full answer.")
+    assert test_orchestrator.logger.log_data.call_args[0][0]["degradations"][-1]["reason"] == "timeout"
+    test_orchestrator.answer_cache.set.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_question_stream_yields_partial_answer_without_time_left(mocker):
+    """
+    Test that the streamed pipeline yields the partial answer as a single chunk when there is no time to generate the final answer.
+
+    Verifies:
+        - The answer stream is not started.
+        - The partial answer is logged with its degradation.
+    """
+    mocker.patch("logic.orchestrator.Orchestrator.retrieve_context", return_value=(None, build_answer_state()))
+    mock_answer = mocker.patch("logic.orchestrator.LlmTasks.generate_final_answer_stream")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    chunks = [chunk async for chunk in test_orchestrator.process_question_stream("What problems do developers face?", deadline_sec=1)]
+
+    mock_answer.assert_not_called()
+    assert len(chunks) == 1 and chunks[0].startswith("There was no time to write a full answer.")
+    log = test_orchestrator.logger.log_data.call_args[0][0]
+    assert log["final_response"] == chunks[0]
+    assert [d["name"] for d in log["degradations"]] == ["partial_answer"]
+
+#------intent fast path---------
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", ["off", "cancel"])
+async def test_capability_question_is_answered_without_api_calls(mocker, policy):
+    """
+    Test that a question about the system is answered with the response of its intent before any LLM or database call.
+
+    Verifies:
+        - The intent's response is returned, with or without speculation.
+        - The question is not validated, analyzed or embedded, and the database is not queried.
+        - The register_query log has the intent and how it matched.
+    """
+    mocker.patch.object(test_orchestrator, "speculation_policy", policy)
+    mocker.patch.object(test_orchestrator, "intent_classifier", IntentClassifier(path=""))
+    mocker.patch("logic.orchestrator.PiiDetector.contains_pii", return_value=False)
+    mock_validate = mocker.patch("logic.orchestrator.LlmTasks.validate_question")
+    mock_extract = mocker.patch("logic.orchestrator.LlmTasks.extract_entities")
+    mock_analyze = mocker.patch("logic.orchestrator.Orchestrator.analyze_question")
+    mock_db = mocker.patch("logic.orchestrator.Neo4jClient.execute_multiple_queries")
+    test_orchestrator.logger.log_data = mocker.Mock()
+
+    result = await test_orchestrator.answer_question("What can you answer?")
+
+    assert result["answer"] == test_orchestrator.intent_classifier.intents["capabilities"]["response"]
+    assert result["cost"] is None
+    for mock in (mock_validate, mock_extract, mock_analyze, mock_db):
+        mock.assert_not_called()
+    log = test_orchestrator.logger.log_data.call_args_list[0][0][0]
+    assert log["intent"] == "capabilities" and log["intent_match"] == "exact"
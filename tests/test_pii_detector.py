@@ -0,0 +1,114 @@
+import pytest
+from logic.pii_detector import PiiDetector
+
+@pytest.fixture
+def detector(mocker):
+    """
+    PiiDetector whose PERSON analyzer is a mock that finds no names.
+    """
+    detector = PiiDetector()
+    analyzer = mocker.Mock()
+    analyzer.analyze.return_value = []
+    mocker.patch.object(detector, "get_person_analyzer", return_value=analyzer)
+    return detector
+
+#------find_pattern_pii---------
+@pytest.mark.parametrize("text, entity", [
+    ("write to info@museum.com about the tour", "EMAIL_ADDRESS"),
+    ("see https://example.org/page for the details", "URL"),
+    ("send the refund to es91 2100 0418 4502 0005 1332 please", "IBAN_CODE"),
+    ("my card is 4111 1111 1111 1111", "CREDIT_CARD"),
+    ("my nif is 12345678z", "ES_NIF"),
+    ("my nie is x1234567l", "ES_NIE"),
+    ("the server 192.168.1.10 returns an error", "IP_ADDRESS"),
+    ("send it to 1BoatSLRHtKNngkdXEeobR76b53LETtpyT", "CRYPTO"),
+    ("send it to bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdq", "CRYPTO"),
+    ("my dea number is ab1234563", "MEDICAL_LICENSE"),
+    ("call me at +34 612 345 678", "PHONE_NUMBER"),
+])
+def test_find_pattern_pii_detects_entities(detector, text, entity):
+    """
+    Test that the pattern recognizers detect each type of PII in lowercased questions.
+
+    Verifies:
+        - The entity type of the PII is returned.
+    """
+    assert detector.find_pattern_pii(text) == entity
+
+@pytest.mark.parametrize("text", [
+    "what problems do the software developers from europe face?",
+    "what was the population of madrid in 2020 and 2021?",
+    "what happened at 10:30 in the morning?",
+    "my nif is 12345678a",
+    "my dea number is ab1234564",
+    "which frameworks use asp.net?",
+])
+def test_find_pattern_pii_ignores_invalid_values(detector, text):
+    """
+    Test that text without PII and values with a wrong checksum are not detected.
+
+    Verifies:
+        - Years, times and technology names are not PII.
+        - NIF and DEA numbers with a wrong control character are rejected.
+    """
+    assert detector.find_pattern_pii(text) is None
+
+def test_validators_check_checksums():
+    """
+    Test the checksum validation functions.
+
+    Verifies:
+        - Valid card numbers, IBANs and Bitcoin addresses are accepted and the ones with a changed character are rejected.
+    """
+    assert PiiDetector.is_luhn_valid("4111111111111111") is True
+    assert PiiDetector.is_luhn_valid("4111111111111112") is False
+    assert PiiDetector.is_iban_valid("ES9121000418450200051332") is True
+    assert PiiDetector.is_iban_valid("ES9121000418450200051333") is False
+    assert PiiDetector.is_crypto_valid("1BoatSLRHtKNngkdXEeobR76b53LETtpyT") is True
+    assert PiiDetector.is_crypto_valid("1BoatSLRHtKNngkdXEeobR76b53LETtpyU") is False
+    assert PiiDetector.is_crypto_valid("bc1qar0srrr7xfkvy5l643lydnw9re59gtzzwf5mdp") is False
+
+#------detect---------
+def test_detect_skips_person_recognizer_after_pattern_match(detector):
+    """
+    Test that the PERSON recognizer does not run when a pattern recognizer already found PII.
+
+    Verifies:
+        - The pattern entity is returned.
+        - The PERSON analyzer is not loaded or called.
+    """
+    assert detector.detect("my name is pedro and my email is pedro@gmail.com") == "EMAIL_ADDRESS"
+    detector.get_person_analyzer.assert_not_called()
+
+def test_detect_runs_person_recognizer_on_clean_text(detector):
+    """
+    Test that questions without pattern PII are checked for names, only for the PERSON entity.
+
+    Verifies:
+        - The PERSON analyzer is called with the PERSON entity.
+        - A detected name is reported as PERSON and no name as no PII.
+    """
+    analyzer = detector.get_person_analyzer.return_value
+    assert detector.contains_pii("what problems do the developers face?") is False
+    analyzer.analyze.assert_called_once_with(text="what problems do the developers face?", entities=["PERSON"], language="en")
+
+    analyzer.analyze.return_value = ["PERSON result"]
+    assert detector.detect("who is john smith?") == "PERSON"
+
+def test_person_analyzer_is_loaded_once_and_shared(mocker):
+    """
+    Test that the PERSON analyzer is loaded lazily and shared by the detectors of the process.
+
+    Verifies:
+        - Creating a detector does not load the analyzer.
+        - Two detectors with the same spaCy model use the same analyzer, loaded once.
+    """
+    mocker.patch.object(PiiDetector, "person_analyzers", {})
+    engine = mocker.patch("presidio_analyzer.AnalyzerEngine")
+    mocker.patch("presidio_analyzer.nlp_engine.SpacyNlpEngine")
+
+    first, second = PiiDetector("test_model"), PiiDetector("test_model")
+    engine.assert_not_called()
+
+    assert first.get_person_analyzer() is second.get_person_analyzer()
+    engine.assert_called_once()
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import pytest
+from logic.pii_pool import PiiPool
+
+@pytest.fixture
+def pool(mocker):
+    """
+    Thread PiiPool with one worker and its own executor, whose workers do not load the analyzer.
+    """
+    mocker.patch.object(PiiPool, "executors", {})
+    mocker.patch.object(PiiPool, "warm_ups", {})
+    mocker.patch.object(PiiPool, "init_worker")
+    pool = PiiPool(mode="thread", workers=1, queue_timeout=0.2)
+    yield pool
+    pool.get_executor().shutdown(wait=True, cancel_futures=True)
+
+@pytest.mark.asyncio
+async def test_run_checks_in_worker_thread(pool):
+    """
+    Test that the check runs in a worker of the pool and not in the event loop.
+
+    Verifies:
+        - The result of the check and its queue wait are returned.
+        - The check runs in a pool thread.
+        - The check is counted in the statistics.
+    """
+    loop_thread = threading.current_thread().name
+
+    result, queue_wait = await pool.run(lambda text: (text, threading.current_thread().name), "hello")
+
+    assert result[0] == "hello"
+    assert result[1] != loop_thread and result[1].startswith("pii")
+    assert queue_wait >= 0
+    assert pool.get_stats()["checks"] == 1
+
+@pytest.mark.asyncio
+async def test_run_rejects_checks_that_wait_too_long(pool):
+    """
+    Test that a check that cannot get a free worker before the queue timeout is rejected, while the running one finishes.
+
+    Verifies:
+        - The queued check raises a TimeoutError and never runs.
+        - The check that was already running is awaited after the timeout.
+        - The timeout and the maximum queue wait are counted.
+    """
+    release = threading.Event()
+    calls = []
+    def slow(text):
+        calls.append(text)
+        release.wait(5)
+        return True
+
+    running = asyncio.create_task(pool.run(slow, "first"))
+    await asyncio.sleep(0.05)
+    with pytest.raises(TimeoutError):
+        await pool.run(slow, "second")
+    await asyncio.sleep(0.3) #Longer than the queue timeout of the running check
+    release.set()
+
+    assert (await running)[0] is True
+    assert calls == ["first"]
+    stats = pool.get_stats()
+    assert stats["timeouts"] == 1
+    assert stats["checks"] == 1
+
+@pytest.mark.asyncio
+async def test_analyzer_loading_does_not_count_against_queue_timeout(mocker):
+    """
+    Test that the workers are started by warm_up() and the first check waits for them without the queue timeout.
+
+    Verifies:
+        - warm_up() submits one task per worker once and returns the same tasks afterwards.
+        - A check sent while the analyzer loads for longer than the queue timeout is answered, with no queue wait.
+    """
+    mocker.patch.object(PiiPool, "executors", {})
+    mocker.patch.object(PiiPool, "warm_ups", {})
+    mocker.patch.object(PiiPool, "init_worker", side_effect=lambda model: time.sleep(0.4))
+    pool = PiiPool(mode="thread", workers=2, queue_timeout=0.2)
+
+    warm_ups = pool.warm_up()
+    assert len(warm_ups) == 2 and pool.warm_up() is warm_ups
+
+    result, queue_wait = await pool.run(lambda text: text, "hello")
+
+    assert result == "hello"
+    assert queue_wait < 0.2
+    assert pool.get_stats()["timeouts"] == 0
+    pool.get_executor().shutdown(wait=True)
+
+def test_executors_are_shared_and_settings_checked(mocker):
+    """
+    Test that the pools with the same settings share their executor and that invalid settings are rejected.
+
+    Verifies:
+        - Two pools with the same settings return the same executor, and a pool with other settings a different one.
+        - An unknown mode or no workers raise a ValueError.
+    """
+    mocker.patch.object(PiiPool, "executors", {})
+    mocker.patch.object(PiiPool, "warm_ups", {})
+    first, second, other = PiiPool("thread", 2, 1), PiiPool("thread", 2, 1), PiiPool("thread", 3, 1)
+
+    assert first.get_executor() is second.get_executor()
+    assert first.get_executor() is not other.get_executor()
+    with pytest.raises(ValueError):
+        PiiPool("fiber", 2, 1)
+    with pytest.raises(ValueError):
+        PiiPool("thread", 0, 1)
+    first.get_executor().shutdown()
+    other.get_executor().shutdown()
@@ -0,0 +1,36 @@
+import pytest
+from pydantic import ValidationError
+from app.models.question_analysis import QuestionAnalysis
+
+def test_question_analysis_splits_into_question_and_entities():
+    """
+    Test that a QuestionAnalysis is converted into the Question and EntityList models of the two-call path.
+
+    Verifies:
+        - The Question has the value, validity and reasoning.
+        - The EntityList has the entities.
+    """
+    analysis = QuestionAnalysis(
+        value="What problems do developers face?",
+        is_valid=True,
+        reasoning=None,
+        entities=[{"value": "developers", "type": "stakeholder", "embedding": None}]
+    )
+
+    question = analysis.to_question()
+    entity_list = analysis.to_entity_list()
+
+    assert question.value == "What problems do developers face?"
+    assert question.is_valid is True
+    assert question.reasoning is None
+    assert entity_list.entities[0].type == "stakeholder"
+
+def test_question_analysis_requires_entities():
+    """
+    Test that omitting the entities raises ValidationError.
+
+    Verifies:
+        - The model enforces presence of all required fields.
+    """
+    with pytest.raises(ValidationError):
+        QuestionAnalysis(value="What problems are there?", is_valid=True, reasoning=None)
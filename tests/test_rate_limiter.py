@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from app.llm.rate_limiter import RateLimiter
+
+#-------acquire------
+@pytest.mark.asyncio
+async def test_acquire_waits_for_token_limit(mocker):
+    """
+    Test that a call over the tokens per minute waits in the queue instead of failing.
+
+    Verifies:
+        - The first call is not delayed.
+        - The second call waits until the token bucket is refilled.
+    """
+    mock_sleep = mocker.patch("app.llm.rate_limiter.asyncio.sleep", new_callable=mocker.AsyncMock)
+    limiter = RateLimiter(rpm_limit=100, tpm_limit=600) #10 tokens per second
+
+    assert await limiter.acquire("gpt-4.1", 600) == 0.0
+    wait = await limiter.acquire("gpt-4.1", 100)
+
+    assert wait == pytest.approx(10, abs=0.05)
+    mock_sleep.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_acquire_gives_back_cancelled_reservation(mocker):
+    """
+    Test that a call cancelled while it waits in the queue gives back its reservation.
+
+    Verifies:
+        - The cancellation is raised to the caller.
+        - The next call only waits for the calls that are still queued.
+    """
+    mocker.patch("app.llm.rate_limiter.asyncio.sleep", new_callable=mocker.AsyncMock, side_effect=asyncio.CancelledError)
+    limiter = RateLimiter(rpm_limit=100, tpm_limit=600) #10 tokens per second
+
+    await limiter.acquire("gpt-4.1", 600)
+    with pytest.raises(asyncio.CancelledError):
+        await limiter.acquire("gpt-4.1", 300)
+
+    request_bucket, token_bucket = limiter.get_buckets("gpt-4.1")
+    assert token_bucket.reserve(0) == pytest.approx(0, abs=0.05)
+    assert request_bucket.level == pytest.approx(99, abs=0.05)
+
+@pytest.mark.asyncio
+async def test_acquire_limits_each_model_separately(mocker):
+    """
+    Test that each model has its own buckets.
+
+    Verifies:
+        - Exhausting a model does not delay another one.
+    """
+    mocker.patch("app.llm.rate_limiter.asyncio.sleep", new_callable=mocker.AsyncMock)
+    limiter = RateLimiter(rpm_limit=1, tpm_limit=0)
+
+    await limiter.acquire("gpt-4.1", 10)
+
+    assert await limiter.acquire("gpt-4.1-mini", 10) == 0.0
+    assert await limiter.acquire("gpt-4.1", 10) > 0
+
+@pytest.mark.asyncio
+async def test_acquire_disabled_limits(mocker):
+    """
+    Test that limits set to 0 are disabled.
+
+    Verifies:
+        - No call waits and no buckets are created.
+    """
+    limiter = RateLimiter(rpm_limit=0, tpm_limit=0)
+
+    for _ in range(10):
+        assert await limiter.acquire("gpt-4.1", 10**9) == 0.0
+    assert limiter.get_buckets("gpt-4.1") == (None, None)
+
+#-------record_usage------
+@pytest.mark.asyncio
+async def test_record_usage_corrects_estimate(mocker):
+    """
+    Test that the real usage replaces the estimate in the token bucket.
+
+    Verifies:
+        - Extra tokens used delay the next call.
+    """
+    mocker.patch("app.llm.rate_limiter.asyncio.sleep", new_callable=mocker.AsyncMock)
+    limiter = RateLimiter(rpm_limit=0, tpm_limit=600)
+
+    await limiter.acquire("gpt-4.1", 100)
+    limiter.record_usage("gpt-4.1", 100, 600)
+
+    assert await limiter.acquire("gpt-4.1", 100) == pytest.approx(10, abs=0.05)
@@ -0,0 +1,118 @@
+import pytest
+from logic.semantic_cache import SemanticCache
+
+#------lookup---------
+def test_lookup_hit_over_threshold():
+    """
+    Test that a similar question returns the cached answer.
+
+    Verifies:
+        - The entry with the most similar embedding is returned.
+        - The similarity is the cosine similarity and a hit is counted.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+    cache.add("question b", [0.0, 2.0], "answer b", 1.0)
+
+    entry, similarity = cache.lookup([0.0, 1.0])
+
+    assert entry["answer"] == "answer b"
+    assert similarity == pytest.approx(1.0)
+    assert cache.hits == 1
+
+def test_lookup_miss_under_threshold():
+    """
+    Test that a question that is not similar enough is not answered from the cache.
+
+    Verifies:
+        - No entry is returned under the threshold.
+        - A miss is counted and reflected in the hit rate.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+
+    entry, similarity = cache.lookup([1.0, 1.0])
+
+    assert entry is None
+    assert similarity == pytest.approx(0.7071, abs=1e-3)
+    assert cache.misses == 1
+    assert cache.hit_rate() == 0.0
+
+#------add---------
+def test_add_evicts_least_recently_used():
+    """
+    Test that the least recently used entry is evicted when the cache is full.
+
+    Verifies:
+        - An entry used by a lookup is kept.
+        - The entry that was not used is removed.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=2, ttl=3600)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+    cache.add("question b", [0.0, 1.0], "answer b", 1.0)
+    cache.entries[1]["last_used"] -= 10
+    cache.lookup([1.0, 0.0])
+
+    cache.add("question c", [1.0, 1.0], "answer c", 1.0)
+
+    assert [entry["question"] for entry in cache.entries] == ["question a", "question c"]
+    assert cache.matrix.shape == (2, 2)
+
+#------expiration---------
+def test_lookup_removes_expired_entries():
+    """
+    Test that entries older than the time to live are not returned.
+
+    Verifies:
+        - The expired entry is removed before the search.
+    """
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=60)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+    cache.entries[0]["created"] -= 120
+
+    entry, _ = cache.lookup([1.0, 0.0])
+
+    assert entry is None
+    assert cache.entries == []
+
+#------check_graph---------
+def test_check_graph_clears_on_change():
+    """
+    Test that the cache is cleared when the graph fingerprint changes.
+
+    Verifies:
+        - The first fingerprint is only stored.
+        - A different fingerprint removes all the entries.
+    """
+    fingerprints = iter([(10, 20), (11, 20)])
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600, fingerprint_fn=lambda: next(fingerprints), graph_check_sec=0)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+
+    entry, _ = cache.lookup([1.0, 0.0])
+    assert entry is not None
+
+    entry, _ = cache.lookup([1.0, 0.0])
+    assert entry is None
+    assert cache.entries == []
+
+def test_check_graph_keeps_entries_when_the_fingerprint_is_unknown():
+    """
+    Test that a graph check that fails, or has no fingerprint yet, does not break the lookup or clear the cache.
+
+    Verifies:
+        - A missing fingerprint and an error are not a graph change.
+        - The entry is still returned after them.
+    """
+    def fingerprint_fn():
+        fingerprint = next(fingerprints)
+        if isinstance(fingerprint, Exception):
+            raise fingerprint
+        return fingerprint
+
+    fingerprints = iter([(10, 20), None, ConnectionError("Neo4j is down"), (10, 20)])
+    cache = SemanticCache(threshold=0.9, max_entries=10, ttl=3600, fingerprint_fn=fingerprint_fn, graph_check_sec=0)
+    cache.add("question a", [1.0, 0.0], "answer a", 1.0)
+
+    for _ in range(4):
+        entry, _ = cache.lookup([1.0, 0.0])
+        assert entry["answer"] == "answer a"
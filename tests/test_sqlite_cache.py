@@ -0,0 +1,93 @@
+from app.data.sqlite_cache import SqliteCache
+import pytest
+
+#-------get / set------
+def test_set_and_get(tmp_path):
+    """
+    Test that stored values are returned and counted as hits.
+
+    Verifies:
+        - The stored value is returned.
+        - Missing keys return None.
+        - Hits and misses are counted.
+    """
+    cache = SqliteCache(str(tmp_path / "cache.db"), "test", max_bytes=1000)
+    cache.set("a", b"value")
+
+    assert cache.get("a") == b"value"
+    assert cache.get("b") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_get_expired_entry(tmp_path):
+    """
+    Test that expired entries are not returned.
+
+    Verifies:
+        - An entry with a negative TTL is treated as missing.
+    """
+    cache = SqliteCache(str(tmp_path / "cache.db"), "test", max_bytes=1000)
+    cache.set("a", b"value", ttl=-1)
+
+    assert cache.get("a") is None
+
+def test_shared_between_instances(tmp_path):
+    """
+    Test that two caches using the same file share the entries, as different processes would.
+
+    Verifies:
+        - A value stored by one instance is read by the other.
+    """
+    path = str(tmp_path / "cache.db")
+    SqliteCache(path, "test", max_bytes=1000).set("a", b"value")
+
+    assert SqliteCache(path, "test", max_bytes=1000).get("a") == b"value"
+
+#-------evict------
+def test_evicts_least_recently_used(tmp_path):
+    """
+    Test that the least recently used entries are evicted when the size limit is exceeded.
+
+    Verifies:
+        - The total size stays under the limit.
+        - The recently read entry is kept and the oldest one is removed.
+    """
+    cache = SqliteCache(str(tmp_path / "cache.db"), "test", max_bytes=10)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.get("a")
+    cache.set("c", b"12345")
+
+    assert cache.total_bytes() <= 10
+    assert cache.get("a") == b"12345"
+    assert cache.get("b") is None
+
+def test_set_only_sums_sizes_over_the_limit(tmp_path):
+    """
+    Test that the total size is only summed when the running estimate goes over the limit.
+
+    Verifies:
+        - Writes under the limit do not sum the sizes of the table.
+        - The write that goes over the limit evicts and resets the estimate to the remaining size.
+    """
+    cache = SqliteCache(str(tmp_path / "cache.db"), "test", max_bytes=10)
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    assert not any("SUM(size)" in statement for statement in statements)
+
+    cache.set("c", b"12345")
+    assert any("SUM(size)" in statement for statement in statements)
+    assert cache.size == cache.total_bytes() == 10
+
+def test_invalid_table_name(tmp_path):
+    """
+    Test that table names that could inject SQL are rejected.
+
+    Verifies:
+        - A ValueError is raised.
+    """
+    with pytest.raises(ValueError):
+        SqliteCache(str(tmp_path / "cache.db"), "test; DROP TABLE x", max_bytes=10)
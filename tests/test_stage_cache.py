@@ -0,0 +1,32 @@
+from app.data.stage_cache import StageCache
+
+#-------get / set------
+def test_set_and_get_by_stage_and_input(tmp_path):
+    """
+    Test that a stage result is found by the stage name and an equal input.
+
+    Verifies:
+        - Inputs with the same content in a different key order share the result.
+        - Another stage or input misses.
+        - Hits and misses are counted by stage.
+    """
+    cache = StageCache(str(tmp_path / "stages.db"), ttl=60, max_bytes=10000)
+    cache.set("cypher_gen", {"question": "Q", "nodes": {"goal": ["good"]}}, "MATCH (n) RETURN n")
+
+    assert cache.get("cypher_gen", {"nodes": {"goal": ["good"]}, "question": "Q"}) == "MATCH (n) RETURN n"
+    assert cache.get("cypher_exec", {"question": "Q", "nodes": {"goal": ["good"]}}) is None
+    assert cache.get("cypher_gen", {"question": "Q", "nodes": {"goal": ["bad"]}}) is None
+    assert cache.hits == {"cypher_gen": 1}
+    assert cache.misses == {"cypher_exec": 1, "cypher_gen": 1}
+
+def test_get_expired(tmp_path):
+    """
+    Test that stage results expire after the TTL.
+
+    Verifies:
+        - An expired result is not returned.
+    """
+    cache = StageCache(str(tmp_path / "stages.db"), ttl=-1, max_bytes=10000)
+    cache.set("similarity", [["goal", "abc"]], [{"value": {"name": "good"}}])
+
+    assert cache.get("similarity", [["goal", "abc"]]) is None
@@ -0,0 +1,181 @@
+import asyncio
+import time
+import pytest
+from logic.stage import Stage, StageStop
+from logic.stage_graph import StageGraph
+
+def make_stage(name, inputs, outputs, delay=0.0, result=None, error=None, calls=None, **kwargs):
+    """
+    Build a stage that waits, records its call and returns one value per output, or raises an error.
+    """
+    async def run(state):
+        if calls is not None:
+            calls.append((name, time.time()))
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return {output: (result if result is not None else f"{name}:{output}") for output in outputs}
+    return Stage(name, run, inputs, outputs, **kwargs)
+
+@pytest.mark.asyncio
+async def test_run_starts_independent_stages_concurrently(mocker):
+    """
+    Test that stages that do not depend on each other run at the same time.
+
+    Verifies:
+        - Two independent stages take about as long as one.
+        - A stage that reads both outputs runs after them and receives them in the state.
+        - The duration of each stage is stored.
+    """
+    async def join(state):
+        return {"c": state["a"] + state["b"]}
+    graph = StageGraph([
+        make_stage("a", ["x"], ["a"], delay=0.2, result="A"),
+        make_stage("b", ["x"], ["b"], delay=0.2, result="B"),
+        Stage("c", join, ["a", "b"], ["c"])
+    ], logger=mocker.Mock())
+    state, timings = {"x": 1}, {}
+
+    start = time.time()
+    message, report = await graph.run(state, timings=timings)
+
+    assert time.time() - start < 0.35
+    assert message is None
+    assert state["c"] == "AB"
+    assert set(timings) == {"a", "b", "c"}
+    assert timings["a"] >= 0.2
+
+@pytest.mark.asyncio
+async def test_run_respects_after_and_adds_costs(mocker):
+    """
+    Test that a stage listed in "after" finishes before the stage starts, and that stage costs are added up.
+
+    Verifies:
+        - The second stage starts after the first one finished.
+        - The costs are added to the total cost of the state and reported by stage.
+    """
+    calls = []
+    async def first(state):
+        await asyncio.sleep(0.05)
+        calls.append("first")
+        return {"a": 1, "cost": 0.1}
+    async def second(state):
+        calls.append("second")
+        return {"b": 2, "cost": 0.2}
+    graph = StageGraph([Stage("first", first, [], ["a"]), Stage("second", second, [], ["b"], after=["first"])], logger=mocker.Mock())
+    state = {"total_cost": 0.5}
+
+    _, report = await graph.run(state)
+
+    assert calls == ["first", "second"]
+    assert state["total_cost"] == pytest.approx(0.8)
+    assert report["costs"] == {"first": 0.1, "second": 0.2}
+
+@pytest.mark.asyncio
+async def test_run_reports_cached_stages(mocker):
+    """
+    Test that stages tell whether their outputs were served from a cache.
+
+    Verifies:
+        - The "cached" flag is reported by stage and is not written into the state.
+        - Stages that do not use a cache are not reported.
+    """
+    async def cached(state):
+        return {"a": 1, "cached": True}
+    async def computed(state):
+        return {"b": 2, "cached": False}
+    graph = StageGraph([Stage("a", cached, [], ["a"]), Stage("b", computed, ["a"], ["b"]), make_stage("c", ["b"], ["c"])], logger=mocker.Mock())
+    state = {}
+
+    _, report = await graph.run(state)
+
+    assert report["cached"] == {"a": True, "b": False}
+    assert "cached" not in state
+
+@pytest.mark.asyncio
+async def test_run_earlier_stop_wins_and_drops_later_stages(mocker):
+    """
+    Test that when several stages stop the pipeline, the one declared first wins, like in a sequential pipeline.
+
+    Verifies:
+        - A later stage that stops first does not hide the stop of an earlier, slower stage.
+        - Running stages declared after the winner are dropped and the stages that depend on them never start.
+    """
+    calls = []
+    on_drop = mocker.Mock()
+    graph = StageGraph([
+        make_stage("check", ["x"], ["checked"], delay=0.1, error=StageStop("first check failed")),
+        make_stage("fast", ["x"], ["fast"], delay=0.0, error=StageStop("second check failed")),
+        make_stage("slow", ["x"], ["slow"], delay=10, calls=calls),
+        make_stage("next", ["slow"], ["next"], calls=calls)
+    ], logger=mocker.Mock())
+
+    message, report = await asyncio.wait_for(graph.run({"x": 1}, on_drop=on_drop), 5)
+
+    assert message == "first check failed"
+    assert report["stopped_by"] == "check"
+    assert report["dropped"] == ["slow"]
+    assert len(on_drop.call_args[0][0]) == 1
+    assert [name for name, _ in calls] == ["slow"]
+    on_drop.call_args[0][0][0].cancel()
+
+@pytest.mark.asyncio
+async def test_run_logs_stage_errors(mocker):
+    """
+    Test that the exception of a stage is logged with its error type and raised.
+
+    Verifies:
+        - The error log has the details of the stage, its name and the error.
+        - A RuntimeError (e.g. invalid API key) is raised without being logged.
+    """
+    logger = mocker.Mock()
+    graph = StageGraph([
+        make_stage("query", ["question"], ["rows"], error=ValueError("bad query"), error_type="DatabaseQueryError",
+                   error_details=lambda state: {"question": state["question"]})
+    ], logger=logger)
+
+    with pytest.raises(ValueError):
+        await graph.run({"question": "What is X?"})
+    logger.log_error.assert_called_once_with("DatabaseQueryError", {"question": "What is X?", "stage": "query", "error": "bad query"})
+
+    graph = StageGraph([make_stage("call", [], ["answer"], error=RuntimeError("API key"), error_type="CallError")], logger=logger)
+    with pytest.raises(RuntimeError):
+        await graph.run({})
+    logger.log_error.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_run_skips_stages_with_outputs_in_state(mocker):
+    """
+    Test that a pipeline can be resumed from a partial state.
+
+    Verifies:
+        - Stages whose outputs are already in the state do not run and are reported as skipped.
+        - Only the selected stages run.
+    """
+    calls = []
+    graph = StageGraph([
+        make_stage("a", [], ["a"], calls=calls),
+        make_stage("b", ["a"], ["b"], calls=calls),
+        make_stage("c", ["b"], ["c"], calls=calls)
+    ], logger=mocker.Mock())
+
+    _, report = await graph.run({"a": "cached"}, stages=["a", "b"])
+
+    assert [name for name, _ in calls] == ["b"]
+    assert report["skipped"] == ["a"]
+
+def test_graph_rejects_invalid_stages():
+    """
+    Test that the graph checks its stages when it is built.
+
+    Verifies:
+        - Duplicated names, outputs written by two stages, unknown "after" stages and cycles raise a ValueError.
+    """
+    with pytest.raises(ValueError):
+        StageGraph([make_stage("a", [], ["x"]), make_stage("a", [], ["y"])])
+    with pytest.raises(ValueError):
+        StageGraph([make_stage("a", [], ["x"]), make_stage("b", [], ["x"])])
+    with pytest.raises(ValueError):
+        StageGraph([make_stage("a", [], ["x"], after=["missing"])])
+    with pytest.raises(ValueError):
+        StageGraph([make_stage("a", ["y"], ["x"]), make_stage("b", ["x"], ["y"])])
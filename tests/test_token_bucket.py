@@ -0,0 +1,60 @@
+import pytest
+from app.llm.token_bucket import TokenBucket
+
+#-------reserve------
+def test_reserve_within_capacity_does_not_wait():
+    """
+    Test that reservations within the capacity are served immediately.
+
+    Verifies:
+        - No wait while the bucket has enough level.
+    """
+    bucket = TokenBucket(60)
+
+    assert bucket.reserve(30) == 0.0
+    assert bucket.reserve(30) == 0.0
+
+def test_reserve_over_level_waits_for_refill():
+    """
+    Test that a reservation over the available level waits the refill time of the deficit.
+
+    Verifies:
+        - The wait is the deficit divided by the refill rate.
+        - Amounts over the capacity are reduced to the capacity.
+    """
+    bucket = TokenBucket(60) #1 per second
+
+    bucket.reserve(60)
+    assert bucket.reserve(5) == pytest.approx(5, abs=0.01)
+    assert bucket.reserve(1000) == pytest.approx(65, abs=0.01)
+
+#-------adjust------
+def test_adjust_gives_back_unused_amount():
+    """
+    Test that correcting a reservation with a smaller real amount frees the difference.
+
+    Verifies:
+        - The level goes up by the unused amount, never over the capacity.
+    """
+    bucket = TokenBucket(60)
+    bucket.reserve(60)
+
+    bucket.adjust(-30)
+
+    assert bucket.reserve(30) == pytest.approx(0, abs=0.01)
+    bucket.adjust(-1000)
+    assert bucket.level <= bucket.capacity
+
+#-------pause------
+def test_pause_delays_next_reservation():
+    """
+    Test that a paused bucket makes the next reservation wait.
+
+    Verifies:
+        - The wait is at least the pause time.
+    """
+    bucket = TokenBucket(60)
+
+    bucket.pause(3)
+
+    assert bucket.reserve(1) >= 3
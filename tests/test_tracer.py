@@ -0,0 +1,139 @@
+import asyncio
+import json
+import pytest
+from logs.tracer import Tracer
+
+@pytest.fixture
+def trace_dir(mocker, tmp_path):
+    """
+    Writes the traces to a temporary directory in the Chrome format.
+    """
+    mocker.patch.object(Tracer, "TRACE_DIR", str(tmp_path))
+    mocker.patch.object(Tracer, "TRACE_FORMAT", "chrome")
+    return tmp_path
+
+def load_trace(trace_dir):
+    """
+    Returns the only trace file written to the directory.
+    """
+    files = list(trace_dir.iterdir())
+    assert len(files) == 1
+    return json.loads(files[0].read_text(encoding="utf-8"))
+
+#------span---------
+def test_span_outside_request_is_not_recorded():
+    """
+    Test that spans opened outside of a traced request do nothing.
+
+    Verifies:
+        - The span is None and there is no request ID or log context.
+    """
+    with Tracer.span("lonely") as span:
+        assert span is None
+        assert Tracer.get_request_id() is None
+        assert Tracer.get_log_context() == {}
+
+@pytest.mark.asyncio
+async def test_spans_nest_across_tasks_and_threads(trace_dir):
+    """
+    Test that the request ID and the current span follow the question through its tasks and threads.
+
+    Verifies:
+        - Spans opened in tasks and in asyncio.to_thread() are children of the span that started them.
+        - Concurrent tasks get their own lanes in the Chrome trace.
+        - The log context has the request ID and the current span.
+    """
+    contexts = []
+
+    @Tracer.traced("database")
+    def query():
+        contexts.append(Tracer.get_log_context())
+        return 1
+
+    @Tracer.traced("stage")
+    async def stage():
+        await asyncio.sleep(0.01)
+        return await asyncio.to_thread(query)
+
+    @Tracer.traced("question", root=True)
+    async def question():
+        return await asyncio.gather(asyncio.create_task(stage(), name="a"), asyncio.create_task(stage(), name="b"))
+
+    assert await question() == [1, 1]
+
+    trace = load_trace(trace_dir)
+    spans = {event["args"]["span_id"]: event for event in trace["traceEvents"] if event["ph"] == "X"}
+    root = next(event for event in spans.values() if event["name"] == "question")
+    stages = [event for event in spans.values() if event["name"] == "stage"]
+    queries = [event for event in spans.values() if event["name"] == "database"]
+    assert root["args"]["parent_id"] is None
+    assert all(event["args"]["parent_id"] == root["args"]["span_id"] for event in stages)
+    assert {event["args"]["parent_id"] for event in queries} == {event["args"]["span_id"] for event in stages}
+    assert len({event["tid"] for event in stages}) == 2
+    assert {context["request_id"] for context in contexts} == {trace["otherData"]["request_id"]}
+    assert {context["span_id"] for context in contexts} == {event["args"]["span_id"] for event in queries}
+    assert {event["args"]["name"] for event in trace["traceEvents"] if event["name"] == "thread_name"} >= {"a", "b"}
+
+@pytest.mark.asyncio
+async def test_nested_roots_and_errors(trace_dir):
+    """
+    Test that a root inside a traced request is a span of the same trace, and that errors are recorded.
+
+    Verifies:
+        - Only one trace file is written.
+        - The exception is raised and stored in the span where it happened and its parents.
+    """
+    @Tracer.traced("inner", root=True)
+    async def inner():
+        raise ValueError("bad query")
+
+    with pytest.raises(ValueError):
+        with Tracer.trace("outer", question="q"):
+            await inner()
+
+    events = [event for event in load_trace(trace_dir)["traceEvents"] if event["ph"] == "X"]
+    assert [event["name"] for event in events] == ["outer", "inner"]
+    assert all(event["args"]["error"] == "ValueError: bad query" for event in events)
+    assert events[0]["args"]["question"] == "q"
+
+@pytest.mark.asyncio
+async def test_traced_async_generator_and_otel_export(mocker, tmp_path):
+    """
+    Test that an asynchronous generator is traced until it finishes and that traces can be written as OTLP JSON.
+
+    Verifies:
+        - The items are yielded unchanged.
+        - The OTLP spans use the request ID as trace ID and link the child to its parent.
+    """
+    mocker.patch.object(Tracer, "TRACE_DIR", str(tmp_path))
+    mocker.patch.object(Tracer, "TRACE_FORMAT", "otel")
+
+    @Tracer.traced("call")
+    async def call():
+        return "b"
+
+    @Tracer.traced("stream", root=True)
+    async def stream():
+        yield "a"
+        yield await call()
+
+    assert [item async for item in stream()] == ["a", "b"]
+
+    data = load_trace(tmp_path)
+    spans = data["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in spans] == ["stream", "call"]
+    assert len(spans[0]["traceId"]) == 32 and spans[0]["traceId"] == spans[1]["traceId"]
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert int(spans[0]["endTimeUnixNano"]) >= int(spans[1]["endTimeUnixNano"])
+
+def test_trace_export_can_be_disabled(mocker, tmp_path):
+    """
+    Test that no file is written when the trace directory is empty, while the request is still traced.
+
+    Verifies:
+        - The request has an ID inside the trace and no file is written.
+    """
+    mocker.patch.object(Tracer, "TRACE_DIR", "")
+    with Tracer.trace("question"):
+        assert Tracer.get_request_id() is not None
+    assert list(tmp_path.iterdir()) == []
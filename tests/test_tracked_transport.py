@@ -0,0 +1,63 @@
+import asyncio
+import httpx
+import pytest
+from app.llm.tracked_transport import TrackedTransport
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """Fake connection pool that opens one connection and reuses it for the next requests."""
+    def __init__(self):
+        self.opened = False
+
+    async def handle_async_request(self, request):
+        if not self.opened:
+            self.opened = True
+            await request.extensions["trace"]("connection.connect_tcp.started", {})
+        return httpx.Response(200, text="ok")
+
+#------handle_async_request-------
+@pytest.mark.asyncio
+async def test_counts_new_and_reused_connections():
+    """
+    Test that requests are counted as new or reused connections.
+
+    Verifies:
+        - The first request opens a connection and the next ones reuse it.
+        - A trace callback of the request is still called.
+    """
+    transport = TrackedTransport(PoolTransport())
+    events = []
+    async def trace(event_name, info):
+        events.append(event_name)
+
+    async with httpx.AsyncClient(transport=transport) as client:
+        await client.get("https://api.openai.com/v1/models", extensions={"trace": trace})
+        await client.get("https://api.openai.com/v1/models")
+        await client.get("https://api.openai.com/v1/models")
+
+    assert transport.new_connections == 1
+    assert transport.reused_connections == 2
+    assert events == ["connection.connect_tcp.started"]
+
+@pytest.mark.asyncio
+async def test_start_counting_is_per_context():
+    """
+    Test that the counts of start_counting() only include the requests of its own context.
+
+    Verifies:
+        - Two concurrent questions get their own counts.
+        - Tasks started by a question add to its counts.
+    """
+    transport = TrackedTransport(PoolTransport())
+    client = httpx.AsyncClient(transport=transport)
+
+    async def question(requests):
+        counts = TrackedTransport.start_counting()
+        await asyncio.gather(*(client.get("https://api.openai.com/v1/models") for _ in range(requests)))
+        return counts
+
+    first, second = await asyncio.gather(question(1), question(3))
+    await client.aclose()
+
+    assert first["new"] + first["reused"] == 1
+    assert second["new"] + second["reused"] == 3
+    assert first["new"] + second["new"] == 1